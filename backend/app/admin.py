@@ -1,8 +1,110 @@
+from django.conf import settings
 from django.contrib import admin
+from django.contrib.admin.utils import quote, unquote
 from django.contrib.auth.admin import UserAdmin
+from django.core.paginator import Paginator
+from django.db import connections
+from django.http import Http404, JsonResponse
+from django.urls import path, reverse
+from django.utils.functional import cached_property
+from django.utils.html import format_html
 from .models import (
-    User, Branch, Category, Transaction, IngestionLog, DailySummary, UserPhoneNumber, UserBranchAssignment, UserLineID
+    User, Branch, Category, Transaction, IngestionLog, DailySummary, UserPhoneNumber, UserBranchAssignment, UserLineID,
+    ReconciliationIssue, Anomaly, ForecastFit, Digest, IdempotencyKey,
 )
+from . import background, purge
+from .search import search_transactions
+
+
+def estimated_count(queryset):
+    """Planner's row estimate for the queryset's table on PostgreSQL, else None"""
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+            [queryset.model._meta.db_table],
+        )
+        row = cursor.fetchone()
+    # -1 until the table has been vacuumed or analyzed
+    return row[0] if row and row[0] >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Unfiltered changelists of large tables use the planner's estimate
+    instead of a full COUNT(*); filtered ones and small tables count exactly
+    """
+
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, 'query', None)
+        if query is not None and not query.where:
+            estimate = estimated_count(self.object_list)
+            if estimate is not None and estimate >= settings.ADMIN_ESTIMATED_COUNT_THRESHOLD:
+                return estimate
+        return super().count
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """
+    Changelist defaults for the big tables: estimated counts, no second
+    unfiltered COUNT(*) for "N results (M total)", and the JSON column in
+    `lazy_json_field` left out of every query; its change page shows it in
+    an iframe that loads <id>/json/ only when the fieldset is opened
+    """
+
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    lazy_json_field = None
+
+    def get_queryset(self, request):
+        qs = super().get_queryset(request)
+        if self.lazy_json_field:
+            qs = qs.defer(self.lazy_json_field)
+        return qs
+
+    def get_urls(self):
+        urls = super().get_urls()
+        if not self.lazy_json_field:
+            return urls
+        opts = self.model._meta
+        return [
+            path(
+                '<path:object_id>/json/',
+                self.admin_site.admin_view(self.json_view),
+                name=f'{opts.app_label}_{opts.model_name}_json',
+            ),
+        ] + urls
+
+    def json_view(self, request, object_id):
+        if not self.has_view_or_change_permission(request):
+            raise Http404
+        values = list(
+            self.get_queryset(request)
+            .filter(pk=unquote(object_id))
+            .values_list(self.lazy_json_field, flat=True)
+        )
+        if not values:
+            raise Http404
+        return JsonResponse(
+            values[0], safe=False, json_dumps_params={'indent': 2, 'ensure_ascii': False}
+        )
+
+    def lazy_json_display(self, obj):
+        if obj is None or obj.pk is None:
+            return "-"
+        opts = self.model._meta
+        url = reverse(
+            f'{self.admin_site.name}:{opts.app_label}_{opts.model_name}_json',
+            args=[quote(obj.pk)],
+        )
+        return format_html(
+            '<iframe src="{}" loading="lazy" title="JSON" '
+            'style="width: 100%; height: 30em; border: 1px solid var(--hairline-color);"></iframe>',
+            url,
+        )
 
 class UserPhoneNumberInline(admin.TabularInline):
     model = UserPhoneNumber
@@ -43,6 +145,10 @@ class CategoryAdmin(admin.ModelAdmin):
     search_fields = ['name']
     readonly_fields = ['created_at', 'updated_at']
 
+    def get_queryset(self, request):
+        qs = super().get_queryset(request)
+        return qs.prefetch_related('branches')
+
     def get_branches(self, obj):
         return ", ".join([b.name for b in obj.branches.all()])
     get_branches.short_description = 'Branches'
@@ -55,7 +161,7 @@ link_categories_to_branches.short_description = "Link selected categories to bra
 
 
 @admin.register(Transaction)
-class TransactionAdmin(admin.ModelAdmin):
+class TransactionAdmin(LargeTableAdmin):
     list_display = [
         'id', 'date', 'branch_name', 'amount', 'transaction_type', 
         'category_name', 'payment_method', 'reported_by', 'is_verified', 'source', 'created_at'
@@ -64,11 +170,13 @@ class TransactionAdmin(admin.ModelAdmin):
         'transaction_type', 'payment_method', 'source', 'is_verified', 'is_valid',
         'date', 'created_at', 'branch'
     ]
+    # description/category go through the full-text index, see get_search_results
     search_fields = [
-        'description', 'branch__name', 'category__name',
-        'reported_by__email', 'reported_by__username'
+        'branch__name', 'reported_by__email', 'reported_by__username'
     ]
-    readonly_fields = ['created_at', 'updated_at']
+    readonly_fields = ['created_at', 'updated_at', 'evidence_hash', 'evidence_variants']
+    list_select_related = ['branch', 'category', 'reported_by']
+    raw_id_fields = ['reported_by', 'voided_by']
     date_hierarchy = 'date'
     
     fieldsets = (
@@ -87,7 +195,7 @@ class TransactionAdmin(admin.ModelAdmin):
             'fields': ('is_valid', 'voided_by', 'voided_at')
         }),
         ('Evidence', {
-            'fields': ('evidence_image',),
+            'fields': ('evidence_image', 'evidence_hash', 'evidence_variants'),
             'classes': ('collapse',)
         }),
         ('Timestamps', {
@@ -96,9 +204,12 @@ class TransactionAdmin(admin.ModelAdmin):
         }),
     )
     
-    def get_queryset(self, request):
-        qs = super().get_queryset(request)
-        return qs.select_related('branch', 'category', 'reported_by', 'voided_by')
+    def get_search_results(self, request, queryset, search_term):
+        """Indexed search on description/category, plain search on the remaining fields"""
+        results, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        if search_term:
+            results = results | search_transactions(queryset, search_term, ranked=False)
+        return results, may_have_duplicates
 
     def branch_name(self, obj):
         return obj.branch.name
@@ -112,14 +223,17 @@ class TransactionAdmin(admin.ModelAdmin):
 
 
 @admin.register(IngestionLog)
-class IngestionLogAdmin(admin.ModelAdmin):
-    list_display = ['id', 'source', 'status', 'created_transaction', 'created_at']
+class IngestionLogAdmin(LargeTableAdmin):
+    list_display = ['id', 'source', 'status', 'created_transaction', 'duration', 'created_at']
     list_filter = ['source', 'status', 'created_at']
-    search_fields = [
-        'raw_payload', 'error_message', 
-        'created_transaction__description'
-    ]
-    readonly_fields = ['created_at', 'updated_at', 'raw_payload_display']
+    # The payload itself is not searched (a LIKE over the whole JSON document),
+    # only the sender/subject keys; the transaction through its search index,
+    # see get_search_results
+    search_fields = ['raw_payload__subject', 'raw_payload__sender', 'error_message']
+    readonly_fields = ['created_at', 'updated_at', 'raw_payload_display', 'timings_display']
+    list_select_related = ['created_transaction__branch']
+    raw_id_fields = ['created_transaction']
+    lazy_json_field = 'raw_payload'
     date_hierarchy = 'created_at'
     actions = ['delete_failed_logs', 'delete_with_transactions']
     
@@ -135,6 +249,9 @@ class IngestionLogAdmin(admin.ModelAdmin):
             'fields': ('error_message',),
             'classes': ('collapse',)
         }),
+        ('Timings', {
+            'fields': ('timings_display',),
+        }),
         ('Timestamps', {
             'fields': ('created_at', 'updated_at'),
             'classes': ('collapse',)
@@ -146,49 +263,80 @@ class IngestionLogAdmin(admin.ModelAdmin):
     has_error.boolean = True
     has_error.short_description = 'Has Error'
     
+    def get_search_results(self, request, queryset, search_term):
+        """Log id, payload sender/subject, error, and the created transaction's indexed text"""
+        results, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        search_term = search_term.strip()
+        if search_term.isdigit():
+            results = results | queryset.filter(pk=search_term)
+        elif search_term:
+            matches = search_transactions(Transaction.objects.all(), search_term, ranked=False)
+            results = results | queryset.filter(created_transaction__in=matches.values('pk'))
+        return results, may_have_duplicates
+
     def raw_payload_display(self, obj):
-        """Display raw payload as formatted JSON."""
-        import json
-        if obj.raw_payload:
-            return json.dumps(obj.raw_payload, indent=2, ensure_ascii=False)
-        return "No payload"
+        """Display raw payload as formatted JSON, loaded on demand."""
+        return self.lazy_json_display(obj)
     raw_payload_display.short_description = 'Raw Payload (JSON)'
+
+    def duration(self, obj):
+        if obj.timings:
+            return f"{obj.timings['total_ms']:.0f} ms"
+        return "-"
+    duration.short_description = 'Duration'
+    duration.admin_order_field = 'timings__total_ms'
+
+    def timings_display(self, obj):
+        """Display the per-stage breakdown recorded by app/tracing.py."""
+        timings = obj.timings
+        if not timings:
+            return "No timings recorded"
+        lines = [
+            f"{'stage':<28}{'start':>10}{'ms':>10}{'queries':>9}{'query ms':>10}",
+            f"{'total':<28}{'':>10}{timings['total_ms']:>10.1f}"
+            f"{timings['queries']:>9}{timings['query_ms']:>10.1f}",
+        ]
+        for span in timings.get('spans', []):
+            name = '  ' * span['depth'] + span['name']
+            lines.append(
+                f"{name:<28}{span['start_ms']:>10.1f}{span['ms']:>10.1f}"
+                f"{span['queries']:>9}{span['query_ms']:>10.1f}"
+            )
+        if timings.get('dropped_spans'):
+            lines.append(f"... {timings['dropped_spans']} more spans not recorded")
+        return format_html('<pre>{}</pre>', '\n'.join(lines))
+    timings_display.short_description = 'Timings'
     
     def delete_failed_logs(self, request, queryset):
         """Delete only failed logs."""
-        failed = queryset.filter(status='FAILED')
-        count = failed.count()
-        failed.delete()
-        self.message_user(request, f'Deleted {count} failed log(s).')
+        self._purge(request, queryset.filter(status='FAILED'), with_transactions=False)
     delete_failed_logs.short_description = 'Delete selected failed logs'
     
     def delete_with_transactions(self, request, queryset):
         """Delete logs and their related transactions."""
-        from django.db import transaction as db_transaction
-        
-        with db_transaction.atomic():
-            transactions_to_delete = []
-            for log in queryset:
-                if log.created_transaction:
-                    transactions_to_delete.append(log.created_transaction.id)
-            
-            # Delete transactions first
-            Transaction.objects.filter(id__in=transactions_to_delete).delete()
-            # Then delete logs
-            count = queryset.delete()[0]
-            
-        self.message_user(
-            request, 
-            f'Deleted {count} log(s) and {len(transactions_to_delete)} transaction(s).'
-        )
+        self._purge(request, queryset, with_transactions=True)
     delete_with_transactions.short_description = 'Delete logs and related transactions'
-    
-    def get_queryset(self, request):
-        qs = super().get_queryset(request)
-        return qs.select_related('created_transaction')
+
+    def _purge(self, request, queryset, with_transactions):
+        """Set-based purge; large selections go to a background task"""
+        count = queryset.count()
+        if count > settings.PURGE_SYNC_LIMIT:
+            background.submit_on_commit(
+                purge.purge_logs, queryset.order_by(), with_transactions=with_transactions,
+            )
+            self.message_user(request, f'Deleting {count} log(s) in the background.')
+            return
+        result = purge.purge_logs(queryset, with_transactions=with_transactions)
+        if with_transactions:
+            self.message_user(
+                request,
+                f"Deleted {result['logs']} log(s) and {result['transactions']} transaction(s).",
+            )
+        else:
+            self.message_user(request, f"Deleted {result['logs']} failed log(s).")
 
 @admin.register(DailySummary)
-class DailySummaryAdmin(admin.ModelAdmin):
+class DailySummaryAdmin(LargeTableAdmin):
     list_display = [
         'id', 'date', 'branch', 'source', 'total_collected',
         'cash_amount', 'qris_amount', 'transfer_amount', 'created_at'
@@ -196,6 +344,9 @@ class DailySummaryAdmin(admin.ModelAdmin):
     list_filter = ['source', 'date', 'branch', 'created_at']
     search_fields = ['branch__name']
     readonly_fields = ['created_at', 'updated_at', 'raw_data_display']
+    list_select_related = ['branch']
+    raw_id_fields = ['ingestion_log']
+    lazy_json_field = 'raw_data'
     date_hierarchy = 'date'
     
     fieldsets = (
@@ -222,32 +373,100 @@ class DailySummaryAdmin(admin.ModelAdmin):
     )
     
     def raw_data_display(self, obj):
-        """Display raw data as formatted JSON."""
-        import json
-        if obj.raw_data:
-            return json.dumps(obj.raw_data, indent=2, ensure_ascii=False)
-        return "No data"
+        """Display raw data as formatted JSON, loaded on demand."""
+        return self.lazy_json_display(obj)
     raw_data_display.short_description = 'Raw Data (JSON)'
-    
-    def get_queryset(self, request):
-        qs = super().get_queryset(request)
-        return qs.select_related('branch', 'ingestion_log')
+
+@admin.register(ReconciliationIssue)
+class ReconciliationIssueAdmin(admin.ModelAdmin):
+    """Written by `manage.py reconcile`; read-only here"""
+    list_display = [
+        'date', 'branch', 'kind', 'expected', 'actual', 'difference',
+        'transaction_count', 'summary',
+    ]
+    list_filter = ['kind', 'date', 'branch']
+    search_fields = ['branch__name']
+    list_select_related = ['branch', 'summary__branch']
+    date_hierarchy = 'date'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+@admin.register(Anomaly)
+class AnomalyAdmin(admin.ModelAdmin):
+    """Written by `manage.py detect_anomalies`; read-only here"""
+    list_display = ['date', 'branch', 'kind', 'category', 'value', 'baseline', 'score']
+    list_filter = ['kind', 'date', 'branch']
+    search_fields = ['branch__name', 'category__name']
+    list_select_related = ['branch', 'category']
+    date_hierarchy = 'date'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+@admin.register(ForecastFit)
+class ForecastFitAdmin(admin.ModelAdmin):
+    """Kept current by the forecast refresh (app/analytics/forecast.py); read-only here"""
+    list_display = ['branch', 'category', 'method', 'alpha', 'gamma', 'errors', 'fitted_through', 'refreshed_at']
+    list_filter = ['method', 'branch']
+    search_fields = ['branch__name', 'category__name']
+    list_select_related = ['branch', 'category']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+@admin.register(Digest)
+class DigestAdmin(admin.ModelAdmin):
+    """Built by `manage.py send_digest`; read-only here"""
+    list_display = ['start', 'end', 'period', 'delivered_at', 'created_at']
+    list_filter = ['period']
+    date_hierarchy = 'start'
+    exclude = ['pdf']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+@admin.register(IdempotencyKey)
+class IdempotencyKeyAdmin(admin.ModelAdmin):
+    """Stored responses of Idempotency-Key requests; read-only here"""
+    list_display = ['scope', 'key', 'status_code', 'created_at', 'expires_at']
+    search_fields = ['key']
+    date_hierarchy = 'created_at'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
 
 @admin.register(User)
 class CustomUserAdmin(UserAdmin):
     # 1. Menampilkan kolom tambahan di tabel daftar user (List View)
-    list_display = UserAdmin.list_display + ('phone_number', 'assigned_branch', 'is_verified', 'is_staff')
+    list_display = UserAdmin.list_display + ('get_phone_numbers', 'get_branches', 'is_verified')
     
     # 2. Menambahkan fitur filter di sidebar kanan
-    list_filter = UserAdmin.list_filter + ('assigned_branch', 'is_verified')
+    list_filter = UserAdmin.list_filter + ('branch_assignments__branch', 'is_verified')
     
     # 3. Menambahkan kolom pencarian berdasarkan nomor HP
-    search_fields = UserAdmin.search_fields + ('phone_number',)
+    search_fields = UserAdmin.search_fields + ('phone_numbers__phone_number',)
     
     # 4. Memunculkan form input di halaman Edit User
+    # (nomor HP, cabang dan LINE ID diisi lewat inline di bawah)
     fieldsets = UserAdmin.fieldsets + (
         ('Staff Information', {
-            'fields': ('phone_number', 'assigned_branch', 'is_verified'),
+            'fields': ('is_verified',),
             'description': 'Informasi khusus untuk Staff MaknaFlow (WhatsApp Bot & Cabang)'
         }),
     )
@@ -255,8 +474,20 @@ class CustomUserAdmin(UserAdmin):
     # 5. Memunculkan form input saat membuat user baru (Add User Page)
     add_fieldsets = UserAdmin.add_fieldsets + (
         ('Staff Information', {
-            'fields': ('phone_number', 'assigned_branch', 'is_verified'),
+            'fields': ('is_verified',),
         }),
     )
 
     inlines = [UserPhoneNumberInline, UserBranchAssignmentInline, UserLineIDInline]
+
+    def get_queryset(self, request):
+        qs = super().get_queryset(request)
+        return qs.prefetch_related('phone_numbers', 'branch_assignments__branch')
+
+    def get_phone_numbers(self, obj):
+        return ", ".join(p.phone_number for p in obj.phone_numbers.all())
+    get_phone_numbers.short_description = 'Phone Numbers'
+
+    def get_branches(self, obj):
+        return ", ".join(a.branch.name for a in obj.branch_assignments.all())
+    get_branches.short_description = 'Branches'
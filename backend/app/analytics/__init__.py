@@ -0,0 +1,10 @@
+"""
+Analytics over the daily branch series
+
+series.py     - DailySummary/Transaction totals loaded as NumPy matrices,
+                one row per branch (or branch and category), one column per day
+anomalies.py  - vectorized anomaly scoring, written to the Anomaly table
+forecast.py   - batched seasonal forecasts, fitted state kept in ForecastFit
+
+Requires the optional numpy package (pip install 'backend[analytics]').
+"""
@@ -0,0 +1,208 @@
+"""
+Anomaly detection on daily branch revenue and expenses
+
+Every series is scored at once on the whole (series, days) matrix; the
+only Python loops are over the weeks of the seasonal window and over the
+flagged cells when writing results.
+
+Revenue (net sales per branch and day):
+- a day is compared with the same weekday of the previous SEASONAL_WEEKS
+  weeks (robust z-score: median and MAD); it is not scored until at least
+  MIN_OBSERVATIONS of those weeks have data. A plain trailing window is not
+  used as a fallback: with weekend peaks it flags every Saturday
+- |z| >= ANOMALY_Z_THRESHOLD -> REVENUE_SPIKE / REVENUE_DROP (a doubled
+  ingestion shows up as a spike)
+- a day without a report, when the branch reported on at least
+  GAP_MIN_COVERAGE of the previous ROLLING_DAYS days -> MISSING_REPORT
+
+Expenses (per branch and category): days with an expense are compared with
+the expense days of the previous EXPENSE_DAYS days -> EXPENSE_SPIKE (only
+upwards: a smaller than usual expense is not worth an alert).
+
+detect() re-scores a window of recent days (or all history) and replaces
+the Anomaly rows in that window.
+"""
+import logging
+import warnings
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, Min
+
+from app import metrics
+from app.models import Anomaly, AnomalyKind, DailySummary, Transaction
+
+from . import series
+from .series import np, require_numpy
+
+logger = logging.getLogger(__name__)
+
+SEASONAL_WEEKS = 8
+ROLLING_DAYS = 14
+EXPENSE_DAYS = 60
+MIN_OBSERVATIONS = 3
+EXPENSE_MIN_OBSERVATIONS = 5
+GAP_MIN_COVERAGE = 0.8
+# MAD is 0 for a perfectly flat history; never divide by less than this
+# share of the baseline
+RELATIVE_SCALE_FLOOR = 0.05
+MAD_TO_SIGMA = 1.4826
+
+LOOKBACK_DAYS = max(SEASONAL_WEEKS * 7, ROLLING_DAYS, EXPENSE_DAYS)
+
+
+def _threshold():
+    return getattr(settings, 'ANOMALY_Z_THRESHOLD', 3.5)
+
+
+def trailing_windows(values, window):
+    """(rows, days) -> (rows, days, window): the `window` days before each day"""
+    rows = values.shape[0]
+    padded = np.concatenate([np.full((rows, window), np.nan), values], axis=1)
+    return np.lib.stride_tricks.sliding_window_view(padded, window, axis=1)[:, :-1, :]
+
+
+def weekday_windows(values, weeks):
+    """(rows, days) -> (rows, days, weeks): the same weekday of the previous weeks"""
+    rows, days = values.shape
+    windows = np.full((rows, days, weeks), np.nan)
+    for week in range(1, weeks + 1):
+        lag = 7 * week
+        if lag < days:
+            windows[:, lag:, week - 1] = values[:, :days - lag]
+    return windows
+
+
+def robust_z(values, windows, min_observations):
+    """Robust z-score of each cell against its window; NaN where the window is too thin"""
+    with warnings.catch_warnings():
+        # All-NaN windows (no history yet) are expected
+        warnings.simplefilter('ignore', RuntimeWarning)
+        median = np.nanmedian(windows, axis=-1)
+        mad = np.nanmedian(np.abs(windows - median[..., None]), axis=-1)
+    observations = np.count_nonzero(~np.isnan(windows), axis=-1)
+    scale = np.maximum(MAD_TO_SIGMA * mad, np.abs(median) * RELATIVE_SCALE_FLOOR)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z = (values - median) / scale
+    z[(observations < min_observations) | (scale == 0)] = np.nan
+    return z, median
+
+
+def score_revenue(values, last_reported):
+    """
+    values: (branches, days) net sales, NaN where not reported
+    last_reported: column of the latest day any branch reported; later days
+    are not flagged as missing (today's reports have not arrived yet)
+    Returns (z, baseline, missing) arrays of the same shape
+    """
+    z, baseline = robust_z(values, weekday_windows(values, SEASONAL_WEEKS), MIN_OBSERVATIONS)
+
+    reported = ~np.isnan(values)
+    # Reported days among the previous ROLLING_DAYS, from a running count
+    running = np.concatenate(
+        [np.zeros((values.shape[0], 1)), np.cumsum(reported, axis=1)], axis=1
+    )
+    columns = np.arange(values.shape[1])
+    window_start = np.maximum(columns - ROLLING_DAYS, 0)
+    recent = running[:, columns] - running[:, window_start]
+    coverage = recent / ROLLING_DAYS
+    missing = ~reported & (coverage >= GAP_MIN_COVERAGE) & (columns <= last_reported)
+    return z, baseline, missing
+
+
+def score_expenses(values):
+    """values: (series, days) expense totals, NaN on days without expense -> (z, baseline)"""
+    return robust_z(values, trailing_windows(values, EXPENSE_DAYS), EXPENSE_MIN_OBSERVATIONS)
+
+
+def _amount(value):
+    if value is None or np.isnan(value):
+        return None
+    return Decimal(str(round(float(value), 2)))
+
+
+def _score(value):
+    return None if np.isnan(value) else round(float(value), 2)
+
+
+def find_anomalies(start, end, first_scored):
+    """Anomaly instances (unsaved) for first_scored..end, using history from start"""
+    require_numpy()
+    threshold = _threshold()
+    found = []
+    offset = (first_scored - start).days
+
+    revenue = series.revenue(start, end)
+    if revenue.keys:
+        reported_any = np.flatnonzero((~np.isnan(revenue.values)).any(axis=0))
+        last_reported = reported_any[-1] if reported_any.size else -1
+        z, baseline, missing = score_revenue(revenue.values, last_reported)
+        z[:, :offset] = np.nan
+        missing[:, :offset] = False
+        flagged = {
+            AnomalyKind.REVENUE_SPIKE: z >= threshold,
+            AnomalyKind.REVENUE_DROP: z <= -threshold,
+            AnomalyKind.MISSING_REPORT: missing,
+        }
+        for kind, mask in flagged.items():
+            for row, column in zip(*np.nonzero(mask)):
+                found.append(Anomaly(
+                    branch_id=revenue.keys[row],
+                    date=revenue.date_at(column),
+                    kind=kind,
+                    value=_amount(revenue.values[row, column]),
+                    baseline=_amount(baseline[row, column]),
+                    score=_score(z[row, column]),
+                ))
+
+    expense = series.expenses(start, end)
+    if expense.keys:
+        z, baseline = score_expenses(expense.values)
+        z[:, :offset] = np.nan
+        for row, column in zip(*np.nonzero(z >= threshold)):
+            branch_id, category_id = expense.keys[row]
+            found.append(Anomaly(
+                branch_id=branch_id,
+                category_id=category_id,
+                date=expense.date_at(column),
+                kind=AnomalyKind.EXPENSE_SPIKE,
+                value=_amount(expense.values[row, column]),
+                baseline=_amount(baseline[row, column]),
+                score=_score(z[row, column]),
+            ))
+    return found
+
+
+def _data_range():
+    summaries = DailySummary.objects.aggregate(first=Min('date'), last=Max('date'))
+    transactions = Transaction.objects.aggregate(first=Min('date'), last=Max('date'))
+    firsts = [d for d in (summaries['first'], transactions['first']) if d]
+    lasts = [d for d in (summaries['last'], transactions['last']) if d]
+    if not firsts:
+        return None, None
+    return min(firsts), max(lasts)
+
+
+def detect(days=None, end=None):
+    """
+    Score the last `days` days up to `end` (default: the latest data), or
+    all history when days is None, and replace the anomalies stored for
+    that window; returns the new Anomaly rows
+    """
+    require_numpy()
+    first, last = _data_range()
+    if first is None:
+        return []
+    end = end or last
+    first_scored = first if days is None else max(first, end - timedelta(days=days - 1))
+    start = first if days is None else first_scored - timedelta(days=LOOKBACK_DAYS)
+
+    found = find_anomalies(start, end, first_scored)
+    with transaction.atomic():
+        Anomaly.objects.filter(date__range=(first_scored, end)).delete()
+        Anomaly.objects.bulk_create(found, batch_size=1000)
+    metrics.record_inserts(Anomaly, len(found))
+    logger.info('Anomaly detection %s..%s: %s anomalies', first_scored, end, len(found))
+    return found
@@ -0,0 +1,449 @@
+"""
+Daily forecasts of branch net sales and expense categories
+
+Two lightweight models run side by side on every series:
+- seasonal naive: tomorrow is the latest value seen on the same weekday
+- exponential smoothing with additive weekday seasonality (ETS(A,N,A)):
+  a level plus seven weekday offsets, both nudged by each day's error
+
+Each series keeps whichever model has the lower one-day-ahead squared
+error so far. Interval widths come from that error (the usual ETS h-step
+variance for smoothing; one step per week ahead for seasonal naive).
+
+Fitting is batched: all series (and, on a full fit, every (alpha, gamma)
+pair of the grid) are rows of one matrix and the recursion steps through
+the days once, updating every row with array operations. The fitted state
+is stored in ForecastFit, so a refresh only steps through the days that
+arrived since; a series is refitted from scratch when it has no fit yet or
+a day it was already fitted on changed.
+
+Revenue days without a report are skipped (not counted as zero sales);
+expense days without an expense count as zero once a category has been
+used. Expenses are forecast as totals per (branch, category) and day.
+"""
+import logging
+import threading
+import warnings
+from dataclasses import dataclass
+from datetime import timedelta
+from statistics import NormalDist
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from app import background, metrics
+from app.models import DailySummary, ForecastFit, ForecastMethod, Transaction, TransactionType
+
+from . import series
+from .series import np, require_numpy
+
+logger = logging.getLogger(__name__)
+
+SEASON = 7
+# Days used to initialise the level and weekday offsets; a series needs
+# at least one more before it gets a fit
+MIN_HISTORY_DAYS = 14
+ALPHAS = (0.05, 0.1, 0.2, 0.3, 0.5)
+GAMMAS = (0.05, 0.1, 0.2, 0.3)
+MAX_HORIZON = 90
+
+REVENUE = 'revenue'
+EXPENSES = 'expenses'
+
+
+@dataclass
+class State:
+    """Smoothing state of a batch of series; every field has one entry per row"""
+    alpha: object
+    gamma: object
+    level: object
+    season: object        # (rows, 7), Monday first
+    last_week: object     # (rows, 7), NaN until the weekday was seen
+    smoothing_sse: object
+    naive_sse: object
+    errors: object
+
+    def take(self, rows):
+        return State(**{name: value[rows] for name, value in vars(self).items()})
+
+
+def _weekdays(start, columns):
+    return (start.weekday() + columns) % SEASON
+
+
+def fill_expenses(values, since=None):
+    """
+    Days without an expense are zero spend once a series has started
+    (or after column `since` per row, for series that started earlier)
+    """
+    observed = ~np.isnan(values)
+    started = np.maximum.accumulate(observed, axis=1)
+    if since is not None:
+        started |= np.arange(values.shape[1]) > since[:, None]
+    return np.where(started & ~observed, 0.0, values)
+
+
+def initial_state(values, start, alpha, gamma):
+    """
+    Level and weekday offsets from each row's first MIN_HISTORY_DAYS days
+    Returns (state, first column to score per row); rows with too little
+    history get a first column past the end
+    """
+    rows, days = values.shape
+    observed = ~np.isnan(values)
+    first = np.where(observed.any(axis=1), observed.argmax(axis=1), days)
+    columns = first[:, None] + np.arange(MIN_HISTORY_DAYS)
+    inside = columns < days
+    window = np.where(
+        inside, values[np.arange(rows)[:, None], np.minimum(columns, days - 1)], np.nan
+    )
+    weekdays = _weekdays(start, columns)
+
+    with warnings.catch_warnings():
+        # Rows without data have all-NaN windows
+        warnings.simplefilter('ignore', RuntimeWarning)
+        level = np.nanmean(window, axis=1)
+        offsets = window - level[:, None]
+        season = np.stack(
+            [np.nanmean(np.where(weekdays == day, offsets, np.nan), axis=1) for day in range(SEASON)],
+            axis=1,
+        )
+    season = np.nan_to_num(season)
+
+    last_week = np.full((rows, SEASON), np.nan)
+    for column in range(MIN_HISTORY_DAYS):
+        value = window[:, column]
+        seen = ~np.isnan(value)
+        last_week[seen, weekdays[seen, column]] = value[seen]
+
+    zeros = np.zeros(rows)
+    state = State(
+        alpha=alpha, gamma=gamma, level=level, season=season, last_week=last_week,
+        smoothing_sse=zeros.copy(), naive_sse=zeros.copy(), errors=zeros.copy(),
+    )
+    return state, first + MIN_HISTORY_DAYS
+
+
+def step(values, start, state, first_column=None):
+    """
+    Run the recursion over the columns of values, updating state in place
+    Only cells from first_column on (per row) are used; NaN cells are skipped
+    """
+    rows, days = values.shape
+    if first_column is None:
+        first_column = np.zeros(rows, dtype=int)
+    for column in range(days):
+        value = values[:, column]
+        live = (column >= first_column) & ~np.isnan(value)
+        if not live.any():
+            continue
+        day = (start.weekday() + column) % SEASON
+        offset = state.season[:, day]
+        error = value - (state.level + offset)
+        naive_error = value - state.last_week[:, day]
+        scored = live & ~np.isnan(naive_error)
+        state.smoothing_sse += np.where(scored, error ** 2, 0.0)
+        state.naive_sse += np.where(scored, naive_error ** 2, 0.0)
+        state.errors += scored
+        state.level = np.where(live, state.level + state.alpha * error, state.level)
+        state.season[:, day] = np.where(
+            live, offset + state.gamma * (1 - state.alpha) * error, offset
+        )
+        state.last_week[:, day] = np.where(live, value, state.last_week[:, day])
+    return state
+
+
+def fit(values, start):
+    """
+    Full fit of every row of a (series, days) matrix
+    Returns (state, fitted) where fitted marks the rows with enough history;
+    each row gets the (alpha, gamma) pair with the lowest smoothing error
+    """
+    require_numpy()
+    grid = [(alpha, gamma) for alpha in ALPHAS for gamma in GAMMAS]
+    rows = values.shape[0]
+    batch = np.repeat(values, len(grid), axis=0)
+    alpha = np.tile([a for a, _ in grid], rows)
+    gamma = np.tile([g for _, g in grid], rows)
+
+    state, first_column = initial_state(batch, start, alpha, gamma)
+    step(batch, start, state, first_column)
+
+    sse = state.smoothing_sse.reshape(rows, len(grid))
+    best = np.arange(rows) * len(grid) + sse.argmin(axis=1)
+    fitted = first_column[best] < values.shape[1]
+    return state.take(best), fitted
+
+
+def _last_columns(values):
+    """Index of the last non-NaN column per row (-1 for empty rows)"""
+    observed = ~np.isnan(values)
+    last = values.shape[1] - 1 - observed[:, ::-1].argmax(axis=1)
+    return np.where(observed.any(axis=1), last, -1)
+
+
+# --- Loading and storing ---
+
+def _data_range(kind):
+    if kind == REVENUE:
+        queryset = DailySummary.objects.all()
+    else:
+        queryset = Transaction.objects.filter(transaction_type=TransactionType.EXPENSE, is_valid=True)
+    bounds = queryset.aggregate(first=Min('date'), last=Max('date'))
+    return bounds['first'], bounds['last']
+
+
+def _matrix(kind, start, end):
+    """DailyMatrix keyed by (branch id, category id or None)"""
+    if kind == REVENUE:
+        matrix = series.revenue(start, end)
+        matrix.keys = [(branch_id, None) for branch_id in matrix.keys]
+        return matrix
+    return series.expenses(start, end)
+
+
+def _changed_since(kind, since):
+    """(key, date, updated_at) of the rows of a kind changed since `since`"""
+    if kind == REVENUE:
+        rows = DailySummary.objects.filter(updated_at__gt=since).values_list('branch_id', 'date', 'updated_at')
+        return [((branch_id, None), day, updated) for branch_id, day, updated in rows]
+    rows = Transaction.objects.filter(
+        transaction_type=TransactionType.EXPENSE, updated_at__gt=since,
+    ).values_list('branch_id', 'category_id', 'date', 'updated_at')
+    return [((branch_id, category_id), day, updated) for branch_id, category_id, day, updated in rows]
+
+
+def _fits(kind):
+    queryset = ForecastFit.objects.filter(category__isnull=(kind == REVENUE))
+    return {(fit.branch_id, fit.category_id): fit for fit in queryset}
+
+
+def _state_of(fits):
+    return State(
+        alpha=np.array([fit.alpha for fit in fits]),
+        gamma=np.array([fit.gamma for fit in fits]),
+        level=np.array([fit.level for fit in fits]),
+        season=np.array([fit.season for fit in fits], dtype=float).reshape(-1, SEASON),
+        last_week=np.array([fit.last_week for fit in fits], dtype=float).reshape(-1, SEASON),
+        smoothing_sse=np.array([fit.smoothing_sse for fit in fits]),
+        naive_sse=np.array([fit.naive_sse for fit in fits]),
+        errors=np.array([fit.errors for fit in fits], dtype=float),
+    )
+
+
+def _method(smoothing_sse, naive_sse):
+    if smoothing_sse <= naive_sse:
+        return ForecastMethod.EXP_SMOOTHING
+    return ForecastMethod.SEASONAL_NAIVE
+
+
+def _write(fit, state, row, fitted_through, refreshed_at):
+    fit.alpha = float(state.alpha[row])
+    fit.gamma = float(state.gamma[row])
+    fit.level = float(state.level[row])
+    fit.season = [round(float(v), 4) for v in state.season[row]]
+    fit.last_week = [None if np.isnan(v) else float(v) for v in state.last_week[row]]
+    fit.smoothing_sse = float(state.smoothing_sse[row])
+    fit.naive_sse = float(state.naive_sse[row])
+    fit.errors = int(state.errors[row])
+    fit.method = _method(fit.smoothing_sse, fit.naive_sse)
+    fit.fitted_through = fitted_through
+    fit.refreshed_at = refreshed_at
+    return fit
+
+
+def _refit(kind, keys, first, last, refreshed_at):
+    """Fit the given series (all when keys is None) on their whole history"""
+    matrix = _matrix(kind, first, last)
+    rows = [i for i, key in enumerate(matrix.keys) if keys is None or key in keys]
+    if not rows:
+        return []
+    values = matrix.values[rows]
+    if kind == EXPENSES:
+        values = fill_expenses(values)
+    state, fitted = fit(values, matrix.start)
+    last_columns = _last_columns(values)
+    created = []
+    for row, key in enumerate(matrix.keys[i] for i in rows):
+        if fitted[row]:
+            fit_row = ForecastFit(branch_id=key[0], category_id=key[1])
+            created.append(_write(fit_row, state, row, matrix.date_at(last_columns[row]), refreshed_at))
+    return created
+
+
+def _update(kind, fits, last, refreshed_at):
+    """Step the stored fits through the days after each one's fitted_through"""
+    start = min(fit.fitted_through for fit in fits) + timedelta(days=1)
+    if start > last:
+        return []
+    matrix = _matrix(kind, start, last)
+    position = {key: i for i, key in enumerate(matrix.keys)}
+    values = np.full((len(fits), matrix.days), np.nan)
+    since = np.array([matrix.index_of(fit.fitted_through) for fit in fits])
+    for row, fit_row in enumerate(fits):
+        source = position.get((fit_row.branch_id, fit_row.category_id))
+        if source is not None:
+            values[row] = matrix.values[source]
+    # Days up to each fit's own fitted_through are already in its state
+    values[np.arange(matrix.days) <= since[:, None]] = np.nan
+    if kind == EXPENSES:
+        values = fill_expenses(values, since)
+
+    state = step(values, matrix.start, _state_of(fits))
+    last_columns = _last_columns(values)
+    updated = []
+    for row, fit_row in enumerate(fits):
+        if last_columns[row] > since[row]:
+            updated.append(_write(fit_row, state, row, matrix.date_at(last_columns[row]), refreshed_at))
+    return updated
+
+
+def _plan(kind, fits):
+    """
+    (keys to refit, fits to step forward); keys is None when everything
+    must be refitted. A series is refitted when it has no fit yet or a day
+    it was already fitted on changed after that fit's refresh
+    """
+    if not fits:
+        return None, []
+    refit = set()
+    oldest = min(fit.refreshed_at for fit in fits.values())
+    for key, day, updated in _changed_since(kind, oldest):
+        fit = fits.get(key)
+        if fit is None or (day <= fit.fitted_through and updated > fit.refreshed_at):
+            refit.add(key)
+    return refit, [fit for key, fit in fits.items() if key not in refit]
+
+
+def refresh(full=False):
+    """
+    Bring the forecast fits up to date with the latest daily data
+    Returns {'refitted': n, 'updated': n} over both series kinds
+    """
+    require_numpy()
+    refreshed_at = timezone.now()
+    counts = {'refitted': 0, 'updated': 0}
+    for kind in (REVENUE, EXPENSES):
+        first, last = _data_range(kind)
+        created, updated, refit = [], [], None
+        if first is not None:
+            refit, stale = _plan(kind, {} if full else _fits(kind))
+            if refit is None or refit:
+                created = _refit(kind, refit, first, last, refreshed_at)
+            if stale:
+                updated = _update(kind, stale, last, refreshed_at)
+
+        scope = ForecastFit.objects.filter(category__isnull=(kind == REVENUE))
+        with transaction.atomic():
+            if refit is None:
+                scope.delete()
+            for branch_id, category_id in refit or ():
+                scope.filter(branch_id=branch_id, category_id=category_id).delete()
+            ForecastFit.objects.bulk_create(created, batch_size=1000)
+            ForecastFit.objects.bulk_update(
+                updated,
+                ['method', 'level', 'season', 'last_week', 'smoothing_sse', 'naive_sse',
+                 'errors', 'fitted_through'],
+                batch_size=1000,
+            )
+            # Fits without new days are still current as of this refresh
+            scope.update(refreshed_at=refreshed_at)
+        metrics.record_inserts(ForecastFit, len(created))
+        counts['refitted'] += len(created)
+        counts['updated'] += len(updated)
+    logger.info('Forecast refresh: %(refitted)s refitted, %(updated)s updated', counts)
+    return counts
+
+
+# _queued: a refresh is submitted or running in this process; _again: one
+# was asked for while it ran. Two refreshes at once would delete and
+# re-insert the same fits (IntegrityError on unique_forecast_fit).
+_state = threading.Lock()
+_queued = False
+_again = False
+
+
+def _run_pending():
+    global _queued, _again
+    try:
+        while True:
+            with _state:
+                _again = False
+            refresh()
+            with _state:
+                if not _again:
+                    _queued = False
+                    return
+            # Ingested during the refresh: run once more for those rows
+    except BaseException:
+        with _state:
+            _queued = False
+        raise
+
+
+def _submit_refresh():
+    global _queued, _again
+    with _state:
+        if _queued:
+            _again = True
+            return
+        _queued = True
+    background.submit(_run_pending)
+
+
+def schedule_refresh():
+    """
+    Refresh in the background once the current transaction commits
+    At most one refresh is queued or running at a time; one requested
+    while it runs is coalesced into a single follow-up run
+    """
+    if np is None or not getattr(settings, 'FORECAST_REFRESH_ON_INGEST', True):
+        return
+    transaction.on_commit(_submit_refresh)
+
+
+# --- Prediction ---
+
+def predict(fits, start, horizon, level):
+    """
+    Forecasts of the given fits for start .. start + horizon - 1
+    Returns (point, sigma, z): point and sigma are (len(fits), horizon)
+    arrays, z is the normal quantile of the interval level
+    """
+    require_numpy()
+    state = _state_of(fits)
+    dates = [start + timedelta(days=i) for i in range(horizon)]
+    weekdays = np.array([day.weekday() for day in dates])
+    steps = np.array([[(day - fit.fitted_through).days for day in dates] for fit in fits], dtype=float)
+    steps = np.maximum(steps, 1).reshape(len(fits), horizon)
+    weeks = np.floor((steps - 1) / SEASON)
+
+    smoothing = np.array([fit.method == ForecastMethod.EXP_SMOOTHING for fit in fits])[:, None]
+    errors = np.maximum(state.errors, 1)
+    sse = np.where(smoothing[:, 0], state.smoothing_sse, state.naive_sse)
+    sigma = np.sqrt(sse / errors)[:, None]
+
+    alpha = state.alpha[:, None]
+    gamma = (state.gamma * (1 - state.alpha))[:, None]
+    smoothing_point = state.level[:, None] + state.season[:, weekdays]
+    naive_point = state.last_week[:, weekdays]
+    naive_point = np.where(np.isnan(naive_point), smoothing_point, naive_point)
+    smoothing_var = 1 + (steps - 1) * alpha ** 2 + weeks * gamma * (2 * alpha + gamma)
+    naive_var = weeks + 1
+
+    point = np.maximum(np.where(smoothing, smoothing_point, naive_point), 0)
+    sigma = sigma * np.sqrt(np.where(smoothing, smoothing_var, naive_var))
+    z = NormalDist().inv_cdf(0.5 + level / 2)
+    return point, sigma, z
+
+
+def combine(point, sigma, groups):
+    """
+    Add up the forecasts of groups of rows (e.g. every branch of a type)
+    Errors are taken as independent, so the variances add up
+    """
+    summed = np.stack([point[rows].sum(axis=0) for rows in groups])
+    spread = np.stack([np.sqrt((sigma[rows] ** 2).sum(axis=0)) for rows in groups])
+    return summed, spread
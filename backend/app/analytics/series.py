@@ -0,0 +1,87 @@
+"""
+Daily series as matrices
+
+Each loader runs one grouped query and scatters the rows into a float
+matrix of shape (series, days); days without a row are NaN, so "nothing
+reported" and "reported zero" stay distinguishable.
+"""
+from dataclasses import dataclass
+from datetime import date, timedelta
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import Sum
+
+from app.models import DailySummary, Transaction, TransactionType
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def require_numpy():
+    if np is None:
+        raise ImproperlyConfigured("numpy is required for analytics: pip install 'backend[analytics]'")
+
+
+@dataclass
+class DailyMatrix:
+    keys: list          # row keys: branch ids, or (branch id, category id)
+    start: date
+    values: object      # float64 ndarray, (len(keys), days), NaN where no data
+
+    @property
+    def days(self):
+        return self.values.shape[1]
+
+    def date_at(self, index):
+        return self.start + timedelta(days=int(index))
+
+    def index_of(self, day):
+        return (day - self.start).days
+
+
+def to_matrix(rows, start, end):
+    """(key, date, amount) rows -> DailyMatrix covering start..end inclusive"""
+    require_numpy()
+    rows = list(rows)
+    keys = sorted({key for key, _, _ in rows})
+    position = {key: i for i, key in enumerate(keys)}
+    values = np.full((len(keys), (end - start).days + 1), np.nan)
+    if rows:
+        count = len(rows)
+        row_index = np.fromiter((position[key] for key, _, _ in rows), dtype=np.intp, count=count)
+        day_index = np.fromiter(((day - start).days for _, day, _ in rows), dtype=np.intp, count=count)
+        amounts = np.fromiter((float(amount) for _, _, amount in rows), dtype=np.float64, count=count)
+        values[row_index, day_index] = amounts
+    return DailyMatrix(keys, start, values)
+
+
+def revenue(start, end):
+    """Net sales per branch and day from the daily summaries"""
+    rows = (
+        DailySummary.objects.filter(date__range=(start, end))
+        .order_by()
+        .values('branch_id', 'date')
+        .annotate(total=Sum('net_sales'))
+        .values_list('branch_id', 'date', 'total')
+    )
+    return to_matrix(rows, start, end)
+
+
+def expenses(start, end):
+    """Valid expense totals per (branch, category) and day"""
+    rows = (
+        Transaction.objects.filter(
+            date__range=(start, end),
+            transaction_type=TransactionType.EXPENSE,
+            is_valid=True,
+        )
+        .order_by()
+        .values('branch_id', 'category_id', 'date')
+        .annotate(total=Sum('amount'))
+        .values_list('branch_id', 'category_id', 'date', 'total')
+    )
+    return to_matrix(
+        (((branch, category), day, total) for branch, category, day, total in rows), start, end
+    )
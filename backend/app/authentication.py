@@ -0,0 +1,176 @@
+"""
+Cached token authentication
+
+DRF's TokenAuthentication joins Token and User on every request. Here the
+resolved token (with its user) is kept in two layers:
+
+- a small per-process LRU (AUTH_TOKEN_LRU_SIZE entries, AUTH_TOKEN_LRU_TTL
+  seconds) so hot clients cost nothing, not even a cache round-trip
+- the shared Django cache (AUTH_TOKEN_CACHE_TTL seconds) so other workers
+  pick it up after one miss
+
+Entries are keyed by a SHA-256 digest of the token key, never the key itself.
+They are evicted when a token is saved or deleted (rotation, dj-rest-auth
+logout), when its user is saved (deactivation, permission changes) and on
+logout (see app/signals.py). Other workers' LRUs only expire by TTL, which
+is why that layer is kept short.
+
+Optional signed access tokens (AUTH_SIGNED_TOKENS=True): POST
+/api/auth/access-token/ with a regular token returns a short-lived
+"Bearer" token signed with SECRET_KEY. It carries the user id and the
+token digest, so it dies with the token it was issued from and is verified
+without touching the database on a cache hit.
+"""
+import hashlib
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+CACHE_KEY = 'auth_token:{digest}'
+SIGNING_SALT = 'app.authentication.access-token'
+
+
+def token_digest(key):
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+class LocalLRU:
+    """Thread-safe bounded LRU with per-entry expiry, values stored pickled"""
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+        # Every request gets its own instances, never a shared user object
+        return pickle.loads(value)
+
+    def set(self, key, value, ttl, max_size):
+        if max_size <= 0 or ttl <= 0:
+            return
+        value = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+local_cache = LocalLRU()
+
+
+def get_cached(digest):
+    token = local_cache.get(digest)
+    if token is None:
+        token = cache.get(CACHE_KEY.format(digest=digest))
+        if token is not None:
+            _set_local(digest, token)
+    return token
+
+
+def set_cached(digest, token):
+    cache.set(CACHE_KEY.format(digest=digest), token, settings.AUTH_TOKEN_CACHE_TTL)
+    _set_local(digest, token)
+
+
+def _set_local(digest, token):
+    local_cache.set(digest, token, settings.AUTH_TOKEN_LRU_TTL, settings.AUTH_TOKEN_LRU_SIZE)
+
+
+def evict(key):
+    """Forget a token key, e.g. after it was deleted or its user changed"""
+    digest = token_digest(key)
+    local_cache.delete(digest)
+    cache.delete(CACHE_KEY.format(digest=digest))
+
+
+def evict_user(user_id):
+    from rest_framework.authtoken.models import Token
+    for key in Token.objects.filter(user_id=user_id).values_list('key', flat=True):
+        evict(key)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """Drop-in replacement for TokenAuthentication ("Authorization: Token <key>")"""
+
+    def authenticate_credentials(self, key):
+        digest = token_digest(key)
+        token = get_cached(digest)
+        if token is not None:
+            return token.user, token
+
+        user, token = super().authenticate_credentials(key)
+        set_cached(digest, token)
+        return user, token
+
+
+def issue_access_token(token):
+    """Signed, short-lived access token derived from a regular Token"""
+    payload = f'{token.user_id}.{token_digest(token.key)}'
+    return signing.TimestampSigner(salt=SIGNING_SALT).sign(payload)
+
+
+class SignedTokenAuthentication(CachedTokenAuthentication):
+    """
+    "Authorization: Bearer <access token>", only active with
+    AUTH_SIGNED_TOKENS=True
+    """
+
+    keyword = 'Bearer'
+
+    def authenticate(self, request):
+        if not settings.AUTH_SIGNED_TOKENS:
+            return None
+        return super().authenticate(request)
+
+    def authenticate_credentials(self, value):
+        try:
+            payload = signing.TimestampSigner(salt=SIGNING_SALT).unsign(
+                value, max_age=settings.AUTH_SIGNED_TOKEN_MAX_AGE
+            )
+            user_id, digest = payload.split('.', 1)
+        except signing.SignatureExpired:
+            raise exceptions.AuthenticationFailed(_('Access token expired.'))
+        except (signing.BadSignature, ValueError):
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+
+        token = get_cached(digest)
+        if token is None:
+            token = (
+                self.get_model().objects.select_related('user')
+                .filter(user_id=user_id).first()
+            )
+            # The token it was issued from has been rotated or deleted
+            if token is None or token_digest(token.key) != digest:
+                raise exceptions.AuthenticationFailed(_('Invalid token.'))
+            if not token.user.is_active:
+                raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+            set_cached(digest, token)
+        elif str(token.user_id) != user_id:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+        return token.user, token
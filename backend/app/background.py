@@ -0,0 +1,57 @@
+"""
+Lightweight in-process background runner
+Used for work that must not block the request/response cycle
+(image processing, bulk clean-ups, report rendering)
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def _get_executor():
+    """Get or create the shared thread pool"""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'BACKGROUND_TASK_WORKERS', 2),
+            thread_name_prefix='maknaflow-bg',
+        )
+    return _executor
+
+
+def _run(func, args, kwargs):
+    """
+    Execute a task in a worker thread
+    Each thread owns its DB connection, so close stale ones before and after
+    """
+    close_old_connections()
+    try:
+        func(*args, **kwargs)
+    except Exception:
+        logger.exception("Background task %s failed", getattr(func, '__name__', func))
+    finally:
+        close_old_connections()
+
+
+def submit(func, *args, **kwargs):
+    """
+    Run func in the background immediately
+    With BACKGROUND_TASKS_SYNC=True (tests, management commands) it runs inline
+    """
+    if getattr(settings, 'BACKGROUND_TASKS_SYNC', False):
+        return func(*args, **kwargs)
+    return _get_executor().submit(_run, func, args, kwargs)
+
+
+def submit_on_commit(func, *args, **kwargs):
+    """
+    Schedule func once the current DB transaction commits,
+    so the worker always sees the committed rows
+    """
+    transaction.on_commit(lambda: submit(func, *args, **kwargs))
@@ -0,0 +1,11 @@
+"""
+Performance benchmarks
+
+datagen.py  - synthetic branches, staff and years of transactions at a chosen scale
+api.py      - drives every REST endpoint and webhook, records query counts,
+              p50/p95 latency and peak memory, compares against baselines/api.json
+parsers.py  - parser throughput on a generated corpus, fuzzing, baselines/parsers.json
+logs.py     - per-request logging overhead, eager vs structured
+
+Run with: python manage.py benchmark_api / benchmark_parsers / benchmark_logging
+"""
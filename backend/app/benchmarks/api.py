@@ -0,0 +1,279 @@
+"""
+REST endpoint benchmark
+
+Every router endpoint, bot endpoint and ingestion webhook is requested
+against a generated dataset. Each endpoint gets:
+- one warm-up request (not recorded)
+- N timed requests with no instrumentation -> p50/p95 latency
+- one instrumented request -> query count and tracemalloc peak memory,
+  then the endpoint's check, if any: a benchmark of a request that did not
+  do its work (e.g. a report filed under a new branch) measures nothing
+
+Query counts exclude SAVEPOINT statements so numbers recorded in a test
+transaction match the ones recorded by the management command.
+"""
+import json
+import statistics
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass, field
+from datetime import timedelta
+from pathlib import Path
+
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.test import APIClient
+
+from app.models import Branch, Transaction, TransactionSource
+
+from .datagen import END_DATE, INCOME_CATEGORIES, luna_report_html
+
+BASELINE_PATH = Path(__file__).resolve().parent / 'baselines' / 'api.json'
+DEFAULT_THRESHOLD = 0.25
+
+# Latency/memory differences below these are noise, whatever the percentage
+MIN_LATENCY_DELTA_MS = 2.0
+MIN_MEMORY_DELTA_KIB = 64
+
+BENCH_API_KEY = 'benchmark-ingestion-key'
+TRANSACTION_CONTROL = ('SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT')
+
+
+@dataclass
+class Endpoint:
+    name: str
+    method: str
+    path: str
+    auth: str = 'owner'          # 'owner', 'staff' or None
+    body: object = None          # dict, or callable(iteration) -> dict
+    headers: dict = field(default_factory=dict)
+    check: object = None         # callable(response) -> problem description or None
+
+
+@dataclass
+class Result:
+    status: int
+    queries: int
+    p50_ms: float
+    p95_ms: float
+    peak_kib: float
+    iterations: int
+
+
+def build_endpoints(dataset):
+    branch = dataset.branches[0]
+    transaction = branch.transactions.order_by('pk').first()
+    income = next(c for c in dataset.categories if c.name == INCOME_CATEGORIES[0])
+    staff = dataset.staff[0]
+    staff_phone = staff.phone_numbers.first().phone_number
+    webhook_headers = {'HTTP_X_API_KEY': BENCH_API_KEY}
+    month_start = (END_DATE - timedelta(days=30)).isoformat()
+
+    def new_transaction(i):
+        return {
+            'branch': branch.pk, 'category': income.pk, 'date': END_DATE.isoformat(),
+            'amount': str(1_000_000 + i), 'transaction_type': income.transaction_type,
+            'source': 'MANUAL', 'source_identifier': 'benchmark', 'description': 'Benchmark',
+        }
+
+    sent = {}
+
+    def luna_email(i):
+        day = END_DATE + timedelta(days=i + 1)
+        sent['day'] = day
+        products = [(name, 3 + n, (n + 1) * 15_000) for n, name in enumerate(INCOME_CATEGORIES)]
+        return {
+            'sender': 'report@lunapos.id',
+            'subject': 'Fwd: Daily Summary Report',
+            'html_body': luna_report_html(branch.name, day, products),
+        }
+
+    def luna_email_ingested(response):
+        """The last report is filed under the dataset's branch and day, one transaction per product"""
+        if response.status_code != 200:
+            return f'status {response.status_code}'
+        if Branch.objects.count() != len(dataset.branches):
+            return 'the report created a new branch'
+        created = Transaction.objects.filter(branch=branch, date=sent['day'], source=TransactionSource.EMAIL).count()
+        if created != len(INCOME_CATEGORIES):
+            return f'{created} transaction(s) for {branch.name} on {sent["day"]}, expected {len(INCOME_CATEGORIES)}'
+        return None
+
+    return [
+        Endpoint('branch-list', 'get', '/api/branches/'),
+        Endpoint('branch-detail', 'get', f'/api/branches/{branch.pk}/'),
+        Endpoint('category-list', 'get', '/api/categories/'),
+        Endpoint('transaction-list', 'get', '/api/transactions/'),
+        Endpoint('transaction-list-staff', 'get', '/api/transactions/', auth='staff'),
+        Endpoint('transaction-list-filtered', 'get',
+                 f'/api/transactions/?branch={branch.pk}&transaction_type=INCOME&ordering=-amount'),
+        Endpoint('transaction-search', 'get', '/api/transactions/?q=cuci'),
+        Endpoint('transaction-detail', 'get', f'/api/transactions/{transaction.pk}/'),
+        Endpoint('transaction-pending', 'get', '/api/transactions/pending/'),
+        Endpoint('transaction-create', 'post', '/api/transactions/', body=new_transaction),
+        Endpoint('user-list', 'get', '/api/users/'),
+        Endpoint('user-profile', 'get', '/api/users/profile/', auth='staff'),
+        Endpoint('ingestionlog-list', 'get', '/api/ingestion-logs/'),
+        Endpoint('dailysummary-list', 'get', '/api/daily-summaries/'),
+        Endpoint('dailysummary-list-staff', 'get', '/api/daily-summaries/', auth='staff'),
+        Endpoint('dailysummary-payment-breakdown', 'get',
+                 f'/api/daily-summaries/payment_breakdown/?start_date={month_start}'),
+        Endpoint('anomaly-list', 'get', '/api/anomalies/'),
+        Endpoint('anomaly-list-staff', 'get', '/api/anomalies/', auth='staff'),
+        Endpoint('forecast', 'get', '/api/analytics/forecast/'),
+        Endpoint('forecast-branch-type', 'get', '/api/analytics/forecast/?group_by=branch_type&horizon=30'),
+        Endpoint('digest-list', 'get', '/api/digests/'),
+        Endpoint('bot-master-data', 'get', '/api/bot/master-data/', auth=None),
+        Endpoint('bot-staff-list', 'get', '/api/bot/staff-list/', auth=None),
+        Endpoint('webhook-email', 'post', '/webhooks/make/', auth=None, body=luna_email,
+                 headers=webhook_headers, check=luna_email_ingested),
+        Endpoint('webhook-whatsapp', 'post', '/webhooks/whatsapp/', auth=None, headers=webhook_headers,
+                 body={'branch_id': branch.pk, 'phone_number': staff_phone, 'message': 'Beli detergen 50rb'}),
+        Endpoint('ingestion-internal-wa', 'post', '/api/ingestion/internal-wa/', auth=None,
+                 body=lambda i: {'phone_number': staff_phone, 'branch_id': branch.pk, 'category_id': income.pk,
+                                 'type': 'INCOME', 'amount': 20_000 + i, 'notes': 'Benchmark'}),
+        Endpoint('health', 'get', '/health/', auth=None),
+    ]
+
+
+def _percentile(samples, pct):
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def _counted_queries(captured):
+    return sum(1 for q in captured.captured_queries if not q['sql'].startswith(TRANSACTION_CONTROL))
+
+
+def run(dataset, iterations=20, only=None):
+    """
+    Benchmark every endpoint against dataset, returns {name: Result};
+    raises ValueError when an endpoint's check fails
+    """
+    tokens = {'owner': dataset.token(dataset.owner), 'staff': dataset.token(dataset.staff[0])}
+    results = {}
+
+    # Forecast refreshes after each ingested report would run in background
+    # threads alongside the measured requests. The per-process token LRU
+    # outlives the run: with its 10s default it expired inside slow
+    # endpoints and the token lookup showed up as one extra query
+    with override_settings(INGESTION_API_KEY=BENCH_API_KEY, SECURE_SSL_REDIRECT=False,
+                           FORECAST_REFRESH_ON_INGEST=False, AUTH_TOKEN_LRU_TTL=3600):
+        client = APIClient(raise_request_exception=False)
+        counter = 0
+
+        for endpoint in build_endpoints(dataset):
+            if only and endpoint.name not in only:
+                continue
+
+            # Start every endpoint with empty throttle buckets
+            cache.clear()
+            headers = dict(endpoint.headers)
+            if endpoint.auth:
+                headers['HTTP_AUTHORIZATION'] = f'Token {tokens[endpoint.auth]}'
+
+            def request():
+                nonlocal counter
+                counter += 1
+                if endpoint.method == 'get':
+                    return client.get(endpoint.path, **headers)
+                body = endpoint.body(counter) if callable(endpoint.body) else endpoint.body
+                return client.post(endpoint.path, body, format='json', **headers)
+
+            request()
+
+            samples = []
+            for _ in range(iterations):
+                started = time.perf_counter()
+                request()
+                samples.append((time.perf_counter() - started) * 1000)
+
+            tracemalloc.start()
+            try:
+                with CaptureQueriesContext(connection) as captured:
+                    response = request()
+                _, peak = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+
+            problem = endpoint.check(response) if endpoint.check else None
+            if problem:
+                raise ValueError(f'{endpoint.name}: {problem}')
+
+            results[endpoint.name] = Result(
+                status=response.status_code,
+                queries=_counted_queries(captured),
+                p50_ms=round(statistics.median(samples), 2) if samples else 0.0,
+                p95_ms=round(_percentile(samples, 95), 2) if samples else 0.0,
+                peak_kib=round(peak / 1024, 1),
+                iterations=iterations,
+            )
+    return results
+
+
+# ==========================================
+# BASELINE
+# ==========================================
+
+def load_baseline(path=BASELINE_PATH):
+    with open(path) as fh:
+        return json.load(fh)
+
+
+def write_baseline(results, scale, path=BASELINE_PATH, merge=False):
+    """
+    Record results as the baseline; refuses server errors, which would
+    otherwise become the expected status. With merge=True only the given
+    endpoints' entries are replaced and the others are kept as they are
+    """
+    errors = sorted(name for name, result in results.items() if result.status >= 500)
+    if errors:
+        raise ValueError(f"Not recording a baseline with server errors: {', '.join(errors)}")
+    endpoints = {name: asdict(result) for name, result in results.items()}
+    if merge:
+        existing = load_baseline(path)
+        if existing.get('scale') != scale:
+            raise ValueError(f"Baseline was recorded at scale '{existing.get('scale')}', not '{scale}'")
+        endpoints = {**existing['endpoints'], **endpoints}
+    data = {
+        'scale': scale,
+        'vendor': connection.vendor,
+        'endpoints': dict(sorted(endpoints.items())),
+    }
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(data, indent=2) + '\n')
+    return data
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD, check_latency=True, check_memory=True):
+    """
+    Return a list of human readable regressions
+    - any server error, any change of status code, or any extra query, is
+      a regression
+    - p95 latency and peak memory may grow by `threshold` (fraction) before
+      they count, and never for differences below the noise floor
+    """
+    regressions = []
+    expected = baseline.get('endpoints', {})
+    for name, result in results.items():
+        if result.status >= 500:
+            regressions.append(f"{name}: server error {result.status}")
+        base = expected.get(name)
+        if base is None:
+            continue
+        if result.status != base['status'] and result.status < 500:
+            regressions.append(f"{name}: status {base['status']} -> {result.status}")
+        if result.queries > base['queries']:
+            regressions.append(f"{name}: queries {base['queries']} -> {result.queries}")
+        if check_latency:
+            limit = base['p95_ms'] * (1 + threshold)
+            if result.p95_ms > limit and result.p95_ms - base['p95_ms'] > MIN_LATENCY_DELTA_MS:
+                regressions.append(f"{name}: p95 {base['p95_ms']}ms -> {result.p95_ms}ms")
+        if check_memory:
+            limit = base['peak_kib'] * (1 + threshold)
+            if result.peak_kib > limit and result.peak_kib - base['peak_kib'] > MIN_MEMORY_DELTA_KIB:
+                regressions.append(f"{name}: peak memory {base['peak_kib']}KiB -> {result.peak_kib}KiB")
+    return regressions
@@ -0,0 +1,222 @@
+"""
+Synthetic data generator for the benchmarks
+
+Everything is written with bulk_create so even the 'large' scale builds in
+seconds, and a fixed seed keeps row contents (and therefore query counts)
+identical between runs.
+"""
+import random
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from rest_framework.authtoken.models import Token
+
+from app import search
+from app.analytics import forecast
+from app.models import (
+    Branch, BranchType, Category, DailySummary, IngestionLog, IngestionStatus,
+    PaymentMethod, Transaction, TransactionSource, TransactionType, User,
+    UserBranchAssignment, UserPhoneNumber,
+)
+
+# Rows per scale; 'small' is the one the checked-in baseline is recorded at
+SCALES = {
+    'tiny': dict(branches=2, staff_per_branch=1, days=14, transactions_per_day=3),
+    'small': dict(branches=3, staff_per_branch=2, days=60, transactions_per_day=4),
+    'medium': dict(branches=8, staff_per_branch=4, days=365, transactions_per_day=10),
+    'large': dict(branches=20, staff_per_branch=6, days=3 * 365, transactions_per_day=25),
+}
+
+# Last day of generated data; fixed so runs do not drift with the calendar
+END_DATE = date(2025, 12, 31)
+
+INCOME_CATEGORIES = [
+    'Cuci Kering Lipat', 'Cuci Setrika', 'Setrika Saja', 'Bed Cover', 'Selimut',
+    'Sepatu', 'Karpet', 'Cuci Express', 'Boneka', 'Jas',
+]
+EXPENSE_CATEGORIES = [
+    'Detergen', 'Pewangi', 'Listrik', 'Air PDAM', 'Gas LPG', 'Plastik Packing',
+    'Gaji Karyawan', 'Perbaikan Mesin',
+]
+BRANCH_TYPES = [BranchType.LAUNDRY, BranchType.CARWASH, BranchType.KOS, BranchType.OTHER]
+
+BENCH_PASSWORD = 'benchmark'
+
+
+@dataclass
+class Dataset:
+    owner: User
+    staff: list
+    branches: list
+    categories: list
+    counts: dict = field(default_factory=dict)
+
+    def token(self, user):
+        return Token.objects.get_or_create(user=user)[0].key
+
+
+def generate(branches, staff_per_branch, days, transactions_per_day, seed=0):
+    """Populate the current database and return a Dataset describing it"""
+    rng = random.Random(seed)
+    password = make_password(BENCH_PASSWORD)
+
+    owner = User.objects.create(
+        username='bench-owner', email='owner@bench.local', password=password,
+        is_superuser=True, is_staff=True, is_verified=True,
+    )
+
+    branch_objs = Branch.objects.bulk_create([
+        Branch(
+            name=f'Bosku Cabang {i + 1:02d}',
+            branch_type=BRANCH_TYPES[i % len(BRANCH_TYPES)],
+            address=f'Jl. Benchmark No. {i + 1}',
+        )
+        for i in range(branches)
+    ])
+
+    categories = Category.objects.bulk_create(
+        [Category(name=name, transaction_type=TransactionType.INCOME) for name in INCOME_CATEGORIES]
+        + [Category(name=name, transaction_type=TransactionType.EXPENSE) for name in EXPENSE_CATEGORIES]
+    )
+    Category.branches.through.objects.bulk_create([
+        Category.branches.through(category_id=category.pk, branch_id=branch.pk)
+        for category in categories for branch in branch_objs
+    ])
+
+    staff = User.objects.bulk_create([
+        User(
+            username=f'bench-staff-{b + 1:02d}-{s + 1}',
+            email=f'staff{b + 1:02d}{s + 1}@bench.local',
+            password=password,
+            is_verified=(s % 2 == 0),
+        )
+        for b in range(branches) for s in range(staff_per_branch)
+    ])
+    staff_branch = {user.pk: branch_objs[i // staff_per_branch] for i, user in enumerate(staff)}
+    staff_phone = {user.pk: f'62812{user.pk:07d}' for user in staff}
+    UserBranchAssignment.objects.bulk_create([
+        UserBranchAssignment(user=user, branch=staff_branch[user.pk]) for user in staff
+    ])
+    UserPhoneNumber.objects.bulk_create([
+        UserPhoneNumber(user=user, phone_number=staff_phone[user.pk]) for user in staff
+    ])
+
+    staff_by_branch = {}
+    for user in staff:
+        staff_by_branch.setdefault(staff_branch[user.pk].pk, []).append(user)
+
+    income = [c for c in categories if c.transaction_type == TransactionType.INCOME]
+    expense = [c for c in categories if c.transaction_type == TransactionType.EXPENSE]
+    start = END_DATE - timedelta(days=days - 1)
+
+    transactions, summaries, logs = [], [], []
+    seen = set()
+    for offset in range(days):
+        day = start + timedelta(days=offset)
+        for branch in branch_objs:
+            reporters = staff_by_branch.get(branch.pk) or [None]
+            for _ in range(transactions_per_day):
+                is_income = rng.random() < 0.7
+                category = rng.choice(income if is_income else expense)
+                amount = Decimal(rng.randrange(5, 400) * 1000)
+                reporter = rng.choice(reporters)
+                source = rng.choice([TransactionSource.WHATSAPP, TransactionSource.MANUAL, TransactionSource.EMAIL])
+                identifier = staff_phone.get(getattr(reporter, 'pk', None), '') if source == TransactionSource.WHATSAPP else ''
+                key = (branch.pk, day, amount, category.pk, source, identifier)
+                if key in seen:
+                    continue
+                seen.add(key)
+                transactions.append(Transaction(
+                    branch=branch,
+                    reported_by=reporter,
+                    is_verified=rng.random() < 0.8,
+                    amount=amount,
+                    transaction_type=category.transaction_type,
+                    category=category,
+                    date=day,
+                    description=f'{category.name} {rng.choice(["pelanggan", "reguler", "member", "antar jemput"])}',
+                    payment_method=rng.choice(PaymentMethod.values),
+                    source=source,
+                    source_identifier=identifier,
+                ))
+
+            cash, qris, transfer = (rng.randrange(100, 3000) * 1000 for _ in range(3))
+            summaries.append(DailySummary(
+                branch=branch, date=day, source=TransactionSource.EMAIL,
+                gross_sales=cash + qris + transfer, net_sales=cash + qris + transfer,
+                total_collected=cash + qris + transfer,
+                cash_amount=cash, qris_amount=qris, transfer_amount=transfer,
+                raw_data={'metadata': {'location': branch.name, 'date': day.isoformat()}},
+            ))
+            logs.append(IngestionLog(
+                source=TransactionSource.EMAIL,
+                raw_payload={
+                    'sender': 'report@lunapos.id',
+                    'subject': f'Fwd: Daily Summary Report {branch.name}',
+                    'text_body': f'Laundry Bosku | {branch.name}',
+                },
+                status=IngestionStatus.SUCCESS if rng.random() < 0.95 else IngestionStatus.FAILED,
+            ))
+
+    transactions = Transaction.objects.bulk_create(transactions, batch_size=1000)
+    DailySummary.objects.bulk_create(summaries, batch_size=1000)
+    IngestionLog.objects.bulk_create(logs, batch_size=1000)
+    # bulk_create skips the post_save signal that keeps the search index current
+    search.reindex([trx.pk for trx in transactions])
+    # Fitted series for the forecast endpoint (bulk_create skips the refresh signal too)
+    if forecast.np is not None:
+        forecast.refresh(full=True)
+
+    return Dataset(
+        owner=owner,
+        staff=staff,
+        branches=branch_objs,
+        categories=categories,
+        counts={
+            'branches': len(branch_objs),
+            'staff': len(staff),
+            'transactions': len(transactions),
+            'daily_summaries': len(summaries),
+            'ingestion_logs': len(logs),
+        },
+    )
+
+
+def generate_scale(scale, seed=0):
+    if scale not in SCALES:
+        raise ValueError(f"Unknown scale '{scale}', expected one of {', '.join(SCALES)}")
+    return generate(seed=seed, **SCALES[scale])
+
+
+def rupiah(amount):
+    """12345 -> 'Rp. 12.345' (the format Luna and Hitachi print)"""
+    return 'Rp. ' + f'{int(amount):,}'.replace(',', '.')
+
+
+def luna_report_html(location, day, products):
+    """
+    A Luna POS 'Daily Summary Report' email body as SendGrid forwards it,
+    one element per line (the location and date are read line by line)
+    products: list of (name, count, amount)
+    """
+    total = sum(amount for _, _, amount in products)
+    return '\n'.join([
+        '<html><body>',
+        f'<p>Laundry Bosku | {location}</p>',
+        f'<p>{day.strftime("%A, %B %d, %Y")}</p>',
+        '<p>Luna POS Daily Summary Report</p>',
+        '<table>',
+        f'<tr><td>Total Sales</td><td>{rupiah(total)}</td></tr>',
+        f'<tr><td>Total Discount</td><td>{rupiah(0)}</td></tr>',
+        f'<tr><td>Total Tax</td><td>{rupiah(0)}</td></tr>',
+        f'<tr><td>Total</td><td>{rupiah(total)}</td></tr>',
+        f'<tr><td>Number of Invoices</td><td>{len(products)}</td></tr>',
+        f'<tr><td>Cash</td><td>{rupiah(total)}</td></tr>',
+        '</table>',
+        '<table>',
+        *(f'<tr><td>{name}</td><td>{count}</td><td>{rupiah(amount)}</td></tr>' for name, count, amount in products),
+        '</table>',
+        '</body></html>',
+    ])
@@ -0,0 +1,128 @@
+"""
+Logging overhead per request
+
+Replays the logging of one WhatsApp bot ingestion request twice:
+- eager: the calls InternalWhatsAppIngestion.post used to make, about twenty
+  f-string INFO lines including banners, written synchronously by a
+  StreamHandler
+- structured: the calls it makes now, a lazy DEBUG line (dropped at INFO)
+  and one INFO summary, through app.log's ContextFilter and QueueHandler
+
+Only the time spent in the request thread is measured; formatting and
+writing happen on the listener thread for the structured setup. Both write
+to os.devnull.
+"""
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import time
+from dataclasses import dataclass
+
+from app import log
+
+PAYLOAD = {
+    'phone_number': '6281234567890',
+    'branch_id': 3,
+    'category_id': 7,
+    'type': 'INCOME',
+    'amount': 125000,
+    'notes': 'Cuci kiloan 5kg, setrika',
+}
+
+
+@dataclass
+class Measurement:
+    eager_us: float
+    structured_us: float
+    structured_sampled_us: float
+    sample_rate: float
+
+    @property
+    def saved_us(self):
+        return round(self.eager_us - self.structured_us, 2)
+
+
+def _eager(logger, data):
+    amount = int(data['amount'])
+    logger.info("=" * 80)
+    logger.info("📥 WhatsApp Bot Internal Ingestion")
+    logger.info(f"Payload received: {data}")
+    logger.info("=" * 80)
+    logger.info(f"📞 Mencari user dengan phone_number: {data['phone_number']}")
+    logger.info(f"✅ User ditemukan: staff (ID: {42})")
+    logger.info(f"✅ Staff verified - Assigned to branch IDs: {[data['branch_id']]}")
+    logger.info(f"🏢 Mencari Branch dengan ID: {data['branch_id']}")
+    logger.info("✅ Branch ditemukan: Cabang Tlogosari (Laundry)")
+    logger.info(f"📂 Mencari Category dengan ID: {data['category_id']}")
+    logger.info("✅ Category ditemukan: Cuci Kiloan (INCOME)")
+    logger.info(f"💰 Amount: Rp {amount:,}")
+    logger.info(f"📊 Transaction Type: {data['type']}")
+    logger.info(f"📝 Notes: {data['notes']}")
+    logger.info("📝 Creating ingestion log...")
+    logger.info(f"✅ Ingestion log created: ID={1001}")
+    logger.info("💾 Creating transaction record...")
+    logger.info(f"✅ Transaction created successfully: ID={5001}")
+    logger.info("   Branch: Cabang Tlogosari")
+    logger.info(f"   Amount: Rp {amount:,}")
+    logger.info(f"   Type: {data['type']}")
+    logger.info("   Category: Cuci Kiloan")
+    logger.info(f"   Verified: {True}")
+    logger.info("=" * 80)
+
+
+def _structured(logger, data):
+    log.bind(source='WHATSAPP')
+    logger.debug("WhatsApp bot ingestion payload: %s", data)
+    log.bind(branch=data['branch_id'])
+    logger.info(
+        "WhatsApp transaction %s created: user=%s amount=%s type=%s category=%s verified=%s",
+        5001, 42, int(data['amount']), data['type'], 'Cuci Kiloan', True,
+    )
+
+
+def _logger(name, handler):
+    logger = logging.getLogger(f'benchmark.logging.{name}')
+    logger.handlers = [handler]
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    return logger
+
+
+def _per_request_us(func, logger, requests, sample_rate=1.0):
+    rng = random.Random(0)
+    started = time.perf_counter()
+    for i in range(requests):
+        token = log._context.set({'request_id': str(i), 'sampled': rng.random() < sample_rate})
+        try:
+            func(logger, PAYLOAD)
+        finally:
+            log._context.reset(token)
+    return round((time.perf_counter() - started) / requests * 1e6, 2)
+
+
+def measure(requests=2000, sample_rate=0.1):
+    with open(os.devnull, 'w') as sink:
+        eager_handler = logging.StreamHandler(sink)
+        eager_handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s %(message)s'))
+        eager = _logger('eager', eager_handler)
+
+        console = logging.StreamHandler(sink)
+        console.setFormatter(log.JsonFormatter())
+        records = queue.SimpleQueue()
+        queue_handler = log.QueueHandler(records)
+        queue_handler.addFilter(log.ContextFilter())
+        listener = logging.handlers.QueueListener(records, console)
+        listener.start()
+        structured = _logger('structured', queue_handler)
+        try:
+            result = Measurement(
+                eager_us=_per_request_us(_eager, eager, requests),
+                structured_us=_per_request_us(_structured, structured, requests),
+                structured_sampled_us=_per_request_us(_structured, structured, requests, sample_rate),
+                sample_rate=sample_rate,
+            )
+        finally:
+            listener.stop()
+    return result
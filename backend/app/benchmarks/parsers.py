@@ -0,0 +1,397 @@
+"""
+Parser benchmark and fuzz harness
+
+Corpora are generated, not checked in: realistic Luna (plain text and
+SendGrid HTML), Hitachi (plain text and HTML) and WhatsApp messages with
+long product lists, markup variants and odd encodings.
+
+- measure() reports emails/second and peak traced KiB per email
+- measure_labels() times the Luna summary-label lookup, compiled
+  alternation vs the per-label startswith scan it replaced
+- fuzz() mutates corpus samples and reports every input that raises or
+  takes longer than the time budget. Inputs are capped at MAX_FUZZ_CHARS
+  so even quadratic regex behaviour finishes and is reported as slow
+  instead of hanging the run.
+"""
+import json
+import random
+import statistics
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass
+from datetime import timedelta
+from pathlib import Path
+
+from app.ingestion.hitachi_parser import parse_hitachi_email
+from app.ingestion import luna_parser
+from app.ingestion.luna_parser import parse_luna_email
+from app.ingestion.luna_parser_sendgrid import parse_luna_email_refined
+from app.integrations.whatsapp_parser import WhatsAppMessageParser
+
+from .datagen import END_DATE, EXPENSE_CATEGORIES, INCOME_CATEGORIES, luna_report_html, rupiah
+
+BASELINE_PATH = Path(__file__).resolve().parent / 'baselines' / 'parsers.json'
+DEFAULT_THRESHOLD = 0.25
+DEFAULT_TIME_BUDGET_MS = 250
+MAX_FUZZ_CHARS = 100_000
+
+PARSERS = {
+    'luna': parse_luna_email,
+    'luna_refined': lambda body: parse_luna_email_refined(body, is_html=True),
+    'hitachi': parse_hitachi_email,
+    'whatsapp': WhatsAppMessageParser.parse_transaction_message,
+}
+
+PRODUCT_WORDS = INCOME_CATEGORIES + [
+    'Cuci Kiloan Reguler 3 Hari', 'Paket Hemat 5kg', 'Setrika Uap Premium',
+    'Dry Clean Kebaya', 'Cuci Helm', 'Sprei King Size', 'Gorden / Vitrase', 'Tas & Ransel',
+]
+LOCATIONS = ['Laundry Bosku Babelan', 'Laundry Bosku Dago', 'Laundry Bosku Cibubur', 'Laundry Bosku Bekasi Timur']
+
+
+@dataclass
+class Measurement:
+    samples: int
+    emails_per_sec: float
+    mean_ms: float
+    p95_ms: float
+    peak_kib_per_email: float
+
+
+@dataclass
+class FuzzFailure:
+    parser: str
+    kind: str         # 'exception' or 'slow'
+    detail: str
+    elapsed_ms: float
+    sample: str       # truncated repr of the offending input
+
+
+# ==========================================
+# CORPUS
+# ==========================================
+
+def _products(rng, count):
+    return [
+        (rng.choice(PRODUCT_WORDS) + (f' #{n}' if n >= len(PRODUCT_WORDS) else ''),
+         rng.randint(1, 60), rng.randrange(5, 2_000) * 1000)
+        for n in range(count)
+    ]
+
+
+def luna_text_email(rng, product_count):
+    day = END_DATE - timedelta(days=rng.randint(0, 365))
+    products = _products(rng, product_count)
+    total = sum(amount for _, _, amount in products)
+    cash = total * rng.randint(20, 80) // 100
+    lines = [
+        'Daily Report Luna POS',
+        rng.choice(LOCATIONS),
+        day.strftime('%A, %B %d, %Y'),
+        f'Total Sales {rupiah(total)}',
+        f'Total Discount {rupiah(0)}',
+        f'Total Service Charge {rupiah(0)}',
+        f'Total Tax {rupiah(total // 11)}',
+        f'Total Adjustment {rupiah(0)}',
+        f'Total {rupiah(total)}',
+        f'Number of Invoices {len(products)}',
+        f'Average Bill per Invoice {rupiah(total // max(len(products), 1))}',
+        'Month to Date',
+        f'Month to Date Sales {rupiah(total * 20)}',
+        f'Average Sales per Day {rupiah(total)}',
+        'Pax',
+        f'Pax {len(products) * 2}',
+        f'Average Bill per Pax {rupiah(total // max(len(products) * 2, 1))}',
+        'Payments',
+        f'Cash {rupiah(cash)}',
+        f'Luna One QRIS {rupiah(total - cash)}',
+        f'Total {rupiah(total)}',
+        'Sales Types',
+        f'Normal {rupiah(total)}',
+        f'Total {rupiah(total)}',
+        'Top 20 Categories',
+        *(f'{name.split()[0].upper()} {count} {rupiah(amount)}' for name, count, amount in products[:20]),
+        'Top 20 Products',
+        *(f'{name} {count} {rupiah(amount)}' for name, count, amount in products),
+    ]
+    separator = rng.choice(['\n', '\r\n', '\n\n'])
+    indent = rng.choice(['', '    ', '\t'])
+    return separator.join(indent + line for line in lines)
+
+
+def luna_html_email(rng, product_count):
+    day = END_DATE - timedelta(days=rng.randint(0, 365))
+    html = luna_report_html(rng.choice(LOCATIONS), day, _products(rng, product_count))
+    variant = rng.randrange(4)
+    if variant == 1:
+        # Outlook-style wrapping: every cell wrapped in spans and non-breaking spaces
+        html = html.replace('<td>', '<td><span style="font-family:Arial">&nbsp;').replace('</td>', '</span></td>')
+    elif variant == 2:
+        html = html.upper().replace('RP.', 'Rp.')
+    elif variant == 3:
+        # Quoted-printable artefacts left behind by a forwarding client
+        html = html.replace('<table>', '<table =\r\nborder=3D"0">')
+    return html
+
+
+def hitachi_email(rng, item_count, html=False):
+    day = END_DATE - timedelta(days=rng.randint(0, 365))
+    items = _products(rng, item_count)
+    gross = sum(amount for _, _, amount in items)
+    lines = [
+        'Merchant Statement',
+        f'Daily Sales Summary for {day.isoformat()}',
+        rng.choice(LOCATIONS),
+        'Sales Summary',
+        f'*Gross Sales* Rp {rupiah(gross)[4:]}',
+        f'*Discount* Rp {rupiah(0)[4:]}',
+        f'*Net Sales* Rp {rupiah(gross)[4:]}',
+        f'*Tax* Rp {rupiah(gross // 11)[4:]}',
+        f'*Total Collected* Rp {rupiah(gross)[4:]}',
+        'Top Items',
+        'Item Name Sales Item Sold',
+        *(f'{name} Rp {rupiah(amount)[4:]} {count}' for name, count, amount in items),
+        'View All Reports',
+        'Best Regards',
+    ]
+    if html:
+        return '<html><body>' + ''.join(f'<div><p>{line}</p></div>' for line in lines) + '</body></html>'
+    return '\n'.join(lines)
+
+
+def whatsapp_message(rng):
+    keyword = rng.choice(WhatsAppMessageParser.INCOME_KEYWORDS + WhatsAppMessageParser.EXPENSE_KEYWORDS)
+    amount = rng.choice([str(rng.randrange(1, 5_000) * 1000), f'{rng.randrange(1, 999)}.000', f'{rng.randrange(1, 999)},50'])
+    words = ' '.join(rng.choice(PRODUCT_WORDS + EXPENSE_CATEGORIES) for _ in range(rng.randint(0, 6)))
+    return rng.choice(['{k} {a} {w}', '{k}{a} {w}', '  {k}   {a}   {w}  ', '{k} Rp {a} {w}']).format(k=keyword.lower(), a=amount, w=words)
+
+
+def build_corpus(size=200, seed=0, max_products=300):
+    """
+    {parser_name: [input, ...]} with `size` inputs per parser
+    Product lists range from a handful to `max_products` lines
+    """
+    rng = random.Random(seed)
+
+    def count():
+        return rng.choice([3, 10, 20, 50, rng.randint(1, max_products)])
+
+    return {
+        'luna': [luna_text_email(rng, count()) for _ in range(size)],
+        'luna_refined': [luna_html_email(rng, count()) for _ in range(size)],
+        'hitachi': [hitachi_email(rng, count(), html=rng.random() < 0.5) for _ in range(size)],
+        'whatsapp': [whatsapp_message(rng) for _ in range(size)],
+    }
+
+
+# ==========================================
+# THROUGHPUT
+# ==========================================
+
+def measure(parser, inputs):
+    """Time every input, then replay a sample under tracemalloc for memory"""
+    timings = []
+    started = time.perf_counter()
+    for body in inputs:
+        t0 = time.perf_counter()
+        parser(body)
+        timings.append((time.perf_counter() - t0) * 1000)
+    total = time.perf_counter() - started
+
+    peaks = []
+    tracemalloc.start()
+    try:
+        for body in inputs[:50]:
+            tracemalloc.reset_peak()
+            baseline, _ = tracemalloc.get_traced_memory()
+            parser(body)
+            peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+    finally:
+        tracemalloc.stop()
+
+    ordered = sorted(timings)
+    return Measurement(
+        samples=len(inputs),
+        emails_per_sec=round(len(inputs) / total, 1) if total else 0.0,
+        mean_ms=round(statistics.fmean(timings), 3),
+        p95_ms=round(ordered[max(0, round(0.95 * len(ordered)) - 1)], 3),
+        peak_kib_per_email=round(statistics.fmean(peaks) / 1024, 1) if peaks else 0.0,
+    )
+
+
+def measure_all(corpus, only=None):
+    return {
+        name: measure(PARSERS[name], inputs)
+        for name, inputs in corpus.items()
+        if not only or name in only
+    }
+
+
+def _scan_labels(line, label_map):
+    """The lookup as it was: lowercase the line again for every label"""
+    for label, key in label_map.items():
+        if line.lower().startswith(label):
+            return key
+    return None
+
+
+def measure_labels(inputs, repeat=5):
+    """
+    Lines/second of the label lookup over every line of the Luna corpus,
+    as {'scan': ..., 'compiled': ...}; both are checked to agree first
+    """
+    lines = [line.strip() for body in inputs for line in body.splitlines() if line.strip()]
+    pairs = [
+        (luna_parser.LABEL_MAPS[section], luna_parser.LABEL_MATCHERS[section])
+        for section in luna_parser.LABELED_SECTIONS
+    ]
+    for line in lines:
+        for label_map, compiled in pairs:
+            assert _scan_labels(line, label_map) == luna_parser.match_label(line.lower(), compiled), line
+
+    def scan():
+        for line in lines:
+            for label_map, _ in pairs:
+                _scan_labels(line, label_map)
+
+    def compiled():
+        for line in lines:
+            lower = line.lower()
+            for _, matcher in pairs:
+                luna_parser.match_label(lower, matcher)
+
+    def rate(lookup):
+        best = float('inf')
+        for _ in range(repeat):
+            started = time.perf_counter()
+            lookup()
+            best = min(best, time.perf_counter() - started)
+        return round(len(lines) / best) if best else 0
+
+    return {'scan': rate(scan), 'compiled': rate(compiled)}
+
+
+# ==========================================
+# FUZZING
+# ==========================================
+
+# Fragments that stress the parsers' regexes: long runs of what the lazy
+# groups and \s+/\d+ quantifiers match, without the terminator they need
+HOSTILE_FRAGMENTS = [
+    ' ' * 5_000,
+    '9' * 5_000,
+    ' 1' * 3_000,
+    'Rp. ' * 2_000,
+    'Rp 1.' * 2_000,
+    'a ' * 5_000,
+    '.' * 5_000,
+    '<td>' * 2_000,
+    '<' * 5_000,
+    '\xa0' * 2_000,
+    '\ufeff\u200b\u202e',
+    'Monday,' * 1_000,
+    'Top 20 Products\n',
+    'Pax\npax x\n',
+    'number of invoices\n',
+    '\x00\x01\x02',
+    '\udcff',
+]
+
+
+def mutate(rng, body):
+    """Return a mutated copy of body"""
+    choice = rng.randrange(8)
+    if not body:
+        return rng.choice(HOSTILE_FRAGMENTS)
+    pos = rng.randrange(len(body) + 1)
+    if choice == 0:
+        return body[:pos] + rng.choice(HOSTILE_FRAGMENTS) + body[pos:]
+    if choice == 1:
+        end = min(len(body), pos + rng.randint(1, 200))
+        return body[:pos] + body[pos:end] * rng.randint(2, 200) + body[end:]
+    if choice == 2:
+        return body[:pos]
+    if choice == 3:
+        end = min(len(body), pos + rng.randint(1, 50))
+        return body[:pos] + body[end:]
+    if choice == 4:
+        return body[:pos] + ''.join(chr(rng.randint(0x20, 0x2FFF)) for _ in range(rng.randint(1, 40))) + body[pos:]
+    if choice == 5:
+        # Replace every line break, turning the whole email into one long line
+        return body.replace('\n', rng.choice([' ', '', '\r', '<br>']))
+    if choice == 6:
+        return body.encode('utf-8', 'surrogatepass').decode('latin-1')
+    return body.swapcase()
+
+
+def fuzz(corpus, iterations=500, seed=0, time_budget_ms=DEFAULT_TIME_BUDGET_MS, only=None):
+    """
+    Feed `iterations` mutated inputs to every parser
+    Returns a list of FuzzFailure (empty when every input parsed in budget)
+    """
+    rng = random.Random(seed)
+    failures = []
+    for name, inputs in corpus.items():
+        if only and name not in only:
+            continue
+        parser = PARSERS[name]
+        for _ in range(iterations):
+            body = rng.choice(inputs)
+            for _ in range(rng.randint(1, 3)):
+                body = mutate(rng, body)
+            body = body[:MAX_FUZZ_CHARS]
+
+            started = time.perf_counter()
+            try:
+                parser(body)
+                error = None
+            except Exception as e:
+                error = f'{type(e).__name__}: {e}'
+            elapsed = (time.perf_counter() - started) * 1000
+
+            if error or elapsed > time_budget_ms:
+                failures.append(FuzzFailure(
+                    parser=name,
+                    kind='exception' if error else 'slow',
+                    detail=error or f'{elapsed:.0f}ms > {time_budget_ms}ms',
+                    elapsed_ms=round(elapsed, 1),
+                    sample=repr(body[:300]),
+                ))
+    return failures
+
+
+# ==========================================
+# BASELINE
+# ==========================================
+
+def load_baseline(path=BASELINE_PATH):
+    with open(path) as fh:
+        return json.load(fh)
+
+
+def write_baseline(results, size, path=BASELINE_PATH):
+    data = {
+        'corpus_size': size,
+        'parsers': {name: asdict(result) for name, result in sorted(results.items())},
+    }
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(data, indent=2) + '\n')
+    return data
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """Throughput may drop, and memory grow, by `threshold` before it counts"""
+    regressions = []
+    expected = baseline.get('parsers', {})
+    for name, result in results.items():
+        base = expected.get(name)
+        if base is None:
+            continue
+        if result.emails_per_sec < base['emails_per_sec'] * (1 - threshold):
+            regressions.append(f"{name}: {base['emails_per_sec']} -> {result.emails_per_sec} emails/s")
+        if result.peak_kib_per_email > base['peak_kib_per_email'] * (1 + threshold) + 1:
+            regressions.append(
+                f"{name}: {base['peak_kib_per_email']} -> {result.peak_kib_per_email} KiB/email"
+            )
+    return regressions
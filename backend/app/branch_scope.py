@@ -0,0 +1,76 @@
+"""
+Branch scope: which branches a user may see
+
+Staff are linked to branches through UserBranchAssignment (many-to-many).
+The allowed branch ids are resolved once per request and cached for a
+short TTL; the cache entry is dropped whenever an assignment of that user
+is saved or deleted (see app/signals.py). Querysets are narrowed with a
+single branch_id__in and object checks become set membership, so neither
+costs a query once the scope is resolved.
+"""
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.core.cache import cache
+
+CACHE_KEY = 'branch_scope:{user_id}'
+REQUEST_ATTR = '_branch_scope'
+
+
+@dataclass(frozen=True)
+class BranchScope:
+    branch_ids: frozenset = frozenset()
+    unrestricted: bool = False
+
+    def allows(self, branch_id):
+        return self.unrestricted or branch_id in self.branch_ids
+
+    def filter(self, queryset, field='branch'):
+        """Narrow a queryset to the allowed branches"""
+        if self.unrestricted:
+            return queryset
+        if not self.branch_ids:
+            return queryset.none()
+        return queryset.filter(**{f'{field}_id__in': self.branch_ids})
+
+
+UNRESTRICTED = BranchScope(unrestricted=True)
+EMPTY = BranchScope()
+
+
+def _ttl():
+    return getattr(settings, 'BRANCH_SCOPE_CACHE_TTL', 60)
+
+
+def for_user(user):
+    """Scope of a user: owners see every branch, staff their assigned ones"""
+    if user is None or not user.is_authenticated:
+        return EMPTY
+    if user.is_superuser:
+        return UNRESTRICTED
+
+    key = CACHE_KEY.format(user_id=user.pk)
+    branch_ids = cache.get(key)
+    if branch_ids is None:
+        from .models import UserBranchAssignment
+        branch_ids = list(
+            UserBranchAssignment.objects.filter(user_id=user.pk).values_list('branch_id', flat=True)
+        )
+        cache.set(key, branch_ids, _ttl())
+    return BranchScope(branch_ids=frozenset(branch_ids))
+
+
+def for_request(request):
+    """Scope of request.user, resolved at most once per request"""
+    # Stored on the Django HttpRequest so DRF's Request wrapper and the
+    # underlying request share it
+    http_request = getattr(request, '_request', request)
+    scope = getattr(http_request, REQUEST_ATTR, None)
+    if scope is None:
+        scope = for_user(getattr(request, 'user', None))
+        setattr(http_request, REQUEST_ATTR, scope)
+    return scope
+
+
+def invalidate(user_id):
+    cache.delete(CACHE_KEY.format(user_id=user_id))
@@ -0,0 +1,43 @@
+"""
+PostgreSQL connection pool statistics
+
+With DATABASE_POOL=True (config/settings.py) every PostgreSQL alias uses
+Django's built-in psycopg 3 pool instead of persistent per-worker
+connections. The pool's counters are cumulative since process start; they
+are summarised here for the health endpoint.
+"""
+from django.db import connections
+
+
+def summarize(raw):
+    """Condense psycopg_pool's get_stats() into sizes, waits and average latencies"""
+    requests = raw.get('requests_num', 0)
+    size = raw.get('pool_size', 0)
+    available = raw.get('pool_available', 0)
+    return {
+        'min_size': raw.get('pool_min', 0),
+        'max_size': raw.get('pool_max', 0),
+        'size': size,
+        'in_use': size - available,
+        'available': available,
+        'waiting': raw.get('requests_waiting', 0),
+        'checkouts': requests,
+        'checkouts_queued': raw.get('requests_queued', 0),
+        'checkout_errors': raw.get('requests_errors', 0),
+        'avg_checkout_wait_ms': round(raw.get('requests_wait_ms', 0) / requests, 2) if requests else 0.0,
+        'avg_usage_ms': round(raw.get('usage_ms', 0) / requests, 2) if requests else 0.0,
+        'connections_opened': raw.get('connections_num', 0),
+        'connections_lost': raw.get('connections_lost', 0),
+    }
+
+
+def pool_stats():
+    """Per-alias pool statistics, empty when pooling is off"""
+    stats = {}
+    for alias in connections:
+        connection = connections[alias]
+        if connection.vendor != 'postgresql' or not connection.settings_dict['OPTIONS'].get('pool'):
+            continue
+        if connection.pool is not None:
+            stats[alias] = summarize(connection.pool.get_stats())
+    return stats
@@ -0,0 +1,165 @@
+"""
+Read-replica routing
+
+DATABASE_REPLICA_URLS adds one alias per replica (replica_0, replica_1, ...,
+see config/settings.py). With none configured every query goes to
+'default' and the middleware below is a no-op.
+
+Which database a read goes to is decided per request:
+
+- ReplicaRoutingMiddleware marks GET/HEAD/OPTIONS requests as replica-safe
+  in a context variable (thread and async safe), unless the client wrote
+  within the last REPLICA_STICKY_SECONDS: after a POST/PUT/PATCH/DELETE the
+  client's reads stay on the primary so it always sees its own writes
+- use_replica() marks a block as replica-safe outside requests (analytics,
+  reports, management commands); use_primary() forces the primary
+- reads inside a transaction on the primary, or after a write in the same
+  request, stay on the primary
+
+Replicas are probed at most every REPLICA_HEALTH_TTL seconds per process. A
+replica that is down, or on Postgres lags more than REPLICA_MAX_LAG seconds
+behind, is skipped; with none healthy reads fall back to the primary.
+"""
+import contextvars
+import hashlib
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+STICKY_CACHE_KEY = 'replica_sticky:{client}'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_read_from_replica = contextvars.ContextVar('read_from_replica', default=False)
+_wrote = contextvars.ContextVar('wrote_to_primary', default=False)
+
+_health = {}
+_health_lock = threading.Lock()
+
+
+def replica_aliases():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+@contextmanager
+def use_replica():
+    """Let reads in this block go to a replica, even after earlier writes"""
+    read_token = _read_from_replica.set(True)
+    wrote_token = _wrote.set(False)
+    try:
+        yield
+    finally:
+        _read_from_replica.reset(read_token)
+        _wrote.reset(wrote_token)
+
+
+@contextmanager
+def use_primary():
+    token = _read_from_replica.set(False)
+    try:
+        yield
+    finally:
+        _read_from_replica.reset(token)
+
+
+def replica_lag(alias):
+    """
+    Seconds the replica is behind; 0 when it has replayed all WAL it
+    received, or is not a streaming replica (SQLite, a primary)
+
+    The age of the last replayed transaction alone keeps growing while the
+    primary is idle, so a caught-up replica would look ever more behind.
+    """
+    connection = connections[alias]
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(
+                'SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 '
+                'ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END'
+            )
+            lag = cursor.fetchone()[0]
+            return float(lag) if lag is not None else 0.0
+        cursor.execute('SELECT 1')
+    return 0.0
+
+
+def replica_is_healthy(alias):
+    now = time.monotonic()
+    with _health_lock:
+        checked_at, healthy = _health.get(alias, (None, False))
+    if checked_at is not None and now - checked_at < settings.REPLICA_HEALTH_TTL:
+        return healthy
+
+    try:
+        lag = replica_lag(alias)
+        healthy = lag <= settings.REPLICA_MAX_LAG
+        if not healthy:
+            logger.warning('Replica %s is %.1fs behind, reading from primary', alias, lag)
+    except DatabaseError:
+        logger.warning('Replica %s is unreachable, reading from primary', alias, exc_info=True)
+        healthy = False
+    with _health_lock:
+        _health[alias] = (now, healthy)
+    return healthy
+
+
+class ReplicaRouter:
+    """Sends replica-safe reads to a healthy replica, everything else to the primary"""
+
+    def db_for_read(self, model, **hints):
+        if not _read_from_replica.get() or _wrote.get():
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        healthy = [alias for alias in replica_aliases() if replica_is_healthy(alias)]
+        return random.choice(healthy) if healthy else DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        _wrote.set(True)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+def client_key(request):
+    """Who the stickiness applies to; the middleware runs before DRF authentication"""
+    credential = (
+        request.headers.get('Authorization')
+        or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+        or request.META.get('REMOTE_ADDR', '')
+    )
+    return hashlib.sha256(credential.encode()).hexdigest()[:32]
+
+
+class ReplicaRoutingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not replica_aliases():
+            return self.get_response(request)
+
+        sticky_key = STICKY_CACHE_KEY.format(client=client_key(request))
+        replica_safe = request.method in SAFE_METHODS and not cache.get(sticky_key)
+        read_token = _read_from_replica.set(replica_safe)
+        wrote_token = _wrote.set(False)
+        try:
+            response = self.get_response(request)
+            if request.method not in SAFE_METHODS or _wrote.get():
+                cache.set(sticky_key, True, settings.REPLICA_STICKY_SECONDS)
+        finally:
+            _read_from_replica.reset(read_token)
+            _wrote.reset(wrote_token)
+        return response
@@ -0,0 +1,318 @@
+"""
+Daily and weekly owner digests across all branches
+
+A digest holds income, expense and net per branch, the top products
+(income categories) and the transactions still waiting for verification.
+Its aggregates come from a fixed set of grouped queries, whatever the
+number of branches:
+
+1. the branches
+2. valid transaction totals per branch and type
+3. valid income per category
+4. unverified transactions per branch (the backlog right now, not only
+   the period's)
+
+The aggregates are stored in a Digest row together with the rendered
+HTML and WhatsApp text (the PDF is rendered from the HTML on first
+request), so reading or re-sending a digest costs no aggregation.
+Daily digests double as rollups: a weekly digest whose seven days are
+already stored is merged from them without touching the transactions.
+
+During DIGEST_BUSINESS_HOURS an existing digest is never recomputed from
+the transactions; rebuilds are deferred to the off-hours run.
+"""
+import logging
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from .models import (
+    Branch, BranchType, Digest, DigestPeriod, Transaction, TransactionType, User,
+)
+
+logger = logging.getLogger(__name__)
+
+TOP_PRODUCTS = 5
+CENTS = Decimal('0.01')
+# Twilio rejects WhatsApp bodies above 1600 characters
+TEXT_LIMIT = 1600
+
+try:
+    from xhtml2pdf import pisa
+except ImportError:
+    pisa = None
+
+
+def period_bounds(period, day):
+    """(start, end) of the day or the Monday-Sunday week containing `day`"""
+    if period == DigestPeriod.DAILY:
+        return day, day
+    start = day - timedelta(days=day.weekday())
+    return start, start + timedelta(days=6)
+
+
+def latest_complete(period, today=None):
+    """A day inside the latest period that has fully passed"""
+    today = today or timezone.localdate()
+    if period == DigestPeriod.DAILY:
+        return today - timedelta(days=1)
+    return today - timedelta(days=today.weekday() + 1)
+
+
+def in_business_hours(now=None):
+    start, end = getattr(settings, 'DIGEST_BUSINESS_HOURS', (7, 22))
+    hour = timezone.localtime(now).hour
+    return start <= hour < end
+
+
+# --- Aggregation ---
+
+def collect(start, end):
+    """Aggregates of start..end from the transactions (4 queries)"""
+    valid = Transaction.objects.filter(is_valid=True)
+    in_period = valid.filter(date__range=(start, end)).order_by()
+
+    branches = {
+        branch_id: {
+            'id': branch_id, 'name': name, 'branch_type': branch_type,
+            'income': Decimal(0), 'expense': Decimal(0), 'transactions': 0,
+            'pending': 0, 'pending_amount': Decimal(0),
+        }
+        for branch_id, name, branch_type in Branch.objects.order_by('name').values_list('id', 'name', 'branch_type')
+    }
+    per_branch = (
+        in_period.values('branch_id', 'transaction_type')
+        .annotate(total=Sum('amount'), count=Count('pk'))
+        .values_list('branch_id', 'transaction_type', 'total', 'count')
+    )
+    for branch_id, transaction_type, total, count in per_branch:
+        row = branches[branch_id]
+        row['income' if transaction_type == TransactionType.INCOME else 'expense'] += total
+        row['transactions'] += count
+
+    products = [
+        {'category': category_id, 'name': name, 'amount': total, 'count': count}
+        for category_id, name, total, count in (
+            in_period.filter(transaction_type=TransactionType.INCOME)
+            .values('category_id', 'category__name')
+            .annotate(total=Sum('amount'), count=Count('pk'))
+            .values_list('category_id', 'category__name', 'total', 'count')
+        )
+    ]
+
+    pending = (
+        valid.filter(is_verified=False).order_by()
+        .values('branch_id')
+        .annotate(total=Sum('amount'), count=Count('pk'))
+        .values_list('branch_id', 'total', 'count')
+    )
+    for branch_id, total, count in pending:
+        branches[branch_id]['pending'] = count
+        branches[branch_id]['pending_amount'] = total
+
+    return _finish(start, end, list(branches.values()), products)
+
+
+def merge(digests, start, end):
+    """Aggregates of a longer period from stored digests covering it"""
+    branches, products = {}, {}
+    latest = max(digests, key=lambda digest: digest.end)
+    for digest in digests:
+        for row in digest.data['branches']:
+            merged = branches.setdefault(row['id'], {
+                **row, 'income': Decimal(0), 'expense': Decimal(0), 'transactions': 0,
+            })
+            merged['income'] += Decimal(row['income'])
+            merged['expense'] += Decimal(row['expense'])
+            merged['transactions'] += row['transactions']
+        for row in digest.data['products']:
+            merged = products.setdefault(row['category'], {**row, 'amount': Decimal(0), 'count': 0})
+            merged['amount'] += Decimal(row['amount'])
+            merged['count'] += row['count']
+    # The backlog is a snapshot: the latest day's is the current one
+    for row in latest.data['branches']:
+        if row['id'] in branches:
+            branches[row['id']]['pending'] = row['pending']
+            branches[row['id']]['pending_amount'] = Decimal(row['pending_amount'])
+    return _finish(start, end, sorted(branches.values(), key=lambda row: row['name']), list(products.values()))
+
+
+def _finish(start, end, branches, products):
+    """Derived totals; amounts are stored as strings to stay exact in JSON"""
+    for row in branches:
+        row['net'] = row['income'] - row['expense']
+    products.sort(key=lambda row: row['amount'], reverse=True)
+    totals = {
+        key: sum((row[key] for row in branches), Decimal(0))
+        for key in ('income', 'expense', 'net', 'pending_amount')
+    }
+    totals['transactions'] = sum(row['transactions'] for row in branches)
+    totals['pending'] = sum(row['pending'] for row in branches)
+
+    by_type = defaultdict(lambda: {'income': Decimal(0), 'expense': Decimal(0), 'net': Decimal(0)})
+    for row in branches:
+        for key in ('income', 'expense', 'net'):
+            by_type[row['branch_type']][key] += row[key]
+
+    return _jsonable({
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'branches': branches,
+        'branch_types': [
+            {'branch_type': branch_type, 'label': BranchType(branch_type).label, **amounts}
+            for branch_type, amounts in sorted(by_type.items())
+        ],
+        'products': products,
+        'totals': totals,
+    })
+
+
+def _jsonable(value):
+    if isinstance(value, Decimal):
+        return str(value.quantize(CENTS))
+    if isinstance(value, dict):
+        return {key: _jsonable(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_jsonable(item) for item in value]
+    return value
+
+
+# --- Rendering ---
+
+def rupiah(amount):
+    """'12345.00' -> 'Rp 12.345'"""
+    amount = Decimal(amount)
+    sign = '-' if amount < 0 else ''
+    return f"{sign}Rp {abs(int(amount)):,}".replace(',', '.')
+
+
+def _context(period, data):
+    def money(row, *keys):
+        return {**row, **{key: rupiah(row[key]) for key in keys}}
+
+    return {
+        'title': f"Ringkasan {'Harian' if period == DigestPeriod.DAILY else 'Mingguan'}",
+        'start': data['start'],
+        'end': data['end'],
+        'totals': money(data['totals'], 'income', 'expense', 'net', 'pending_amount'),
+        'branches': [money(row, 'income', 'expense', 'net') for row in data['branches']],
+        'branch_types': [money(row, 'income', 'expense', 'net') for row in data['branch_types']],
+        'products': [money(row, 'amount') for row in data['products'][:TOP_PRODUCTS]],
+    }
+
+
+def render_html(period, data):
+    return render_to_string('app/digest.html', _context(period, data))
+
+
+def render_text(period, data):
+    """Compact version for WhatsApp: totals, branch types, top products, backlog"""
+    context = _context(period, data)
+    days = context['start'] if context['start'] == context['end'] else f"{context['start']} s/d {context['end']}"
+    totals = context['totals']
+    lines = [
+        f"*{context['title']}* {days}",
+        f"Pemasukan: {totals['income']}",
+        f"Pengeluaran: {totals['expense']}",
+        f"Bersih: {totals['net']}",
+    ]
+    if context['branch_types']:
+        lines += ['', '*Per unit*']
+        lines += [f"- {row['label']}: {row['net']}" for row in context['branch_types']]
+    if context['products']:
+        lines += ['', '*Produk teratas*']
+        lines += [f"{i}. {row['name']}: {row['amount']}" for i, row in enumerate(context['products'], 1)]
+    lines += ['', f"Menunggu verifikasi: {totals['pending']} transaksi ({totals['pending_amount']})"]
+    text = '\n'.join(lines)
+    return text if len(text) <= TEXT_LIMIT else text[:TEXT_LIMIT - 1] + '…'
+
+
+def pdf_of(digest):
+    """PDF bytes of a digest, rendered once and stored (needs xhtml2pdf)"""
+    if digest.pdf is None:
+        if pisa is None:
+            return None
+        output = BytesIO()
+        result = pisa.CreatePDF(digest.html, dest=output)
+        if result.err:
+            logger.error('PDF rendering of %s failed', digest)
+            return None
+        digest.pdf = output.getvalue()
+        digest.save(update_fields=['pdf', 'updated_at'])
+    return bytes(digest.pdf)
+
+
+# --- Building and delivery ---
+
+def build(period, day, rebuild=False):
+    """
+    The digest of the period containing `day`; stored ones are returned
+    as they are unless rebuild=True (ignored during business hours)
+    """
+    start, end = period_bounds(period, day)
+    existing = Digest.objects.filter(period=period, start=start).first()
+    if existing and (not rebuild or in_business_hours()):
+        return existing
+
+    data = None
+    if period != DigestPeriod.DAILY:
+        days = list(Digest.objects.filter(period=DigestPeriod.DAILY, start__range=(start, end)))
+        if len(days) == (end - start).days + 1:
+            data = merge(days, start, end)
+    if data is None:
+        data = collect(start, end)
+
+    with transaction.atomic():
+        digest, _ = Digest.objects.update_or_create(
+            period=period, start=start,
+            defaults={
+                'end': end,
+                'data': data,
+                'html': render_html(period, data),
+                'text': render_text(period, data),
+                'pdf': None,
+            },
+        )
+    logger.info('Built %s', digest)
+    return digest
+
+
+def recipients():
+    """WhatsApp numbers of the owners"""
+    return [
+        number.phone_number
+        for owner in User.objects.filter(is_superuser=True, is_active=True).prefetch_related('phone_numbers')
+        for number in owner.phone_numbers.all()
+    ]
+
+
+def whatsapp_address(number):
+    """'0812-345' / '62812345' / '+62812345' -> 'whatsapp:+62812345'"""
+    number = ''.join(ch for ch in number if ch.isdigit() or ch == '+')
+    if number.startswith('0'):
+        number = '+62' + number[1:]
+    elif not number.startswith('+'):
+        number = '+' + number
+    return f'whatsapp:{number}'
+
+
+def deliver(digest, service=None):
+    """Send the WhatsApp text to every owner; returns the number of messages sent"""
+    if service is None:
+        from .integrations.whatsapp_service import WhatsAppService
+        service = WhatsAppService()
+    sent = 0
+    for number in recipients():
+        if service.send_message(whatsapp_address(number), digest.text).get('success'):
+            sent += 1
+    if sent:
+        digest.delivered_at = timezone.now()
+        digest.save(update_fields=['delivered_at', 'updated_at'])
+    return sent
@@ -0,0 +1,154 @@
+"""
+Health checks
+
+/health/        liveness: the process answers, touches nothing
+/health/ready/  readiness: probes the dependencies a worker needs to serve
+
+Readiness probes run concurrently in a small thread pool, each under
+HEALTH_PROBE_TIMEOUT seconds, and the combined result is cached per
+process for HEALTH_CACHE_SECONDS so a load balancer polling every worker
+does not turn the check itself into load. Concurrent callers wait for the
+probe run in progress instead of starting their own.
+
+Each probe returns {"status": "ok" | "fail" | "timeout" | "skipped", ...}.
+A worker is ready when no probe failed or timed out:
+
+- database:         SELECT 1 under HEALTH_DB_LATENCY_BUDGET_MS, and a free
+                    connection in the pool when pooling is on (DATABASE_POOL)
+- cache:            set/get round trip
+- ingestion_queue:  age of the oldest PENDING IngestionLog under
+                    HEALTH_QUEUE_MAX_AGE seconds
+- imap:             TCP connect to IMAP_HOST, skipped when not configured
+"""
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.utils import timezone
+
+from .db_pool import pool_stats
+
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='health')
+_lock = threading.Lock()
+_cached = {'at': None, 'result': None}
+
+
+def _elapsed_ms(started):
+    return round((time.perf_counter() - started) * 1000, 2)
+
+
+def probe_database():
+    started = time.perf_counter()
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        latency = _elapsed_ms(started)
+    finally:
+        # Probe threads are not request threads, nothing else closes it
+        connection.close()
+    result = {'status': 'ok', 'latency_ms': latency}
+    if latency > settings.HEALTH_DB_LATENCY_BUDGET_MS:
+        result.update(status='fail', detail='latency over budget')
+
+    pools = pool_stats()
+    if pools:
+        result['pool'] = pools
+        saturated = [alias for alias, p in pools.items() if p['waiting'] and not p['available']]
+        if saturated:
+            result.update(status='fail', detail=f"pool saturated: {', '.join(saturated)}")
+    return result
+
+
+def probe_cache():
+    started = time.perf_counter()
+    key = f'health:{uuid.uuid4().hex}'
+    cache.set(key, 1, 10)
+    ok = cache.get(key) == 1
+    cache.delete(key)
+    return {'status': 'ok' if ok else 'fail', 'latency_ms': _elapsed_ms(started)}
+
+
+def probe_ingestion_queue():
+    from .models import IngestionLog, IngestionStatus
+
+    try:
+        pending = IngestionLog.objects.filter(status=IngestionStatus.PENDING)
+        oldest = pending.order_by('created_at').values_list('created_at', flat=True).first()
+        count = pending.count()
+    finally:
+        connection.close()
+    age = (timezone.now() - oldest).total_seconds() if oldest else 0
+    result = {'status': 'ok', 'pending': count, 'oldest_age_s': round(age)}
+    if age > settings.HEALTH_QUEUE_MAX_AGE:
+        result.update(status='fail', detail='pending ingestion older than budget')
+    return result
+
+
+def probe_imap():
+    host = getattr(settings, 'IMAP_HOST', None)
+    if not host:
+        return {'status': 'skipped'}
+    started = time.perf_counter()
+    with socket.create_connection(
+        (host, getattr(settings, 'IMAP_PORT', 993)), timeout=settings.HEALTH_PROBE_TIMEOUT
+    ):
+        pass
+    return {'status': 'ok', 'latency_ms': _elapsed_ms(started)}
+
+
+PROBES = {
+    'database': probe_database,
+    'cache': probe_cache,
+    'ingestion_queue': probe_ingestion_queue,
+    'imap': probe_imap,
+}
+
+
+def _run_safely(probe):
+    try:
+        return probe()
+    except Exception as exc:
+        return {'status': 'fail', 'detail': f'{type(exc).__name__}: {exc}'}
+
+
+def run_probes(probes=None):
+    probes = probes or PROBES
+    started = time.perf_counter()
+    futures = {name: _executor.submit(_run_safely, probe) for name, probe in probes.items()}
+    wait(futures.values(), timeout=settings.HEALTH_PROBE_TIMEOUT)
+
+    checks = {}
+    for name, future in futures.items():
+        if future.done():
+            checks[name] = future.result()
+        else:
+            future.cancel()
+            checks[name] = {'status': 'timeout'}
+    ready = all(check['status'] in ('ok', 'skipped') for check in checks.values())
+    return {
+        'status': 'ok' if ready else 'unavailable',
+        'checks': checks,
+        'duration_ms': _elapsed_ms(started),
+    }
+
+
+def readiness():
+    """Probe results, reused for HEALTH_CACHE_SECONDS"""
+    with _lock:
+        checked_at = _cached['at']
+        if checked_at is None or time.monotonic() - checked_at >= settings.HEALTH_CACHE_SECONDS:
+            _cached['result'] = run_probes()
+            _cached['at'] = time.monotonic()
+        return _cached['result']
+
+
+def reset():
+    with _lock:
+        _cached['at'] = None
+        _cached['result'] = None
+
@@ -0,0 +1,200 @@
+"""
+Idempotency-Key support for the ingestion and create endpoints
+
+Clients that retry (Make.com scenarios, the WhatsApp bot, mobile apps on a
+flaky network) send the same `Idempotency-Key` header with every attempt.
+The first request with a key is processed and its response stored; a
+retry gets the stored response back, marked `Idempotent-Replayed: true`,
+without any processing.
+
+- Keys are scoped per endpoint and caller (the user, or the webhooks'
+  valid X-Api-Key), so no caller can read another's responses
+- Keys of unauthenticated callers (no user, missing or wrong X-Api-Key)
+  are ignored: the request is processed as if it had none, so anyone
+  can't fill the table with stored 401s. The internal bot endpoint
+  is open, so whatsapp-service sends the X-Api-Key along with a key
+  derived from the WhatsApp message id
+- A key reused with a different request (method, path or body) is
+  rejected with 422
+- A retry that arrives while the first request is still running gets 409
+  and should try again later. A claim still in progress after
+  IDEMPOTENCY_LEASE_SECONDS belongs to a worker that died (timeout, OOM)
+  and is taken over by the next retry
+- 5xx responses (and exceptions) are not stored: the key is released so
+  a retry runs again
+- Responses are stored in IdempotencyKey with the cache in front; both
+  expire after IDEMPOTENCY_KEY_TTL seconds (`manage.py
+  purge_idempotency_keys` deletes the expired rows)
+
+Requests without the header behave exactly as before.
+"""
+import hashlib
+import json
+import logging
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import UploadedFile
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import IdempotencyKey
+
+logger = logging.getLogger(__name__)
+
+HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+CACHE_KEY = 'idempotency:{scope}:{key}'
+MAX_KEY_LENGTH = 255
+
+
+def _ttl():
+    return getattr(settings, 'IDEMPOTENCY_KEY_TTL', 86400)
+
+
+def _lease():
+    return getattr(settings, 'IDEMPOTENCY_LEASE_SECONDS', 600)
+
+
+def _caller(request):
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return f'user:{user.pk}'
+    api_key = request.headers.get('X-Api-Key') or ''
+    expected = getattr(settings, 'INGESTION_API_KEY', '')
+    if expected and constant_time_compare(api_key, expected):
+        return 'api:' + hashlib.sha256(api_key.encode()).hexdigest()[:16]
+    return None
+
+
+def _part(value):
+    """JSON form of the non-JSON parts of a parsed body (uploads)"""
+    if isinstance(value, UploadedFile):
+        return {'file': value.name, 'size': value.size, 'hash': getattr(value, 'content_hash', None)}
+    return str(value)
+
+
+def fingerprint(request):
+    data = request.data
+    if hasattr(data, 'lists'):
+        data = sorted(data.lists())
+    body = json.dumps([request.method, request.path, data], sort_keys=True, default=_part)
+    return hashlib.sha256(body.encode()).hexdigest()
+
+
+def _stored(record):
+    return {
+        'fingerprint': record.fingerprint,
+        'status': record.status_code,
+        'body': record.response_body,
+        'expires_at': record.expires_at,
+    }
+
+
+def _claim(scope, key, digest):
+    """
+    Insert the in-progress row for a key; returns None when this request
+    owns the key, or the stored state of an earlier request with it
+    """
+    now = timezone.now()
+    for _ in range(2):
+        try:
+            with transaction.atomic():
+                IdempotencyKey.objects.create(
+                    scope=scope, key=key, fingerprint=digest, expires_at=now + timedelta(seconds=_ttl()),
+                )
+            return None
+        except IntegrityError:
+            record = IdempotencyKey.objects.filter(scope=scope, key=key).first()
+            if record is None:
+                continue
+            if record.status_code is None and record.created_at <= now - timedelta(seconds=_lease()):
+                # Its request never finished: take the key over
+                IdempotencyKey.objects.filter(pk=record.pk, status_code__isnull=True).delete()
+                continue
+            if record.expires_at > now:
+                return _stored(record)
+            # Expired: the key is free again
+            record.delete()
+    return {'fingerprint': digest, 'status': None}
+
+
+def _release(scope, key):
+    IdempotencyKey.objects.filter(scope=scope, key=key, status_code__isnull=True).delete()
+
+
+def _save(scope, key, digest, response):
+    body = json.loads(json.dumps(response.data, cls=JSONEncoder))
+    IdempotencyKey.objects.filter(scope=scope, key=key).update(
+        status_code=response.status_code, response_body=body,
+    )
+    cache.set(
+        CACHE_KEY.format(scope=scope, key=key),
+        {'fingerprint': digest, 'status': response.status_code, 'body': body},
+        _ttl(),
+    )
+
+
+def _replay(stored, digest):
+    if stored['fingerprint'] != digest:
+        return Response(
+            {"error": f"{HEADER} was already used for a different request"},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
+    if stored['status'] is None:
+        return Response(
+            {"error": f"A request with this {HEADER} is still being processed"},
+            status=status.HTTP_409_CONFLICT,
+        )
+    return Response(stored['body'], status=stored['status'], headers={REPLAYED_HEADER: 'true'})
+
+
+def idempotent(name):
+    """
+    Decorator for the POST handler (post/create) of a DRF view; `name`
+    scopes the keys to the endpoint
+    """
+    def decorator(handler):
+        @wraps(handler)
+        def wrapper(view, request, *args, **kwargs):
+            key = request.headers.get(HEADER)
+            caller = _caller(request) if key else None
+            if caller is None:
+                return handler(view, request, *args, **kwargs)
+            if len(key) > MAX_KEY_LENGTH:
+                return Response(
+                    {"error": f"{HEADER} must be at most {MAX_KEY_LENGTH} characters"},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+
+            scope = f'{name}:{caller}'
+            digest = fingerprint(request)
+            stored = cache.get(CACHE_KEY.format(scope=scope, key=key)) or _claim(scope, key, digest)
+            if stored is not None:
+                logger.info('Idempotent replay of %s key %s', scope, key)
+                return _replay(stored, digest)
+
+            try:
+                response = handler(view, request, *args, **kwargs)
+            except Exception:
+                _release(scope, key)
+                raise
+            if response.status_code >= 500 or not hasattr(response, 'data'):
+                _release(scope, key)
+            else:
+                _save(scope, key, digest, response)
+            return response
+        return wrapper
+    return decorator
+
+
+def purge_expired():
+    """Delete the expired keys; returns how many"""
+    deleted, _ = IdempotencyKey.objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted
@@ -1,15 +1,17 @@
-import imaplib, email, re, logging
+import imaplib, re, logging
 from datetime import datetime
-from email.header import decode_header
 from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.utils import timezone
+from app import metrics, tracing
 from app.models import (
     Branch, User, Category, Transaction, IngestionLog,
     TransactionType, TransactionSource, IngestionStatus, BranchType,
 )
 from app.ingestion.luna_parser import parse_luna_email
+from app.ingestion.luna_parser_sendgrid import parse_luna_email_refined
 from app.ingestion.hitachi_parser import parse_hitachi_email
+from app.ingestion import imap_triage, upsert
 
 logger = logging.getLogger(__name__)
 
@@ -62,32 +64,62 @@ class EmailIngestionService:
             email_ids = messages[0].split()
             if self.limit:
                 email_ids = email_ids[:self.limit]
-            processed, failed = 0, 0
+            processed, failed, skipped = 0, 0, 0
             for e_id in email_ids:
                 try:
-                    _, msg_data = self.mail.fetch(e_id, "(RFC822)")
-                    for response_part in msg_data:
-                        if isinstance(response_part, tuple):
-                            msg = email.message_from_bytes(response_part[1])
-                            if self._process_single_email(msg, e_id):
-                                processed += 1
-                            else:
-                                failed += 1
+                    fingerprint = self._triage(e_id)
+                    reason = imap_triage.skip_reason(fingerprint, self._body_limit())
+                    if not reason:
+                        body = self._fetch_body(e_id, fingerprint["part"])
+                        reason = imap_triage.body_skip_reason(fingerprint["part"], body)
+                    if reason:
+                        logger.info(f"Skipping email ID {e_id.decode()} ({reason}): {fingerprint['subject']}")
+                        metrics.record_imap_message(reason)
+                        skipped += 1
+                    else:
+                        metrics.record_imap_message('downloaded')
+                        if self._process_single_email(e_id, fingerprint, body):
+                            processed += 1
+                        else:
+                            failed += 1
+                    self._mark_seen(e_id)
                 except Exception as e:
                     logger.error(f"Error processing email ID {e_id.decode()}: {e}")
                     failed += 1
-            return f"Successfully processed {processed} emails. Failed: {failed}."
+            return f"Successfully processed {processed} emails. Failed: {failed}. Skipped: {skipped}."
         except Exception as e:
             logger.error(f"Ingestion Loop Error: {e}")
             return f"Error: {e}"
         finally:
             self.close()
 
+    # Fetch the headers, size and MIME structure of a message (no body)
+    def _triage(self, email_id):
+        _, msg_data = self.mail.fetch(email_id, imap_triage.TRIAGE_ITEMS)
+        return imap_triage.fingerprint(imap_triage.parse_fetch(msg_data))
+
+    # Larger text parts are skipped by the triage, never cut
+    def _body_limit(self):
+        return getattr(settings, 'IMAP_BODY_MAX_BYTES', 262144)
+
+    # Download the text part picked by the triage, up to IMAP_BODY_MAX_BYTES
+    def _fetch_body(self, email_id, part):
+        limit = self._body_limit()
+        _, msg_data = self.mail.fetch(email_id, f"(BODY.PEEK[{part['section']}]<0.{limit}>)")
+        return imap_triage.decode_part(imap_triage.item(imap_triage.parse_fetch(msg_data), 'BODY['), part)
+
+    # Mark a message as read (BODY.PEEK leaves it unread)
+    def _mark_seen(self, email_id):
+        try:
+            self.mail.store(email_id, "+FLAGS", "\\Seen")
+        except Exception as e:
+            logger.warning(f"Failed to mark email as read: {e}")
+
     # Process a single email message
-    def _process_single_email(self, msg, email_id):
-        subject = self._decode_subject(msg["Subject"])
-        body = self._get_email_body(msg)
-        sender = msg.get("From")
+    @tracing.trace('imap_email')
+    def _process_single_email(self, email_id, fingerprint, body):
+        subject = fingerprint["subject"]
+        sender = fingerprint["sender"]
 
         if not body:
             logger.warning(f"Could not extract email body from email ID {email_id.decode()}")
@@ -100,38 +132,46 @@ class EmailIngestionService:
         )
 
         try:
-            email_type, parsed_data = self._detect_and_parse_email(body)
+            with tracing.span('parse'):
+                email_type, parsed_data = self._detect_and_parse_email(body, imap_triage.is_html(fingerprint["part"]))
             log.raw_payload.update({"email_type": email_type, "parsed_data": parsed_data})
             log.save()
-            branch = self._find_branch_from_metadata(parsed_data or {}, email_type, subject)
-            user = self._find_user_by_email(self._extract_email_from_sender(sender))
+            items_key = {"LUNA": "top_products", "HITACHI": "top_items"}.get(email_type)
+            if items_key and not (parsed_data.get("summary") and parsed_data.get(items_key)):
+                # Nothing to ingest: the branch would come from the subject and no item lands
+                raise ValidationError(f"{email_type} report parsed without a summary or items")
+            with tracing.span('resolve_branch'):
+                branch = self._find_branch_from_metadata(parsed_data or {}, email_type, subject)
+            with tracing.span('resolve_user'):
+                user = self._find_user_by_email(self._extract_email_from_sender(sender))
             
-            if email_type == "LUNA":
-                trans = self._create_transactions(branch, user, subject, parsed_data, log, TransactionType.INCOME, "top_products", "LUNA POS")
-            elif email_type == "HITACHI":
-                trans = self._create_transactions(branch, user, subject, parsed_data, log, TransactionType.INCOME, "top_items", "Hitachi")
-            else:
-                category, amount = self._parse_body(body)
-                trans = [Transaction.objects.create(
-                    branch=branch, reported_by=user, amount=amount,
-                    transaction_type=TransactionType.EXPENSE, category=category,
-                    date=timezone.localtime(log.created_at).date(),
-                    description=f"Via Email: {subject}", source=TransactionSource.EMAIL
-                )]
+            with tracing.span('create_transactions'):
+                if email_type == "LUNA":
+                    trans = self._create_transactions(branch, user, subject, parsed_data, log, TransactionType.INCOME, "top_products", "LUNA POS")
+                elif email_type == "HITACHI":
+                    trans = self._create_transactions(branch, user, subject, parsed_data, log, TransactionType.INCOME, "top_items", "Hitachi")
+                elif imap_triage.is_html(fingerprint["part"]):
+                    # A report marker was found but the report did not parse
+                    raise ValidationError("HTML email is not a parsable POS report")
+                else:
+                    category, amount = self._parse_body(body)
+                    trans = [Transaction.objects.create(
+                        branch=branch, reported_by=user, amount=amount,
+                        transaction_type=TransactionType.EXPENSE, category=category,
+                        date=timezone.localtime(log.created_at).date(),
+                        description=f"Via Email: {subject}", source=TransactionSource.EMAIL
+                    )]
 
             log.status = IngestionStatus.SUCCESS
             log.created_transaction = trans[0] if isinstance(trans, list) and trans else None
+            log.timings = tracing.timings()
             log.save()
-
-            try:
-                self.mail.store(email_id, "+FLAGS", "\\Seen")
-            except Exception as e:
-                logger.warning(f"Failed to mark email as read: {e}")
             return True
         
         except Exception as e:
             log.status = IngestionStatus.FAILED
             log.error_message = str(e)
+            log.timings = tracing.timings()
             log.save()
             logger.error(f"Parsing Error for Log {log.id}: {e}")
             return False
@@ -166,10 +206,13 @@ class EmailIngestionService:
         return branch
 
     # Detect email type and parse accordingly
-    def _detect_and_parse_email(self, body):
+    def _detect_and_parse_email(self, body, is_html=False):
         body_upper = body.upper()
         if "LUNA POS" in body_upper or "DAILY REPORT LUNA POS" in body_upper:
             try:
+                if is_html:
+                    # The plain-text parser finds nothing in markup (as EmailWebhookService does)
+                    return "LUNA", parse_luna_email_refined(body, is_html=True)
                 return "LUNA", parse_luna_email(body)
             except Exception as e:
                 logger.warning(f"Failed to parse LUNA email: {e}")
@@ -196,25 +239,10 @@ class EmailIngestionService:
                     transaction_date = datetime.strptime(date_str, "%Y-%m-%d").date()
             except:
                 pass
-        transactions = []
-        for item in (parsed_data or {}).get(items_key, []):
-            name = item.get("name")
-            amount = item.get("amount", 0)
-            if not name or not amount:
-                continue
-            category, _ = Category.objects.get_or_create(
-                name=name, defaults={'name': name, 'transaction_type': trx_type}
-            )
-            category.branches.add(branch)
-            trans = Transaction.objects.create(
-                branch=branch, reported_by=user, amount=amount,
-                transaction_type=trx_type, category=category,
-                date=transaction_date,
-                description=f"{desc_prefix}: {name} ({subject})",
-                source=TransactionSource.EMAIL
-            )
-            transactions.append(trans)
-        return transactions
+        return upsert.report_items(
+            branch, user, transaction_date, (parsed_data or {}).get(items_key, []), trx_type,
+            lambda name: f"{desc_prefix}: {name} ({subject})",
+        )
 
     # Parse simple body format
     def _parse_body(self, text):
@@ -269,43 +297,6 @@ class EmailIngestionService:
                 is_active=True, is_staff=True, is_superuser=False
             )
 
-    # Decode email subject
-    def _decode_subject(self, subject):
-        if not subject:
-            return ""
-        decoded_list = decode_header(subject)
-        subject_str = ""
-        for text, encoding in decoded_list:
-            if isinstance(text, bytes):
-                try:
-                    subject_str += text.decode(encoding if encoding else "utf-8")
-                except Exception:
-                    subject_str += text.decode("utf-8", errors="replace")
-            else:
-                subject_str += text
-        return subject_str
-
-    # Extract email body text
-    def _get_email_body(self, msg):
-        if msg.is_multipart():
-            for part in msg.walk():
-                if part.get_content_type() == "text/plain" and "attachment" not in str(part.get("Content-Disposition") or ""):
-                    payload = part.get_payload(decode=True)
-                    charset = part.get_content_charset() or "utf-8"
-                    try:
-                        return (payload or b"").decode(charset, errors="replace").strip()
-                    except Exception:
-                        continue
-        else:
-            if msg.get_content_type() == "text/plain":
-                payload = msg.get_payload(decode=True)
-                charset = msg.get_content_charset() or "utf-8"
-                try:
-                    return (payload or b"").decode(charset, errors="replace").strip()
-                except Exception:
-                    pass
-        return ""
-
     # Find branch by name
     def _find_branch(self, text):
         if not text:
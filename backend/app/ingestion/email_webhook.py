@@ -1,15 +1,14 @@
 from django.conf import settings
 from django.core.exceptions import ValidationError
-from django.db import IntegrityError
 from datetime import date, datetime
 import logging
 import re
-from app.models import (
-    Transaction, Category, Branch, DailySummary,
-    TransactionType, TransactionSource, BranchType
-)
+from app.models import Branch, TransactionType, TransactionSource, BranchType
 from .luna_parser_sendgrid import parse_luna_email_refined
 from .hitachi_parser import parse_hitachi_email
+from app import log, tracing
+from . import upsert
+from app.metrics import timed
 
 logger = logging.getLogger(__name__)
 
@@ -17,6 +16,7 @@ def normalize(text):
     return (text or "").strip().lower()
 
 class EmailWebhookService:
+    @timed('source', 'email_webhook')
     def process_payload(self, payload):
         """
         Process the email webhook payload and create transactions
@@ -26,43 +26,52 @@ class EmailWebhookService:
         text_body = payload.get('text_body', '')
         html_body = payload.get('html_body', '')  # Add HTML body support
 
-        logger.info(f"Processing email - Subject: {subject}, Sender: {sender}")
+        log.bind(source=TransactionSource.EMAIL)
+        logger.info("Processing email - Subject: %s, Sender: %s", subject, sender)
 
         if not text_body and not html_body:
             logger.error("Payload missing 'text_body' and 'html_body'")
             raise ValidationError("Payload missing both 'text_body' and 'html_body'")
 
         # Detect and parse email type
-        email_type, parsed_data = self._detect_and_parse_email(subject, sender, text_body, html_body)
-        logger.info(f"Detected email type: {email_type}")
-        logger.debug(f"Parsed data: {parsed_data}")
+        with tracing.span('parse'):
+            email_type, parsed_data = self._detect_and_parse_email(subject, sender, text_body, html_body)
+        logger.info("Detected email type: %s", email_type)
+        logger.debug("Parsed data: %s", parsed_data)
 
         # Find branch
-        branch = self._find_branch_from_metadata(parsed_data, email_type, subject)
-        logger.info(f"Found/created branch: {branch.name} (ID: {branch.id})")
+        with tracing.span('resolve_branch'):
+            branch = self._find_branch_from_metadata(parsed_data, email_type, subject)
+        log.bind(branch=branch.id)
+        logger.info("Found/created branch: %s (ID: %s)", branch.name, branch.id)
 
         # Find user (optional, can be None)
         user = None
         try:
-            user = self._find_user_by_email(sender)
+            with tracing.span('resolve_user'):
+                user = self._find_user_by_email(sender)
             if user:
-                logger.info(f"Found user: {user.email} (ID: {user.id})")
+                logger.info("Found user: %s (ID: %s)", user.email, user.id)
         except Exception as e:
             logger.warning("Failed to find user by email '%s': %s", sender, e)
 
         # Create daily summary AND individual transactions
         if email_type == "LUNA":
-            summary = self._create_luna_summary(branch, user, subject, parsed_data)
-            transactions = self._create_transactions(branch, user, subject, parsed_data, TransactionType.INCOME, "top_products", "Luna POS")
-            logger.info(f"Created Luna summary + {len(transactions)} transactions")
+            with tracing.span('daily_summary'):
+                summary = self._create_luna_summary(branch, user, subject, parsed_data)
+            with tracing.span('create_transactions'):
+                transactions = self._create_transactions(branch, user, subject, parsed_data, TransactionType.INCOME, "top_products", "Luna POS")
+            logger.info("Created Luna summary + %s transactions", len(transactions))
             return f"Created Luna summary + {len(transactions)} transactions"
         elif email_type == "HITACHI":
-            summary = self._create_hitachi_summary(branch, user, subject, parsed_data)
-            transactions = self._create_transactions(branch, user, subject, parsed_data, TransactionType.INCOME, "top_items", "Hitachi")
-            logger.info(f"Created Hitachi summary + {len(transactions)} transactions")
+            with tracing.span('daily_summary'):
+                summary = self._create_hitachi_summary(branch, user, subject, parsed_data)
+            with tracing.span('create_transactions'):
+                transactions = self._create_transactions(branch, user, subject, parsed_data, TransactionType.INCOME, "top_items", "Hitachi")
+            logger.info("Created Hitachi summary + %s transactions", len(transactions))
             return f"Created Hitachi summary + {len(transactions)} transactions"
         else:
-            logger.info(f"Unknown email type: {email_type}")
+            logger.info("Unknown email type: %s", email_type)
             return f"Processed email with unknown type: {email_type}"
 
     def _detect_and_parse_email(self, subject, sender, text_body, html_body):
@@ -73,7 +82,7 @@ class EmailWebhookService:
         subject_upper = subject.upper()
         sender_upper = (sender or "").upper()
 
-        logger.debug(f"Checking email patterns - Subject: {subject_upper}, Sender: {sender_upper}")
+        logger.debug("Checking email patterns - Subject: %s, Sender: %s", subject_upper, sender_upper)
 
         # LUNA detection - Use HTML if available, fallback to text
         if "LUNA POS" in body_upper or "Fwd: Daily Summary Report" in subject_upper or "LAUNDRY BOSKU" in body_upper:
@@ -87,10 +96,10 @@ class EmailWebhookService:
                     logger.debug("Using text body for Luna parsing")
                     parsed = parse_luna_email_refined(text_body, is_html=False)
                 
-                logger.debug(f"LUNA parse successful: {parsed}")
+                logger.debug("LUNA parse successful: %s", parsed)
                 return "LUNA", parsed
             except Exception as e:
-                logger.error(f"Failed to parse LUNA email: {e}", exc_info=True)
+                logger.error("Failed to parse LUNA email: %s", e, exc_info=True)
                 return "LUNA_ERROR", {}
 
         # HITACHI detection
@@ -98,10 +107,10 @@ class EmailWebhookService:
             logger.info("Detected HITACHI email pattern")
             try:
                 parsed = parse_hitachi_email(text_body or html_body)
-                logger.debug(f"HITACHI parse successful: {parsed}")
+                logger.debug("HITACHI parse successful: %s", parsed)
                 return "HITACHI", parsed
             except Exception as e:
-                logger.error(f"Failed to parse Hitachi email: {e}", exc_info=True)
+                logger.error("Failed to parse Hitachi email: %s", e, exc_info=True)
                 return "HITACHI_ERROR", {}
         
         logger.warning("No matching email pattern found")
@@ -113,23 +122,23 @@ class EmailWebhookService:
         """
         branch_name = None
         
-        logger.debug(f"Finding branch - Email type: {email_type}, Parsed data: {parsed_data}")
+        logger.debug("Finding branch - Email type: %s, Parsed data: %s", email_type, parsed_data)
         
         # Extract from metadata.location
         if parsed_data:
             metadata = parsed_data.get("metadata", {})
             branch_name = metadata.get("location")
-            logger.debug(f"Extracted location from metadata: {branch_name}")
+            logger.debug("Extracted location from metadata: %s", branch_name)
         
         # Fallback to subject if no location in metadata
         if not branch_name and subject_fallback:
-            logger.debug(f"No location in metadata, trying subject: {subject_fallback}")
+            logger.debug("No location in metadata, trying subject: %s", subject_fallback)
             subject = subject_fallback
             for prefix in ["Fwd:", "FW:", "Re:"]:
                 if subject.upper().startswith(prefix.upper()):
                     subject = subject[len(prefix):].strip()
             branch_name = subject.split(":")[0].strip()
-            logger.debug(f"Extracted branch from subject: {branch_name}")
+            logger.debug("Extracted branch from subject: %s", branch_name)
         
         if not branch_name:
             logger.error("No branch information found in parsed data or subject")
@@ -139,7 +148,7 @@ class EmailWebhookService:
         if "|" in branch_name:
             original = branch_name
             branch_name = branch_name.split("|")[-1].strip()
-            logger.debug(f"Cleaned branch name: {original} -> {branch_name}")
+            logger.debug("Cleaned branch name: %s -> %s", original, branch_name)
         
         # Get or create the branch
         branch, created = Branch.objects.get_or_create(
@@ -148,9 +157,9 @@ class EmailWebhookService:
         )
         
         if created:
-            logger.info(f"Created new branch: {branch.name}")
+            logger.info("Created new branch: %s", branch.name)
         else:
-            logger.debug(f"Found existing branch: {branch.name}")
+            logger.debug("Found existing branch: %s", branch.name)
         
         return branch
 
@@ -159,85 +168,71 @@ class EmailWebhookService:
         Find User by email, or return None if not found
         """
         from app.models import User
-        logger.debug(f"Looking up user by email: {email_addr}")
+        logger.debug("Looking up user by email: %s", email_addr)
         if email_addr:
             try:
                 user = User.objects.get(email=email_addr)
-                logger.debug(f"Found user: {user.email}")
+                logger.debug("Found user: %s", user.email)
                 return user
             except User.DoesNotExist:
-                logger.warning(f"User with email {email_addr} not found")
+                logger.warning("User with email %s not found", email_addr)
         return None
 
     def _create_luna_summary(self, branch, user, subject, parsed_data):
         """
-        Create DailySummary from Luna email
+        Create or update the DailySummary from a Luna email
         """
-        logger.debug(f"Creating Luna summary - Branch: {branch.name}")
+        logger.debug("Creating Luna summary - Branch: %s", branch.name)
         
         transaction_date = self._parse_date(parsed_data.get("metadata", {}))
         summary_data = parsed_data.get("summary", {})
         payments = parsed_data.get("payments", {})
         
         try:
-            summary, created = DailySummary.objects.update_or_create(
-                branch=branch,
-                date=transaction_date,
-                source=TransactionSource.EMAIL,
-                defaults={
-                    'gross_sales': summary_data.get("total_sales", 0),
-                    'total_discount': summary_data.get("total_discount", 0),
-                    'net_sales': summary_data.get("grand_total", 0),
-                    'total_tax': summary_data.get("total_tax", 0),
-                    'total_collected': summary_data.get("grand_total", 0),
-                    'cash_amount': payments.get("cash", 0),
-                    'qris_amount': payments.get("qris", 0),
-                    'transfer_amount': payments.get("transfer", 0),
-                    'raw_data': parsed_data,
-                }
-            )
-            
-            action = "Created" if created else "Updated"
-            logger.info(f"{action} Luna summary ID {summary.id} for {transaction_date}")
+            summary = upsert.summary(branch, transaction_date, {
+                'gross_sales': summary_data.get("total_sales", 0),
+                'total_discount': summary_data.get("total_discount", 0),
+                'net_sales': summary_data.get("grand_total", 0),
+                'total_tax': summary_data.get("total_tax", 0),
+                'total_collected': summary_data.get("grand_total", 0),
+                'cash_amount': payments.get("cash", 0),
+                'qris_amount': payments.get("qris", 0),
+                'transfer_amount': payments.get("transfer", 0),
+                'raw_data': parsed_data,
+            })
+            logger.info("Upserted Luna summary ID %s for %s", summary.id, transaction_date)
             return summary
             
         except Exception as e:
-            logger.error(f"Failed to create Luna summary: {e}", exc_info=True)
+            logger.error("Failed to create Luna summary: %s", e, exc_info=True)
             raise
 
     def _create_hitachi_summary(self, branch, user, subject, parsed_data):
         """
-        Create DailySummary from Hitachi email
+        Create or update the DailySummary from a Hitachi email
         """
-        logger.debug(f"Creating Hitachi summary - Branch: {branch.name}")
+        logger.debug("Creating Hitachi summary - Branch: %s", branch.name)
         
         transaction_date = self._parse_date(parsed_data.get("metadata", {}))
         summary_data = parsed_data.get("summary", {})
         
         try:
-            summary, created = DailySummary.objects.update_or_create(
-                branch=branch,
-                date=transaction_date,
-                source=TransactionSource.EMAIL,
-                defaults={
-                    'gross_sales': summary_data.get("gross_sales", 0),
-                    'total_discount': summary_data.get("total_discount", 0),
-                    'net_sales': summary_data.get("net_sales", 0),
-                    'total_tax': summary_data.get("total_tax", 0),
-                    'total_collected': summary_data.get("total_collected", 0),
-                    'cash_amount': 0,
-                    'qris_amount': 0,  # Hitachi doesn't provide payment breakdown
-                    'transfer_amount': 0,
-                    'raw_data': parsed_data,
-                }
-            )
-            
-            action = "Created" if created else "Updated"
-            logger.info(f"{action} Hitachi summary ID {summary.id} for {transaction_date}")
+            summary = upsert.summary(branch, transaction_date, {
+                'gross_sales': summary_data.get("gross_sales", 0),
+                'total_discount': summary_data.get("total_discount", 0),
+                'net_sales': summary_data.get("net_sales", 0),
+                'total_tax': summary_data.get("total_tax", 0),
+                'total_collected': summary_data.get("total_collected", 0),
+                'cash_amount': 0,
+                'qris_amount': 0,  # Hitachi doesn't provide payment breakdown
+                'transfer_amount': 0,
+                'raw_data': parsed_data,
+            })
+            logger.info("Upserted Hitachi summary ID %s for %s", summary.id, transaction_date)
             return summary
             
         except Exception as e:
-            logger.error(f"Failed to create Hitachi summary: {e}", exc_info=True)
+            logger.error("Failed to create Hitachi summary: %s", e, exc_info=True)
             raise
 
     def _parse_date(self, metadata):
@@ -257,70 +252,28 @@ class EmailWebhookService:
                 for fmt in date_formats:
                     try:
                         transaction_date = datetime.strptime(date_str, fmt).date()
-                        logger.debug(f"Parsed date with format '{fmt}': {transaction_date}")
+                        logger.debug("Parsed date with format '%s': %s", fmt, transaction_date)
                         break
                     except ValueError:
                         continue
             except Exception as e:
-                logger.warning(f"Failed to parse date: {e}")
+                logger.warning("Failed to parse date: %s", e)
         return transaction_date
 
     def _create_transactions(self, branch, user, subject, parsed_data, trx_type, items_key, desc_prefix):
         """
-        Create Transaction records from parsed data
+        Create (or refresh, when the report is re-sent) Transaction records
+        for the report's item lines in a single upsert
         """
-        logger.debug(f"Creating transactions - Branch: {branch.name}, Items key: {items_key}")
+        logger.debug("Creating transactions - Branch: %s, Items key: %s", branch.name, items_key)
         
         transaction_date = self._parse_date(parsed_data.get("metadata", {}))
-        
-        transactions = []
-        duplicates = 0
-        category_cache = {}
         items = (parsed_data or {}).get(items_key, [])
-        logger.info(f"Processing {len(items)} items for transactions")
-        
-        for item in items:
-            name = item.get("name")
-            amount = int(item.get("amount", 0))
-            logger.debug(f"Processing item: {name}, Amount: {amount}")
-            
-            if not name or not amount:
-                logger.debug(f"Skipping item (missing name or zero amount): {item}")
-                continue
-            
-            try:
-                cache_key = (name, trx_type)
-                category = category_cache.get(cache_key)
-                if category is None:
-                    category, cat_created = Category.objects.get_or_create(
-                        name=name,
-                        transaction_type=trx_type
-                    )
-                    category.branches.add(branch)
-                    category_cache[cache_key] = category
-                    if cat_created:
-                        logger.debug(f"Created new category: {name}")
-                    else:
-                        logger.debug(f"Found existing category: {name}")
-                
-                trans = Transaction.objects.create(
-                    branch=branch,
-                    reported_by=user,
-                    amount=amount,
-                    transaction_type=trx_type,
-                    category=category,
-                    date=transaction_date,
-                    description=f"{desc_prefix}: {name} ({subject})",
-                    source=TransactionSource.EMAIL,
-                )
-                transactions.append(trans)
-                logger.debug(f"Created transaction ID {trans.id} for {name}: Rp {amount:,}")
-            except IntegrityError:
-                duplicates += 1
-                logger.warning(f"Duplicate transaction skipped for {name}: Rp {amount:,} on {transaction_date}")
-                continue
-            except Exception as e:
-                logger.error(f"Failed to create transaction for item {item}: {e}", exc_info=True)
+        logger.info("Processing %s items for transactions", len(items))
         
-        logger.info(f"Successfully created {len(transactions)} transactions ({duplicates} duplicates skipped)")
-        return transactions
\ No newline at end of file
+        transactions = upsert.report_items(
+            branch, user, transaction_date, items, trx_type,
+            lambda name: f"{desc_prefix}: {name} ({subject})",
+        )
+        logger.info("Successfully stored %s transactions", len(transactions))
+        return transactions
@@ -3,7 +3,30 @@
 import re
 from bs4 import BeautifulSoup
 
+from app.metrics import timed
+
 CURRENCY_RE = re.compile(r"Rp[\. ]+([\d\.]+)", re.IGNORECASE)
+# "ItemName Rp 123.456 5"; the name must end in a non-space because a bare
+# (.*?)\s+ rescans every long whitespace run once per position (quadratic)
+TOP_ITEM_RE = re.compile(r'^(.*?\S)\s+Rp[\. ]*([\d\.]+)\s+(\d+)$')
+# Bodies without tags or entities are already the text BeautifulSoup would give
+MARKUP_RE = re.compile(r'[<&]')
+DATE_LINE = 'Daily Sales Summary for'
+# Date Pattern: "Daily Sales Summary for 2025-11-05"; the date may also
+# start the next line when HTML markup split them
+DATE_RE = re.compile(r'Daily Sales Summary for\s+(\d{4}-\d{2}-\d{2})')
+DATE_START_RE = re.compile(r'\d{4}-\d{2}-\d{2}')
+# Summary lines look like "*Gross Sales* Rp 180.000" or "Gross Sales Rp 180.000"
+SUMMARY_LABELS = (
+    ("Gross Sales", "gross_sales"),
+    ("Net Sales", "net_sales"),
+    ("Total Collected", "total_collected"),
+    ("Discount", "total_discount"),
+    ("Tax", "total_tax"),
+)
+TOP_ITEMS_START_RE = re.compile(r'top items|item name sales item sold', re.IGNORECASE)
+# How many lines after the date line may hold the business name
+LOCATION_LOOKAHEAD = 3
 
 def clean_currency(value):
     if not value:
@@ -20,100 +43,113 @@ def extract_currency(text):
     match = CURRENCY_RE.search(text)
     return clean_currency(match.group(1)) if match else 0
 
+def parse_top_item(line):
+    """{'name', 'amount', 'count'} of an "ItemName Rp 123.456 5" line, None otherwise"""
+    item_match = TOP_ITEM_RE.match(line)
+    if item_match:
+        name, digits, count = item_match.groups()
+        try:
+            amount = int(digits.replace(".", ""))
+        except ValueError:
+            amount = 0
+        if amount > 0:
+            return {"name": name.strip(), "amount": amount, "count": int(count)}
+    return None
+
+def is_top_items_end(line):
+    return "View All Reports" in line or "Best Regards" in line
+
+def parse_top_items(lines):
+    """Items of the lines following the "Top Items" header, up to the footer"""
+    items = []
+    for line in lines:
+        if is_top_items_end(line):
+            break
+        try:
+            item = parse_top_item(line)
+        except ValueError:
+            break
+        if item:
+            items.append(item)
+    return items
+
+def body_text(email_body):
+    if not MARKUP_RE.search(email_body):
+        return email_body
+    return BeautifulSoup(email_body, 'html.parser').get_text("\n")
+
+@timed('parser', 'hitachi')
 def parse_hitachi_email(email_body):
     """
     Parse Hitachi daily sales summary email
     Format: Daily Sales Summary for YYYY-MM-DD
+
+    One forward pass over the lines picks up the date, the location (the
+    first of the next few lines after the date line that is not a
+    heading), the summary figures and the top items. Summary labels are
+    looked for on every line, item lines included.
     """
     metadata = {}
     summary = {}
     top_items = []
 
-    # 1. Parse HTML First (If available and structured)
-    soup = BeautifulSoup(email_body, 'html.parser')
-    text_content = soup.get_text("\n") # Convert to text with newlines
-
-    # 2. Extract Metadata (Date & Location)
-    
-    # Date Pattern: "Daily Sales Summary for 2025-11-05"
-    date_match = re.search(r'Daily Sales Summary for\s+(\d{4}-\d{2}-\d{2})', text_content)
-    if date_match:
-        metadata['date'] = date_match.group(1)
-
-    # Location Pattern: Look for the line immediately following the Date line
-    # We split by newlines and iterate to find the date line
-    lines = [line.strip() for line in text_content.split('\n') if line.strip()]
-    
-    found_date = False
-    for i, line in enumerate(lines):
-        if 'Daily Sales Summary for' in line:
-            found_date = True
-            # The next non-empty line is usually the business name
-            # But sometimes the business name is repeated or there's noise.
-            # We look ahead up to 3 lines.
-            for j in range(1, 4):
-                if i + j < len(lines):
-                    candidate = lines[i + j]
-                    # Filter out common noise
-                    if candidate and "Sales Summary" not in candidate and "Daily Sales" not in candidate:
-                        metadata['location'] = candidate
-                        break
-            break
-    
-    if 'location' not in metadata:
-        metadata['location'] = "Unknown Branch"
+    date_pending = False      # previous line ended in "Daily Sales Summary for"
+    location_lines = None     # lines left to look at for the location
+    header = True             # date or location still to be found
+    items = False             # inside the top items section
+    items_seen = False
 
-    # 3. Extract Summary Data
-    # We look for lines like "*Gross Sales* Rp 180.000" or just "Gross Sales Rp 180.000"
-    # Mapping readable labels to keys
-    key_map = {
-        "Gross Sales": "gross_sales",
-        "Net Sales": "net_sales",
-        "Total Collected": "total_collected",
-        "Discount": "total_discount",
-        "Tax": "total_tax"
-    }
+    for line in body_text(email_body).split('\n'):
+        line = line.strip()
+        if not line:
+            continue
 
-    for line in lines:
-        for label, key in key_map.items():
-            if label in line and "Rp" in line:
-                # Extract the number at the end
-                amount = extract_currency(line)
-                summary[key] = amount
-
-    # 4. Extract Top Items
-    # Look for the "Top Items" section
-    try:
-        start_index = -1
-        for i, line in enumerate(lines):
-            if "Top Items" in line or "Item Name Sales Item Sold" in line:
-                start_index = i
-                break
-        
-        if start_index != -1:
-            for line in lines[start_index+1:]:
-                if "View All Reports" in line or "Best Regards" in line:
-                    break
-                
-                # Regex for "ItemName Rp 123.456 5"
-                # This matches: Any text (lazy), space, Rp, space/dot, number, space, number
-                item_match = re.search(r'^(.*?)\s+Rp[\. ]+([\d\.]+)\s+(\d+)$', line)
-                if item_match:
-                    name = item_match.group(1).strip()
-                    amount = clean_currency(item_match.group(2))
-                    count = int(item_match.group(3))
-                    
-                    if amount > 0:
-                        top_items.append({
-                            "name": name,
-                            "amount": amount,
-                            "count": count
-                        })
-    except Exception:
-        pass # item parsing failure shouldn't kill the whole process
+        if header:
+            if 'date' not in metadata:
+                if date_pending and DATE_START_RE.match(line):
+                    metadata['date'] = line[:10]
+                date_pending = False
+                if DATE_LINE in line:
+                    date_match = DATE_RE.search(line)
+                    if date_match:
+                        metadata['date'] = date_match.group(1)
+                    else:
+                        date_pending = line.endswith(DATE_LINE)
+
+            if location_lines:
+                location_lines -= 1
+                if "Sales Summary" not in line and "Daily Sales" not in line:
+                    metadata['location'] = line
+                    location_lines = 0
+            elif location_lines is None and DATE_LINE in line:
+                location_lines = LOCATION_LOOKAHEAD
+            header = 'date' not in metadata or location_lines != 0
+
+        if "Rp" in line:
+            for label, key in SUMMARY_LABELS:
+                if label in line:
+                    summary[key] = extract_currency(line)
+
+        if items:
+            if "View All Reports" in line or "Best Regards" in line:
+                items = False
+                continue
+            try:
+                item = parse_top_item(line)
+            except ValueError:
+                # item parsing failure shouldn't kill the whole process
+                items = False
+                continue
+            if item:
+                top_items.append(item)
+        elif not items_seen and TOP_ITEMS_START_RE.search(line):
+            items = items_seen = True
+
+    if 'location' not in metadata:
+        metadata['location'] = "Unknown Branch"
 
     return {
         'metadata': metadata,
         'summary': summary,
         'top_items': top_items,
-    }
\ No newline at end of file
+    }
@@ -0,0 +1,208 @@
+"""
+Header-first triage of IMAP messages
+
+Instead of downloading every unread message whole (RFC822), the ingestion
+first fetches a fingerprint of each one:
+
+    RFC822.SIZE BODYSTRUCTURE BODY.PEEK[HEADER.FIELDS (FROM SUBJECT CONTENT-TYPE)]
+
+From it, skip_reason() tells apart mail that cannot be a report or a
+"Category: Amount" note (bounces, auto-replies, mail without a text
+part); such mail is never downloaded and never reaches the database.
+For the rest only the first inline text part is fetched (text/plain,
+else text/html), so attachments of a forwarded report are never
+transferred. A text part larger than IMAP_BODY_MAX_BYTES is skipped as
+'too_large' rather than cut: a truncated report would ingest only part
+of its items.
+
+An HTML part is only ingested when it holds a POS report marker
+(body_skip_reason); HTML-only newsletters are skipped as 'no_text' and
+HTML never reaches the "Category: Amount" parser, whose pattern would
+match CSS ("margin:0").
+"""
+import binascii
+import quopri
+import re
+from email.parser import BytesHeaderParser
+from itertools import takewhile
+
+from .utils import decode_email_subject
+
+TRIAGE_ITEMS = '(RFC822.SIZE BODYSTRUCTURE BODY.PEEK[HEADER.FIELDS (FROM SUBJECT CONTENT-TYPE)])'
+
+# Delivery failures and out-of-office replies
+BOUNCE_SENDERS = ('mailer-daemon@', 'postmaster@')
+AUTO_REPLY_SUBJECTS = (
+    'automatic reply', 'auto:', 'autoreply', 'out of office',
+    'undeliverable', 'delivery status notification', 'mail delivery failed',
+)
+
+# Markers of the Luna and Hitachi reports (EmailIngestionService._detect_and_parse_email)
+REPORT_MARKERS = ('LUNA POS', 'DAILY SALES SUMMARY', 'MERCHANT STATEMENT')
+
+# One token of a FETCH response: ( ) "quoted" {literal length} or an atom,
+# where an atom may carry a section and partial: BODY[HEADER.FIELDS (FROM)]<0>
+TOKEN_RE = re.compile(rb'\s*(?:(\()|(\))|"((?:[^"\\]|\\.)*)"|\{(\d+)\}$|([^\s()"\[]+(?:\[[^\]]*\])?(?:<\d+>)?))')
+OPEN, CLOSE = object(), object()
+
+
+def _tokens(data):
+    """Tokens of a FETCH response as imaplib returns it: literals come as (line, bytes) tuples"""
+    for chunk in data:
+        literal = None
+        if isinstance(chunk, tuple):
+            chunk, literal = chunk
+        if not isinstance(chunk, bytes):
+            continue
+        pos = 0
+        while match := TOKEN_RE.match(chunk, pos):
+            if match.end() == pos:
+                break
+            pos = match.end()
+            opened, closed, quoted, length, atom = match.groups()
+            if opened:
+                yield OPEN
+            elif closed:
+                yield CLOSE
+            elif quoted is not None:
+                yield re.sub(rb'\\(.)', rb'\1', quoted)
+            elif length is not None:
+                yield literal or b''
+            else:
+                yield None if atom.upper() == b'NIL' else atom
+
+
+def parse_fetch(data):
+    """{ITEM: value} of a one-message FETCH response; lists are nested lists"""
+    stack = [[]]
+    for token in _tokens(data):
+        if token is OPEN:
+            stack.append([])
+        elif token is CLOSE:
+            if len(stack) > 1:
+                done = stack.pop()
+                stack[-1].append(done)
+        else:
+            stack[-1].append(token)
+    # b'12' (NAME value NAME value ...)
+    items = next((token for token in stack[0] if isinstance(token, list)), [])
+    return {
+        items[i].decode('ascii', 'replace').upper(): items[i + 1]
+        for i in range(0, len(items) - 1, 2)
+        if isinstance(items[i], bytes)
+    }
+
+
+def item(items, prefix):
+    """Value of the first item whose name starts with `prefix` (e.g. 'BODY[')"""
+    return next((value for name, value in items.items() if name.startswith(prefix)), None)
+
+
+def _text(value):
+    return value.decode('ascii', 'replace').lower() if isinstance(value, bytes) else ''
+
+
+def _text_parts(body, section=''):
+    """Inline text parts of a BODYSTRUCTURE, in message order"""
+    if not isinstance(body, list) or not body:
+        return
+    if isinstance(body[0], list):
+        # multipart: the parts, then the subtype and extension data
+        parts = takewhile(lambda part: isinstance(part, list), body)
+        for number, child in enumerate(parts, 1):
+            yield from _text_parts(child, f'{section}.{number}' if section else str(number))
+        return
+    if len(body) < 7 or _text(body[0]) != 'text':
+        return
+    # text parts: type subtype params id description encoding size lines md5 disposition
+    disposition = body[9] if len(body) > 9 else None
+    if isinstance(disposition, list) and disposition and _text(disposition[0]) == 'attachment':
+        return
+    params = body[2] if isinstance(body[2], list) else []
+    params = {_text(params[i]): _text(params[i + 1]) for i in range(0, len(params) - 1, 2)}
+    try:
+        size = int(body[6] or 0)
+    except ValueError:
+        size = 0
+    yield {
+        # A single-part message has just part 1
+        'section': section or '1',
+        'subtype': _text(body[1]),
+        'charset': params.get('charset') or 'utf-8',
+        'encoding': _text(body[5]) or '7bit',
+        'size': size,
+    }
+
+
+def text_part(structure):
+    """The part to download: the first inline text/plain, else the first text/html"""
+    parts = list(_text_parts(structure))
+    return (
+        next((part for part in parts if part['subtype'] == 'plain'), None)
+        or next((part for part in parts if part['subtype'] == 'html'), None)
+    )
+
+
+def fingerprint(items):
+    """Sender, subject, content type, size and text part of a triage FETCH"""
+    headers = BytesHeaderParser().parsebytes(item(items, 'BODY[') or b'')
+    try:
+        size = int(items.get('RFC822.SIZE') or 0)
+    except ValueError:
+        size = 0
+    return {
+        'sender': headers.get('From') or '',
+        'subject': decode_email_subject(headers.get('Subject')),
+        'content_type': headers.get_content_type(),
+        'size': size,
+        'part': text_part(items.get('BODYSTRUCTURE')),
+    }
+
+
+def skip_reason(fingerprint, body_limit=None):
+    """
+    Why a message needs no download ('bounce', 'auto_reply', 'no_text',
+    'too_large' past body_limit bytes), None when it does
+    """
+    sender = fingerprint['sender'].lower()
+    if fingerprint['content_type'] == 'multipart/report' or any(marker in sender for marker in BOUNCE_SENDERS):
+        return 'bounce'
+    if fingerprint['subject'].lower().startswith(AUTO_REPLY_SUBJECTS):
+        return 'auto_reply'
+    if fingerprint['part'] is None:
+        return 'no_text'
+    if body_limit is not None and fingerprint['part']['size'] > body_limit:
+        return 'too_large'
+    return None
+
+
+def is_html(part):
+    return part is not None and part['subtype'] == 'html'
+
+
+def body_skip_reason(part, body):
+    """'no_text' for an HTML body that is not a POS report, None otherwise"""
+    if is_html(part):
+        body = body.upper()
+        if not any(marker in body for marker in REPORT_MARKERS):
+            return 'no_text'
+    return None
+
+
+def decode_part(data, part):
+    """Text of a downloaded part (possibly cut at the size cap)"""
+    data = data or b''
+    if part['encoding'] == 'base64':
+        data = re.sub(rb'[^A-Za-z0-9+/=]', b'', data)
+        # A capped download may end inside a 4-character group
+        data = data[:len(data) // 4 * 4]
+        try:
+            data = binascii.a2b_base64(data)
+        except binascii.Error:
+            return ''
+    elif part['encoding'] == 'quoted-printable':
+        data = quopri.decodestring(data)
+    try:
+        return data.decode(part['charset'], errors='replace').strip()
+    except LookupError:
+        return data.decode('utf-8', errors='replace').strip()
@@ -1,10 +1,16 @@
 # Luna POS daily sales report email parser
 
+import functools
 import re
 from collections import defaultdict
 
+from app.metrics import timed
+
 CURRENCY_RE = re.compile(r"Rp\. ([\d\.,]+)")
-COUNT_VALUE_RE = re.compile(r"(.+?)\s+(\d+)\s+Rp\. ([\d\.,]+)")
+# The name must end in a non-space: a bare (.+?)\s+ rescans every long
+# whitespace run once per position, which is quadratic
+COUNT_VALUE_RE = re.compile(r"(.*?\S)\s+(\d+)\s+Rp\. ([\d\.,]+)")
+INT_RE = re.compile(r"\d{1,18}")
 
 def clean_currency(text_value):
     if not text_value:
@@ -18,12 +24,83 @@ def extract_currency(line):
     m = CURRENCY_RE.search(line)
     return clean_currency(m.group(1)) if m else 0
 
+def extract_int(line):
+    """First whole number in the line (at most 18 digits), 0 if there is none"""
+    m = INT_RE.search(line)
+    return int(m.group(0)) if m else 0
+
+# Summary labels per section, in match order: the first label the
+# lowercased line starts with wins ("total sales" before "total")
+LABEL_MAPS = {
+    "daily": {
+        "total sales": "total_sales",
+        "total discount": "total_discount",
+        "total service charge": "total_service_charge",
+        "total tax": "total_tax",
+        "total adjustment": "total_adjustment",
+        "total": "grand_total",
+        "average bill per invoice": "average_bill_per_invoice",
+        "average bill per pax": "average_bill_per_pax",
+        "number of invoices": "number_of_invoices",
+        "pax ": "pax_count",
+    },
+    "month_to_date": {
+        "month to date sales": "sales",
+        "average sales per day": "average_per_day",
+    },
+    "payments": {
+        "cash": "cash",
+        "luna one qris": "qris",
+        "qris": "qris",
+        "total": "total",
+    },
+    "sales_types": {
+        "normal": "normal",
+        "total": "total",
+    },
+}
+
+def compile_labels(label_map):
+    """
+    One anchored alternation for a label table, a group per label
+    Alternatives are tried left to right, so it keeps the table's order
+    """
+    return re.compile("|".join(f"({re.escape(label)})" for label in label_map)), list(label_map.values())
+
+def match_label(lower, compiled):
+    """Key of the first label the (already lowercased) line starts with"""
+    regex, keys = compiled
+    m = regex.match(lower)
+    return keys[m.lastindex - 1] if m else None
+
+LABEL_MATCHERS = {section: compile_labels(labels) for section, labels in LABEL_MAPS.items()}
+# Lines outside the daily section that still carry a daily figure
+DAILY_FALLBACK = compile_labels({
+    "number of invoices": ("number_of_invoices", extract_int),
+    "average bill per invoice": ("average_bill_per_invoice", extract_currency),
+    "average bill per pax": ("average_bill_per_pax", extract_currency),
+    "pax ": ("pax_count", extract_int),
+})
+SECTION_HEADERS = {
+    "pax": "pax",
+    "payments": "payments",
+    "sales types": "sales_types",
+    "top 20 categories": "top_categories",
+    "top 20 products": "top_products",
+}
+LABELED_SECTIONS = ("daily", "month_to_date", "payments", "sales_types")
+DATE_RE = re.compile(r"[a-z]+day,")
+
 def parse_labeled_currency(line, label_map):
-    for label, key in label_map.items():
-        if line.lower().startswith(label):
-            return key, extract_currency(line)
+    key = match_label(line.lower(), _compiled(tuple(label_map.items())))
+    if key:
+        return key, extract_currency(line)
     return None, None
 
+@functools.lru_cache(maxsize=32)
+def _compiled(items):
+    return compile_labels(dict(items))
+
 def parse_top_list(lines):
     items = []
     for line in lines:
@@ -37,42 +114,11 @@ def parse_top_list(lines):
             })
     return items
 
+@timed('parser', 'luna')
 def parse_luna_email(plain_text):
     lines = [ln.strip() for ln in plain_text.strip().splitlines() if ln.strip()]
     data = defaultdict(dict)
     
-    # Default to CASH, will be updated if we find payment details
-    payment_method = "CASH"
-
-    label_maps = {
-        "daily": {
-            "total sales": "total_sales",
-            "total discount": "total_discount",
-            "total service charge": "total_service_charge",
-            "total tax": "total_tax",
-            "total adjustment": "total_adjustment",
-            "total": "grand_total",
-            "average bill per invoice": "average_bill_per_invoice",
-            "average bill per pax": "average_bill_per_pax",
-            "number of invoices": "number_of_invoices",
-            "pax ": "pax_count",
-        },
-        "month_to_date": {
-            "month to date sales": "sales",
-            "average sales per day": "average_per_day",
-        },
-        "payments": {
-            "cash": "cash",
-            "luna one qris": "qris",
-            "qris": "qris",
-            "total": "total",
-        },
-        "sales_types": {
-            "normal": "normal",
-            "total": "total",
-        },
-    }
-
     current_section = "daily"
     top_categories_lines = []
     top_products_lines = []
@@ -83,53 +129,32 @@ def parse_luna_email(plain_text):
         if lower.startswith("month to date"):
             current_section = "month_to_date"
             continue
-        if lower == "pax":
-            current_section = "pax"
-            continue
-        if lower == "payments":
-            current_section = "payments"
-            continue
-        if lower == "sales types":
-            current_section = "sales_types"
-            continue
-        if lower == "top 20 categories":
-            current_section = "top_categories"
-            continue
-        if lower == "top 20 products":
-            current_section = "top_products"
+        section = SECTION_HEADERS.get(lower)
+        if section:
+            current_section = section
             continue
 
-        if current_section in ("daily", "month_to_date", "payments", "sales_types"):
-            key, value = parse_labeled_currency(line, label_maps[current_section])
+        if current_section in LABELED_SECTIONS:
+            key = match_label(lower, LABEL_MATCHERS[current_section])
             if key:
                 if current_section in ("payments", "sales_types"):
-                    data[current_section][key] = value
+                    data[current_section][key] = extract_currency(line)
                 else:
-                    data["summary"][key] = value
+                    data["summary"][key] = extract_currency(line)
                 continue
-            if lower.startswith("number of invoices"):
-                data["summary"]["number_of_invoices"] = int(re.findall(r"\d+", line)[0])
-                continue
-            if lower.startswith("average bill per invoice"):
-                key = label_maps["daily"]["average bill per invoice"]
-                data["summary"][key] = extract_currency(line)
-                continue
-            if lower.startswith("average bill per pax"):
-                key = label_maps["daily"]["average bill per pax"]
-                data["summary"][key] = extract_currency(line)
-                continue
-            if lower.startswith("pax "):
-                key = label_maps["daily"]["pax "]
-                data["summary"][key] = int(re.findall(r"\d+", line)[0])
+            fallback = match_label(lower, DAILY_FALLBACK)
+            if fallback:
+                key, extract = fallback
+                data["summary"][key] = extract(line)
                 continue
 
         if current_section == "pax":
             if lower.startswith("pax "):
-                data["summary"]["pax_count"] = int(re.findall(r"\d+", line)[0])
+                data["summary"]["pax_count"] = extract_int(line)
                 continue
-            key, value = parse_labeled_currency(line, label_maps["daily"])
+            key = match_label(lower, LABEL_MATCHERS["daily"])
             if key:
-                data["summary"][key] = value
+                data["summary"][key] = extract_currency(line)
                 continue
 
         if current_section == "top_categories":
@@ -143,7 +168,7 @@ def parse_luna_email(plain_text):
             data["metadata"]["report_title"] = line
         elif lower.startswith("laundry"):
             data["metadata"]["location"] = line
-        elif re.match(r"[a-z]+day,", lower):
+        elif DATE_RE.match(lower):
             data["metadata"]["date"] = line
 
     data["payments"] = dict(data["payments"])
@@ -152,4 +177,4 @@ def parse_luna_email(plain_text):
     data["top_categories"] = parse_top_list(top_categories_lines)
     data["top_products"] = parse_top_list(top_products_lines)
 
-    return data
\ No newline at end of file
+    return data
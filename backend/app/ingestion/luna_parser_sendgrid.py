@@ -2,6 +2,8 @@ import re
 from collections import defaultdict
 from bs4 import BeautifulSoup
 
+from app.metrics import timed
+
 CURRENCY_RE = re.compile(r"Rp\.\s+([\d\.,]+)")
 
 def clean_currency(text_value):
@@ -14,6 +16,7 @@ def clean_currency(text_value):
     except (ValueError, TypeError):
         return 0
 
+@timed('parser', 'luna_refined')
 def parse_luna_email_refined(full_content, is_html=True):
     """
     Refined parser optimized for SendGrid Luna POS emails
@@ -48,86 +51,83 @@ def parse_luna_email_refined(full_content, is_html=True):
             data["metadata"]["date"] = line
             break
     
-    # Parse all tables
-    tables = soup.find_all('table')
-    
-    for table in tables:
-        rows = table.find_all('tr')
+    # Parse every table row once, in document order
+    # (per-table recursive searches revisit rows of nested layout tables,
+    # which is quadratic on badly nested HTML and duplicates top products)
+    for row in soup.find_all('tr'):
+        cells = row.find_all(['td', 'th'], recursive=False)
+        if len(cells) < 2:
+            continue
+        
+        label = cells[0].get_text(strip=True).lower()
+        value_text = cells[-1].get_text(strip=True)
+        
+        # Summary section
+        if "total sales" in label:
+            data["summary"]["total_sales"] = clean_currency(value_text)
+        elif "total discount" in label:
+            data["summary"]["total_discount"] = clean_currency(value_text)
+        elif "total service charge" in label:
+            data["summary"]["total_service_charge"] = clean_currency(value_text)
+        elif "total tax" in label:
+            data["summary"]["total_tax"] = clean_currency(value_text)
+        elif "total adjustment" in label:
+            data["summary"]["total_adjustment"] = clean_currency(value_text)
+        elif label == "total":
+            data["summary"]["grand_total"] = clean_currency(value_text)
+        elif "number of invoices" in label:
+            try:
+                data["summary"]["number_of_invoices"] = int(value_text)
+            except:
+                pass
+        elif "average bill per invoice" in label:
+            data["summary"]["average_bill_per_invoice"] = clean_currency(value_text)
+        elif "month to date sales" in label:
+            data["summary"]["mtd_sales"] = clean_currency(value_text)
+        elif "average sales per day" in label:
+            data["summary"]["avg_sales_per_day"] = clean_currency(value_text)
+        elif label == "pax":
+            try:
+                data["summary"]["pax_count"] = int(value_text)
+            except:
+                pass
+        elif "average bill per pax" in label:
+            data["summary"]["average_bill_per_pax"] = clean_currency(value_text)
         
-        for row in rows:
-            cells = row.find_all(['td', 'th'])
-            if len(cells) < 2:
+        # Payments section
+        elif label == "cash":
+            data["payments"]["cash"] = clean_currency(value_text)
+        elif label == "qris":
+            data["payments"]["qris"] = clean_currency(value_text)
+        elif label == "transfer":
+            data["payments"]["transfer"] = clean_currency(value_text)
+        
+        # Sales types
+        elif label == "normal":
+            data["sales_types"]["normal"] = clean_currency(value_text)
+        
+        # Top Categories/Products (3 columns: name, count, amount)
+        elif len(cells) == 3:
+            try:
+                item_name = cells[0].get_text(strip=True)
+                count = int(cells[1].get_text(strip=True))
+                amount = clean_currency(cells[2].get_text(strip=True))
+                
+                # Determine if category or product based on context
+                # Categories are usually ALL CAPS (CUCI, SABUN)
+                if item_name.isupper() and len(item_name) < 20:
+                    data["top_categories"].append({
+                        "name": item_name,
+                        "count": count,
+                        "amount": amount
+                    })
+                else:
+                    data["top_products"].append({
+                        "name": item_name,
+                        "count": count,
+                        "amount": amount
+                    })
+            except:
                 continue
-            
-            label = cells[0].get_text(strip=True).lower()
-            value_text = cells[-1].get_text(strip=True)
-            
-            # Summary section
-            if "total sales" in label:
-                data["summary"]["total_sales"] = clean_currency(value_text)
-            elif "total discount" in label:
-                data["summary"]["total_discount"] = clean_currency(value_text)
-            elif "total service charge" in label:
-                data["summary"]["total_service_charge"] = clean_currency(value_text)
-            elif "total tax" in label:
-                data["summary"]["total_tax"] = clean_currency(value_text)
-            elif "total adjustment" in label:
-                data["summary"]["total_adjustment"] = clean_currency(value_text)
-            elif label == "total":
-                data["summary"]["grand_total"] = clean_currency(value_text)
-            elif "number of invoices" in label:
-                try:
-                    data["summary"]["number_of_invoices"] = int(value_text)
-                except:
-                    pass
-            elif "average bill per invoice" in label:
-                data["summary"]["average_bill_per_invoice"] = clean_currency(value_text)
-            elif "month to date sales" in label:
-                data["summary"]["mtd_sales"] = clean_currency(value_text)
-            elif "average sales per day" in label:
-                data["summary"]["avg_sales_per_day"] = clean_currency(value_text)
-            elif label == "pax":
-                try:
-                    data["summary"]["pax_count"] = int(value_text)
-                except:
-                    pass
-            elif "average bill per pax" in label:
-                data["summary"]["average_bill_per_pax"] = clean_currency(value_text)
-            
-            # Payments section
-            elif label == "cash":
-                data["payments"]["cash"] = clean_currency(value_text)
-            elif label == "qris":
-                data["payments"]["qris"] = clean_currency(value_text)
-            elif label == "transfer":
-                data["payments"]["transfer"] = clean_currency(value_text)
-            
-            # Sales types
-            elif label == "normal":
-                data["sales_types"]["normal"] = clean_currency(value_text)
-            
-            # Top Categories/Products (3 columns: name, count, amount)
-            elif len(cells) == 3:
-                try:
-                    item_name = cells[0].get_text(strip=True)
-                    count = int(cells[1].get_text(strip=True))
-                    amount = clean_currency(cells[2].get_text(strip=True))
-                    
-                    # Determine if category or product based on context
-                    # Categories are usually ALL CAPS (CUCI, SABUN)
-                    if item_name.isupper() and len(item_name) < 20:
-                        data["top_categories"].append({
-                            "name": item_name,
-                            "count": count,
-                            "amount": amount
-                        })
-                    else:
-                        data["top_products"].append({
-                            "name": item_name,
-                            "count": count,
-                            "amount": amount
-                        })
-                except:
-                    continue
-    
+
     return data
\ No newline at end of file
@@ -0,0 +1,92 @@
+"""
+Single-statement upserts for POS reports
+
+A report is written as one INSERT ... ON CONFLICT DO UPDATE for its
+DailySummary (keyed on unique_daily_summary) and one for its item lines
+(keyed on Transaction.dedupe_key), so two workers ingesting the same
+report at once both succeed and leave one summary and one row per line,
+without the SELECT-then-write race of update_or_create or an
+IntegrityError per duplicate line.
+
+Re-sent lines only refresh reported_by/description; verification and
+voiding are left alone. bulk_create sends no post_save, so the work of
+those signals (metrics, search index, forecast refresh) is done here.
+"""
+import logging
+
+from app import metrics, search
+from app.analytics import forecast
+from app.models import Category, DailySummary, Transaction, TransactionSource
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_FIELDS = [
+    'gross_sales', 'total_discount', 'net_sales', 'total_tax', 'total_collected',
+    'cash_amount', 'qris_amount', 'transfer_amount', 'raw_data',
+]
+
+
+def summary(branch, day, values, source=TransactionSource.EMAIL):
+    """Insert or overwrite the branch's summary of `day`; `values` maps SUMMARY_FIELDS"""
+    row = DailySummary(branch=branch, date=day, source=source, **values)
+    DailySummary.objects.bulk_create(
+        [row],
+        update_conflicts=True,
+        unique_fields=['branch', 'date', 'source'],
+        update_fields=[*values, 'updated_at'],
+    )
+    metrics.record_inserts(DailySummary, 1, mode='upsert')
+    forecast.schedule_refresh()
+    return row
+
+
+def categories(branch, names, trx_type):
+    """Category per name, creating the missing ones and linking all to the branch"""
+    found = {
+        category.name: category
+        for category in Category.objects.filter(name__in=names, transaction_type=trx_type).order_by('pk')
+    }
+    missing = [Category(name=name, transaction_type=trx_type) for name in names if name not in found]
+    if missing:
+        for category in Category.objects.bulk_create(missing):
+            found[category.name] = category
+    Category.branches.through.objects.bulk_create(
+        [Category.branches.through(category_id=category.pk, branch_id=branch.pk) for category in found.values()],
+        ignore_conflicts=True,
+    )
+    return found
+
+
+def report_items(branch, user, day, items, trx_type, describe):
+    """
+    Upsert the item lines ({'name', 'amount'}) of a report as transactions
+    of `day`; `describe` gives the description of an item name
+    Returns the transactions, new and already stored alike
+    """
+    items = [(item.get('name'), int(item.get('amount') or 0)) for item in items]
+    items = [(name, amount) for name, amount in items if name and amount]
+    if not items:
+        return []
+
+    by_name = categories(branch, sorted({name for name, _ in items}), trx_type)
+    rows = {}
+    for name, amount in items:
+        category = by_name[name]
+        key = Transaction.report_item_key(branch.pk, day, category.pk, trx_type, amount)
+        # One statement cannot touch a row twice (PostgreSQL rejects it)
+        rows.setdefault(key, Transaction(
+            branch=branch, reported_by=user, amount=amount, transaction_type=trx_type,
+            category=category, date=day, description=describe(name),
+            source=TransactionSource.EMAIL, dedupe_key=key,
+        ))
+    # Lock rows in a fixed order so concurrent upserts cannot deadlock
+    transactions = Transaction.objects.bulk_create(
+        [rows[key] for key in sorted(rows)],
+        update_conflicts=True,
+        unique_fields=['dedupe_key'],
+        update_fields=['reported_by', 'description', 'updated_at'],
+    )
+    metrics.record_inserts(Transaction, len(transactions), mode='upsert')
+    search.reindex([trx.pk for trx in transactions])
+    logger.info("Upserted %s report lines for %s on %s", len(transactions), branch.name, day)
+    return transactions
@@ -7,6 +7,8 @@ import logging
 from datetime import datetime
 from typing import Optional, Dict, Tuple
 
+from app.metrics import timed
+
 logger = logging.getLogger(__name__)
 
 
@@ -22,6 +24,7 @@ class WhatsAppMessageParser:
     EXPENSE_KEYWORDS = ['EXPENSE', 'EXPENSE:', 'PENGELUARAN', 'KELUAR', '-']
     
     @staticmethod
+    @timed('parser', 'whatsapp')
     def parse_transaction_message(message: str) -> Optional[Dict]:
         """
         Parse transaction message
@@ -0,0 +1,129 @@
+"""
+Structured logging
+
+Configured from settings.LOGGING:
+
+- RequestContextMiddleware gives every request an id (X-Request-ID is
+  honoured and echoed back) and decides once whether the request's INFO
+  and DEBUG records are kept (LOG_INFO_SAMPLE_RATE), so a sampled request
+  is logged completely and the others not at all. Warnings and errors are
+  always kept.
+- bind(branch=..., source=...) adds fields to every further record of the
+  current request; ContextFilter copies them onto the records.
+- JsonFormatter writes one JSON object per line (LOG_FORMAT=json, the
+  default outside DEBUG).
+- The console handler sits behind a QueueHandler: the request thread only
+  enqueues the record, a listener thread formats and writes it. The
+  listener starts when logging is configured, i.e. in each gunicorn worker
+  (do not use --preload, threads do not survive the fork).
+
+Log with %-style arguments (logger.info('Created %s', obj)), not f-strings:
+the message is then only formatted for records that are actually emitted.
+"""
+import atexit
+import contextvars
+import copy
+import json
+import logging
+import logging.handlers
+import random
+import uuid
+
+from django.conf import settings
+
+_context = contextvars.ContextVar('log_context', default=None)
+
+# Attributes of a bare LogRecord; everything else was passed via extra=
+_RECORD_ATTRS = frozenset(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+
+
+def bind(**fields):
+    """Add fields to the current request's context; a no-op outside requests"""
+    context = _context.get()
+    if context is not None:
+        context.update(fields)
+
+
+def get_context():
+    return _context.get() or {}
+
+
+class ContextFilter(logging.Filter):
+    """Copies the bound context onto the record; drops unsampled INFO/DEBUG"""
+
+    def filter(self, record):
+        context = _context.get()
+        if context is None:
+            return True
+        if record.levelno <= logging.INFO and not context.get('sampled', True):
+            return False
+        for key, value in context.items():
+            if key != 'sampled' and not hasattr(record, key):
+                setattr(record, key, value)
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        payload = {
+            'time': self.formatTime(record, '%Y-%m-%dT%H:%M:%S'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                payload[key] = value
+        if record.exc_info:
+            payload['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            payload['exception'] = record.exc_text
+        return json.dumps(payload, default=str, ensure_ascii=False)
+
+
+class QueueHandler(logging.handlers.QueueHandler):
+    """
+    Enqueues records with the message merged but the traceback kept apart
+    (the stock handler folds it into the message, losing it for JSON)
+    """
+
+    _exc_formatter = logging.Formatter()
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = self._exc_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class QueueListener(logging.handlers.QueueListener):
+    """dictConfig creates the listener but leaves starting it to the caller"""
+
+    def __init__(self, queue, *handlers, respect_handler_level=False):
+        super().__init__(queue, *handlers, respect_handler_level=respect_handler_level)
+        self.start()
+        atexit.register(self.stop)
+
+
+class RequestContextMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex
+        sample_rate = getattr(settings, 'LOG_INFO_SAMPLE_RATE', 1.0)
+        token = _context.set({
+            'request_id': request_id,
+            'method': request.method,
+            'path': request.path,
+            'sampled': sample_rate >= 1 or random.random() < sample_rate,
+        })
+        try:
+            response = self.get_response(request)
+        finally:
+            _context.reset(token)
+        response['X-Request-ID'] = request_id
+        return response
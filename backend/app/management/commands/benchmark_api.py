@@ -0,0 +1,91 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from app.benchmarks import api, datagen
+
+
+class Command(BaseCommand):
+    """
+    Benchmark every REST endpoint and webhook against generated data
+    Runs in a throwaway test database, so the real database is never touched
+
+    Usage:
+        python manage.py benchmark_api
+        python manage.py benchmark_api --scale medium --iterations 50
+        python manage.py benchmark_api --only transaction-list transaction-pending
+        python manage.py benchmark_api --update-baseline
+        python manage.py benchmark_api --only digest-list --update-baseline   # that entry only
+    """
+
+    help = 'Measure query counts, latency and memory of the API and compare with the baseline'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=list(datagen.SCALES), default='small')
+        parser.add_argument(
+            '--iterations',
+            type=int,
+            default=20,
+            help='Timed requests per endpoint (keep below the anon throttle rate)',
+        )
+        parser.add_argument('--only', nargs='+', help='Endpoint names to run')
+        parser.add_argument('--baseline', default=str(api.BASELINE_PATH))
+        parser.add_argument(
+            '--threshold',
+            type=float,
+            default=api.DEFAULT_THRESHOLD,
+            help='Allowed p95/memory growth as a fraction (0.25 = 25%%)',
+        )
+        parser.add_argument('--no-latency', action='store_true', help='Only compare query counts and memory')
+        parser.add_argument('--update-baseline', action='store_true', help='Write results as the new baseline (with --only: replace just those entries)')
+        parser.add_argument('--json', action='store_true', help='Print results as JSON')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            dataset = datagen.generate_scale(options['scale'])
+            results = api.run(dataset, iterations=options['iterations'], only=options['only'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        if options['json']:
+            self.stdout.write(json.dumps({name: vars(r) for name, r in results.items()}, indent=2))
+        else:
+            self.stdout.write(f"Dataset ({options['scale']}): {dataset.counts}")
+            self.stdout.write(f"{'endpoint':<34}{'status':>7}{'queries':>9}{'p50 ms':>10}{'p95 ms':>10}{'peak KiB':>11}")
+            for name, r in results.items():
+                self.stdout.write(f'{name:<34}{r.status:>7}{r.queries:>9}{r.p50_ms:>10}{r.p95_ms:>10}{r.peak_kib:>11}')
+
+        if options['update_baseline']:
+            try:
+                api.write_baseline(results, options['scale'], options['baseline'], merge=bool(options['only']))
+            except ValueError as e:
+                raise CommandError(str(e))
+            self.stdout.write(self.style.SUCCESS(f"Baseline written to {options['baseline']}"))
+            return
+
+        try:
+            baseline = api.load_baseline(options['baseline'])
+        except FileNotFoundError:
+            self.stdout.write(self.style.WARNING('No baseline found, run with --update-baseline to create one'))
+            return
+        if baseline.get('scale') != options['scale']:
+            raise CommandError(f"Baseline was recorded at scale '{baseline.get('scale')}', not '{options['scale']}'")
+
+        regressions = api.compare(
+            results, baseline,
+            threshold=options['threshold'],
+            check_latency=not options['no_latency'],
+        )
+        if regressions:
+            for line in regressions:
+                self.stderr.write(f'  {line}')
+            raise CommandError(f'{len(regressions)} regression(s) against baseline')
+        self.stdout.write(self.style.SUCCESS('No regressions against baseline'))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from app.benchmarks import logs
+
+
+class Command(BaseCommand):
+    """
+    Compare the per-request logging cost of the old eager f-string logging
+    with the structured, queued and sampled setup
+
+    Usage:
+        python manage.py benchmark_logging
+        python manage.py benchmark_logging --requests 10000 --sample-rate 0.05
+    """
+
+    help = 'Measure per-request logging overhead, eager vs structured'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--sample-rate', type=float, default=0.1)
+
+    def handle(self, *args, **options):
+        result = logs.measure(requests=options['requests'], sample_rate=options['sample_rate'])
+        self.stdout.write(f'eager f-strings, synchronous:  {result.eager_us:>8} us/request')
+        self.stdout.write(f'structured, queued:            {result.structured_us:>8} us/request')
+        self.stdout.write(
+            f'structured, sampled at {result.sample_rate:<6} {result.structured_sampled_us:>8} us/request'
+        )
+        self.stdout.write(self.style.SUCCESS(f'Saved {result.saved_us} us per request'))
@@ -0,0 +1,82 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from app.benchmarks import parsers
+
+
+class Command(BaseCommand):
+    """
+    Measure parser throughput on a generated corpus and fuzz the parsers
+    for exceptions and catastrophic backtracking
+
+    Usage:
+        python manage.py benchmark_parsers
+        python manage.py benchmark_parsers --size 1000 --fuzz-iterations 5000
+        python manage.py benchmark_parsers --only luna hitachi --no-fuzz
+        python manage.py benchmark_parsers --update-baseline
+    """
+
+    help = 'Benchmark and fuzz the Luna, Hitachi and WhatsApp parsers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=200, help='Corpus inputs per parser')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--only', nargs='+', choices=list(parsers.PARSERS))
+        parser.add_argument('--fuzz-iterations', type=int, default=500, help='Mutated inputs per parser')
+        parser.add_argument('--time-budget-ms', type=float, default=parsers.DEFAULT_TIME_BUDGET_MS)
+        parser.add_argument('--no-fuzz', action='store_true')
+        parser.add_argument('--baseline', default=str(parsers.BASELINE_PATH))
+        parser.add_argument('--threshold', type=float, default=parsers.DEFAULT_THRESHOLD)
+        parser.add_argument('--update-baseline', action='store_true', help='Write results as the new baseline')
+
+    def handle(self, *args, **options):
+        corpus = parsers.build_corpus(size=options['size'], seed=options['seed'])
+        results = parsers.measure_all(corpus, only=options['only'])
+
+        self.stdout.write(f"{'parser':<16}{'emails/s':>12}{'mean ms':>10}{'p95 ms':>10}{'KiB/email':>11}")
+        for name, r in results.items():
+            self.stdout.write(f'{name:<16}{r.emails_per_sec:>12}{r.mean_ms:>10}{r.p95_ms:>10}{r.peak_kib_per_email:>11}')
+
+        if 'luna' in results:
+            labels = parsers.measure_labels(corpus['luna'])
+            self.stdout.write(
+                f"Luna label lookup: {labels['compiled']:,} lines/s compiled vs {labels['scan']:,} scanning "
+                f"({labels['compiled'] / max(labels['scan'], 1):.1f}x)"
+            )
+
+        problems = []
+        if not options['no_fuzz']:
+            failures = parsers.fuzz(
+                corpus,
+                iterations=options['fuzz_iterations'],
+                seed=options['seed'],
+                time_budget_ms=options['time_budget_ms'],
+                only=options['only'],
+            )
+            for failure in failures:
+                self.stderr.write(f'  [{failure.parser}] {failure.kind}: {failure.detail}\n    {failure.sample}')
+            if failures:
+                problems.append(f'{len(failures)} fuzz failure(s)')
+            else:
+                self.stdout.write(f"Fuzzing: {options['fuzz_iterations']} inputs per parser, no failures")
+
+        if options['update_baseline']:
+            if options['only']:
+                raise CommandError('--update-baseline needs every parser (drop --only)')
+            parsers.write_baseline(results, options['size'], options['baseline'])
+            self.stdout.write(self.style.SUCCESS(f"Baseline written to {options['baseline']}"))
+        else:
+            try:
+                baseline = parsers.load_baseline(options['baseline'])
+            except FileNotFoundError:
+                baseline = None
+                self.stdout.write(self.style.WARNING('No baseline found, run with --update-baseline to create one'))
+            if baseline:
+                regressions = parsers.compare(results, baseline, threshold=options['threshold'])
+                for line in regressions:
+                    self.stderr.write(f'  {line}')
+                if regressions:
+                    problems.append(f'{len(regressions)} regression(s) against baseline')
+
+        if problems:
+            raise CommandError(', '.join(problems))
+        self.stdout.write(self.style.SUCCESS('Parsers OK'))
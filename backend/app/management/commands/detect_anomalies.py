@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from app.analytics.anomalies import detect
+
+
+class Command(BaseCommand):
+    """
+    Score daily branch sales and expenses and store the anomalies
+    (see app/analytics/anomalies.py); meant to run daily from cron
+
+    Usage:
+        python manage.py detect_anomalies
+        python manage.py detect_anomalies --days 90
+        python manage.py detect_anomalies --full
+    """
+
+    help = 'Detect anomalies in daily branch revenue and expenses'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=30,
+            help='Number of most recent days to re-score (default 30)',
+        )
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Re-score all history',
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        found = detect(days=None if options['full'] else options['days'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f'Found {len(found)} anomaly(ies) in {elapsed:.2f}s'))
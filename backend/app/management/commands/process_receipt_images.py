@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+from app.models import Transaction
+from app.receipt_images import process_receipt
+
+
+class Command(BaseCommand):
+    """
+    Run the receipt image pipeline for evidence images that were uploaded
+    before the pipeline existed (or whose background run was lost)
+
+    Usage:
+        python manage.py process_receipt_images
+        python manage.py process_receipt_images --limit 500
+    """
+
+    help = 'Thumbnail, recompress and deduplicate unprocessed receipt images'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=None,
+            help='Maximum number of transactions to process',
+        )
+
+    def handle(self, *args, **options):
+        pending = (
+            Transaction.objects
+            .exclude(evidence_image='')
+            .exclude(evidence_image__isnull=True)
+            .filter(evidence_variants__isnull=True)
+            .order_by('pk')
+            .values_list('pk', flat=True)
+        )
+        if options['limit']:
+            pending = pending[:options['limit']]
+
+        processed = 0
+        for pk in pending.iterator():
+            if process_receipt(pk) is not None:
+                processed += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Processed {processed} receipt image(s)'))
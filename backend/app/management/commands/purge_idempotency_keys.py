@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from app.idempotency import purge_expired
+
+
+class Command(BaseCommand):
+    """
+    Delete stored Idempotency-Key responses past IDEMPOTENCY_KEY_TTL
+    (see app/idempotency.py); meant to run daily from cron
+
+    Usage:
+        python manage.py purge_idempotency_keys
+    """
+
+    help = 'Delete expired idempotency keys'
+
+    def handle(self, *args, **options):
+        deleted = purge_expired()
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} expired key(s)'))
@@ -0,0 +1,77 @@
+from datetime import datetime, time, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from app.models import IngestionLog, IngestionStatus, TransactionSource
+from app.purge import purge_logs
+
+
+class Command(BaseCommand):
+    """
+    Delete ingestion logs in set-based batches, e.g. to clean up a day of
+    duplicated ingestion; see app/purge.py
+
+    Usage:
+        python manage.py purge_ingestion_logs --status FAILED --before 2026-01-01
+        python manage.py purge_ingestion_logs --date 2026-03-02 --source EMAIL --with-transactions
+        python manage.py purge_ingestion_logs --date 2026-03-02 --dry-run
+    """
+
+    help = 'Delete ingestion logs (and optionally their transactions) in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--status', choices=IngestionStatus.values)
+        parser.add_argument('--source', choices=TransactionSource.values)
+        parser.add_argument('--date', help='Only logs created on this day (YYYY-MM-DD)')
+        parser.add_argument('--before', help='Only logs created before this day (YYYY-MM-DD)')
+        parser.add_argument(
+            '--with-transactions',
+            action='store_true',
+            help='Also delete the transactions created by the logs',
+        )
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report how many logs would be deleted',
+        )
+
+    def _day_start(self, value):
+        try:
+            day = datetime.strptime(value, '%Y-%m-%d').date()
+        except ValueError:
+            raise CommandError(f'Invalid date {value!r}, expected YYYY-MM-DD')
+        return timezone.make_aware(datetime.combine(day, time.min))
+
+    def handle(self, *args, **options):
+        if not any(options[name] for name in ('status', 'source', 'date', 'before')):
+            raise CommandError('Refusing to purge every log; pass at least one filter')
+
+        logs = IngestionLog.objects.all()
+        if options['status']:
+            logs = logs.filter(status=options['status'])
+        if options['source']:
+            logs = logs.filter(source=options['source'])
+        if options['date']:
+            start = self._day_start(options['date'])
+            logs = logs.filter(created_at__gte=start, created_at__lt=start + timedelta(days=1))
+        if options['before']:
+            logs = logs.filter(created_at__lt=self._day_start(options['before']))
+
+        if options['dry_run']:
+            count = logs.count()
+            linked = logs.exclude(created_transaction=None).count()
+            self.stdout.write(f'Would delete {count} log(s), {linked} with a linked transaction')
+            return
+
+        result = purge_logs(
+            logs,
+            with_transactions=options['with_transactions'],
+            batch_size=options['batch_size'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Deleted {result['logs']} log(s) and {result['transactions']} transaction(s) "
+            f"in {result['batches']} batch(es); unlinked {result['summaries_unlinked']} daily "
+            f"summary(ies) and {result['logs_unlinked']} other log(s)"
+        ))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from app import search
+
+
+class Command(BaseCommand):
+    """
+    Rebuild the transaction full-text index from scratch
+    Normally the index is kept up to date on save; use this after bulk
+    imports done outside the ORM or after changing SEARCH_CONFIG
+
+    Usage:
+        python manage.py rebuild_search_index
+    """
+
+    help = 'Rebuild the full-text search index for transactions'
+
+    def handle(self, *args, **options):
+        count = search.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Indexed {count} transaction(s)'))
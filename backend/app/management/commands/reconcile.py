@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from app.reconciliation import reconcile
+
+
+class Command(BaseCommand):
+    """
+    Compare DailySummary totals with the itemized email transactions and
+    record mismatches as ReconciliationIssue rows; see app/reconciliation.py
+    Meant to run from cron; each run only checks days touched since the last
+
+    Usage:
+        python manage.py reconcile
+        python manage.py reconcile --full
+    """
+
+    help = 'Reconcile daily summaries against itemized transactions'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Check every day, not only the ones touched since the last run',
+        )
+
+    def handle(self, *args, **options):
+        run = reconcile(full=options['full'])
+        seconds = (run.finished_at - run.started_at).total_seconds()
+        self.stdout.write(self.style.SUCCESS(
+            f'Checked {run.days_checked} day(s) in {seconds:.2f}s, found {run.issues_found} issue(s)'
+        ))
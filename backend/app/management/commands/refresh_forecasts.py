@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from app.analytics.forecast import refresh
+
+
+class Command(BaseCommand):
+    """
+    Bring the forecast fits up to date (see app/analytics/forecast.py)
+    Ingestion already refreshes them in the background; run --full nightly
+    to also pick up deleted rows and history edited outside the ORM
+
+    Usage:
+        python manage.py refresh_forecasts
+        python manage.py refresh_forecasts --full
+    """
+
+    help = 'Refresh the revenue and expense forecast fits'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Refit every series from its whole history',
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        counts = refresh(full=options['full'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Refitted {counts['refitted']} and updated {counts['updated']} series in {elapsed:.2f}s"
+        ))
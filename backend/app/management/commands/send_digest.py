@@ -0,0 +1,71 @@
+from datetime import date
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app import digest as digests
+from app.models import DigestPeriod
+
+
+class Command(BaseCommand):
+    """
+    Build the owner digest of the latest complete day or week and send it
+    (see app/digest.py); meant to run from cron after midnight
+
+    Usage:
+        python manage.py send_digest daily --deliver
+        python manage.py send_digest weekly --deliver
+        python manage.py send_digest daily --date 2026-03-02 --rebuild
+        python manage.py send_digest weekly --output /tmp/digests
+    """
+
+    help = 'Build (and optionally deliver) the daily or weekly owner digest'
+
+    def add_arguments(self, parser):
+        parser.add_argument('period', choices=['daily', 'weekly'])
+        parser.add_argument(
+            '--date',
+            help='A day inside the period (YYYY-MM-DD); default: the latest complete one',
+        )
+        parser.add_argument(
+            '--rebuild',
+            action='store_true',
+            help='Recompute a stored digest (outside DIGEST_BUSINESS_HOURS only)',
+        )
+        parser.add_argument(
+            '--deliver',
+            action='store_true',
+            help='Send the WhatsApp text to the owners',
+        )
+        parser.add_argument(
+            '--output',
+            help='Directory to write the HTML, text and (with xhtml2pdf) PDF versions to',
+        )
+
+    def handle(self, *args, **options):
+        period = DigestPeriod.DAILY if options['period'] == 'daily' else DigestPeriod.WEEKLY
+        if options['date']:
+            try:
+                day = date.fromisoformat(options['date'])
+            except ValueError:
+                raise CommandError(f"Invalid --date '{options['date']}', expected YYYY-MM-DD")
+        else:
+            day = digests.latest_complete(period)
+
+        digest = digests.build(period, day, rebuild=options['rebuild'])
+        self.stdout.write(self.style.SUCCESS(f'{digest}: {digest.data["totals"]["transactions"]} transaction(s)'))
+
+        if options['output']:
+            directory = Path(options['output'])
+            directory.mkdir(parents=True, exist_ok=True)
+            name = f'{period.lower()}-{digest.start}'
+            (directory / f'{name}.html').write_text(digest.html, encoding='utf-8')
+            (directory / f'{name}.txt').write_text(digest.text, encoding='utf-8')
+            pdf = digests.pdf_of(digest)
+            if pdf is not None:
+                (directory / f'{name}.pdf').write_bytes(pdf)
+            self.stdout.write(f'Written to {directory}')
+
+        if options['deliver']:
+            sent = digests.deliver(digest)
+            self.stdout.write(self.style.SUCCESS(f'Sent to {sent} owner number(s)'))
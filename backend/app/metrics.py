@@ -0,0 +1,169 @@
+"""
+Prometheus metrics
+
+Exported from /metrics in the Prometheus text format, or OpenMetrics when
+the scraper asks for it (Accept: application/openmetrics-text). Requires
+the optional prometheus-client package (pip install 'backend[metrics]');
+without it every helper here is a no-op and /metrics answers 404.
+
+/metrics requires "Authorization: Bearer <METRICS_TOKEN>". With
+METRICS_TOKEN unset it answers 404 unless DEBUG is on, so a deployment
+that forgot the token does not publish its traffic and ingestion numbers.
+
+Under gunicorn set PROMETHEUS_MULTIPROC_DIR to an empty, writable
+directory: each worker then writes its samples to mmap files there and
+/metrics aggregates all of them (gunicorn.conf.py cleans up after exited
+workers). Without it each process reports only its own numbers.
+
+Recorded:
+
+- http_request_duration_seconds{route,method,status}  MetricsMiddleware
+- http_request_db_queries{route}                      MetricsMiddleware
+- parse_duration_seconds{parser}                      @timed on the parsers
+- ingestion_duration_seconds{source}                  @timed on the ingestion entry points
+- ingestion_logs_total{source,status}                 IngestionLog saves (app/signals.py)
+- db_inserts_total{model,mode}                        single saves and record_inserts() for bulk/upsert
+- imap_messages_total{outcome}                        IMAP triage: downloaded, or the skip reason
+"""
+import functools
+import os
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, HttpResponseNotFound
+from django.utils.crypto import constant_time_compare
+
+try:
+    import prometheus_client
+    from prometheus_client import CollectorRegistry, Counter, Histogram, multiprocess
+    from prometheus_client.exposition import choose_encoder
+except ImportError:
+    prometheus_client = None
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+if prometheus_client:
+    REQUEST_LATENCY = Histogram(
+        'http_request_duration_seconds', 'Request latency by route',
+        ['route', 'method', 'status'], buckets=LATENCY_BUCKETS,
+    )
+    REQUEST_QUERIES = Histogram(
+        'http_request_db_queries', 'Database queries per request',
+        ['route'], buckets=QUERY_BUCKETS,
+    )
+    DURATIONS = {
+        'parser': Histogram(
+            'parse_duration_seconds', 'Time to parse one POS report',
+            ['parser'], buckets=LATENCY_BUCKETS,
+        ),
+        'source': Histogram(
+            'ingestion_duration_seconds', 'Time to ingest one webhook or bot message',
+            ['source'], buckets=LATENCY_BUCKETS,
+        ),
+    }
+    INGESTION_LOGS = Counter(
+        'ingestion_logs', 'Ingestion log saves by outcome', ['source', 'status'],
+    )
+    INSERTS = Counter(
+        'db_inserts', 'Rows inserted (or upserted), single saves vs bulk_create', ['model', 'mode'],
+    )
+    IMAP_MESSAGES = Counter(
+        'imap_messages', 'Unread IMAP messages by triage outcome', ['outcome'],
+    )
+
+
+def enabled():
+    return prometheus_client is not None
+
+
+def timed(label, value):
+    """
+    Observe the wrapped callable's duration, e.g. @timed('parser', 'luna');
+    label is 'parser' or 'source'
+    """
+
+    def decorator(func):
+        if not enabled():
+            return func
+        histogram = DURATIONS[label].labels(value)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - started)
+
+        return wrapper
+
+    return decorator
+
+
+def record_ingestion_log(source, status):
+    if enabled():
+        INGESTION_LOGS.labels(source, status).inc()
+
+
+def record_inserts(model, count, mode='bulk'):
+    if enabled() and count:
+        INSERTS.labels(model._meta.model_name, mode).inc(count)
+
+
+def record_imap_message(outcome):
+    if enabled():
+        IMAP_MESSAGES.labels(outcome).inc()
+
+
+class MetricsMiddleware:
+    """Latency and query count per resolved route (the URL pattern, not the path)"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not enabled():
+            return self.get_response(request)
+
+        queries = 0
+
+        def count_query(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(count_query))
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - started
+
+        match = getattr(request, 'resolver_match', None)
+        route = match.route if match else 'unmatched'
+        REQUEST_LATENCY.labels(route, request.method, response.status_code).observe(elapsed)
+        REQUEST_QUERIES.labels(route).observe(queries)
+        return response
+
+
+def metrics_view(request):
+    """GET /metrics, guarded by METRICS_TOKEN (Bearer); open only under DEBUG when unset"""
+    if not enabled():
+        return HttpResponseNotFound('prometheus-client is not installed')
+
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if not token and not settings.DEBUG:
+        return HttpResponseNotFound('METRICS_TOKEN is not set')
+    if token and not constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return HttpResponse(status=401)
+
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = prometheus_client.REGISTRY
+    encoder, content_type = choose_encoder(request.headers.get('Accept', ''))
+    return HttpResponse(encoder(registry), content_type=content_type)
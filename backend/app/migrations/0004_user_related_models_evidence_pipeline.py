@@ -0,0 +1,87 @@
+# Generated by Django 5.2.10 on 2026-10-19 11:25
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def copy_user_contact_fields(apps, schema_editor):
+    User = apps.get_model('app', 'User')
+    UserPhoneNumber = apps.get_model('app', 'UserPhoneNumber')
+    UserBranchAssignment = apps.get_model('app', 'UserBranchAssignment')
+
+    for user in User.objects.exclude(phone_number__isnull=True).exclude(phone_number=''):
+        UserPhoneNumber.objects.get_or_create(user=user, phone_number=user.phone_number)
+    for user in User.objects.exclude(assigned_branch__isnull=True):
+        UserBranchAssignment.objects.get_or_create(user=user, branch_id=user.assigned_branch_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0003_dailysummary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='evidence_hash',
+            field=models.CharField(blank=True, db_index=True, help_text='SHA-256 of the uploaded receipt, used to deduplicate identical images', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='evidence_variants',
+            field=models.JSONField(blank=True, help_text='Thumbnail paths generated by the receipt image pipeline', null=True),
+        ),
+        migrations.CreateModel(
+            name='UserLineID',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('line_id', models.CharField(max_length=100, unique=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='line_ids', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='UserPhoneNumber',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('phone_number', models.CharField(max_length=20, unique=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='phone_numbers', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='UserBranchAssignment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('branch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='assigned_staff', to='app.branch')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='branch_assignments', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('user', 'branch')},
+            },
+        ),
+        # Carry the old single-value columns over before dropping them
+        migrations.RunPython(copy_user_contact_fields, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='user',
+            name='assigned_branch',
+        ),
+        migrations.RemoveField(
+            model_name='user',
+            name='phone_number',
+        ),
+    ]
@@ -0,0 +1,74 @@
+# Generated by Django 5.2.10 on 2026-10-19 11:31
+
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    """
+    PostgreSQL: GIN indexes on the tsvector and trigram index on description
+    SQLite: FTS5 table (skipped if this SQLite build has no FTS5)
+    Both are backfilled from the existing rows
+    """
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(
+            "CREATE INDEX IF NOT EXISTS app_transaction_search_gin "
+            "ON app_transaction USING gin (search_vector)"
+        )
+        schema_editor.execute(
+            "CREATE INDEX IF NOT EXISTS app_transaction_description_trgm "
+            "ON app_transaction USING gin (description gin_trgm_ops)"
+        )
+        schema_editor.execute(
+            """
+            UPDATE app_transaction t SET search_vector =
+                setweight(to_tsvector('simple', coalesce(t.description, '')), 'A') ||
+                setweight(to_tsvector('simple', coalesce(c.name, '')), 'B') ||
+                setweight(to_tsvector('simple', coalesce(t.source_identifier, '')), 'C')
+            FROM app_category c WHERE c.id = t.category_id
+            """
+        )
+    elif vendor == 'sqlite':
+        try:
+            schema_editor.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS app_transaction_fts USING fts5("
+                "description, category, source_identifier, "
+                "tokenize = 'unicode61 remove_diacritics 2')"
+            )
+        except Exception:
+            return
+        schema_editor.execute(
+            """
+            INSERT INTO app_transaction_fts (rowid, description, category, source_identifier)
+            SELECT t.id, t.description, c.name, t.source_identifier
+            FROM app_transaction t JOIN app_category c ON c.id = t.category_id
+            """
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute("DROP INDEX IF EXISTS app_transaction_search_gin")
+        schema_editor.execute("DROP INDEX IF EXISTS app_transaction_description_trgm")
+    elif vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE IF EXISTS app_transaction_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0004_user_related_models_evidence_pipeline'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='transaction',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.10 on 2026-10-19 12:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0005_transaction_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingestionlog',
+            name='timings',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
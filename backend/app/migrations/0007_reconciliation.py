@@ -0,0 +1,49 @@
+# Generated by Django 5.2.10 on 2026-10-19 12:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0006_ingestionlog_timings'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReconciliationRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started_at', models.DateTimeField()),
+                ('finished_at', models.DateTimeField()),
+                ('full', models.BooleanField(default=False)),
+                ('days_checked', models.PositiveIntegerField(default=0)),
+                ('issues_found', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['-started_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ReconciliationIssue',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('date', models.DateField()),
+                ('kind', models.CharField(choices=[('SALES_MISMATCH', 'Net sales differ from transactions'), ('PAYMENT_MISMATCH', 'Payments differ from total collected'), ('MISSING_SUMMARY', 'Transactions without a daily summary')], max_length=20)),
+                ('expected', models.DecimalField(decimal_places=2, help_text='Figure reported by the summary', max_digits=14)),
+                ('actual', models.DecimalField(decimal_places=2, help_text='What the transactions (or payment breakdown) add up to', max_digits=14)),
+                ('difference', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('transaction_count', models.PositiveIntegerField(default=0)),
+                ('branch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reconciliation_issues', to='app.branch')),
+                ('summary', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='reconciliation_issues', to='app.dailysummary')),
+            ],
+            options={
+                'ordering': ['-date', 'branch'],
+                'indexes': [models.Index(fields=['date', 'branch'], name='app_reconci_date_ca2576_idx')],
+                'constraints': [models.UniqueConstraint(fields=('branch', 'date', 'kind'), name='unique_reconciliation_issue')],
+            },
+        ),
+    ]
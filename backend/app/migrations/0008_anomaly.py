@@ -0,0 +1,34 @@
+# Generated by Django 5.2.10 on 2026-10-19 12:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0007_reconciliation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Anomaly',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('date', models.DateField()),
+                ('kind', models.CharField(choices=[('REVENUE_SPIKE', 'Sales far above normal'), ('REVENUE_DROP', 'Sales far below normal'), ('MISSING_REPORT', 'No sales report'), ('EXPENSE_SPIKE', 'Unusually large expense')], max_length=20)),
+                ('value', models.DecimalField(blank=True, decimal_places=2, help_text="The day's amount; empty for a missing report", max_digits=14, null=True)),
+                ('baseline', models.DecimalField(blank=True, decimal_places=2, help_text='Typical amount (median of the comparison window)', max_digits=14, null=True)),
+                ('score', models.FloatField(blank=True, help_text='Robust z-score of the amount against the baseline', null=True)),
+                ('branch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='anomalies', to='app.branch')),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='anomalies', to='app.category')),
+            ],
+            options={
+                'verbose_name_plural': 'Anomalies',
+                'ordering': ['-date', 'branch'],
+                'indexes': [models.Index(fields=['date', 'branch'], name='app_anomaly_date_d6784a_idx'), models.Index(fields=['kind', 'date'], name='app_anomaly_kind_54a1a4_idx')],
+            },
+        ),
+    ]
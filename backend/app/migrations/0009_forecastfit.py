@@ -0,0 +1,38 @@
+# Generated by Django 5.2.10 on 2026-10-19 12:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0008_anomaly'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ForecastFit',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('method', models.CharField(choices=[('SEASONAL_NAIVE', 'Same weekday last week'), ('EXP_SMOOTHING', 'Exponential smoothing with weekday seasonality')], help_text='The method with the lower one-day-ahead error so far', max_length=20)),
+                ('alpha', models.FloatField(help_text='Level smoothing')),
+                ('gamma', models.FloatField(help_text='Weekday seasonality smoothing')),
+                ('level', models.FloatField()),
+                ('season', models.JSONField(help_text='Weekday offsets from the level')),
+                ('last_week', models.JSONField(help_text='Latest value seen on each weekday')),
+                ('smoothing_sse', models.FloatField(default=0)),
+                ('naive_sse', models.FloatField(default=0)),
+                ('errors', models.PositiveIntegerField(default=0, help_text='Days both methods were scored on')),
+                ('fitted_through', models.DateField()),
+                ('refreshed_at', models.DateTimeField(help_text='Start of the refresh that last updated this fit')),
+                ('branch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='forecast_fits', to='app.branch')),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='forecast_fits', to='app.category')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('branch', 'category'), name='unique_forecast_fit'), models.UniqueConstraint(condition=models.Q(('category__isnull', True)), fields=('branch',), name='unique_forecast_fit_revenue')],
+            },
+        ),
+    ]
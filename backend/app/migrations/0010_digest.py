@@ -0,0 +1,33 @@
+# Generated by Django 5.2.10 on 2026-10-19 12:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0009_forecastfit'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Digest',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('period', models.CharField(choices=[('DAILY', 'Daily'), ('WEEKLY', 'Weekly')], max_length=10)),
+                ('start', models.DateField()),
+                ('end', models.DateField()),
+                ('data', models.JSONField(help_text='Aggregates the digest is rendered from')),
+                ('html', models.TextField(blank=True)),
+                ('text', models.TextField(blank=True, help_text='Compact WhatsApp version')),
+                ('pdf', models.BinaryField(blank=True, help_text='Rendered on first request', null=True)),
+                ('delivered_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['-start', 'period'],
+                'constraints': [models.UniqueConstraint(fields=('period', 'start'), name='unique_digest_period')],
+            },
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.2.10 on 2026-10-19 13:03
+
+from django.db import migrations, models
+
+
+def backfill_report_item_keys(apps, schema_editor):
+    """
+    POS report lines were kept unique by unique_transaction_per_source;
+    give the existing ones the dedupe_key that replaces it
+    (same format as Transaction.report_item_key)
+    """
+    Transaction = apps.get_model('app', 'Transaction')
+    rows = Transaction.objects.filter(source='EMAIL', transaction_type='INCOME').values_list(
+        'pk', 'branch_id', 'date', 'category_id', 'transaction_type', 'amount'
+    )
+    batch = []
+    for pk, branch_id, day, category_id, transaction_type, amount in rows.iterator(chunk_size=2000):
+        batch.append(Transaction(
+            pk=pk,
+            dedupe_key=f"report:{branch_id}:{day.isoformat()}:{category_id}:{transaction_type}:{int(amount)}",
+        ))
+        if len(batch) == 2000:
+            Transaction.objects.bulk_update(batch, ['dedupe_key'])
+            batch = []
+    Transaction.objects.bulk_update(batch, ['dedupe_key'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0010_digest'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IdempotencyKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(help_text='Endpoint and caller', max_length=100)),
+                ('key', models.CharField(max_length=255)),
+                ('fingerprint', models.CharField(help_text='SHA-256 of the method, path and body', max_length=64)),
+                ('status_code', models.PositiveSmallIntegerField(blank=True, help_text='Empty while the first request is processing', null=True)),
+                ('response_body', models.JSONField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='dedupe_key',
+            field=models.CharField(blank=True, editable=False, max_length=150, null=True, unique=True),
+        ),
+        migrations.RunPython(backfill_report_item_keys, migrations.RunPython.noop),
+        # Identical manual expenses on one day are legitimate; retries are
+        # handled by Idempotency-Key (app/idempotency.py)
+        migrations.RemoveConstraint(
+            model_name='transaction',
+            name='unique_transaction_per_source',
+        ),
+        migrations.AddConstraint(
+            model_name='idempotencykey',
+            constraint=models.UniqueConstraint(fields=('scope', 'key'), name='unique_idempotency_key'),
+        ),
+    ]
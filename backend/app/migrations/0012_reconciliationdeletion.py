@@ -0,0 +1,23 @@
+# Generated by Django 5.2.10 on 2026-10-19 14:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0011_idempotency'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReconciliationDeletion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('deleted_at', models.DateTimeField(auto_now_add=True)),
+                ('branch', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='app.branch')),
+            ],
+        ),
+    ]
@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser
+from django.contrib.postgres.search import SearchVectorField
 import uuid
 
 # ==========================================
@@ -46,6 +47,25 @@ class PaymentMethod(models.TextChoices):
     QRIS = 'QRIS', 'QRIS'
     TRANSFER = 'TRANSFER', 'Transfer'
 
+class ReconciliationIssueKind(models.TextChoices):
+    SALES_MISMATCH = 'SALES_MISMATCH', 'Net sales differ from transactions'
+    PAYMENT_MISMATCH = 'PAYMENT_MISMATCH', 'Payments differ from total collected'
+    MISSING_SUMMARY = 'MISSING_SUMMARY', 'Transactions without a daily summary'
+
+class AnomalyKind(models.TextChoices):
+    REVENUE_SPIKE = 'REVENUE_SPIKE', 'Sales far above normal'
+    REVENUE_DROP = 'REVENUE_DROP', 'Sales far below normal'
+    MISSING_REPORT = 'MISSING_REPORT', 'No sales report'
+    EXPENSE_SPIKE = 'EXPENSE_SPIKE', 'Unusually large expense'
+
+class ForecastMethod(models.TextChoices):
+    SEASONAL_NAIVE = 'SEASONAL_NAIVE', 'Same weekday last week'
+    EXP_SMOOTHING = 'EXP_SMOOTHING', 'Exponential smoothing with weekday seasonality'
+
+class DigestPeriod(models.TextChoices):
+    DAILY = 'DAILY', 'Daily'
+    WEEKLY = 'WEEKLY', 'Weekly'
+
 # ==========================================
 # 3. DOMAIN MODELS
 # ==========================================
@@ -147,6 +167,8 @@ class IngestionLog(TimeStampedModel):
         blank=True,
         related_name='ingestion_logs'
     )
+    # Per-stage timing breakdown from app/tracing.py
+    timings = models.JSONField(null=True, blank=True)
 
     def __str__(self):
         return f"Log #{self.id} - {self.source} - {self.status}"
@@ -198,9 +220,26 @@ class Transaction(TimeStampedModel):
         help_text="WhatsApp phone number that sent the data"
     )
     evidence_image = models.ImageField(upload_to='receipts/%Y/%m/', blank=True, null=True)
+    evidence_hash = models.CharField(
+        max_length=64,
+        blank=True,
+        db_index=True,
+        help_text="SHA-256 of the uploaded receipt, used to deduplicate identical images"
+    )
+    evidence_variants = models.JSONField(
+        blank=True,
+        null=True,
+        help_text="Thumbnail paths generated by the receipt image pipeline"
+    )
 
     # Unique identifier for the transaction
     uuid = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
+    # Natural key of rows that must exist once (a POS report line); empty for
+    # manual entries, where two identical expenses on a day are legitimate
+    dedupe_key = models.CharField(max_length=150, null=True, blank=True, unique=True, editable=False)
+
+    # Full-text search document (PostgreSQL only, maintained by app/search.py)
+    search_vector = SearchVectorField(null=True, editable=False)
 
     class Meta:
         ordering = ['-date', '-created_at']
@@ -210,13 +249,10 @@ class Transaction(TimeStampedModel):
             models.Index(fields=['reported_by']),
         ]
 
-        # Constrain to prevent duplicate transactions
-        constraints = [
-            models.UniqueConstraint(
-                fields=['branch', 'date', 'amount', 'transaction_type', 'category', 'source', 'source_identifier'],
-                name='unique_transaction_per_source'
-            ),
-        ]
+    @staticmethod
+    def report_item_key(branch_id, day, category_id, transaction_type, amount):
+        """dedupe_key of a POS report line: once per branch, day, product and amount"""
+        return f"report:{branch_id}:{day.isoformat()}:{category_id}:{transaction_type}:{int(amount)}"
 
     def __str__(self):
         status = "✓" if self.is_verified else "⏳"
@@ -291,3 +327,242 @@ class DailySummary(TimeStampedModel):
 
     def __str__(self):
         return f"{self.date} - {self.branch.name} - {self.source} - Rp {self.total_collected:,}"
+
+
+class ReconciliationIssue(TimeStampedModel):
+    """
+    A disagreement between a DailySummary and the itemized transactions of
+    the same branch and day, found by app/reconciliation.py
+    """
+    branch = models.ForeignKey(
+        'Branch',
+        on_delete=models.CASCADE,
+        related_name='reconciliation_issues'
+    )
+    date = models.DateField()
+    kind = models.CharField(max_length=20, choices=ReconciliationIssueKind.choices)
+    summary = models.ForeignKey(
+        'DailySummary',
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='reconciliation_issues'
+    )
+    expected = models.DecimalField(
+        max_digits=14, decimal_places=2,
+        help_text="Figure reported by the summary"
+    )
+    actual = models.DecimalField(
+        max_digits=14, decimal_places=2,
+        help_text="What the transactions (or payment breakdown) add up to"
+    )
+    difference = models.DecimalField(max_digits=14, decimal_places=2)
+    transaction_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['-date', 'branch']
+        indexes = [
+            models.Index(fields=['date', 'branch']),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['branch', 'date', 'kind'],
+                name='unique_reconciliation_issue'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.date} - {self.branch.name} - {self.get_kind_display()} (Rp {self.difference:,})"
+
+
+class ReconciliationDeletion(models.Model):
+    """
+    A branch and day that lost a summary or email transaction; deletions
+    leave no updated_at behind, so the next incremental run checks these too
+    """
+    # No FK constraint: rows are written while the branch itself may be
+    # deleting (cascade), and a stale branch id just reconciles nothing
+    branch = models.ForeignKey(
+        'Branch',
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name='+'
+    )
+    date = models.DateField()
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.date} - branch {self.branch_id} (deleted {self.deleted_at:%Y-%m-%d %H:%M})"
+
+
+class ReconciliationRun(models.Model):
+    """Bookkeeping for incremental runs: the next run checks days touched since started_at"""
+    started_at = models.DateTimeField()
+    finished_at = models.DateTimeField()
+    full = models.BooleanField(default=False)
+    days_checked = models.PositiveIntegerField(default=0)
+    issues_found = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['-started_at']
+
+    def __str__(self):
+        return f"Reconciliation {self.started_at:%Y-%m-%d %H:%M} ({self.issues_found} issues)"
+
+
+class Anomaly(TimeStampedModel):
+    """
+    A day on which a branch's sales or an expense category deviated sharply
+    from its own history, found by app/analytics/anomalies.py
+    """
+    branch = models.ForeignKey(
+        'Branch',
+        on_delete=models.CASCADE,
+        related_name='anomalies'
+    )
+    # Set for expense anomalies
+    category = models.ForeignKey(
+        'Category',
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='anomalies'
+    )
+    date = models.DateField()
+    kind = models.CharField(max_length=20, choices=AnomalyKind.choices)
+    value = models.DecimalField(
+        max_digits=14, decimal_places=2, null=True, blank=True,
+        help_text="The day's amount; empty for a missing report"
+    )
+    baseline = models.DecimalField(
+        max_digits=14, decimal_places=2, null=True, blank=True,
+        help_text="Typical amount (median of the comparison window)"
+    )
+    score = models.FloatField(
+        null=True, blank=True,
+        help_text="Robust z-score of the amount against the baseline"
+    )
+
+    class Meta:
+        verbose_name_plural = "Anomalies"
+        ordering = ['-date', 'branch']
+        indexes = [
+            models.Index(fields=['date', 'branch']),
+            models.Index(fields=['kind', 'date']),
+        ]
+
+    def __str__(self):
+        return f"{self.date} - {self.branch.name} - {self.get_kind_display()}"
+
+
+class ForecastFit(TimeStampedModel):
+    """
+    Fitted forecasting state of one series (app/analytics/forecast.py):
+    a branch's net sales (no category) or one of its expense categories
+    Updated in place as new days arrive; refitted from scratch when
+    history changes
+    """
+    branch = models.ForeignKey(
+        'Branch',
+        on_delete=models.CASCADE,
+        related_name='forecast_fits'
+    )
+    # Empty for the branch's net sales
+    category = models.ForeignKey(
+        'Category',
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='forecast_fits'
+    )
+    method = models.CharField(
+        max_length=20, choices=ForecastMethod.choices,
+        help_text="The method with the lower one-day-ahead error so far"
+    )
+    alpha = models.FloatField(help_text="Level smoothing")
+    gamma = models.FloatField(help_text="Weekday seasonality smoothing")
+    level = models.FloatField()
+    # Seven values each, Monday first
+    season = models.JSONField(help_text="Weekday offsets from the level")
+    last_week = models.JSONField(help_text="Latest value seen on each weekday")
+    smoothing_sse = models.FloatField(default=0)
+    naive_sse = models.FloatField(default=0)
+    errors = models.PositiveIntegerField(
+        default=0, help_text="Days both methods were scored on"
+    )
+    fitted_through = models.DateField()
+    refreshed_at = models.DateTimeField(
+        help_text="Start of the refresh that last updated this fit"
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['branch', 'category'],
+                name='unique_forecast_fit'
+            ),
+            models.UniqueConstraint(
+                fields=['branch'],
+                condition=models.Q(category__isnull=True),
+                name='unique_forecast_fit_revenue'
+            ),
+        ]
+
+    def __str__(self):
+        series = self.category.name if self.category_id else 'net sales'
+        return f"{self.branch.name} - {series} ({self.get_method_display()})"
+
+
+class Digest(TimeStampedModel):
+    """
+    Owner summary of one day or week across all branches (app/digest.py)
+    The aggregates are stored with the rendered versions, so reading or
+    re-sending a digest never queries the transactions again
+    """
+    period = models.CharField(max_length=10, choices=DigestPeriod.choices)
+    start = models.DateField()
+    end = models.DateField()
+    data = models.JSONField(help_text="Aggregates the digest is rendered from")
+    html = models.TextField(blank=True)
+    text = models.TextField(blank=True, help_text="Compact WhatsApp version")
+    pdf = models.BinaryField(null=True, blank=True, help_text="Rendered on first request")
+    delivered_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-start', 'period']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['period', 'start'],
+                name='unique_digest_period'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.get_period_display()} digest {self.start} - {self.end}"
+
+
+class IdempotencyKey(models.Model):
+    """
+    Stored response of a request sent with an Idempotency-Key header
+    (app/idempotency.py); retries with the same key get it back unprocessed
+    """
+    scope = models.CharField(max_length=100, help_text="Endpoint and caller")
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64, help_text="SHA-256 of the method, path and body")
+    status_code = models.PositiveSmallIntegerField(
+        null=True, blank=True, help_text="Empty while the first request is processing"
+    )
+    response_body = models.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['scope', 'key'],
+                name='unique_idempotency_key'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.scope} {self.key} ({self.status_code or 'processing'})"
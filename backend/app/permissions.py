@@ -1,5 +1,7 @@
 from rest_framework import permissions
 
+from . import branch_scope
+
 
 class IsOwner(permissions.BasePermission):
     """
@@ -21,8 +23,8 @@ class IsStaffOrOwner(permissions.BasePermission):
         if request.user.is_superuser:
             return True
         
-        # For staff accessing transactions/reports from their branch
-        if hasattr(obj, 'branch') and obj.branch == request.user.assigned_branch:
+        # For staff accessing transactions/reports from their branches
+        if hasattr(obj, 'branch_id') and branch_scope.for_request(request).allows(obj.branch_id):
             return True
         
         return False
@@ -58,9 +60,8 @@ class CanVerifyTransaction(permissions.BasePermission):
         if 'verify' in request.path and not request.user.is_superuser:
             return False
         
-        # Staff can only modify their own branch transactions
-        if hasattr(obj, 'branch') and obj.branch != request.user.assigned_branch:
-            if not request.user.is_superuser:
-                return False
+        # Staff can only modify transactions of their own branches
+        if hasattr(obj, 'branch_id') and not branch_scope.for_request(request).allows(obj.branch_id):
+            return False
         
         return True
@@ -0,0 +1,96 @@
+"""
+Set-based purge of ingestion logs and the transactions they created
+
+QuerySet.delete() collects every row and its relations in Python before
+deleting (IngestionLog and Transaction both have SET_NULL relations and
+signal receivers, so Django cannot take its fast path). Here each batch of
+log ids is handled with a few statements in one DB transaction:
+
+1. DailySummary rows pointing at the logs are unlinked (SET_NULL)
+2. with transactions: their ids are read through the logs, other logs
+   pointing at them are unlinked, their search documents removed, and
+   their days recorded for the next reconciliation run (this DELETE
+   sends no post_delete signals)
+3. logs, then transactions, are deleted with a plain DELETE ... WHERE id IN
+
+Batches are bounded (PURGE_BATCH_SIZE) so locks and the transaction stay
+short; a failure leaves earlier batches deleted and later ones untouched.
+"""
+import logging
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+
+from . import reconciliation, search
+from .models import DailySummary, IngestionLog, Transaction, TransactionSource
+
+logger = logging.getLogger(__name__)
+
+
+def _batch_size():
+    return getattr(settings, 'PURGE_BATCH_SIZE', 1000)
+
+
+def _id_batches(queryset, batch_size):
+    """Keyset-paginated pk batches, so nothing is loaded up front"""
+    ids = queryset.order_by('pk').values_list('pk', flat=True)
+    last = None
+    while True:
+        page = ids if last is None else ids.filter(pk__gt=last)
+        batch = list(page[:batch_size])
+        if not batch:
+            return
+        yield batch
+        last = batch[-1]
+
+
+def _purge_batch(log_ids, with_transactions, counts):
+    counts['summaries_unlinked'] += DailySummary.objects.filter(
+        ingestion_log_id__in=log_ids
+    ).update(ingestion_log=None)
+
+    transaction_ids, reconciled_days = [], []
+    if with_transactions:
+        rows = (
+            IngestionLog.objects
+            .filter(pk__in=log_ids, created_transaction__isnull=False)
+            .values_list(
+                'created_transaction_id', 'created_transaction__source',
+                'created_transaction__branch_id', 'created_transaction__date',
+            )
+            .distinct()
+        )
+        for transaction_id, source, branch_id, day in rows:
+            transaction_ids.append(transaction_id)
+            if source == TransactionSource.EMAIL:
+                reconciled_days.append((branch_id, day))
+
+    logs = IngestionLog.objects.filter(pk__in=log_ids)
+    counts['logs'] += logs._raw_delete(logs.db)
+
+    if transaction_ids:
+        counts['logs_unlinked'] += IngestionLog.objects.filter(
+            created_transaction_id__in=transaction_ids
+        ).update(created_transaction=None)
+        search.remove(transaction_ids)
+        transactions = Transaction.objects.filter(pk__in=transaction_ids)
+        counts['transactions'] += transactions._raw_delete(transactions.db)
+        if reconciled_days:
+            reconciliation.record_deletions(reconciled_days)
+
+
+def purge_logs(queryset, with_transactions=False, batch_size=None):
+    """
+    Delete the logs in queryset (and, with_transactions, the transactions
+    they created); returns counts of what was deleted and unlinked
+    """
+    batch_size = batch_size or _batch_size()
+    counts = Counter(logs=0, transactions=0, logs_unlinked=0, summaries_unlinked=0, batches=0)
+    for log_ids in _id_batches(queryset, batch_size):
+        with transaction.atomic():
+            _purge_batch(log_ids, with_transactions, counts)
+        counts['batches'] += 1
+        logger.debug('Purged batch of %s ingestion logs (total %s)', len(log_ids), counts['logs'])
+    logger.info('Purged ingestion logs: %s', dict(counts))
+    return dict(counts)
@@ -0,0 +1,172 @@
+"""
+Receipt image pipeline for Transaction.evidence_image
+
+Runs off the request path (see app.background):
+1. Hash the uploaded bytes and reuse the stored files of an identical receipt
+2. Apply EXIF orientation, strip metadata and recompress the original
+   within a size budget
+3. Generate WebP + JPEG thumbnails for the dashboard
+"""
+import hashlib
+import io
+import logging
+import os
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+from .models import Transaction
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_DIR = 'receipts/thumbs'
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def content_hash(data):
+    """SHA-256 hex digest of the raw upload bytes"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def needs_processing(instance):
+    """
+    True when the stored evidence image has not been through the pipeline yet
+    (new upload, or the image was replaced since the last run)
+    """
+    if not instance.evidence_image:
+        return False
+    variants = instance.evidence_variants or {}
+    return variants.get('source') != instance.evidence_image.name
+
+
+def _encode(image, fmt, quality):
+    buffer = io.BytesIO()
+    if fmt == 'JPEG':
+        image.save(buffer, 'JPEG', quality=quality, optimize=True, progressive=True)
+    else:
+        image.save(buffer, fmt, quality=quality, method=4)
+    return buffer.getvalue()
+
+
+def _recompress(image):
+    """
+    Re-encode the original as JPEG, stepping the quality down until it
+    fits RECEIPT_IMAGE_MAX_BYTES (or the quality floor is reached)
+    """
+    max_dimension = _setting('RECEIPT_IMAGE_MAX_DIMENSION', 2048)
+    max_bytes = _setting('RECEIPT_IMAGE_MAX_BYTES', 600 * 1024)
+    quality = _setting('RECEIPT_IMAGE_QUALITY', 85)
+    min_quality = _setting('RECEIPT_IMAGE_MIN_QUALITY', 60)
+
+    image = image.copy()
+    image.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+
+    data = _encode(image, 'JPEG', quality)
+    while len(data) > max_bytes and quality > min_quality:
+        quality = max(min_quality, quality - 10)
+        data = _encode(image, 'JPEG', quality)
+    return data
+
+
+def _build_thumbnails(image, digest):
+    """Write every configured thumbnail size as WebP and JPEG, keyed by content hash"""
+    variants = {}
+    quality = _setting('RECEIPT_THUMBNAIL_QUALITY', 75)
+    for size in _setting('RECEIPT_THUMBNAIL_SIZES', [320, 960]):
+        thumb = image.copy()
+        thumb.thumbnail((size, size), Image.LANCZOS)
+        variants[str(size)] = {}
+        for fmt, ext in (('WEBP', 'webp'), ('JPEG', 'jpg')):
+            name = f"{THUMBNAIL_DIR}/{digest[:2]}/{digest}_{size}.{ext}"
+            if not default_storage.exists(name):
+                name = default_storage.save(name, ContentFile(_encode(thumb, fmt, quality)))
+            variants[str(size)][ext] = name
+    return variants
+
+
+def _is_shared(name, exclude_pk):
+    return Transaction.objects.filter(evidence_image=name).exclude(pk=exclude_pk).exists()
+
+
+def process_receipt(transaction_id, upload_hash=None):
+    """
+    Run the full pipeline for one transaction
+    upload_hash may be supplied by the upload handler to skip re-hashing
+    """
+    trx = Transaction.objects.filter(pk=transaction_id).first()
+    if trx is None or not needs_processing(trx):
+        return None
+
+    original_name = trx.evidence_image.name
+    with default_storage.open(original_name, 'rb') as fh:
+        raw = fh.read()
+    digest = upload_hash or content_hash(raw)
+
+    # 1. Dedup: an identical receipt was already processed, point at its files
+    duplicate = (
+        Transaction.objects
+        .filter(evidence_hash=digest, evidence_variants__isnull=False)
+        .exclude(pk=trx.pk)
+        .only('evidence_image', 'evidence_variants')
+        .first()
+    )
+    if duplicate and duplicate.evidence_image:
+        Transaction.objects.filter(pk=trx.pk).update(
+            evidence_image=duplicate.evidence_image.name,
+            evidence_hash=digest,
+            evidence_variants=duplicate.evidence_variants,
+        )
+        if original_name != duplicate.evidence_image.name and not _is_shared(original_name, trx.pk):
+            default_storage.delete(original_name)
+        logger.info("Receipt for transaction %s deduplicated against %s", trx.pk, duplicate.pk)
+        return duplicate.evidence_variants
+
+    # 2. Normalise orientation, drop EXIF (GPS, device info) and recompress
+    try:
+        with Image.open(io.BytesIO(raw)) as img:
+            image = ImageOps.exif_transpose(img).convert('RGB')
+    except (OSError, Image.DecompressionBombError) as e:
+        logger.warning("Transaction %s evidence is not a readable image: %s", trx.pk, e)
+        Transaction.objects.filter(pk=trx.pk).update(
+            evidence_hash=digest,
+            evidence_variants={'source': original_name, 'error': str(e)},
+        )
+        return None
+
+    # Always replaced, even when larger: the upload still carries its EXIF
+    # (GPS) and unrotated orientation
+    compressed = _recompress(image)
+    base, _ = os.path.splitext(original_name)
+    stored_name = default_storage.save(f"{base}.jpg", ContentFile(compressed))
+    if stored_name != original_name and not _is_shared(original_name, trx.pk):
+        default_storage.delete(original_name)
+
+    # 3. Thumbnails
+    variants = _build_thumbnails(image, digest)
+    variants['source'] = stored_name
+
+    Transaction.objects.filter(pk=trx.pk).update(
+        evidence_image=stored_name,
+        evidence_hash=digest,
+        evidence_variants=variants,
+    )
+    logger.info(
+        "Processed receipt for transaction %s: %d -> %d bytes",
+        trx.pk, len(raw), len(compressed),
+    )
+    return variants
+
+
+def variant_urls(instance):
+    """Public URLs of the thumbnails, e.g. {'320': {'webp': url, 'jpg': url}}"""
+    variants = instance.evidence_variants or {}
+    urls = {}
+    for size, files in variants.items():
+        if isinstance(files, dict):
+            urls[size] = {ext: default_storage.url(name) for ext, name in files.items()}
+    return urls
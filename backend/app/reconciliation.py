@@ -0,0 +1,193 @@
+"""
+Reconciliation of DailySummary totals against itemized transactions
+
+Every Luna/Hitachi report produces a DailySummary and per-product income
+transactions (source EMAIL). For each branch and day this checks that:
+
+- the summary's net_sales equals the sum of the valid email income
+  transactions of that day              -> SALES_MISMATCH
+- cash + QRIS + transfer equals total_collected, when a breakdown was
+  reported (Hitachi reports none)       -> PAYMENT_MISMATCH
+- email income transactions have a summary at all -> MISSING_SUMMARY
+
+Differences up to RECONCILIATION_TOLERANCE rupiah are ignored.
+
+All summaries are checked in one query (the transaction sums are
+correlated subqueries on the (date, branch) index) and transactions
+without a summary in a second one; the issues of the checked scope are
+then replaced in one DB transaction. Without full=True only branches and
+days touched since the previous run's start are checked, plus those that
+lost a summary or email transaction since (ReconciliationDeletion rows,
+written by the post_delete receivers and by purge.purge_logs, which
+deletes without signals); each run clears the deletions before its start.
+"""
+import logging
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import (
+    Count, DecimalField, Exists, IntegerField, OuterRef, Subquery, Sum, Value,
+)
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import metrics
+from .models import (
+    DailySummary, ReconciliationDeletion, ReconciliationIssue, ReconciliationIssueKind,
+    ReconciliationRun, Transaction, TransactionSource, TransactionType,
+)
+
+logger = logging.getLogger(__name__)
+
+AMOUNT = DecimalField(max_digits=14, decimal_places=2)
+
+
+def _tolerance():
+    return Decimal(str(getattr(settings, 'RECONCILIATION_TOLERANCE', 1)))
+
+
+def _itemized():
+    """The transactions a POS report is itemized into"""
+    return Transaction.objects.filter(
+        source=TransactionSource.EMAIL,
+        transaction_type=TransactionType.INCOME,
+        is_valid=True,
+    )
+
+
+def _summaries():
+    return DailySummary.objects.filter(source=TransactionSource.EMAIL)
+
+
+def record_deletions(pairs):
+    """Have the next run recheck these (branch id, date) pairs"""
+    deletions = ReconciliationDeletion.objects.bulk_create(
+        [ReconciliationDeletion(branch_id=branch_id, date=day) for branch_id, day in set(pairs)]
+    )
+    metrics.record_inserts(ReconciliationDeletion, len(deletions))
+
+
+def touched_scope(since):
+    """(branch ids, dates) with a summary or transaction changed or deleted since `since`"""
+    pairs = set(
+        _summaries().filter(updated_at__gte=since)
+        .order_by().values_list('branch_id', 'date').distinct()
+    )
+    pairs |= set(
+        Transaction.objects.filter(source=TransactionSource.EMAIL, updated_at__gte=since)
+        .order_by().values_list('branch_id', 'date').distinct()
+    )
+    pairs |= set(
+        ReconciliationDeletion.objects.filter(deleted_at__gte=since)
+        .order_by().values_list('branch_id', 'date').distinct()
+    )
+    return {branch for branch, _ in pairs}, {day for _, day in pairs}
+
+
+def _in_scope(queryset, scope):
+    if scope is None:
+        return queryset
+    branch_ids, dates = scope
+    return queryset.filter(branch_id__in=branch_ids, date__in=dates)
+
+
+def _summary_issues(scope, tolerance):
+    per_day = (
+        _itemized()
+        .filter(branch=OuterRef('branch'), date=OuterRef('date'))
+        .order_by()
+        .values('branch')
+    )
+    rows = (
+        _in_scope(_summaries(), scope)
+        .annotate(
+            items_total=Coalesce(
+                Subquery(per_day.annotate(total=Sum('amount')).values('total')),
+                Value(Decimal(0)), output_field=AMOUNT,
+            ),
+            items_count=Coalesce(
+                Subquery(per_day.annotate(count=Count('pk')).values('count')),
+                Value(0), output_field=IntegerField(),
+            ),
+        )
+        .order_by()
+        .values_list(
+            'pk', 'branch_id', 'date', 'net_sales', 'total_collected',
+            'cash_amount', 'qris_amount', 'transfer_amount', 'items_total', 'items_count',
+        )
+    )
+
+    checked, issues = 0, []
+    for (pk, branch_id, day, net_sales, collected, cash, qris, transfer,
+         items_total, items_count) in rows.iterator(chunk_size=2000):
+        checked += 1
+        if abs(items_total - net_sales) > tolerance:
+            issues.append(ReconciliationIssue(
+                branch_id=branch_id, date=day, summary_id=pk,
+                kind=ReconciliationIssueKind.SALES_MISMATCH,
+                expected=net_sales, actual=items_total,
+                difference=items_total - net_sales, transaction_count=items_count,
+            ))
+        payments = cash + qris + transfer
+        if payments and abs(payments - collected) > tolerance:
+            issues.append(ReconciliationIssue(
+                branch_id=branch_id, date=day, summary_id=pk,
+                kind=ReconciliationIssueKind.PAYMENT_MISMATCH,
+                expected=collected, actual=payments,
+                difference=payments - collected, transaction_count=items_count,
+            ))
+    return checked, issues
+
+
+def _missing_summary_issues(scope):
+    has_summary = _summaries().filter(branch=OuterRef('branch'), date=OuterRef('date'))
+    rows = (
+        _in_scope(_itemized(), scope)
+        .filter(~Exists(has_summary))
+        .order_by()
+        .values('branch_id', 'date')
+        .annotate(total=Sum('amount'), count=Count('pk'))
+        .values_list('branch_id', 'date', 'total', 'count')
+    )
+    return [
+        ReconciliationIssue(
+            branch_id=branch_id, date=day,
+            kind=ReconciliationIssueKind.MISSING_SUMMARY,
+            expected=Decimal(0), actual=total, difference=total, transaction_count=count,
+        )
+        for branch_id, day, total, count in rows
+    ]
+
+
+def reconcile(full=False):
+    """Check the days touched since the last run (all days with full=True)"""
+    started = timezone.now()
+    last_run = None if full else ReconciliationRun.objects.order_by('-started_at').first()
+    scope = touched_scope(last_run.started_at) if last_run else None
+
+    checked, issues = 0, []
+    if scope is None or scope[1]:
+        checked, issues = _summary_issues(scope, _tolerance())
+        missing = _missing_summary_issues(scope)
+        checked += len(missing)
+        issues += missing
+
+    with transaction.atomic():
+        _in_scope(ReconciliationIssue.objects.all(), scope).delete()
+        ReconciliationIssue.objects.bulk_create(issues, batch_size=1000)
+        # Checked by this run (or an earlier one); later ones wait for the next
+        ReconciliationDeletion.objects.filter(deleted_at__lt=started).delete()
+        run = ReconciliationRun.objects.create(
+            started_at=started,
+            finished_at=timezone.now(),
+            full=scope is None,
+            days_checked=checked,
+            issues_found=len(issues),
+        )
+    metrics.record_inserts(ReconciliationIssue, len(issues))
+    logger.info(
+        'Reconciliation checked %s day(s), found %s issue(s) in %.2fs',
+        checked, len(issues), (run.finished_at - started).total_seconds(),
+    )
+    return run
@@ -0,0 +1,201 @@
+"""
+Full-text search over transactions
+
+PostgreSQL: Transaction.search_vector (tsvector, GIN index) ranked with
+ts_rank, plus pg_trgm word similarity on description for fuzzy product names
+SQLite (local dev): an FTS5 table keyed by transaction id, ranked with bm25
+
+Both backends read a query the same way: every word must match, as a
+prefix ('cuci kilo' finds "Cuci Kiloan"); quotes and operators are
+ignored. The match is always taken within the queryset it is applied to
+(branch scope and other filters), so SEARCH_MAX_RESULTS caps a caller's
+own results, never the global ones.
+
+The index is maintained incrementally from signals (see app/signals.py) and
+by the bulk write paths, one set-based statement per batch of ids.
+"""
+import logging
+import re
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramWordSimilarity
+from django.core.exceptions import EmptyResultSet
+from django.db import connection
+from django.db.models import Case, F, IntegerField, Q, When
+from rest_framework.filters import BaseFilterBackend
+
+logger = logging.getLogger(__name__)
+
+FTS_TABLE = 'app_transaction_fts'
+INDEXED_FIELDS = {'description', 'category', 'category_id', 'source_identifier'}
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+BATCH_SIZE = 500
+
+
+def _config():
+    return getattr(settings, 'SEARCH_CONFIG', 'simple')
+
+
+def _vendor():
+    return connection.vendor
+
+
+_fts5_table_exists = None
+
+
+def _fts5_available():
+    """The FTS5 table is created by migration 0005; it can be missing if SQLite lacks FTS5"""
+    global _fts5_table_exists
+    if _fts5_table_exists is None:
+        with connection.cursor() as cursor:
+            _fts5_table_exists = FTS_TABLE in connection.introspection.table_names(cursor)
+    return _fts5_table_exists
+
+
+def _batches(ids):
+    ids = list(ids)
+    for i in range(0, len(ids), BATCH_SIZE):
+        yield ids[i:i + BATCH_SIZE]
+
+
+# ==========================================
+# INDEX MAINTENANCE
+# ==========================================
+
+def reindex(ids):
+    """Rebuild the search document of the given transaction ids"""
+    vendor = _vendor()
+    with connection.cursor() as cursor:
+        for batch in _batches(ids):
+            if vendor == 'postgresql':
+                cursor.execute(
+                    """
+                    UPDATE app_transaction t SET search_vector =
+                        setweight(to_tsvector(%s::regconfig, coalesce(t.description, '')), 'A') ||
+                        setweight(to_tsvector(%s::regconfig, coalesce(c.name, '')), 'B') ||
+                        setweight(to_tsvector(%s::regconfig, coalesce(t.source_identifier, '')), 'C')
+                    FROM app_category c
+                    WHERE c.id = t.category_id AND t.id = ANY(%s)
+                    """,
+                    [_config(), _config(), _config(), batch],
+                )
+            elif vendor == 'sqlite' and _fts5_available():
+                placeholders = ', '.join(['%s'] * len(batch))
+                cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})", batch)
+                cursor.execute(
+                    f"""
+                    INSERT INTO {FTS_TABLE} (rowid, description, category, source_identifier)
+                    SELECT t.id, t.description, c.name, t.source_identifier
+                    FROM app_transaction t JOIN app_category c ON c.id = t.category_id
+                    WHERE t.id IN ({placeholders})
+                    """,
+                    batch,
+                )
+
+
+def remove(ids):
+    """Drop deleted transactions from the SQLite index (Postgres rows carry their own vector)"""
+    if _vendor() != 'sqlite' or not _fts5_available():
+        return
+    with connection.cursor() as cursor:
+        for batch in _batches(ids):
+            placeholders = ', '.join(['%s'] * len(batch))
+            cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})", batch)
+
+
+def rebuild():
+    """Reindex every transaction (used by the rebuild_search_index command)"""
+    from .models import Transaction
+    ids = Transaction.objects.order_by('pk').values_list('pk', flat=True)
+    if _vendor() == 'sqlite' and _fts5_available():
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE}")
+    count = 0
+    for batch in _batches(ids.iterator()):
+        reindex(batch)
+        count += len(batch)
+    return count
+
+
+# ==========================================
+# QUERYING
+# ==========================================
+
+def _fts5_query(text):
+    """Quote every token and make it a prefix match: 'cuci kilo' -> "cuci"* "kilo"*"""
+    tokens = TOKEN_RE.findall(text)
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+def _tsquery(text):
+    """Same reading for PostgreSQL: 'cuci kilo' -> cuci:* & kilo:*"""
+    return ' & '.join(f'{token}:*' for token in TOKEN_RE.findall(text))
+
+
+def search_transactions(queryset, text, ranked=True):
+    """
+    Filter a Transaction queryset by a free-text query
+    With ranked=True the result is ordered by relevance
+    """
+    text = (text or '').strip()
+    if not text:
+        return queryset
+
+    vendor = _vendor()
+    if vendor == 'postgresql':
+        tsquery = _tsquery(text)
+        if not tsquery:
+            return queryset.none()
+        query = SearchQuery(tsquery, config=_config(), search_type='raw')
+        queryset = queryset.filter(Q(search_vector=query) | Q(description__trigram_word_similar=text))
+        if ranked:
+            queryset = queryset.annotate(
+                rank=SearchRank(F('search_vector'), query),
+                similarity=TrigramWordSimilarity(text, 'description'),
+            ).order_by('-rank', '-similarity', '-date')
+        return queryset
+
+    if vendor == 'sqlite' and _fts5_available():
+        match = _fts5_query(text)
+        if not match:
+            return queryset.none()
+        limit = getattr(settings, 'SEARCH_MAX_RESULTS', 1000)
+        # Rank within the caller's rows only, then cut
+        try:
+            scoped_sql, scoped_params = queryset.order_by().values('pk').query.sql_with_params()
+        except EmptyResultSet:
+            return queryset.none()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s AND rowid IN ({scoped_sql}) "
+                f"ORDER BY bm25({FTS_TABLE}) LIMIT %s",
+                [match, *scoped_params, limit],
+            )
+            ids = [row[0] for row in cursor.fetchall()]
+        queryset = queryset.filter(pk__in=ids)
+        if ranked and ids:
+            position = Case(*[When(pk=pk, then=i) for i, pk in enumerate(ids)], output_field=IntegerField())
+            queryset = queryset.order_by(position)
+        return queryset
+
+    # No index available: behave like SearchFilter
+    return queryset.filter(
+        Q(description__icontains=text)
+        | Q(category__name__icontains=text)
+        | Q(source_identifier__icontains=text)
+    )
+
+
+class RankedSearchFilter(BaseFilterBackend):
+    """
+    ?q=<text> full-text search ordered by relevance
+    An explicit ?ordering= still wins over the relevance order
+    """
+    search_param = 'q'
+
+    def filter_queryset(self, request, queryset, view):
+        text = request.query_params.get(self.search_param, '')
+        if not text.strip():
+            return queryset
+        ranked = 'ordering' not in request.query_params
+        return search_transactions(queryset, text, ranked=ranked)
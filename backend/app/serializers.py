@@ -1,5 +1,7 @@
 from rest_framework import serializers
-from .models import Branch, User, Category, Transaction, IngestionLog, DailySummary, UserPhoneNumber, UserBranchAssignment, UserLineID
+from .models import Branch, BranchType, User, Category, Transaction, IngestionLog, DailySummary, UserPhoneNumber, UserBranchAssignment, UserLineID, Anomaly, Digest
+from .analytics.forecast import EXPENSES, MAX_HORIZON, REVENUE
+from .receipt_images import variant_urls
 
 # ==============================================
 # 1. REFERENCE SERIALIZERS
@@ -58,6 +60,9 @@ class TransactionSerializer(serializers.ModelSerializer):
     reported_by_username = serializers.CharField(source='reported_by.username', read_only=True)
     reported_by_phone = serializers.CharField(source='reported_by.phone_number', read_only=True)
 
+    # Thumbnails from the receipt image pipeline, so list views never load the original
+    evidence_variants = serializers.SerializerMethodField()
+
     class Meta:
         model = Transaction
         fields = [
@@ -75,6 +80,7 @@ class TransactionSerializer(serializers.ModelSerializer):
             'source',
             'source_identifier',
             'evidence_image',
+            'evidence_variants',
             'is_verified',
             'payment_method',
 
@@ -98,8 +104,16 @@ class TransactionSerializer(serializers.ModelSerializer):
             'reported_by_email',
             'reported_by_username',
             'reported_by_phone',
+            'evidence_variants',
         ]
 
+    def get_evidence_variants(self, obj):
+        """
+        Thumbnail URLs keyed by size, e.g. {'320': {'webp': ..., 'jpg': ...}}
+        Empty until the background pipeline has processed the image
+        """
+        return variant_urls(obj)
+
     def validate_amount(self, value):
         """
         Validation to ensure the transaction amount is positive
@@ -165,7 +179,14 @@ class EmailWebhookPayloadSerializer(serializers.Serializer):
     """
     sender = serializers.EmailField()
     subject = serializers.CharField()
-    text_body = serializers.CharField()
+    # At least one of them; Luna reports are parsed from the HTML when present
+    text_body = serializers.CharField(required=False, allow_blank=True)
+    html_body = serializers.CharField(required=False, allow_blank=True)
+
+    def validate(self, data):
+        if not data.get('text_body') and not data.get('html_body'):
+            raise serializers.ValidationError("Either 'text_body' or 'html_body' is required")
+        return data
 
 
 class WhatsAppWebhookPayloadSerializer(serializers.Serializer):
@@ -217,3 +238,58 @@ class DailySummarySerializer(serializers.ModelSerializer):
             'created_at',
             'updated_at',
         ]
+
+
+class AnomalySerializer(serializers.ModelSerializer):
+    branch_name = serializers.CharField(source='branch.name', read_only=True)
+    category_name = serializers.CharField(source='category.name', read_only=True, default=None)
+    kind_display = serializers.CharField(source='get_kind_display', read_only=True)
+
+    class Meta:
+        model = Anomaly
+        fields = [
+            'id',
+            'branch',
+            'branch_name',
+            'category',
+            'category_name',
+            'date',
+            'kind',
+            'kind_display',
+            'value',
+            'baseline',
+            'score',
+            'created_at',
+        ]
+        read_only_fields = fields
+
+
+class DigestSerializer(serializers.ModelSerializer):
+    period_display = serializers.CharField(source='get_period_display', read_only=True)
+
+    class Meta:
+        model = Digest
+        fields = [
+            'id',
+            'period',
+            'period_display',
+            'start',
+            'end',
+            'data',
+            'text',
+            'delivered_at',
+            'created_at',
+        ]
+        read_only_fields = fields
+
+
+class ForecastQuerySerializer(serializers.Serializer):
+    """Query parameters of /api/analytics/forecast/"""
+    series = serializers.ChoiceField(choices=[REVENUE, EXPENSES], default=REVENUE)
+    branch = serializers.IntegerField(required=False)
+    branch_type = serializers.ChoiceField(choices=BranchType.choices, required=False)
+    category = serializers.IntegerField(required=False)
+    group_by = serializers.ChoiceField(choices=['branch', 'branch_type'], default='branch')
+    start = serializers.DateField(required=False, help_text="Defaults to the day after the latest data")
+    horizon = serializers.IntegerField(min_value=1, max_value=MAX_HORIZON, default=14)
+    level = serializers.FloatField(min_value=0.5, max_value=0.99, default=0.8)
@@ -0,0 +1,123 @@
+"""
+Model signal handlers
+Registered from AppConfig.ready()
+"""
+from django.contrib.auth.signals import user_logged_out
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from rest_framework.authtoken.models import Token
+
+from . import authentication, background, branch_scope, metrics, reconciliation, search
+from .analytics import forecast
+from .models import (
+    Category, DailySummary, IngestionLog, IngestionStatus, Transaction, TransactionSource,
+    TransactionType, User, UserBranchAssignment,
+)
+from .receipt_images import needs_processing, process_receipt
+
+
+@receiver(pre_save, sender=Transaction, dispatch_uid='transaction_receipt_upload_hash')
+def remember_upload_hash(sender, instance, **kwargs):
+    """
+    Keep the hash computed by ReceiptUploadHandler while the upload is still
+    attached; the field only holds the stored name after save
+    """
+    upload = getattr(instance.evidence_image, '_file', None)
+    instance._evidence_upload_hash = getattr(upload, 'content_hash', None)
+
+
+@receiver(post_save, sender=Transaction, dispatch_uid='transaction_receipt_pipeline')
+def schedule_receipt_processing(sender, instance, **kwargs):
+    """Queue thumbnailing/recompression whenever a new evidence image is stored"""
+    if needs_processing(instance):
+        upload_hash = getattr(instance, '_evidence_upload_hash', None)
+        background.submit_on_commit(process_receipt, instance.pk, upload_hash=upload_hash)
+
+
+@receiver(post_save, sender=Transaction, dispatch_uid='transaction_search_index')
+def update_search_index(sender, instance, update_fields=None, **kwargs):
+    """Keep the full-text document in sync; skip saves that touch no indexed field"""
+    if update_fields is not None and not search.INDEXED_FIELDS.intersection(update_fields):
+        return
+    search.reindex([instance.pk])
+
+
+@receiver(post_delete, sender=Transaction, dispatch_uid='transaction_search_remove')
+def remove_from_search_index(sender, instance, **kwargs):
+    search.remove([instance.pk])
+
+
+@receiver(post_save, sender=Category, dispatch_uid='category_search_index')
+def reindex_category_transactions(sender, instance, created, **kwargs):
+    """A renamed category changes the document of every transaction using it"""
+    if not created:
+        search.reindex(instance.transaction_set.values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=UserBranchAssignment, dispatch_uid='branch_scope_invalidate_save')
+@receiver(post_delete, sender=UserBranchAssignment, dispatch_uid='branch_scope_invalidate_delete')
+def invalidate_branch_scope(sender, instance, **kwargs):
+    """
+    Drop the cached branch ids of the user now and again after commit, so a
+    request racing the transaction cannot re-cache the old assignments
+    """
+    branch_scope.invalidate(instance.user_id)
+    transaction.on_commit(lambda: branch_scope.invalidate(instance.user_id))
+
+
+@receiver(post_save, sender=Token, dispatch_uid='auth_token_evict_save')
+@receiver(post_delete, sender=Token, dispatch_uid='auth_token_evict_delete')
+def evict_cached_token(sender, instance, **kwargs):
+    """Token rotated or deleted (dj-rest-auth logout deletes it)"""
+    authentication.evict(instance.key)
+
+
+@receiver(post_save, sender=User, dispatch_uid='auth_token_evict_user')
+def evict_cached_user_tokens(sender, instance, update_fields=None, **kwargs):
+    """Cached tokens carry the user, so any change (deactivation, roles) drops them"""
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    authentication.evict_user(instance.pk)
+
+
+@receiver(user_logged_out, dispatch_uid='auth_token_evict_logout')
+def evict_tokens_on_logout(sender, request, user, **kwargs):
+    if user is not None:
+        authentication.evict_user(user.pk)
+
+
+@receiver(post_save, sender=IngestionLog, dispatch_uid='metrics_ingestion_log')
+def count_ingestion_log(sender, instance, created, **kwargs):
+    """Count received logs and their final outcome"""
+    if created or instance.status != IngestionStatus.PENDING:
+        metrics.record_ingestion_log(instance.source, instance.status)
+
+
+@receiver(post_save, sender=Transaction, dispatch_uid='metrics_transaction_insert')
+@receiver(post_save, sender=DailySummary, dispatch_uid='metrics_summary_insert')
+def count_single_insert(sender, instance, created, **kwargs):
+    """bulk_create sends no signals, its callers use metrics.record_inserts()"""
+    if created:
+        metrics.record_inserts(sender, 1, mode='single')
+
+
+@receiver(post_save, sender=DailySummary, dispatch_uid='forecast_refresh_summary')
+def refresh_forecasts_on_summary(sender, instance, **kwargs):
+    forecast.schedule_refresh()
+
+
+@receiver(post_save, sender=Transaction, dispatch_uid='forecast_refresh_expense')
+def refresh_forecasts_on_expense(sender, instance, **kwargs):
+    """Income transactions come with a DailySummary, which already schedules one"""
+    if instance.transaction_type == TransactionType.EXPENSE:
+        forecast.schedule_refresh()
+
+
+@receiver(post_delete, sender=Transaction, dispatch_uid='reconciliation_transaction_delete')
+@receiver(post_delete, sender=DailySummary, dispatch_uid='reconciliation_summary_delete')
+def recheck_reconciliation_on_delete(sender, instance, **kwargs):
+    """Deletions leave no updated_at for the incremental run to find"""
+    if instance.source == TransactionSource.EMAIL:
+        reconciliation.record_deletions([(instance.branch_id, instance.date)])
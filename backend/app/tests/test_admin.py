@@ -4,7 +4,7 @@ from django.test import RequestFactory
 from app.admin import (
     BranchAdmin, CategoryAdmin, TransactionAdmin, IngestionLogAdmin,
 )
-from app.models import Branch, Category, Transaction, IngestionLog, User, TransactionType, TransactionSource, IngestionStatus
+from app.models import Branch, Category, Transaction, IngestionLog, DailySummary, User, TransactionType, TransactionSource, IngestionStatus
 import types
 
 @pytest.mark.django_db
@@ -27,7 +27,7 @@ def test_category_admin_get_branches():
 def test_transaction_admin_actions():
     branch = Branch.objects.create(name="Test", branch_type="LAUNDRY")
     category = Category.objects.create(name="Soap", transaction_type=TransactionType.EXPENSE)
-    user = User.objects.create_user(username="u", email="u@x.com", password="x", assigned_branch=branch)
+    user = User.objects.create_user(username="u", email="u@x.com", password="x")
     transaction = Transaction.objects.create(
         branch=branch, reported_by=user, amount=1000, transaction_type=TransactionType.EXPENSE,
         category=category, date="2023-01-01", description="desc", source=TransactionSource.EMAIL
@@ -40,7 +40,7 @@ def test_transaction_admin_actions():
 def test_ingestionlog_admin_actions():
     branch = Branch.objects.create(name="Test", branch_type="LAUNDRY")
     category = Category.objects.create(name="Soap", transaction_type=TransactionType.EXPENSE)
-    user = User.objects.create_user(username="u", email="u@x.com", password="x", assigned_branch=branch)
+    user = User.objects.create_user(username="u", email="u@x.com", password="x")
     transaction = Transaction.objects.create(
         branch=branch, reported_by=user, amount=1000, transaction_type=TransactionType.EXPENSE,
         category=category, date="2023-01-01", description="desc", source=TransactionSource.EMAIL
@@ -53,7 +53,7 @@ def test_ingestionlog_admin_actions():
     # Patch message_user to avoid MessageFailure
     admin.message_user = types.MethodType(lambda self, request, message, *a, **k: None, admin)
     assert isinstance(admin.has_error(log), bool)
-    assert "foo" in admin.raw_payload_display(log)
+    assert f"/admin/app/ingestionlog/{log.pk}/json/" in admin.raw_payload_display(log)
     # Test delete_failed_logs and delete_with_transactions using a real request
     queryset = IngestionLog.objects.filter(id=log.id)
     rf = RequestFactory()
@@ -65,4 +65,74 @@ def test_ingestionlog_admin_actions():
         created_transaction=transaction
     )
     queryset = IngestionLog.objects.filter(id=log.id)
-    admin.delete_with_transactions(request, queryset)
\ No newline at end of file
+    admin.delete_with_transactions(request, queryset)
+
+def _changelist_queries(client, model_name):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    with CaptureQueriesContext(connection) as ctx:
+        response = client.get(f"/admin/app/{model_name}/")
+    assert response.status_code == 200
+    return len(ctx)
+
+
+def _add_rows(count, offset=0):
+    branch = Branch.objects.create(name=f"Branch {offset}", branch_type="LAUNDRY")
+    user = User.objects.create_user(username=f"staff{offset}", email=f"staff{offset}@x.com", password="x")
+    user.phone_numbers.create(phone_number=f"0812{offset}")
+    user.branch_assignments.create(branch=branch)
+    for i in range(count):
+        category = Category.objects.create(name=f"Cat {offset}-{i}", transaction_type=TransactionType.EXPENSE)
+        category.branches.add(branch)
+        transaction = Transaction.objects.create(
+            branch=branch, reported_by=user, amount=1000 + i, transaction_type=TransactionType.EXPENSE,
+            category=category, date=f"2024-01-{i + 1:02d}", description=f"item {i}",
+            source=TransactionSource.EMAIL,
+        )
+        IngestionLog.objects.create(
+            source=TransactionSource.EMAIL, raw_payload={"subject": f"s{i}"},
+            status=IngestionStatus.SUCCESS, created_transaction=transaction,
+        )
+        DailySummary.objects.create(branch=branch, date=f"2024-01-{i + 1:02d}", source=TransactionSource.EMAIL)
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("model_name", ["category", "transaction", "ingestionlog", "dailysummary", "user"])
+def test_changelist_queries_do_not_grow_with_rows(client, model_name):
+    admin_user = User.objects.create_superuser(username="root", email="root@x.com", password="x")
+    client.force_login(admin_user)
+    _add_rows(2)
+    few = _changelist_queries(client, model_name)
+    _add_rows(6, offset=1)
+    assert _changelist_queries(client, model_name) == few
+
+
+@pytest.mark.django_db
+def test_estimated_count_only_for_unfiltered_large_tables(monkeypatch, settings):
+    from app import admin as app_admin
+
+    settings.ADMIN_ESTIMATED_COUNT_THRESHOLD = 1000
+    monkeypatch.setattr(app_admin, "estimated_count", lambda queryset: 50000)
+    Branch.objects.create(name="Test", branch_type="LAUNDRY")
+
+    assert app_admin.EstimatedCountPaginator(Branch.objects.all(), 10).count == 50000
+    assert app_admin.EstimatedCountPaginator(Branch.objects.filter(name="Test"), 10).count == 1
+
+    monkeypatch.setattr(app_admin, "estimated_count", lambda queryset: 10)
+    assert app_admin.EstimatedCountPaginator(Branch.objects.all(), 10).count == 1
+
+
+@pytest.mark.django_db
+def test_raw_payload_loaded_on_demand(client):
+    client.force_login(User.objects.create_superuser(username="root", email="root@x.com", password="x"))
+    log = IngestionLog.objects.create(source=TransactionSource.EMAIL, raw_payload={"subject": "Laporan"})
+
+    change_page = client.get(f"/admin/app/ingestionlog/{log.pk}/change/")
+    assert change_page.status_code == 200
+    assert b"Laporan" not in change_page.content
+
+    response = client.get(f"/admin/app/ingestionlog/{log.pk}/json/")
+    assert response.json() == {"subject": "Laporan"}
+    assert client.get("/admin/app/ingestionlog/0/json/").status_code == 404
+    assert client.get("/admin/app/ingestionlog/?q=Laporan").context["cl"].result_count == 1
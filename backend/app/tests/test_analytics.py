@@ -0,0 +1,283 @@
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+import pytest
+from rest_framework.test import APIClient
+
+np = pytest.importorskip('numpy')
+
+from app.analytics import anomalies, forecast, series
+from app.models import (
+    Anomaly, AnomalyKind, Branch, Category, DailySummary, ForecastFit, ForecastMethod,
+    Transaction, TransactionSource, TransactionType, User,
+)
+
+START = date(2025, 1, 6)  # a Monday
+WEEKLY = np.array([100, 90, 95, 110, 150, 220, 200], dtype=float) * 1000
+
+
+def weekly_sales(branches, days, seed=0):
+    rng = np.random.default_rng(seed)
+    base = np.tile(WEEKLY, days // 7 + 1)[:days]
+    return base * rng.uniform(0.95, 1.05, size=(branches, days))
+
+
+def test_to_matrix_keeps_gaps_as_nan():
+    matrix = series.to_matrix([(2, START, 10), (1, START + timedelta(days=2), 5)], START, START + timedelta(days=3))
+    assert matrix.keys == [1, 2]
+    assert matrix.values.shape == (2, 4)
+    assert matrix.values[1, 0] == 10 and matrix.values[0, 2] == 5
+    assert np.isnan(matrix.values[0, 0])
+    assert matrix.date_at(2) == START + timedelta(days=2)
+
+
+def test_revenue_scoring_flags_spikes_drops_and_gaps():
+    values = weekly_sales(3, 120)
+    values[0, 100] *= 2          # doubled ingestion
+    values[1, 101] *= 0.2        # collapse in sales
+    values[2, 102] = np.nan      # missing report
+    values[:, 118:] = np.nan     # not reported yet by anyone
+
+    z, baseline, missing = anomalies.score_revenue(values, last_reported=117)
+    threshold = 3.5
+
+    assert list(zip(*np.nonzero(z >= threshold))) == [(0, 100)]
+    assert list(zip(*np.nonzero(z <= -threshold))) == [(1, 101)]
+    assert list(zip(*np.nonzero(missing))) == [(2, 102)]
+    # Saturday is compared with Saturdays, not with the weekday average
+    assert baseline[0, 103] == pytest.approx(WEEKLY[(103) % 7], rel=0.06)
+
+
+def test_expense_scoring_only_uses_expense_days():
+    values = np.full((1, 200), np.nan)
+    values[0, ::10] = 50_000
+    values[0, 150] = 400_000
+    z, baseline = anomalies.score_expenses(values)
+    assert list(zip(*np.nonzero(z >= 3.5))) == [(0, 150)]
+    assert baseline[0, 150] == 50_000
+
+
+def test_scoring_is_vectorized():
+    values = weekly_sales(50, 730)
+    started = time.perf_counter()
+    anomalies.score_revenue(values, last_reported=729)
+    anomalies.score_expenses(values)
+    # Every branch over two years; a per-cell Python loop takes far longer
+    assert time.perf_counter() - started < 1.0
+
+
+@pytest.fixture
+def history():
+    branch = Branch.objects.create(name="Analitik", branch_type="LAUNDRY")
+    soap = Category.objects.create(name="Sabun", transaction_type=TransactionType.EXPENSE)
+    sales = weekly_sales(1, 90)[0]
+    sales[80] *= 2
+    summaries = [
+        DailySummary(branch=branch, date=START + timedelta(days=i), source=TransactionSource.EMAIL,
+                     net_sales=Decimal(str(round(sales[i]))))
+        for i in range(90) if i != 85
+    ]
+    DailySummary.objects.bulk_create(summaries)
+    for i in range(0, 90, 7):
+        Transaction.objects.create(
+            branch=branch, category=soap, date=START + timedelta(days=i),
+            amount=500_000 if i == 84 else 40_000 + i,
+            transaction_type=TransactionType.EXPENSE, source=TransactionSource.WHATSAPP,
+        )
+    return branch
+
+
+@pytest.mark.django_db
+def test_detect_stores_anomalies(history):
+    found = anomalies.detect()
+    kinds = sorted((a.kind, (a.date - START).days) for a in found)
+    assert kinds == [
+        (AnomalyKind.EXPENSE_SPIKE, 84),
+        (AnomalyKind.MISSING_REPORT, 85),
+        (AnomalyKind.REVENUE_SPIKE, 80),
+    ]
+    assert Anomaly.objects.count() == 3
+    spike = Anomaly.objects.get(kind=AnomalyKind.REVENUE_SPIKE)
+    assert float(spike.value) == pytest.approx(2 * float(spike.baseline), rel=0.1)
+
+    # Re-scoring a window replaces only that window
+    anomalies.detect(days=7)
+    assert Anomaly.objects.count() == 3
+    assert anomalies.detect(days=3) == []
+    assert Anomaly.objects.count() == 3
+
+
+@pytest.mark.django_db
+def test_api_is_branch_scoped(history):
+    other = Branch.objects.create(name="Lain", branch_type="CARWASH")
+    Anomaly.objects.create(branch=history, date=START, kind=AnomalyKind.MISSING_REPORT)
+    Anomaly.objects.create(branch=other, date=START, kind=AnomalyKind.MISSING_REPORT)
+    staff = User.objects.create_user(username="staff", email="staff@x.com", password="x")
+    staff.branch_assignments.create(branch=history)
+    owner = User.objects.create_superuser(username="owner", email="owner@x.com", password="x")
+
+    client = APIClient()
+    client.force_authenticate(owner)
+    assert len(client.get('/api/anomalies/').json()['results']) == 2
+
+    client.force_authenticate(staff)
+    results = client.get('/api/anomalies/?kind=MISSING_REPORT').json()['results']
+    assert [r['branch_name'] for r in results] == ["Analitik"]
+    assert results[0]['kind_display'] == "No sales report"
+
+
+# --- Forecasts ---
+
+def test_forecast_learns_the_weekly_pattern():
+    values = weekly_sales(2, 140)
+    values[1, 60:80] = np.nan  # a branch that stopped reporting for a while
+    state, fitted = forecast.fit(values, START)
+    assert fitted.all()
+    season = state.level[:, None] + state.season
+    assert season == pytest.approx(np.vstack([WEEKLY, WEEKLY]), rel=0.05)
+    # Seasonal naive carries the day-to-day noise; smoothing averages it out
+    assert (state.smoothing_sse < state.naive_sse).all()
+
+
+def test_forecast_needs_two_weeks_of_history():
+    values = np.full((2, 30), np.nan)
+    values[0] = 100
+    values[1, 20:] = 100
+    _, fitted = forecast.fit(values, START)
+    assert fitted.tolist() == [True, False]
+
+
+def test_forecast_fit_is_batched():
+    values = weekly_sales(50, 730)
+    started = time.perf_counter()
+    forecast.fit(values, START)
+    # 50 series x 20 parameter pairs stepped through two years at once
+    assert time.perf_counter() - started < 2.0
+
+
+def add_sales(branch, days, offset=0):
+    sales = weekly_sales(1, offset + days, seed=branch.pk)[0]
+    DailySummary.objects.bulk_create([
+        DailySummary(branch=branch, date=START + timedelta(days=i), source=TransactionSource.EMAIL,
+                     net_sales=Decimal(str(round(sales[i]))))
+        for i in range(offset, offset + days)
+    ])
+
+
+@pytest.mark.django_db
+def test_refresh_steps_fits_forward_and_refits_edited_history():
+    branch = Branch.objects.create(name="Ramalan", branch_type="LAUNDRY")
+    add_sales(branch, 60)
+    assert forecast.refresh() == {'refitted': 1, 'updated': 0}
+    fit = ForecastFit.objects.get()
+    assert fit.fitted_through == START + timedelta(days=59)
+    assert fit.category is None and len(fit.season) == 7
+
+    assert forecast.refresh() == {'refitted': 0, 'updated': 0}
+    add_sales(branch, 3, offset=60)
+    assert forecast.refresh() == {'refitted': 0, 'updated': 1}
+    fit.refresh_from_db()
+    assert fit.fitted_through == START + timedelta(days=62)
+
+    DailySummary.objects.filter(date=START + timedelta(days=10)).first().save()
+    assert forecast.refresh() == {'refitted': 1, 'updated': 0}
+    assert ForecastFit.objects.count() == 1
+
+
+@pytest.mark.django_db
+def test_expense_days_without_spend_count_as_zero():
+    branch = Branch.objects.create(name="Ramalan", branch_type="LAUNDRY")
+    soap = Category.objects.create(name="Sabun", transaction_type=TransactionType.EXPENSE)
+    for i in range(0, 63, 7):
+        Transaction.objects.create(
+            branch=branch, category=soap, date=START + timedelta(days=i), amount=70_000,
+            transaction_type=TransactionType.EXPENSE, source=TransactionSource.WHATSAPP,
+        )
+    forecast.refresh(full=True)
+    fit = ForecastFit.objects.get(category=soap)
+    point, _, _ = forecast.predict([fit], START + timedelta(days=63), 7, 0.8)
+    # Bought every Monday: the forecast is that Monday's purchase, not 10000 a day
+    assert point[0, 0] == pytest.approx(70_000, rel=0.1)
+    assert point[0, 1:].max() < 7_000
+
+
+@pytest.mark.django_db
+def test_ingestion_schedules_a_refresh(settings, django_capture_on_commit_callbacks):
+    settings.BACKGROUND_TASKS_SYNC = True
+    branch = Branch.objects.create(name="Ramalan", branch_type="LAUNDRY")
+    add_sales(branch, 30)
+    with django_capture_on_commit_callbacks(execute=True):
+        DailySummary.objects.create(branch=branch, date=START + timedelta(days=30),
+                                    source=TransactionSource.EMAIL, net_sales=100_000)
+    assert ForecastFit.objects.get().fitted_through == START + timedelta(days=30)
+
+    settings.FORECAST_REFRESH_ON_INGEST = False
+    with django_capture_on_commit_callbacks(execute=True) as callbacks:
+        DailySummary.objects.create(branch=branch, date=START + timedelta(days=31),
+                                    source=TransactionSource.EMAIL, net_sales=100_000)
+    assert callbacks == []
+
+
+def test_refreshes_never_overlap(settings, monkeypatch):
+    settings.BACKGROUND_TASKS_SYNC = True
+    calls = []
+
+    def refresh():
+        calls.append(len(calls))
+        if len(calls) == 1:
+            # Two reports ingested while the first refresh runs
+            forecast._submit_refresh()
+            forecast._submit_refresh()
+            assert len(calls) == 1
+
+    monkeypatch.setattr(forecast, 'refresh', refresh)
+    forecast._submit_refresh()
+    # Coalesced into one follow-up run
+    assert calls == [0, 1]
+
+    monkeypatch.setattr(forecast, 'refresh', lambda: 1 / 0)
+    with pytest.raises(ZeroDivisionError):
+        forecast._submit_refresh()
+    # A failed refresh does not block the next one
+    monkeypatch.setattr(forecast, 'refresh', refresh)
+    forecast._submit_refresh()
+    assert calls == [0, 1, 2]
+
+
+@pytest.mark.django_db
+def test_forecast_api():
+    laundry = [Branch.objects.create(name=f"Laundry {i}", branch_type="LAUNDRY") for i in range(2)]
+    carwash = Branch.objects.create(name="Carwash", branch_type="CARWASH")
+    for branch in laundry + [carwash]:
+        add_sales(branch, 70)
+    forecast.refresh()
+    staff = User.objects.create_user(username="staff", email="staff@x.com", password="x")
+    staff.branch_assignments.create(branch=carwash)
+    owner = User.objects.create_superuser(username="owner", email="owner@x.com", password="x")
+    client = APIClient()
+
+    client.force_authenticate(owner)
+    body = client.get('/api/analytics/forecast/?horizon=28').json()
+    assert body['start'] == (START + timedelta(days=70)).isoformat()
+    assert [r['branch_name'] for r in body['results']] == ["Carwash", "Laundry 0", "Laundry 1"]
+    points = body['results'][0]['points']
+    assert len(points) == 28
+    saturday = points[5]
+    assert saturday['forecast'] == pytest.approx(WEEKLY[5], rel=0.1)
+    assert saturday['lower'] < saturday['forecast'] < saturday['upper']
+    # Further ahead is less certain
+    width = [p['upper'] - p['lower'] for p in points]
+    assert width[-1] > width[0]
+
+    grouped = client.get('/api/analytics/forecast/?group_by=branch_type&branch_type=LAUNDRY').json()['results']
+    assert [(g['branch_type'], g['branches']) for g in grouped] == [("LAUNDRY", 2)]
+    each = client.get('/api/analytics/forecast/?branch_type=LAUNDRY').json()['results']
+    assert grouped[0]['points'][0]['forecast'] == pytest.approx(
+        sum(r['points'][0]['forecast'] for r in each), abs=0.02
+    )
+
+    client.force_authenticate(staff)
+    results = client.get('/api/analytics/forecast/').json()['results']
+    assert [r['branch_name'] for r in results] == ["Carwash"]
+    assert client.get('/api/analytics/forecast/?horizon=365').status_code == 400
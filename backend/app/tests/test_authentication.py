@@ -56,4 +56,76 @@ def test_google_login_staff_user(api_client, staff_user):
     mock_sociallogin = Mock()
     mock_sociallogin.account.extra_data = {'email': staff_user.email}
     # Should not raise
-    adapter.pre_social_login(None, mock_sociallogin)
\ No newline at end of file
+    adapter.pre_social_login(None, mock_sociallogin)
+
+@pytest.fixture
+def token_client():
+    from django.core.cache import cache
+    from rest_framework.authtoken.models import Token
+    from app import authentication
+    cache.clear()
+    authentication.local_cache.clear()
+    user = User.objects.create_user(username='bot', email='bot@example.com', password='testpass')
+    token = Token.objects.create(user=user)
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+    return client, token
+
+
+def _token_queries(client, path='/api/users/profile/'):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    with CaptureQueriesContext(connection) as captured:
+        response = client.get(path)
+    return response, [q for q in captured.captured_queries if 'authtoken_token' in q['sql']]
+
+
+@pytest.mark.django_db
+def test_cached_token_skips_lookup(token_client):
+    client, _ = token_client
+    response, queries = _token_queries(client)
+    assert response.status_code == 200 and len(queries) == 1
+    response, queries = _token_queries(client)
+    assert response.status_code == 200 and queries == []
+
+
+@pytest.mark.django_db
+def test_cached_token_evicted_on_deactivation_and_delete(token_client):
+    client, token = token_client
+    assert client.get('/api/users/profile/').status_code == 200
+
+    token.user.is_active = False
+    token.user.save()
+    assert client.get('/api/users/profile/').status_code == 401
+
+    token.user.is_active = True
+    token.user.save()
+    assert client.get('/api/users/profile/').status_code == 200
+    token.delete()
+    assert client.get('/api/users/profile/').status_code == 401
+
+
+@pytest.mark.django_db
+def test_signed_access_token(token_client, settings):
+    settings.AUTH_SIGNED_TOKENS = True
+    client, token = token_client
+    access = client.post('/api/auth/access-token/').data['access']
+
+    bearer = APIClient()
+    bearer.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+    response, queries = _token_queries(bearer)
+    assert response.status_code == 200 and queries == []
+
+    # Rotating the token revokes access tokens issued from it
+    token.delete()
+    token.__class__.objects.create(user=token.user)
+    assert bearer.get('/api/users/profile/').status_code == 401
+
+    bearer.credentials(HTTP_AUTHORIZATION=f'Bearer {access[:-2]}xx')
+    assert bearer.get('/api/users/profile/').status_code == 401
+
+
+@pytest.mark.django_db
+def test_signed_access_tokens_disabled_by_default(token_client):
+    client, _ = token_client
+    assert client.post('/api/auth/access-token/').status_code == 404
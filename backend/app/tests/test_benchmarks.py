@@ -0,0 +1,57 @@
+import pytest
+from django.db import transaction
+
+from app.benchmarks import api, datagen
+
+
+@pytest.mark.django_db
+def test_api_query_counts_match_baseline():
+    """N+1 guard: every endpoint runs no more queries than the checked-in baseline"""
+    baseline = api.load_baseline()
+    dataset = datagen.generate_scale(baseline['scale'])
+    results = api.run(dataset, iterations=1)
+
+    assert set(results) == set(baseline['endpoints'])
+    assert api.compare(results, baseline, check_latency=False, check_memory=False) == []
+
+
+@pytest.mark.django_db
+def test_query_counts_do_not_grow_with_the_dataset():
+    """A per-row query (N+1) must never be recorded as an endpoint's expected count"""
+    counts = []
+    for scale in ('tiny', 'small'):
+        with transaction.atomic():
+            results = api.run(datagen.generate_scale(scale), iterations=1)
+            transaction.set_rollback(True)
+        counts.append({name: result.queries for name, result in results.items()})
+    assert counts[0] == counts[1]
+
+
+def test_compare_thresholds():
+    baseline = {'endpoints': {'x': {'status': 200, 'queries': 3, 'p50_ms': 9.0, 'p95_ms': 10.0, 'peak_kib': 100.0}}}
+
+    same = api.Result(status=200, queries=3, p50_ms=9.0, p95_ms=11.0, peak_kib=120.0, iterations=5)
+    assert api.compare({'x': same}, baseline) == []
+
+    worse = api.Result(status=200, queries=4, p50_ms=15.0, p95_ms=20.0, peak_kib=100.0, iterations=5)
+    assert api.compare({'x': worse}, baseline) == ['x: queries 3 -> 4', 'x: p95 10.0ms -> 20.0ms']
+    assert api.compare({'x': worse}, baseline, check_latency=False) == ['x: queries 3 -> 4']
+
+
+def test_server_errors_are_never_a_baseline(tmp_path):
+    baseline = {'endpoints': {'x': {'status': 500, 'queries': 3, 'p50_ms': 9.0, 'p95_ms': 10.0, 'peak_kib': 100.0}}}
+    broken = api.Result(status=500, queries=3, p50_ms=9.0, p95_ms=10.0, peak_kib=100.0, iterations=5)
+    assert api.compare({'x': broken}, baseline) == ['x: server error 500']
+    with pytest.raises(ValueError):
+        api.write_baseline({'x': broken}, 'small', tmp_path / 'api.json')
+    assert not (tmp_path / 'api.json').exists()
+
+
+def test_partial_baseline_update_keeps_other_entries(tmp_path):
+    path = tmp_path / 'api.json'
+    old = api.Result(status=200, queries=3, p50_ms=9.0, p95_ms=10.0, peak_kib=100.0, iterations=5)
+    api.write_baseline({'x': old, 'y': old}, 'small', path)
+    new = api.Result(status=200, queries=1, p50_ms=1.0, p95_ms=2.0, peak_kib=50.0, iterations=5)
+    api.write_baseline({'y': new}, 'small', path, merge=True)
+    endpoints = api.load_baseline(path)['endpoints']
+    assert (endpoints['x']['queries'], endpoints['y']['queries']) == (3, 1)
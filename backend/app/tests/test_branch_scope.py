@@ -0,0 +1,86 @@
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from app import branch_scope
+from app.models import (
+    Branch, Category, DailySummary, Transaction, User, UserBranchAssignment,
+    BranchType, TransactionSource, TransactionType,
+)
+
+
+class BranchScopeTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.branch_a = Branch.objects.create(name='A', branch_type=BranchType.LAUNDRY)
+        self.branch_b = Branch.objects.create(name='B', branch_type=BranchType.LAUNDRY)
+        self.staff = User.objects.create_user(username='staff', email='staff@example.com', password='pass')
+        UserBranchAssignment.objects.create(user=self.staff, branch=self.branch_a)
+
+    def test_owner_is_unrestricted(self):
+        owner = User.objects.create_superuser(username='owner', email='owner@example.com', password='pass')
+        with self.assertNumQueries(0):
+            self.assertTrue(branch_scope.for_user(owner).allows(self.branch_b.id))
+
+    def test_scope_is_cached_and_invalidated(self):
+        self.assertEqual(branch_scope.for_user(self.staff).branch_ids, {self.branch_a.id})
+        with self.assertNumQueries(0):
+            branch_scope.for_user(self.staff)
+
+        assignment = UserBranchAssignment.objects.create(user=self.staff, branch=self.branch_b)
+        self.assertEqual(branch_scope.for_user(self.staff).branch_ids, {self.branch_a.id, self.branch_b.id})
+
+        assignment.delete()
+        self.assertEqual(branch_scope.for_user(self.staff).branch_ids, {self.branch_a.id})
+
+    def test_unassigned_user_sees_nothing(self):
+        other = User.objects.create_user(username='other', email='other@example.com', password='pass')
+        scope = branch_scope.for_user(other)
+        self.assertFalse(scope.allows(self.branch_a.id))
+        self.assertFalse(scope.filter(Branch.objects.all()).exists())
+
+
+class BranchScopedViewsTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.branch_a = Branch.objects.create(name='A', branch_type=BranchType.LAUNDRY)
+        self.branch_b = Branch.objects.create(name='B', branch_type=BranchType.CARWASH)
+        self.branch_c = Branch.objects.create(name='C', branch_type=BranchType.KOS)
+        self.staff = User.objects.create_user(username='staff', email='staff@example.com', password='pass')
+        UserBranchAssignment.objects.create(user=self.staff, branch=self.branch_a)
+        UserBranchAssignment.objects.create(user=self.staff, branch=self.branch_b)
+        category = Category.objects.create(name='Cuci', transaction_type=TransactionType.INCOME)
+        self.transactions = {
+            branch.name: Transaction.objects.create(
+                branch=branch, amount=1000, transaction_type=TransactionType.INCOME, category=category,
+                date=timezone.now().date(), source=TransactionSource.MANUAL,
+            )
+            for branch in (self.branch_a, self.branch_b, self.branch_c)
+        }
+        for branch in (self.branch_a, self.branch_c):
+            DailySummary.objects.create(branch=branch, date=timezone.now().date(), source=TransactionSource.EMAIL)
+        self.client.force_authenticate(user=self.staff)
+
+    def test_transactions_limited_to_assigned_branches(self):
+        response = self.client.get('/api/transactions/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual({row['branch_name'] for row in response.data['results']}, {'A', 'B'})
+
+        other = self.transactions['C']
+        self.assertEqual(self.client.get(f'/api/transactions/{other.pk}/').status_code, 404)
+
+    def test_daily_summaries_limited_to_assigned_branches(self):
+        response = self.client.get('/api/daily-summaries/')
+        self.assertEqual([row['branch_name'] for row in response.data['results']], ['A'])
+
+    def test_assignments_resolved_once_per_request(self):
+        trx = self.transactions['A']
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.patch(f'/api/transactions/{trx.pk}/', {'description': 'x'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        # get_queryset and the object permission check share one lookup
+        lookups = [q for q in captured.captured_queries if 'app_userbranchassignment' in q['sql']]
+        self.assertEqual(len(lookups), 1)
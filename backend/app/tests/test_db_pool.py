@@ -0,0 +1,19 @@
+from app.db_pool import pool_stats, summarize
+
+
+def test_summarize_pool_stats():
+    stats = summarize({
+        'pool_min': 2, 'pool_max': 10, 'pool_size': 4, 'pool_available': 1,
+        'requests_waiting': 3, 'requests_num': 200, 'requests_queued': 20,
+        'requests_wait_ms': 500, 'usage_ms': 3000, 'connections_num': 5,
+    })
+    assert stats['in_use'] == 3
+    assert stats['waiting'] == 3
+    assert stats['avg_checkout_wait_ms'] == 2.5
+    assert stats['avg_usage_ms'] == 15.0
+    assert stats['checkout_errors'] == 0
+
+
+def test_no_pool_without_postgres():
+    assert summarize({})['avg_checkout_wait_ms'] == 0.0
+    assert pool_stats() == {}
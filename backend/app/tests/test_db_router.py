@@ -0,0 +1,73 @@
+from unittest import mock
+
+import pytest
+from django.core.cache import cache
+from django.db import DatabaseError
+from django.http import HttpResponse
+from django.test import RequestFactory
+
+from app import db_router
+from app.models import Transaction
+
+router = db_router.ReplicaRouter()
+
+
+@pytest.fixture
+def replicas(settings):
+    settings.DATABASE_REPLICAS = ['replica_0']
+    cache.clear()
+    db_router._health.clear()
+    with mock.patch.object(db_router, 'replica_lag', return_value=0.0) as lag:
+        yield lag
+    db_router._health.clear()
+
+
+def _read_during(method, headers=None):
+    """Run a request through the middleware and report where a read goes"""
+    seen = {}
+
+    def view(request):
+        seen['db'] = router.db_for_read(Transaction)
+        if request.method == 'POST':
+            router.db_for_write(Transaction)
+        return HttpResponse()
+
+    request = getattr(RequestFactory(), method.lower())('/api/transactions/', **(headers or {}))
+    db_router.ReplicaRoutingMiddleware(view)(request)
+    return seen['db']
+
+
+def test_primary_only_without_replicas(settings):
+    settings.DATABASE_REPLICAS = []
+    assert _read_during('GET') == 'default'
+    with db_router.use_replica():
+        assert router.db_for_read(Transaction) == 'default'
+
+
+def test_safe_reads_go_to_replica(replicas):
+    assert _read_during('GET') == 'replica_0'
+    assert _read_during('POST') == 'default'
+    assert router.db_for_read(Transaction) == 'default'
+    with db_router.use_replica():
+        assert router.db_for_read(Transaction) == 'replica_0'
+
+
+def test_reads_stick_to_primary_after_a_write(replicas):
+    alice = {'HTTP_AUTHORIZATION': 'Token alice'}
+    assert _read_during('POST', alice) == 'default'
+    assert _read_during('GET', alice) == 'default'
+    assert _read_during('GET', {'HTTP_AUTHORIZATION': 'Token bob'}) == 'replica_0'
+
+
+def test_lagging_or_down_replica_falls_back(replicas, settings):
+    replicas.return_value = settings.REPLICA_MAX_LAG + 1
+    assert _read_during('GET') == 'default'
+
+    # Health is cached; once rechecked a reachable, caught-up replica is used again
+    replicas.return_value = 0.0
+    db_router._health.clear()
+    assert _read_during('GET') == 'replica_0'
+
+    replicas.side_effect = DatabaseError('connection refused')
+    db_router._health.clear()
+    assert _read_during('GET') == 'default'
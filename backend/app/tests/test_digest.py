@@ -0,0 +1,159 @@
+import time
+from datetime import date, timedelta
+
+import pytest
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from app import digest
+from app.models import (
+    Branch, Category, Digest, DigestPeriod, Transaction, TransactionSource, TransactionType, User,
+)
+
+MONDAY = date(2026, 3, 2)
+
+
+@pytest.fixture
+def shop():
+    laundry = Branch.objects.create(name="Laundry A", branch_type="LAUNDRY")
+    carwash = Branch.objects.create(name="Carwash B", branch_type="CARWASH")
+    wash = Category.objects.create(name="Cuci Kering", transaction_type=TransactionType.INCOME)
+    iron = Category.objects.create(name="Setrika", transaction_type=TransactionType.INCOME)
+    soap = Category.objects.create(name="Sabun", transaction_type=TransactionType.EXPENSE)
+    return laundry, carwash, wash, iron, soap
+
+
+def add(branch, category, amount, day=MONDAY, **extra):
+    extra.setdefault('is_verified', True)
+    return Transaction.objects.create(
+        branch=branch, category=category, amount=amount, date=day,
+        transaction_type=category.transaction_type, source=TransactionSource.WHATSAPP, **extra,
+    )
+
+
+@pytest.mark.django_db
+def test_collect_aggregates_in_four_queries(shop):
+    laundry, carwash, wash, iron, soap = shop
+    add(laundry, wash, 30000)
+    add(laundry, iron, 10000)
+    add(laundry, soap, 5000, is_verified=False)
+    add(carwash, wash, 50000)
+    add(carwash, wash, 99999, is_valid=False)          # voided
+    add(carwash, wash, 77777, day=MONDAY + timedelta(days=1))  # another day
+
+    with CaptureQueriesContext(connection) as ctx:
+        data = digest.collect(MONDAY, MONDAY)
+    assert len(ctx.captured_queries) == 4
+
+    assert data['totals'] == {
+        'income': '90000.00', 'expense': '5000.00', 'net': '85000.00',
+        'pending_amount': '5000.00', 'transactions': 4, 'pending': 1,
+    }
+    rows = {row['name']: row for row in data['branches']}
+    assert (rows['Laundry A']['net'], rows['Laundry A']['pending']) == ('35000.00', 1)
+    assert [p['name'] for p in data['products']] == ["Cuci Kering", "Setrika"]
+    assert [(t['label'], t['net']) for t in data['branch_types']] == [("Car Wash", "50000.00"), ("Laundry Service", "35000.00")]
+
+
+@pytest.mark.django_db
+def test_query_count_does_not_grow_with_branches(shop):
+    _, _, wash, _, soap = shop
+    for i in range(50):
+        branch = Branch.objects.create(name=f"Cabang {i:02}", branch_type="LAUNDRY")
+        add(branch, wash, 1000 + i)
+        add(branch, soap, 100)
+    started = time.perf_counter()
+    with CaptureQueriesContext(connection) as ctx:
+        built = digest.build(DigestPeriod.DAILY, MONDAY)
+    assert time.perf_counter() - started < 1.0
+    selects = [q for q in ctx.captured_queries if q['sql'].startswith('SELECT')]
+    # Existing digest lookup + 4 aggregates (+ update_or_create's own lookup)
+    assert len(selects) <= 6
+    assert len(built.data['branches']) == 52
+
+
+@pytest.mark.django_db
+def test_weekly_digest_merges_stored_days(shop, settings):
+    laundry, carwash, wash, _, soap = shop
+    settings.DIGEST_BUSINESS_HOURS = (0, 0)
+    for offset in range(7):
+        add(laundry, wash, 10000, day=MONDAY + timedelta(days=offset))
+    add(carwash, soap, 2000, day=MONDAY + timedelta(days=3))
+    for offset in range(7):
+        digest.build(DigestPeriod.DAILY, MONDAY + timedelta(days=offset))
+
+    with CaptureQueriesContext(connection) as ctx:
+        weekly = digest.build(DigestPeriod.WEEKLY, MONDAY + timedelta(days=2))
+    assert not any('app_transaction' in q['sql'] for q in ctx.captured_queries)
+    assert (weekly.start, weekly.end) == (MONDAY, MONDAY + timedelta(days=6))
+    assert weekly.data['totals']['income'] == '70000.00'
+    assert weekly.data['totals']['net'] == '68000.00'
+    assert weekly.data['products'][0]['count'] == 7
+    assert weekly.data == digest.collect(MONDAY, MONDAY + timedelta(days=6))
+
+
+@pytest.mark.django_db
+def test_stored_digest_is_not_rebuilt_in_business_hours(shop, settings):
+    laundry, _, wash, _, _ = shop
+    add(laundry, wash, 10000)
+    first = digest.build(DigestPeriod.DAILY, MONDAY)
+    add(laundry, wash, 5000)
+
+    assert digest.build(DigestPeriod.DAILY, MONDAY).data == first.data
+    settings.DIGEST_BUSINESS_HOURS = (0, 24)
+    assert digest.build(DigestPeriod.DAILY, MONDAY, rebuild=True).data == first.data
+    settings.DIGEST_BUSINESS_HOURS = (0, 0)
+    rebuilt = digest.build(DigestPeriod.DAILY, MONDAY, rebuild=True)
+    assert rebuilt.pk == first.pk
+    assert rebuilt.data['totals']['income'] == '15000.00'
+
+
+@pytest.mark.django_db
+def test_renders_and_delivers(shop):
+    laundry, _, wash, _, _ = shop
+    add(laundry, wash, 1234567)
+    built = digest.build(DigestPeriod.DAILY, MONDAY)
+    assert "Rp 1.234.567" in built.html and "Laundry A" in built.html
+    assert built.text.startswith("*Ringkasan Harian* 2026-03-02")
+    assert "1. Cuci Kering: Rp 1.234.567" in built.text
+
+    owner = User.objects.create_superuser(username="owner", email="owner@x.com", password="x")
+    owner.phone_numbers.create(phone_number="0812-3456")
+    staff = User.objects.create_user(username="staff", email="staff@x.com", password="x")
+    staff.phone_numbers.create(phone_number="0899")
+
+    class Service:
+        sent = []
+
+        def send_message(self, to, body):
+            self.sent.append((to, body))
+            return {'success': True}
+
+    assert digest.deliver(built, Service()) == 1
+    assert Service.sent == [("whatsapp:+628123456", built.text)]
+    built.refresh_from_db()
+    assert built.delivered_at is not None
+
+
+@pytest.mark.django_db
+def test_api_and_command(shop, tmp_path, capsys):
+    laundry, _, wash, _, _ = shop
+    add(laundry, wash, 10000)
+    call_command('send_digest', 'daily', date=MONDAY.isoformat(), output=str(tmp_path))
+    assert "Daily digest 2026-03-02" in capsys.readouterr().out
+    assert (tmp_path / 'daily-2026-03-02.txt').read_text().startswith("*Ringkasan Harian*")
+    built = Digest.objects.get()
+
+    client = APIClient()
+    client.force_authenticate(User.objects.create_user(username="staff", email="s@x.com", password="x"))
+    assert client.get('/api/digests/').status_code == 403
+
+    client.force_authenticate(User.objects.create_superuser(username="owner", email="o@x.com", password="x"))
+    results = client.get('/api/digests/?period=DAILY').json()['results']
+    assert [r['start'] for r in results] == ["2026-03-02"]
+    assert 'html' not in results[0]
+    html = client.get(f'/api/digests/{built.pk}/html/')
+    assert html['Content-Type'].startswith('text/html')
+    assert b"Laundry A" in html.content
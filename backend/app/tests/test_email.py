@@ -4,7 +4,7 @@ import pytest
 from unittest.mock import patch, MagicMock
 from django.core.exceptions import ValidationError
 from app.ingestion.email_webhook import EmailWebhookService
-from app.models import Branch, Category, TransactionType, BranchType, Transaction, User
+from app.models import Branch, Category, DailySummary, TransactionType, BranchType, Transaction, User
 
 @pytest.fixture
 def test_branch(db):
@@ -123,3 +123,29 @@ def test_detect_and_parse_email_types(monkeypatch, webhook_service):
     assert webhook_service._detect_and_parse_email("LUNA POS", "", "")[0] == "LUNA"
     assert webhook_service._detect_and_parse_email("DAILY SALES SUMMARY", "", "")[0] == "HITACHI"
     assert webhook_service._detect_and_parse_email("random", "", "")[0] == "SIMPLE"
+
+@pytest.mark.django_db
+def test_resent_report_is_upserted(webhook_service, test_branch, test_user, monkeypatch):
+    parsed = {
+        "metadata": {"location": "Test Branch", "date": "November 5, 2025"},
+        "summary": {"gross_sales": 30000, "total_collected": 30000},
+        "top_items": [{"name": "Soap", "amount": 20000}, {"name": "Cuci", "amount": 10000}],
+    }
+    monkeypatch.setattr("app.ingestion.email_webhook.parse_hitachi_email", lambda x: parsed)
+    monkeypatch.setattr(EmailWebhookService, "_find_user_by_email", lambda self, email: test_user)
+    payload = {"sender": test_user.email, "subject": "Fwd: Daily Summary", "text_body": "DAILY SALES SUMMARY"}
+
+    webhook_service.process_payload(payload)
+    first = set(Transaction.objects.values_list("pk", flat=True))
+    voided = Transaction.objects.get(category__name="Soap")
+    voided.is_valid = False
+    voided.save()
+
+    parsed["summary"]["total_collected"] = 31000
+    result = webhook_service.process_payload(payload)
+    assert result == "Created Hitachi summary + 2 transactions"
+    assert set(Transaction.objects.values_list("pk", flat=True)) == first
+    assert not Transaction.objects.get(pk=voided.pk).is_valid
+    summary = DailySummary.objects.get()
+    assert summary.total_collected == 31000
+    assert list(Category.objects.get(name="Cuci").branches.all()) == [test_branch]
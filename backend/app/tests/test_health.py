@@ -0,0 +1,50 @@
+import time
+from datetime import timedelta
+
+from django.test import TransactionTestCase, override_settings
+from django.urls import reverse
+
+from app import health
+from app.models import IngestionLog, IngestionStatus, TransactionSource
+
+
+# Probes run in other threads, so the rows they read must be committed
+@override_settings(IMAP_HOST='', HEALTH_PROBE_TIMEOUT=2.0)
+class ReadinessTestCase(TransactionTestCase):
+    def setUp(self):
+        health.reset()
+        self.url = reverse('health-ready')
+
+    def test_ready_when_dependencies_respond(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        checks = response.json()['checks']
+        self.assertEqual(checks['database']['status'], 'ok')
+        self.assertEqual(checks['cache']['status'], 'ok')
+        self.assertEqual(checks['ingestion_queue']['pending'], 0)
+        self.assertEqual(checks['imap']['status'], 'skipped')
+
+    def test_stale_ingestion_queue_is_not_ready(self):
+        log = IngestionLog.objects.create(
+            source=TransactionSource.EMAIL, raw_payload={}, status=IngestionStatus.PENDING,
+        )
+        IngestionLog.objects.filter(pk=log.pk).update(created_at=log.created_at - timedelta(hours=2))
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()['checks']['ingestion_queue']['status'], 'fail')
+
+    def test_results_are_cached(self):
+        self.client.get(self.url)
+        IngestionLog.objects.create(source=TransactionSource.EMAIL, raw_payload={})
+        response = self.client.get(self.url)
+        self.assertEqual(response.json()['checks']['ingestion_queue']['pending'], 0)
+
+    @override_settings(HEALTH_PROBE_TIMEOUT=0.05)
+    def test_slow_probe_times_out(self):
+        started = time.perf_counter()
+        result = health.run_probes({'fast': lambda: {'status': 'ok'}, 'slow': lambda: time.sleep(0.5)})
+        self.assertLess(time.perf_counter() - started, 0.4)
+        self.assertEqual(result['status'], 'unavailable')
+        self.assertEqual(result['checks']['slow']['status'], 'timeout')
+        self.assertEqual(result['checks']['fast']['status'], 'ok')
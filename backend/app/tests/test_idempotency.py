@@ -0,0 +1,204 @@
+from datetime import date, timedelta
+
+import pytest
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from app import idempotency
+from app.ingestion.email_webhook import EmailWebhookService
+from app.models import (
+    Branch, Category, IdempotencyKey, Transaction, TransactionSource, TransactionType, User,
+    UserBranchAssignment, UserPhoneNumber,
+)
+
+HITACHI_BODY = """Daily Sales Summary for 2025-11-05
+Laundry Bosku Cabang A
+Gross Sales Rp 100.000
+"""
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    cache.clear()
+    yield
+    cache.clear()
+
+
+@pytest.fixture
+def owner():
+    return User.objects.create_superuser(username="owner", email="owner@x.com", password="x")
+
+
+@pytest.fixture
+def expense():
+    branch = Branch.objects.create(name="Laundry A", branch_type="LAUNDRY")
+    soap = Category.objects.create(name="Sabun", transaction_type=TransactionType.EXPENSE)
+    return {
+        'branch': branch.id, 'category': soap.id, 'date': '2026-03-02', 'amount': '5000',
+        'transaction_type': TransactionType.EXPENSE, 'source': TransactionSource.MANUAL,
+        'source_identifier': 'owner',
+    }
+
+
+def post(client, data, key=None):
+    headers = {'HTTP_IDEMPOTENCY_KEY': key} if key else {}
+    return client.post('/api/transactions/', data, format='json', **headers)
+
+
+@pytest.mark.django_db
+def test_retry_replays_the_stored_response(owner, expense):
+    client = APIClient()
+    client.force_authenticate(owner)
+    first = post(client, expense, key="abc")
+    assert first.status_code == 201
+    assert idempotency.REPLAYED_HEADER not in first
+
+    retry = post(client, expense, key="abc")
+    assert retry.status_code == 201
+    assert retry[idempotency.REPLAYED_HEADER] == 'true'
+    assert retry.json() == first.json()
+    assert Transaction.objects.count() == 1
+
+    # The DB row answers once the cache is gone
+    cache.clear()
+    assert post(client, expense, key="abc").json()['id'] == first.json()['id']
+    assert Transaction.objects.count() == 1
+
+
+@pytest.mark.django_db
+def test_key_reuse_conflicts(owner, expense):
+    client = APIClient()
+    client.force_authenticate(owner)
+    assert post(client, expense, key="abc").status_code == 201
+    assert post(client, {**expense, 'amount': '6000'}, key="abc").status_code == 422
+    assert post(client, expense, key="x" * 256).status_code == 400
+
+    # A retry while the first request is still being processed
+    IdempotencyKey.objects.update(status_code=None, response_body=None)
+    cache.clear()
+    assert post(client, expense, key="abc").status_code == 409
+    assert Transaction.objects.count() == 1
+
+
+@pytest.mark.django_db
+def test_keys_are_scoped_per_caller_and_expire(owner, expense):
+    other = User.objects.create_superuser(username="other", email="other@x.com", password="x")
+    client = APIClient()
+    client.force_authenticate(owner)
+    post(client, expense, key="abc")
+    client.force_authenticate(other)
+    assert idempotency.REPLAYED_HEADER not in post(client, expense, key="abc")
+    assert Transaction.objects.count() == 2
+
+    IdempotencyKey.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+    cache.clear()
+    assert idempotency.REPLAYED_HEADER not in post(client, expense, key="abc")
+    assert Transaction.objects.count() == 3
+
+    assert IdempotencyKey.objects.count() == 2
+    call_command('purge_idempotency_keys')
+    assert IdempotencyKey.objects.count() == 1
+
+
+@pytest.mark.django_db
+def test_abandoned_claims_are_taken_over_after_the_lease(owner, expense, settings):
+    client = APIClient()
+    client.force_authenticate(owner)
+    assert post(client, expense, key="abc").status_code == 201
+    # Left in progress, as by a worker killed mid-request
+    IdempotencyKey.objects.update(status_code=None, response_body=None)
+    cache.clear()
+    assert post(client, expense, key="abc").status_code == 409
+
+    IdempotencyKey.objects.update(created_at=timezone.now() - timedelta(seconds=settings.IDEMPOTENCY_LEASE_SECONDS + 1))
+    retry = post(client, expense, key="abc")
+    assert retry.status_code == 201
+    assert idempotency.REPLAYED_HEADER not in retry
+    assert IdempotencyKey.objects.get().status_code == 201
+
+
+@pytest.mark.django_db
+def test_identical_requests_without_a_key_are_allowed(owner, expense):
+    # Two equal purchases on one day are two transactions
+    client = APIClient()
+    client.force_authenticate(owner)
+    assert post(client, expense).status_code == 201
+    assert post(client, expense).status_code == 201
+    assert Transaction.objects.count() == 2
+    assert not IdempotencyKey.objects.exists()
+
+
+@pytest.mark.django_db
+def test_server_errors_release_the_key():
+    client = Client()
+    payload = {'sender': 'pos@example.com', 'subject': 'Fwd: Daily Summary', 'text_body': HITACHI_BODY}
+    headers = {'HTTP_X_API_KEY': 'testkey', 'HTTP_IDEMPOTENCY_KEY': 'report-1'}
+    url = reverse('email-webhook')
+
+    with override_settings(INGESTION_API_KEY=''):
+        assert client.post(url, payload, content_type='application/json', **headers).status_code == 500
+    assert not IdempotencyKey.objects.exists()
+
+    with override_settings(INGESTION_API_KEY='testkey'):
+        response = client.post(url, payload, content_type='application/json', **headers)
+        assert response.status_code == 200
+        assert idempotency.REPLAYED_HEADER not in response
+        replay = client.post(url, payload, content_type='application/json', **headers)
+        assert replay[idempotency.REPLAYED_HEADER] == 'true'
+
+
+@pytest.mark.django_db
+@override_settings(INGESTION_API_KEY='testkey')
+def test_unauthenticated_callers_never_claim_a_key():
+    client = Client()
+    payload = {'sender': 'pos@example.com', 'subject': 'Fwd: Daily Summary', 'text_body': HITACHI_BODY}
+    headers = {'HTTP_X_API_KEY': 'wrong', 'HTTP_IDEMPOTENCY_KEY': 'report-1'}
+    url = reverse('email-webhook')
+
+    for _ in range(2):
+        response = client.post(url, payload, content_type='application/json', **headers)
+        assert response.status_code == 401
+        assert idempotency.REPLAYED_HEADER not in response
+    assert not IdempotencyKey.objects.exists()
+
+
+@pytest.mark.django_db
+@override_settings(INGESTION_API_KEY='testkey')
+def test_bot_retries_replay_by_message_id(expense):
+    staff = User.objects.create_user(username="staff", email="staff@x.com", password="x")
+    UserPhoneNumber.objects.create(user=staff, phone_number='6281234567890')
+    UserBranchAssignment.objects.create(user=staff, branch_id=expense['branch'])
+    payload = {
+        'phone_number': '6281234567890', 'branch_id': expense['branch'], 'category_id': expense['category'],
+        'type': 'EXPENSE', 'amount': 5000, 'notes': '-',
+    }
+    # What whatsapp-service sends: its API key and the WhatsApp message id
+    headers = {'HTTP_X_API_KEY': 'testkey', 'HTTP_IDEMPOTENCY_KEY': 'wa-3EB0C431C26A1916D0F2'}
+
+    first = APIClient().post('/api/ingestion/internal-wa/', payload, format='json', **headers)
+    retry = APIClient().post('/api/ingestion/internal-wa/', payload, format='json', **headers)
+    assert first.status_code == retry.status_code == 201
+    assert retry[idempotency.REPLAYED_HEADER] == 'true'
+    assert Transaction.objects.count() == 1
+
+
+@pytest.mark.django_db
+def test_report_lines_are_deduplicated_by_dedupe_key(monkeypatch):
+    user = User.objects.create_user(username="pos", email="pos@x.com", password="x")
+    monkeypatch.setattr("app.ingestion.email_webhook.parse_hitachi_email", lambda x: {
+        "metadata": {"location_alias": "Laundry A", "date": "November 5, 2025"},
+        "top_items": [{"name": "Soap", "amount": 20000}],
+    })
+    monkeypatch.setattr(EmailWebhookService, "_find_user_by_email", lambda self, email: user)
+    payload = {"sender": user.email, "subject": "Fwd: Daily Summary", "text_body": "Daily Sales Summary"}
+
+    EmailWebhookService().process_payload(payload)
+    EmailWebhookService().process_payload(payload)
+    trx = Transaction.objects.get()
+    assert trx.dedupe_key == Transaction.report_item_key(
+        trx.branch_id, date(2025, 11, 5), trx.category_id, TransactionType.INCOME, 20000,
+    )
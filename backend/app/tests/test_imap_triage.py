@@ -0,0 +1,180 @@
+import base64
+from datetime import date
+
+import pytest
+from django.test import override_settings
+
+from app.benchmarks.datagen import luna_report_html
+from app.ingestion import imap_triage
+from app.ingestion.email_ingestion import EmailIngestionService
+from app.models import (
+    Branch, Category, IngestionLog, IngestionStatus, Transaction, TransactionType, User,
+)
+
+REPORT = """Daily Sales Summary for 2025-11-05
+Laundry Bosku Cabang A
+Gross Sales Rp 100.000
+Top Items
+Cuci Kering Rp 60.000 3
+Best Regards
+"""
+# multipart/mixed: (multipart/alternative: text/plain, text/html), PDF attachment
+FORWARD_STRUCTURE = (
+    b'((("text" "plain" ("charset" "utf-8") NIL NIL "base64" %d 6 NIL NIL NIL NIL)'
+    b'("text" "html" ("charset" "utf-8") NIL NIL "7bit" 900 20 NIL NIL NIL NIL) "alternative" ("boundary" "b2") NIL NIL NIL)'
+    b'("application" "pdf" ("name" "report.pdf") NIL NIL "base64" 4000000 NIL ("attachment" ("filename" "report.pdf")) NIL NIL)'
+    b' "mixed" ("boundary" "b1") NIL NIL NIL)'
+)
+
+
+def triage_response(number, headers, structure, size):
+    headers = headers.encode()
+    return [
+        (b'%d (RFC822.SIZE %d BODYSTRUCTURE %s BODY[HEADER.FIELDS (FROM SUBJECT CONTENT-TYPE)] {%d}'
+         % (number, size, structure, len(headers)), headers),
+        b')',
+    ]
+
+
+class FakeIMAP:
+    """Answers FETCH like imaplib does; a message is (headers, structure, size, {section: bytes})"""
+
+    def __init__(self, messages):
+        self.messages = messages
+        self.fetches = []
+        self.seen = []
+
+    def select(self, mailbox):
+        return 'OK', [b'%d' % len(self.messages)]
+
+    def search(self, charset, criteria):
+        return 'OK', [b' '.join(b'%d' % (i + 1) for i in range(len(self.messages)))]
+
+    def fetch(self, email_id, items):
+        self.fetches.append((email_id, items))
+        headers, structure, size, parts = self.messages[int(email_id) - 1]
+        if items == imap_triage.TRIAGE_ITEMS:
+            return 'OK', triage_response(int(email_id), headers, structure, size)
+        section = items[len('(BODY.PEEK['):items.index(']')]
+        limit = int(items[items.index('<0.') + 3:items.index('>')])
+        data = parts[section][:limit]
+        return 'OK', [(b'%s (BODY[%s]<0> {%d}' % (email_id, section.encode(), len(data)), data), b')']
+
+    def store(self, email_id, command, flags):
+        self.seen.append(email_id)
+
+    def close(self):
+        pass
+
+    def logout(self):
+        pass
+
+
+def test_fingerprint_picks_the_first_inline_text_part():
+    headers = "From: Owner <owner@x.com>\r\nSubject: =?utf-8?q?Fwd=3A_Daily_Summary?=\r\nContent-Type: multipart/mixed; boundary=b1\r\n\r\n"
+    fingerprint = imap_triage.fingerprint(imap_triage.parse_fetch(triage_response(7, headers, FORWARD_STRUCTURE % 120, 4001234)))
+    assert fingerprint == {
+        'sender': "Owner <owner@x.com>",
+        'subject': "Fwd: Daily Summary",
+        'content_type': "multipart/mixed",
+        'size': 4001234,
+        'part': {'section': '1.1', 'subtype': 'plain', 'charset': 'utf-8', 'encoding': 'base64', 'size': 120},
+    }
+    assert imap_triage.skip_reason(fingerprint) is None
+
+    html_only = b'("text" "html" NIL NIL NIL "quoted-printable" 50 2 NIL NIL NIL NIL)'
+    assert imap_triage.text_part(imap_triage.parse_fetch(triage_response(1, headers, html_only, 60))['BODYSTRUCTURE'])['section'] == '1'
+
+
+def test_capped_base64_part_decodes():
+    part = {'encoding': 'base64', 'charset': 'utf-8'}
+    data = base64.encodebytes(REPORT.encode())
+    assert imap_triage.decode_part(data, part) == REPORT.strip()
+    assert REPORT.startswith(imap_triage.decode_part(data[:45], part))
+
+
+@pytest.mark.django_db
+@override_settings(IMAP_HOST='imap.example.com', IMAP_USER='ingest', IMAP_PASSWORD='x', IMAP_BODY_MAX_BYTES=10000)
+def test_only_mail_that_needs_a_body_is_downloaded(monkeypatch):
+    User.objects.create_user(username="owner", email="owner@x.com", password="x")
+    report = base64.encodebytes(REPORT.encode())
+    pdf = b'("application" "pdf" ("name" "scan.pdf") NIL NIL "base64" 900000 NIL NIL NIL NIL)'
+    bounce = b'(("text" "plain" NIL NIL NIL "7bit" 200 5 NIL NIL NIL NIL) "report" NIL NIL NIL NIL)'
+    fake = FakeIMAP([
+        ("From: Mail Delivery Subsystem <MAILER-DAEMON@x.com>\r\nSubject: Undelivered\r\n\r\n", bounce, 1000, {}),
+        ("From: owner@x.com\r\nSubject: Scan\r\nContent-Type: application/pdf\r\n\r\n", pdf, 900000, {}),
+        ("From: owner@x.com\r\nSubject: Automatic reply: Kas\r\n\r\n", b'("text" "plain" NIL NIL NIL "7bit" 10 1 NIL NIL NIL NIL)', 500, {'1': b'Out of office'}),
+        ("From: owner@x.com\r\nSubject: Fwd: Daily Summary\r\nContent-Type: multipart/mixed\r\n\r\n", FORWARD_STRUCTURE % len(report), 4000000, {'1.1': report}),
+        # Past IMAP_BODY_MAX_BYTES: a cut report would ingest part of its items
+        ("From: owner@x.com\r\nSubject: Fwd: Daily Summary\r\n\r\n", b'("text" "plain" NIL NIL NIL "7bit" 20000 400 NIL NIL NIL NIL)', 20500, {}),
+    ])
+
+    def connect(service):
+        service.mail = fake
+        return True
+
+    monkeypatch.setattr(EmailIngestionService, 'connect', connect)
+    result = EmailIngestionService().fetch_and_process()
+
+    assert result == "Successfully processed 1 emails. Failed: 0. Skipped: 4."
+    assert [items for _, items in fake.fetches if items != imap_triage.TRIAGE_ITEMS] == ["(BODY.PEEK[1.1]<0.10000>)"]
+    assert sorted(fake.seen) == [b'1', b'2', b'3', b'4', b'5']
+    log = IngestionLog.objects.get()
+    assert log.raw_payload['email_type'] == "HITACHI"
+    assert log.raw_payload['body'] == REPORT.strip()
+    assert Transaction.objects.get().amount == 60000
+
+
+@pytest.mark.django_db
+@override_settings(IMAP_HOST='imap.example.com', IMAP_USER='ingest', IMAP_PASSWORD='x')
+def test_html_only_mail_without_a_report_is_skipped(monkeypatch):
+    User.objects.create_user(username="owner", email="owner@x.com", password="x")
+    newsletter = b'<html><style>body{margin:0;font-size:14px}</style><p>Promo minggu ini!</p></html>'
+    report = (b'<html><p>Daily Sales Summary for 2025-11-05</p><p>Laundry Bosku Cabang A</p>'
+              b'<p>Gross Sales Rp 100.000</p><p>Top Items</p><p>Cuci Kering Rp 60.000 3</p><p>Best Regards</p></html>')
+    html = b'("text" "html" ("charset" "utf-8") NIL NIL "7bit" %d 1 NIL NIL NIL NIL)'
+    fake = FakeIMAP([
+        ("From: owner@x.com\r\nSubject: Newsletter\r\nContent-Type: text/html\r\n\r\n",
+         html % len(newsletter), len(newsletter), {'1': newsletter}),
+        ("From: owner@x.com\r\nSubject: Fwd: Daily Summary\r\nContent-Type: text/html\r\n\r\n",
+         html % len(report), len(report), {'1': report}),
+    ])
+
+    def connect(service):
+        service.mail = fake
+        return True
+
+    monkeypatch.setattr(EmailIngestionService, 'connect', connect)
+    assert EmailIngestionService().fetch_and_process() == "Successfully processed 1 emails. Failed: 0. Skipped: 1."
+    assert IngestionLog.objects.get().raw_payload['email_type'] == "HITACHI"
+    assert not Category.objects.filter(transaction_type=TransactionType.EXPENSE).exists()
+    assert not Transaction.objects.filter(transaction_type=TransactionType.EXPENSE).exists()
+
+
+@pytest.mark.django_db
+@override_settings(IMAP_HOST='imap.example.com', IMAP_USER='ingest', IMAP_PASSWORD='x')
+def test_html_luna_report_is_parsed_as_html(monkeypatch):
+    User.objects.create_user(username="luna", email="report@lunapos.id", password="x")
+    branch = Branch.objects.create(name="Bosku Cabang 01", branch_type="LAUNDRY")
+    report = luna_report_html(branch.name, date(2025, 11, 5), [("Cuci Kering", 3, 60000), ("Setrika", 1, 20000)]).encode()
+    empty = b'<html><p>Luna POS Daily Summary Report</p></html>'
+    html = b'("text" "html" ("charset" "utf-8") NIL NIL "7bit" %d 1 NIL NIL NIL NIL)'
+    subject = "From: report@lunapos.id\r\nSubject: Fwd: Daily Summary Report\r\nContent-Type: text/html\r\n\r\n"
+    fake = FakeIMAP([
+        (subject, html % len(report), len(report), {'1': report}),
+        (subject, html % len(empty), len(empty), {'1': empty}),
+    ])
+
+    def connect(service):
+        service.mail = fake
+        return True
+
+    monkeypatch.setattr(EmailIngestionService, 'connect', connect)
+    assert EmailIngestionService().fetch_and_process() == "Successfully processed 1 emails. Failed: 1. Skipped: 0."
+    assert sorted(Transaction.objects.values_list('branch__name', 'date', 'amount')) == [
+        ("Bosku Cabang 01", date(2025, 11, 5), 20000),
+        ("Bosku Cabang 01", date(2025, 11, 5), 60000),
+    ]
+    # A report without a summary or items is a failure, not an empty success under a subject-named branch
+    assert list(Branch.objects.values_list('name', flat=True)) == ["Bosku Cabang 01"]
+    assert IngestionLog.objects.filter(status=IngestionStatus.FAILED).count() == 1
@@ -0,0 +1,56 @@
+import pytest
+from django.test import Client, override_settings
+
+prometheus_client = pytest.importorskip('prometheus_client')
+
+from app.ingestion.luna_parser import parse_luna_email
+from app.models import IngestionLog, IngestionStatus, TransactionSource
+
+
+def sample(name, **labels):
+    return prometheus_client.REGISTRY.get_sample_value(name, labels) or 0
+
+
+@pytest.mark.django_db
+def test_request_latency_and_queries_by_route():
+    before = sample('http_request_duration_seconds_count', route='health/', method='GET', status='200')
+    Client().get('/health/')
+    assert sample('http_request_duration_seconds_count', route='health/', method='GET', status='200') == before + 1
+    assert sample('http_request_db_queries_count', route='health/') >= 1
+
+
+def test_parser_duration():
+    before = sample('parse_duration_seconds_count', parser='luna')
+    parse_luna_email('Pax\nPax 3\n')
+    assert sample('parse_duration_seconds_count', parser='luna') == before + 1
+
+
+@pytest.mark.django_db
+def test_ingestion_outcomes_counted():
+    labels = {'source': TransactionSource.EMAIL, 'status': IngestionStatus.FAILED}
+    before = sample('ingestion_logs_total', **labels)
+    log = IngestionLog.objects.create(source=TransactionSource.EMAIL, raw_payload={})
+    log.status = IngestionStatus.FAILED
+    log.save()
+    assert sample('ingestion_logs_total', **labels) == before + 1
+
+
+@pytest.mark.django_db
+@override_settings(DEBUG=True)
+def test_metrics_endpoint_formats_and_token():
+    client = Client()
+    response = client.get('/metrics', HTTP_ACCEPT='application/openmetrics-text; version=1.0.0')
+    assert response.status_code == 200
+    assert response['Content-Type'].startswith('application/openmetrics-text')
+    assert response.content.rstrip().endswith(b'# EOF')
+    assert b'http_request_duration_seconds' in client.get('/metrics').content
+
+    with override_settings(METRICS_TOKEN='scrape'):
+        assert client.get('/metrics').status_code == 401
+        assert client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape').status_code == 200
+
+
+@pytest.mark.django_db
+@override_settings(DEBUG=False, METRICS_TOKEN='')
+def test_metrics_endpoint_closed_without_a_token():
+    assert Client().get('/metrics').status_code == 404
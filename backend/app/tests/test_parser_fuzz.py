@@ -0,0 +1,61 @@
+import random
+import time
+
+from app.benchmarks import parsers
+from app.ingestion.hitachi_parser import parse_hitachi_email
+from app.ingestion.luna_parser import parse_luna_email, parse_top_list
+
+
+def test_generated_corpus_parses_back():
+    rng = random.Random(1)
+    luna = parse_luna_email(parsers.luna_text_email(rng, 30))
+    assert len(luna["top_products"]) == 30
+    assert luna["summary"]["total_sales"] == sum(p["amount"] for p in luna["top_products"])
+    assert luna["summary"]["pax_count"] == 60
+
+    hitachi = parse_hitachi_email(parsers.hitachi_email(rng, 12, html=True))
+    assert len(hitachi["top_items"]) == 12
+    assert hitachi["summary"]["gross_sales"] == sum(i["amount"] for i in hitachi["top_items"])
+
+
+def test_luna_pax_line_without_number():
+    data = parse_luna_email("Pax\nPax n/a\nNumber of Invoices")
+    assert data["summary"]["pax_count"] == 0
+
+
+def test_long_whitespace_runs_parse_in_linear_time():
+    line = "Soap" + " " * 20_000 + "x 2 Rp. 1.000"
+    started = time.perf_counter()
+    assert parse_top_list([line])[0]["count"] == 2
+    parse_hitachi_email("Top Items\nSoap" + " " * 20_000 + "x Rp 1.000 2")
+    assert time.perf_counter() - started < 0.5
+
+
+def test_fuzz_smoke():
+    corpus = parsers.build_corpus(size=10, max_products=40)
+    failures = parsers.fuzz(corpus, iterations=60, time_budget_ms=2_000)
+    assert failures == [], failures[:3]
+
+
+def test_compiled_labels_keep_table_order():
+    from app.ingestion.luna_parser import parse_labeled_currency
+    assert parse_labeled_currency("TOTAL Sales Rp. 2.000", {"total": "a", "total sales": "b"}) == ("a", 2000)
+    assert parse_labeled_currency("Total Sales Rp. 2.000", {"total sales": "b", "total": "a"}) == ("b", 2000)
+    assert parse_labeled_currency("Totals (x+y) Rp. 1", {"totals (x": "c"}) == ("c", 1)
+
+    rng = random.Random(2)
+    corpus = [parsers.luna_text_email(rng, 5) for _ in range(5)]
+    rates = parsers.measure_labels(corpus, repeat=1)
+    assert rates['scan'] > 0 and rates['compiled'] > 0
+
+
+def test_hitachi_text_and_html_bodies_agree():
+    text = (
+        "Daily Sales Summary for 2025-11-05\nLaundry Bosku Cabang A\n"
+        "Gross Sales Rp 100.000\nTop Items\nCuci Kering Rp 60.000 3\nBest Regards"
+    )
+    html = "".join(f"<p>{line}</p>" for line in text.split("\n"))
+    parsed = parse_hitachi_email(text)
+    assert parsed == parse_hitachi_email(html)
+    assert parsed["metadata"] == {"date": "2025-11-05", "location": "Laundry Bosku Cabang A"}
+    assert parsed["top_items"] == [{"name": "Cuci Kering", "amount": 60000, "count": 3}]
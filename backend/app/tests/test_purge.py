@@ -0,0 +1,100 @@
+import pytest
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from app import search
+from app.models import (
+    Branch, Category, DailySummary, IngestionLog, IngestionStatus, Transaction,
+    TransactionSource, TransactionType,
+)
+from app.purge import purge_logs
+
+
+@pytest.fixture
+def ingested():
+    branch = Branch.objects.create(name="Purge", branch_type="LAUNDRY")
+    category = Category.objects.create(name="Cuci", transaction_type=TransactionType.INCOME)
+    logs = []
+    for i in range(7):
+        transaction = Transaction.objects.create(
+            branch=branch, amount=1000 + i, transaction_type=TransactionType.INCOME,
+            category=category, date="2026-03-02", description=f"Cuci kering {i}",
+            source=TransactionSource.EMAIL,
+        )
+        logs.append(IngestionLog.objects.create(
+            source=TransactionSource.EMAIL, raw_payload={}, created_transaction=transaction,
+            status=IngestionStatus.FAILED if i % 2 else IngestionStatus.SUCCESS,
+        ))
+    summary = DailySummary.objects.create(
+        branch=branch, date="2026-03-02", source=TransactionSource.EMAIL, ingestion_log=logs[0],
+    )
+    return {'logs': logs, 'summary': summary}
+
+
+@pytest.mark.django_db
+def test_purge_with_transactions_unlinks_and_cleans_up(ingested):
+    logs = ingested['logs']
+    # A log outside the purge pointing at a purged transaction is kept, unlinked
+    survivor = IngestionLog.objects.create(
+        source=TransactionSource.EMAIL, raw_payload={}, created_transaction=logs[0].created_transaction,
+    )
+    purged = IngestionLog.objects.exclude(pk=survivor.pk)
+
+    result = purge_logs(purged, with_transactions=True, batch_size=3)
+
+    assert result == {
+        'logs': 7, 'transactions': 7, 'logs_unlinked': 1, 'summaries_unlinked': 1, 'batches': 3,
+    }
+    assert not Transaction.objects.exists()
+    assert list(IngestionLog.objects.values_list('pk', 'created_transaction')) == [(survivor.pk, None)]
+    ingested['summary'].refresh_from_db()
+    assert ingested['summary'].ingestion_log is None
+    assert not search.search_transactions(Transaction.objects.all(), "kering").exists()
+
+
+@pytest.mark.django_db
+def test_purge_is_a_few_statements_per_batch(ingested):
+    with CaptureQueriesContext(connection) as ctx:
+        purge_logs(IngestionLog.objects.all(), batch_size=100)
+    # one batch: fetch ids, unlink summaries, delete, and the empty next page
+    assert len([q for q in ctx.captured_queries if not q['sql'].startswith(('SAVEPOINT', 'RELEASE'))]) == 4
+    assert Transaction.objects.count() == 7
+
+
+@pytest.mark.django_db
+def test_admin_actions_use_purge(ingested, settings, rf, django_capture_on_commit_callbacks):
+    from django.contrib.admin.sites import AdminSite
+    from app.admin import IngestionLogAdmin
+
+    messages = []
+    admin = IngestionLogAdmin(IngestionLog, AdminSite())
+    admin.message_user = lambda request, message, *a, **k: messages.append(message)
+
+    admin.delete_failed_logs(rf.get('/'), IngestionLog.objects.all())
+    assert messages[-1] == "Deleted 3 failed log(s)."
+    assert Transaction.objects.count() == 7
+
+    settings.PURGE_SYNC_LIMIT = 1
+    settings.BACKGROUND_TASKS_SYNC = True
+    with django_capture_on_commit_callbacks(execute=True):
+        admin.delete_with_transactions(rf.get('/'), IngestionLog.objects.all())
+    assert messages[-1] == "Deleting 4 log(s) in the background."
+    assert not IngestionLog.objects.exists()
+    assert Transaction.objects.count() == 3
+
+
+@pytest.mark.django_db
+def test_command_filters_and_dry_run(ingested, capsys):
+    with pytest.raises(CommandError):
+        call_command('purge_ingestion_logs', skip_checks=True)
+
+    call_command('purge_ingestion_logs', status='FAILED', dry_run=True, skip_checks=True)
+    assert "Would delete 3 log(s), 3 with a linked transaction" in capsys.readouterr().out
+    assert IngestionLog.objects.count() == 7
+
+    call_command('purge_ingestion_logs', status='FAILED', with_transactions=True, skip_checks=True)
+    assert "Deleted 3 log(s) and 3 transaction(s)" in capsys.readouterr().out
+    assert IngestionLog.objects.count() == 4
+    assert Transaction.objects.count() == 4
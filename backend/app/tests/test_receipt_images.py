@@ -0,0 +1,111 @@
+import io
+
+import pytest
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from PIL import Image
+
+from app.models import Branch, Category, Transaction, TransactionType, TransactionSource
+from app.receipt_images import process_receipt, needs_processing, variant_urls
+
+
+def make_jpeg(color="red", size=(2400, 1800), exif=True):
+    image = Image.new("RGB", size, color)
+    buffer = io.BytesIO()
+    extra = {}
+    if exif:
+        data = Image.Exif()
+        data[0x010F] = "PhoneMaker"  # Make
+        extra["exif"] = data.tobytes()
+    image.save(buffer, "JPEG", quality=95, **extra)
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def media_root(settings, tmp_path):
+    settings.MEDIA_ROOT = str(tmp_path)
+    settings.BACKGROUND_TASKS_SYNC = True
+    return tmp_path
+
+
+@pytest.fixture
+def make_transaction(db):
+    branch = Branch.objects.create(name="Test Branch", branch_type="LAUNDRY")
+    category = Category.objects.create(name="Soap", transaction_type=TransactionType.EXPENSE)
+
+    def _make(content, amount=1000):
+        return Transaction.objects.create(
+            branch=branch, amount=amount, transaction_type=TransactionType.EXPENSE,
+            category=category, date="2025-01-01", source=TransactionSource.MANUAL,
+            evidence_image=SimpleUploadedFile("receipt.jpg", content, content_type="image/jpeg"),
+        )
+    return _make
+
+
+@pytest.mark.django_db
+def test_process_receipt_builds_thumbnails_and_strips_exif(media_root, make_transaction):
+    trx = make_transaction(make_jpeg())
+    assert needs_processing(trx)
+
+    variants = process_receipt(trx.pk)
+    trx.refresh_from_db()
+
+    assert not needs_processing(trx)
+    assert set(variants["320"]) == {"webp", "jpg"}
+    assert len(trx.evidence_hash) == 64
+
+    with default_storage.open(trx.evidence_image.name) as fh, Image.open(fh) as img:
+        assert max(img.size) <= 2048
+        assert not img.getexif()
+
+    with default_storage.open(variants["320"]["webp"]) as fh, Image.open(fh) as img:
+        assert img.format == "WEBP"
+        assert max(img.size) == 320
+
+    urls = variant_urls(trx)
+    assert urls["960"]["jpg"].startswith("/media/")
+
+
+@pytest.mark.django_db
+def test_process_receipt_deduplicates_identical_uploads(media_root, make_transaction):
+    content = make_jpeg(color="blue")
+    first = make_transaction(content, amount=1000)
+    process_receipt(first.pk)
+    first.refresh_from_db()
+
+    second = make_transaction(content, amount=2000)
+    process_receipt(second.pk)
+    second.refresh_from_db()
+
+    assert second.evidence_hash == first.evidence_hash
+    assert second.evidence_image.name == first.evidence_image.name
+    assert second.evidence_variants == first.evidence_variants
+
+
+@pytest.mark.django_db
+def test_process_receipt_skips_processed_and_unreadable(media_root, make_transaction):
+    trx = make_transaction(b"not an image at all")
+    assert process_receipt(trx.pk) is None
+    trx.refresh_from_db()
+    assert "error" in trx.evidence_variants
+    assert not needs_processing(trx)
+    assert process_receipt(trx.pk) is None
+
+
+@pytest.mark.django_db
+def test_small_jpeg_is_still_stripped_and_rotated(media_root, make_transaction):
+    # Already smaller than any re-encode: the original must not be kept
+    image = Image.effect_noise((200, 100), 100).convert("RGB")
+    exif = Image.Exif()
+    exif[0x0112] = 6  # Orientation: rotate 90 CW
+    exif.get_ifd(0x8825)[2] = (6.0, 54.0, 0.0)  # GPSLatitude
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=5, exif=exif.tobytes())
+    trx = make_transaction(buffer.getvalue())
+
+    process_receipt(trx.pk)
+    trx.refresh_from_db()
+
+    with default_storage.open(trx.evidence_image.name) as fh, Image.open(fh) as img:
+        assert not img.getexif()
+        assert img.size == (100, 200)
@@ -0,0 +1,136 @@
+from datetime import date, timedelta
+from decimal import Decimal
+
+import pytest
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from app.models import (
+    Branch, Category, DailySummary, IngestionLog, ReconciliationDeletion, ReconciliationIssue,
+    ReconciliationIssueKind, ReconciliationRun, Transaction, TransactionSource, TransactionType,
+)
+from app.purge import purge_logs
+from app.reconciliation import reconcile
+
+DAY = date(2026, 3, 2)
+
+
+@pytest.fixture
+def branch():
+    return Branch.objects.create(name="Rekon", branch_type="LAUNDRY")
+
+
+def add_items(branch, day, *amounts, **extra):
+    for i, amount in enumerate(amounts):
+        category, _ = Category.objects.get_or_create(name=f"Item {i}", transaction_type=TransactionType.INCOME)
+        Transaction.objects.create(
+            branch=branch, category=category, date=day, amount=amount,
+            transaction_type=TransactionType.INCOME, source=TransactionSource.EMAIL, **extra,
+        )
+
+
+def add_summary(branch, day, net_sales, **extra):
+    return DailySummary.objects.create(
+        branch=branch, date=day, source=TransactionSource.EMAIL,
+        net_sales=net_sales, total_collected=net_sales, **extra,
+    )
+
+
+def issues():
+    return {(issue.date, issue.kind): issue for issue in ReconciliationIssue.objects.all()}
+
+
+@pytest.mark.django_db
+def test_full_pass_flags_each_kind(branch):
+    # Balanced day
+    add_summary(branch, DAY, 30000)
+    add_items(branch, DAY, 10000, 20000)
+    # Net sales off (voided transactions do not count), payments short
+    add_summary(branch, DAY + timedelta(days=1), 50000, cash_amount=20000, qris_amount=20000)
+    add_items(branch, DAY + timedelta(days=1), 10000, 20000)
+    add_items(branch, DAY + timedelta(days=1), 5000, is_valid=False, source_identifier="void")
+    # Transactions without a summary
+    add_items(branch, DAY + timedelta(days=2), 7000)
+
+    run = reconcile(full=True)
+
+    found = issues()
+    assert set(found) == {
+        (DAY + timedelta(days=1), ReconciliationIssueKind.SALES_MISMATCH),
+        (DAY + timedelta(days=1), ReconciliationIssueKind.PAYMENT_MISMATCH),
+        (DAY + timedelta(days=2), ReconciliationIssueKind.MISSING_SUMMARY),
+    }
+    sales = found[(DAY + timedelta(days=1), ReconciliationIssueKind.SALES_MISMATCH)]
+    assert (sales.expected, sales.actual, sales.difference) == (Decimal(50000), Decimal(30000), Decimal(-20000))
+    assert sales.transaction_count == 2
+    assert found[(DAY + timedelta(days=1), ReconciliationIssueKind.PAYMENT_MISMATCH)].difference == Decimal(-10000)
+    assert found[(DAY + timedelta(days=2), ReconciliationIssueKind.MISSING_SUMMARY)].actual == Decimal(7000)
+    assert (run.full, run.days_checked, run.issues_found) == (True, 3, 3)
+
+
+@pytest.mark.django_db
+def test_query_count_does_not_grow_with_days(branch):
+    for offset in range(20):
+        add_summary(branch, DAY + timedelta(days=offset), 1000)
+        add_items(branch, DAY + timedelta(days=offset), 999 if offset % 2 else 1000)
+    with CaptureQueriesContext(connection) as ctx:
+        reconcile(full=True)
+    selects = [q for q in ctx.captured_queries if q['sql'].startswith('SELECT')]
+    assert len(selects) == 2
+    assert ReconciliationIssue.objects.count() == 0  # within the 1 rupiah tolerance
+
+
+@pytest.mark.django_db
+def test_incremental_run_only_rechecks_touched_days(branch, settings):
+    settings.RECONCILIATION_TOLERANCE = 0
+    add_summary(branch, DAY, 1000)
+    add_items(branch, DAY, 900)
+    other_day = add_summary(branch, DAY + timedelta(days=5), 2000)
+    reconcile()
+    assert len(issues()) == 2
+
+    # Nothing touched: nothing checked, issues kept
+    run = reconcile()
+    assert (run.full, run.days_checked) == (False, 0)
+    assert len(issues()) == 2
+
+    # Fixing one day clears only its issue
+    add_items(branch, DAY, 100)
+    run = reconcile()
+    assert run.days_checked == 1
+    assert set(issues()) == {(other_day.date, ReconciliationIssueKind.SALES_MISMATCH)}
+    assert ReconciliationRun.objects.count() == 3
+
+
+@pytest.mark.django_db
+def test_incremental_run_rechecks_deleted_rows(branch, settings):
+    settings.RECONCILIATION_TOLERANCE = 0
+    summary = add_summary(branch, DAY, 1000)
+    add_items(branch, DAY, 1000)
+    add_summary(branch, DAY + timedelta(days=1), 500)
+    add_items(branch, DAY + timedelta(days=1), 500)
+    for item in Transaction.objects.filter(date=DAY + timedelta(days=1)):
+        IngestionLog.objects.create(source=TransactionSource.EMAIL, raw_payload={}, created_transaction=item)
+    reconcile()
+    assert not issues()
+
+    # Admin delete (signals) and purge (raw DELETE)
+    summary.delete()
+    purge_logs(IngestionLog.objects.all(), with_transactions=True)
+    run = reconcile()
+    assert run.days_checked == 2
+    assert set(issues()) == {
+        (DAY, ReconciliationIssueKind.MISSING_SUMMARY),
+        (DAY + timedelta(days=1), ReconciliationIssueKind.SALES_MISMATCH),
+    }
+    assert not ReconciliationDeletion.objects.exists()
+
+
+@pytest.mark.django_db
+def test_command(branch, capsys):
+    add_summary(branch, DAY, 1000)
+    call_command('reconcile', full=True)
+    output = capsys.readouterr().out
+    assert "Checked 1 day(s)" in output
+    assert "found 1 issue(s)" in output
@@ -0,0 +1,88 @@
+import pytest
+from rest_framework.test import APIClient
+
+from app import search
+from app.models import Branch, Category, Transaction, User, TransactionType, TransactionSource
+
+
+@pytest.fixture
+def transactions(db):
+    branch = Branch.objects.create(name="Dago", branch_type="LAUNDRY")
+    cuci = Category.objects.create(name="Cuci Kering", transaction_type=TransactionType.INCOME)
+    sabun = Category.objects.create(name="Sabun Cair", transaction_type=TransactionType.EXPENSE)
+
+    def make(category, description, amount):
+        return Transaction.objects.create(
+            branch=branch, category=category, amount=amount, date="2025-01-01",
+            transaction_type=category.transaction_type, description=description,
+            source=TransactionSource.MANUAL,
+        )
+
+    return {
+        "setrika": make(cuci, "Cuci setrika 5 kg", 30000),
+        "kering": make(cuci, "Cuci kering express", 20000),
+        "sabun": make(sabun, "Beli sabun cair 2 liter", 45000),
+    }
+
+
+@pytest.mark.django_db
+def test_search_matches_description_and_category(transactions):
+    qs = Transaction.objects.all()
+    assert set(search.search_transactions(qs, "setrika")) == {transactions["setrika"]}
+    # Category name is part of the document
+    assert set(search.search_transactions(qs, "kering")) == {transactions["setrika"], transactions["kering"]}
+    # Prefix match
+    assert set(search.search_transactions(qs, "sab")) == {transactions["sabun"]}
+
+
+@pytest.mark.django_db
+def test_search_index_follows_updates_and_deletes(transactions):
+    trx = transactions["sabun"]
+    trx.description = "Pewangi lavender"
+    trx.save()
+    qs = Transaction.objects.all()
+    assert list(search.search_transactions(qs, "lavender")) == [trx]
+
+    trx.delete()
+    assert list(search.search_transactions(qs, "lavender")) == []
+
+
+@pytest.mark.django_db
+def test_category_rename_reindexes_transactions(transactions):
+    category = transactions["sabun"].category
+    category.name = "Deterjen"
+    category.save()
+    assert list(search.search_transactions(Transaction.objects.all(), "deterjen")) == [transactions["sabun"]]
+
+
+@pytest.mark.django_db
+def test_ranked_q_param(transactions):
+    owner = User.objects.create_superuser(username="owner", email="owner@example.com", password="pass")
+    client = APIClient()
+    client.force_authenticate(user=owner)
+
+    response = client.get("/api/transactions/", {"q": "cuci kering"})
+    assert response.status_code == 200
+    ids = [row["id"] for row in response.data["results"]]
+    # Matches both terms in description and category, so it ranks first
+    assert ids[0] == transactions["kering"].id
+    assert transactions["sabun"].id not in ids
+
+
+@pytest.mark.django_db
+def test_result_cap_applies_within_the_scoped_queryset(transactions, settings):
+    settings.SEARCH_MAX_RESULTS = 5
+    other = Branch.objects.create(name="Buah Batu", branch_type="LAUNDRY")
+    category = transactions["setrika"].category
+    # Better-ranked matches in another branch
+    for i in range(10):
+        Transaction.objects.create(
+            branch=other, category=category, amount=1000 + i, date="2025-01-01",
+            transaction_type=category.transaction_type, description="setrika setrika setrika",
+            source=TransactionSource.MANUAL,
+        )
+    scoped = Transaction.objects.filter(branch=transactions["setrika"].branch)
+    assert list(search.search_transactions(scoped, "setrika")) == [transactions["setrika"]]
+    assert search.search_transactions(Transaction.objects.all(), "setrika").count() == 5
+    assert list(search.search_transactions(Transaction.objects.none(), "setrika")) == []
+    assert search._tsquery('cuci "kilo" -x') == 'cuci:* & kilo:* & x:*'
@@ -0,0 +1,76 @@
+import time
+
+from django.core.cache import cache
+from django.test import override_settings
+from rest_framework.test import APIRequestFactory, APITestCase
+
+from app.throttling import EndpointThrottle
+
+RATES = {
+    'anon': '100/hour',
+    'user': '1000/hour',
+    'webhook': '3/minute',
+    'bot': '600/hour',
+}
+
+
+class FakeView:
+    throttle_scope = 'webhook'
+
+
+class ClockedThrottle(EndpointThrottle):
+    now = 0.0
+
+    def timer(self):
+        return self.now
+
+
+@override_settings(
+    REST_FRAMEWORK={'DEFAULT_THROTTLE_RATES': RATES},
+    THROTTLE_BURSTS={'webhook': 2},
+    INGESTION_API_KEY='secret-key',
+)
+class EndpointThrottleTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.factory = APIRequestFactory()
+
+    def allow(self, throttle, **headers):
+        return throttle.allow_request(self.factory.post('/webhooks/make/', **headers), FakeView())
+
+    def test_sliding_window_carries_previous_window(self):
+        throttle = ClockedThrottle()
+        throttle.now = 120.0
+        self.assertTrue(all(self.allow(throttle) for _ in range(3)))
+        self.assertFalse(self.allow(throttle))
+        self.assertEqual(throttle.wait(), 60)
+
+        # A third into the next window the previous one still weighs 2/3 * 3 = 2
+        throttle.now = 200.0
+        self.assertTrue(self.allow(throttle))
+        self.assertFalse(self.allow(throttle))
+        self.assertGreaterEqual(throttle.wait(), 1)
+
+    def test_known_api_key_gets_burst_allowance(self):
+        throttle = ClockedThrottle()
+        allowed = [self.allow(throttle, HTTP_X_API_KEY='secret-key') for _ in range(6)]
+        self.assertEqual(allowed, [True] * 5 + [False])
+        # Budgets are per key: an unknown caller from the same address is counted apart
+        self.assertTrue(self.allow(throttle, HTTP_X_API_KEY='wrong'))
+
+    def test_webhook_returns_retry_after(self):
+        for _ in range(3):
+            self.client.post('/webhooks/make/', {}, format='json')
+        response = self.client.post('/webhooks/make/', {}, format='json')
+        self.assertEqual(response.status_code, 429)
+        self.assertTrue(0 < int(response['Retry-After']) <= 60)
+
+    def test_overhead_under_a_millisecond(self):
+        throttle = EndpointThrottle()
+        request = self.factory.post('/webhooks/make/', HTTP_X_API_KEY='secret-key')
+        with override_settings(REST_FRAMEWORK={'DEFAULT_THROTTLE_RATES': {'webhook': '1000000/hour'}}):
+            started = time.perf_counter()
+            for _ in range(500):
+                throttle.allow_request(request, FakeView())
+            elapsed = (time.perf_counter() - started) / 500
+        self.assertLess(elapsed, 0.001)
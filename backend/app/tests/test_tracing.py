@@ -0,0 +1,96 @@
+import pytest
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from app import tracing
+from app.models import Branch, IngestionLog, IngestionStatus
+
+HITACHI_BODY = """Daily Sales Summary for 2025-11-05
+Laundry Bosku Cabang A
+Gross Sales Rp 100.000
+"""
+
+
+def test_span_outside_trace_is_a_noop():
+    with tracing.span('parse') as span:
+        assert span is None
+    assert tracing.timings() is None
+
+
+@pytest.mark.django_db
+def test_spans_nest_and_count_queries():
+    with tracing.trace('ingest') as trace:
+        with tracing.span('resolve_branch'):
+            Branch.objects.count()
+            with tracing.span('create'):
+                Branch.objects.create(name='Traced')
+        with tracing.span('parse'):
+            pass
+        # A nested trace is a span of the outer one
+        with tracing.trace('inner'):
+            Branch.objects.exists()
+        timings = tracing.timings()
+
+    assert tracing.current() is None
+    assert trace.end is not None
+    names = [(span['name'], span['depth']) for span in timings['spans']]
+    assert names == [('resolve_branch', 0), ('create', 1), ('parse', 0), ('inner', 0)]
+    resolve, create, parse, inner = timings['spans']
+    assert create['queries'] >= 1
+    assert resolve['queries'] == create['queries'] + 1
+    assert parse['queries'] == 0
+    assert inner['queries'] == 1
+    assert timings['queries'] == resolve['queries'] + inner['queries']
+    assert timings['total_ms'] >= resolve['ms'] >= create['ms']
+
+
+def test_span_limit():
+    with tracing.trace('loop'):
+        for _ in range(tracing.MAX_SPANS + 3):
+            with tracing.span('item'):
+                pass
+        timings = tracing.timings()
+    assert len(timings['spans']) == tracing.MAX_SPANS
+    assert timings['dropped_spans'] == 3
+
+
+@pytest.mark.django_db
+@override_settings(INGESTION_API_KEY='testkey')
+def test_email_webhook_stores_timings():
+    response = Client().post(
+        reverse('email-webhook'),
+        {'sender': 'pos@example.com', 'subject': 'Fwd: Daily Summary', 'text_body': HITACHI_BODY},
+        content_type='application/json',
+        HTTP_X_API_KEY='testkey',
+    )
+    assert response.status_code == 200
+
+    log = IngestionLog.objects.get()
+    assert log.status == IngestionStatus.SUCCESS
+    stages = [span['name'] for span in log.timings['spans']]
+    assert stages[:3] == ['parse', 'resolve_branch', 'resolve_user']
+    assert 'daily_summary' in stages
+    assert log.timings['queries'] > 0
+
+
+def test_export_to_opentelemetry(monkeypatch):
+    sdk_trace = pytest.importorskip('opentelemetry.sdk.trace')
+    from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+    from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+
+    exporter = InMemorySpanExporter()
+    provider = sdk_trace.TracerProvider()
+    provider.add_span_processor(SimpleSpanProcessor(exporter))
+    monkeypatch.setitem(tracing._otel, 'tracer', provider.get_tracer('test'))
+
+    with tracing.trace('ingest'):
+        with tracing.span('parse'):
+            with tracing.span('luna'):
+                pass
+
+    spans = {span.name: span for span in exporter.get_finished_spans()}
+    assert set(spans) == {'ingest', 'parse', 'luna'}
+    assert spans['luna'].parent.span_id == spans['parse'].context.span_id
+    assert spans['parse'].parent.span_id == spans['ingest'].context.span_id
+    assert spans['ingest'].start_time <= spans['parse'].start_time <= spans['luna'].start_time
+    assert spans['luna'].end_time <= spans['ingest'].end_time
@@ -0,0 +1,84 @@
+import hashlib
+import io
+import tempfile
+from unittest.mock import patch
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import override_settings
+from PIL import Image
+from rest_framework.test import APITestCase
+
+from app.models import Branch, Category, Transaction, User, TransactionType, TransactionSource, BranchType
+from app.uploads import sniff_image_type
+
+
+def png_bytes(size=(40, 40)):
+    buffer = io.BytesIO()
+    Image.new("RGB", size, "green").save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def test_sniff_image_type():
+    assert sniff_image_type(png_bytes()[:16]) == "image/png"
+    assert sniff_image_type(b"\xff\xd8\xff\xe0" + b"\x00" * 12) == "image/jpeg"
+    assert sniff_image_type(b"RIFF\x00\x00\x00\x00WEBPVP8 ") == "image/webp"
+    assert sniff_image_type(b"%PDF-1.7\n") is None
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ReceiptUploadTestCase(APITestCase):
+    def setUp(self):
+        self.owner = User.objects.create_superuser(username='owner', email='owner@example.com', password='pass')
+        self.branch = Branch.objects.create(name='Branch 1', branch_type=BranchType.LAUNDRY)
+        self.category = Category.objects.create(name='Soap', transaction_type=TransactionType.EXPENSE)
+        self.client.force_authenticate(user=self.owner)
+        self.url = '/api/transactions/'
+
+    def payload(self, upload):
+        return {
+            'branch': self.branch.id,
+            'category': self.category.id,
+            'date': '2025-01-01',
+            'amount': '1000',
+            'transaction_type': TransactionType.EXPENSE,
+            'source': TransactionSource.MANUAL,
+            'source_identifier': 'owner',
+            'evidence_image': upload,
+        }
+
+    @patch('app.signals.background.submit_on_commit')
+    def test_image_upload_is_hashed_while_streaming(self, mock_submit):
+        content = png_bytes()
+        upload = SimpleUploadedFile('receipt.png', content, content_type='image/png')
+        response = self.client.post(self.url, self.payload(upload), format='multipart')
+        self.assertEqual(response.status_code, 201)
+
+        trx = Transaction.objects.get(pk=response.data['id'])
+        self.assertTrue(trx.evidence_image.name.endswith('.png'))
+        _, kwargs = mock_submit.call_args
+        self.assertEqual(kwargs['upload_hash'], hashlib.sha256(content).hexdigest())
+
+    def test_non_image_rejected(self):
+        upload = SimpleUploadedFile('receipt.png', b'%PDF-1.7\n' + b'x' * 100, content_type='image/png')
+        response = self.client.post(self.url, self.payload(upload), format='multipart')
+        self.assertEqual(response.status_code, 415)
+        self.assertFalse(Transaction.objects.exists())
+
+    @override_settings(RECEIPT_UPLOAD_MAX_BYTES=1024)
+    def test_oversized_upload_rejected(self):
+        upload = SimpleUploadedFile('receipt.png', png_bytes((600, 600)) + b'\x00' * 4096, content_type='image/png')
+        response = self.client.post(self.url, self.payload(upload), format='multipart')
+        self.assertEqual(response.status_code, 413)
+        self.assertFalse(Transaction.objects.exists())
+
+    @override_settings(INGESTION_API_KEY='testkey', RECEIPT_UPLOAD_MAX_BYTES=1024)
+    @patch('app.views.EmailWebhookService.process_payload', return_value="ok")
+    def test_email_webhook_ignores_attachments(self, mock_process):
+        # The receipt checks apply to transaction uploads only, not to forwarded mail
+        attachment = SimpleUploadedFile('report.pdf', b'%PDF-1.7\n' + b'x' * 4096, content_type='application/pdf')
+        response = self.client.post('/webhooks/make/', {
+            'sender': 'pos@example.com', 'subject': 'Fwd: Daily Summary',
+            'text_body': 'Daily Sales Summary', 'attachment': attachment,
+        }, format='multipart', HTTP_X_API_KEY='testkey')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(mock_process.call_args[0][0]['subject'], 'Fwd: Daily Summary')
@@ -6,7 +6,8 @@ from rest_framework.test import APITestCase, APIClient
 from rest_framework import status
 
 from app.models import (
-    Branch, Category, Transaction, User, IngestionLog,
+    Branch, Category, Transaction, User, IngestionLog, DailySummary,
+    UserBranchAssignment, UserPhoneNumber,
     TransactionSource, IngestionStatus, TransactionType, BranchType
 )
 
@@ -107,10 +108,10 @@ class WhatsAppWebhookTestCase(APITestCase):
         self.user = User.objects.create_user(
             username='testuser',
             email='test@example.com',
-            password='testpass',
-            phone_number='+1234567890',
-            assigned_branch=self.branch
+            password='testpass'
         )
+        UserPhoneNumber.objects.create(user=self.user, phone_number='+1234567890')
+        UserBranchAssignment.objects.create(user=self.user, branch=self.branch)
         
         # Updated payload to match WhatsAppWebhookPayloadSerializer
         self.valid_payload = {
@@ -157,12 +158,12 @@ class WhatsAppWebhookTestCase(APITestCase):
     @override_settings(INGESTION_API_KEY='testkey')
     def test_user_without_branch(self):
         """Test that user without assigned branch returns error"""
-        User.objects.create_user(
+        user = User.objects.create_user(
             username='nobranch',
             email='nobranch@example.com',
-            password='testpass',
-            phone_number='+1111111111'
+            password='testpass'
         )
+        UserPhoneNumber.objects.create(user=user, phone_number='+1111111111')
         
         self.client.credentials(HTTP_X_API_KEY=self.api_key)
         payload = {
@@ -323,7 +324,8 @@ class TransactionViewSetTestCase(APITestCase):
     def setUp(self):
         self.owner = User.objects.create_superuser(username='owner', email='owner@example.com', password='pass')
         self.branch = Branch.objects.create(name='Branch 1', branch_type=BranchType.LAUNDRY, address='Addr')
-        self.staff = User.objects.create_user(username='staff', email='staff@example.com', password='pass', assigned_branch=self.branch)
+        self.staff = User.objects.create_user(username='staff', email='staff@example.com', password='pass')
+        UserBranchAssignment.objects.create(user=self.staff, branch=self.branch)
         self.category = Category.objects.create(name='Cat', transaction_type=TransactionType.INCOME)
         self.transaction = Transaction.objects.create(
             branch=self.branch, reported_by=self.staff, amount=100000,
@@ -367,7 +369,8 @@ class UserViewSetTestCase(APITestCase):
     def setUp(self):
         self.owner = User.objects.create_superuser(username='owner', email='owner@example.com', password='pass')
         self.branch = Branch.objects.create(name='Branch', branch_type=BranchType.LAUNDRY, address='Addr')
-        self.staff = User.objects.create_user(username='staff', email='staff@example.com', password='pass', assigned_branch=self.branch)
+        self.staff = User.objects.create_user(username='staff', email='staff@example.com', password='pass')
+        UserBranchAssignment.objects.create(user=self.staff, branch=self.branch)
         self.url = '/api/users/'
 
     def test_list_unauthenticated(self):
@@ -453,3 +456,30 @@ class HealthCheckTestCase(TestCase):
         self.assertIn('status', data)
         self.assertIn('service', data)
         self.assertEqual(len(data.keys()), 2)
+
+
+# ==========================================
+# BOT STAFF LIST TESTS
+# ==========================================
+
+class StaffListTestCase(TestCase):
+    def setUp(self):
+        self.url = reverse('api_staff_list')
+        branch = Branch.objects.create(name="Laundry A", branch_type=BranchType.LAUNDRY)
+        self.staff = User.objects.create_user(username="budi", email="budi@x.com", password="x")
+        UserPhoneNumber.objects.create(user=self.staff, phone_number="+62-812-111")
+        UserPhoneNumber.objects.create(user=self.staff, phone_number="62813222")
+        UserBranchAssignment.objects.create(user=self.staff, branch=branch)
+        head = User.objects.create_user(username="sari", email="sari@x.com", password="x")
+        UserPhoneNumber.objects.create(user=head, phone_number="62899")
+        User.objects.create_user(username="nophone", email="n@x.com", password="x")
+
+    def test_staff_list(self):
+        with self.assertNumQueries(4):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {
+            "62812111@s.whatsapp.net": {"nama": "budi", "cabang": "Laundry A", "unit": "Laundry"},
+            "62813222@s.whatsapp.net": {"nama": "budi", "cabang": "Laundry A", "unit": "Laundry"},
+            "62899@s.whatsapp.net": {"nama": "sari", "cabang": "Pusat", "unit": "Laundry"},
+        })
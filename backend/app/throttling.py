@@ -0,0 +1,150 @@
+"""
+Sliding-window throttling on the shared cache
+
+DRF's SimpleRateThrottle keeps a list of timestamps per client in the
+cache and rewrites it on every request; with the default locmem cache each
+gunicorn worker also counts on its own. Here every client gets two integer
+counters per scope (the current and the previous fixed window) and the
+request count is the sliding-window estimate
+
+    previous * (1 - elapsed / period) + current
+
+Checking costs one get_many and one incr on the cache configured in
+settings.CACHES (Redis when REDIS_URL is set, so limits hold across
+workers).
+
+Rates come from REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'] per scope.
+THROTTLE_BURSTS adds a burst allowance on top of a scope's rate for
+requests that present a valid ingestion API key, so known webhook sources
+(Make.com, the WhatsApp bot) can flush a backlog without being cut off
+while unknown callers stay at the base rate. When a limit is hit DRF
+answers 429 with a Retry-After header taken from wait().
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.crypto import constant_time_compare
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+CACHE_KEY = 'throttle:{scope}:{ident}:{window}'
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """'100/hour' -> (100, 3600), None -> (None, None)"""
+    if rate is None:
+        return None, None
+    num, period = rate.split('/')
+    return int(num), PERIODS[period[0]]
+
+
+def api_key_ident(request):
+    """Hashed identity of a valid ingestion API key, or None"""
+    api_key = request.headers.get('X-Api-Key')
+    expected = getattr(settings, 'INGESTION_API_KEY', '')
+    if api_key and expected and constant_time_compare(api_key, expected):
+        return 'key:' + hashlib.sha256(api_key.encode()).hexdigest()[:16]
+    return None
+
+
+class SlidingWindowThrottle(BaseThrottle):
+    """Base class; subclasses set `scope` and implement get_cache_ident()"""
+
+    scope = None
+    timer = time.time
+
+    def get_cache_ident(self, request, view):
+        """Client identity, or None to skip throttling this request"""
+        raise NotImplementedError
+
+    def get_scope(self, view):
+        return self.scope
+
+    def get_limit(self, scope, request, trusted):
+        num, period = parse_rate(api_settings.DEFAULT_THROTTLE_RATES.get(scope))
+        if num is not None and trusted:
+            num += getattr(settings, 'THROTTLE_BURSTS', {}).get(scope, 0)
+        return num, period
+
+    def allow_request(self, request, view):
+        scope = self.get_scope(view)
+        if scope is None:
+            return True
+        ident = self.get_cache_ident(request, view)
+        if ident is None:
+            return True
+        limit, period = self.get_limit(scope, request, trusted=ident.startswith('key:'))
+        if limit is None:
+            return True
+
+        now = self.timer()
+        window = int(now // period)
+        key = CACHE_KEY.format(scope=scope, ident=ident, window=window)
+        previous_key = CACHE_KEY.format(scope=scope, ident=ident, window=window - 1)
+        counts = cache.get_many([key, previous_key])
+        current = counts.get(key, 0)
+        previous = counts.get(previous_key, 0)
+        elapsed = now - window * period
+        weight = 1 - elapsed / period
+
+        if previous * weight + current >= limit:
+            self._wait = self._compute_wait(limit, period, elapsed, current, previous)
+            return False
+
+        try:
+            cache.incr(key)
+        except ValueError:
+            # First hit of the window; a concurrent add may win, then incr
+            if not cache.add(key, 1, period * 2):
+                cache.incr(key)
+        return True
+
+    @staticmethod
+    def _compute_wait(limit, period, elapsed, current, previous):
+        if current >= limit or not previous:
+            return period - elapsed
+        # Time until the previous window's weight has decayed enough
+        decayed_at = period * (1 - (limit - current) / previous)
+        return max(decayed_at - elapsed, 1)
+
+    def wait(self):
+        return getattr(self, '_wait', None)
+
+
+class AnonSlidingThrottle(SlidingWindowThrottle):
+    """Unauthenticated requests, per client IP (replaces AnonRateThrottle)"""
+
+    scope = 'anon'
+
+    def get_cache_ident(self, request, view):
+        if request.user and request.user.is_authenticated:
+            return None
+        return self.get_ident(request)
+
+
+class UserSlidingThrottle(SlidingWindowThrottle):
+    """Authenticated requests, per user (replaces UserRateThrottle)"""
+
+    scope = 'user'
+
+    def get_cache_ident(self, request, view):
+        if request.user and request.user.is_authenticated:
+            return f'user:{request.user.pk}'
+        return None
+
+
+class EndpointThrottle(SlidingWindowThrottle):
+    """
+    Per-endpoint budget from the view's `throttle_scope`, counted per API
+    key when a valid one is sent, otherwise per client IP
+    """
+
+    def get_scope(self, view):
+        return getattr(view, 'throttle_scope', None)
+
+    def get_cache_ident(self, request, view):
+        return api_key_ident(request) or self.get_ident(request)
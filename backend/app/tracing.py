@@ -0,0 +1,220 @@
+"""
+Ingestion tracing
+
+A trace covers one ingestion (an email webhook call, one IMAP message, one
+bot message); spans inside it time the stages:
+
+    @tracing.trace('email_webhook')
+    def post(...):
+        with tracing.span('parse'):
+            ...
+        log.timings = tracing.timings()
+
+While a trace is active every query on every connection is counted and
+timed against the trace and all open spans, so a span's numbers include
+its children. Outside a trace span() costs one context variable lookup,
+and a nested trace() is just a span.
+
+timings() is the compact breakdown stored on IngestionLog.timings and
+shown in the admin:
+
+    {"total_ms": 812.4, "queries": 41, "query_ms": 640.1,
+     "spans": [{"name": "parse", "start_ms": 3.1, "ms": 120.3,
+                "queries": 0, "query_ms": 0.0, "depth": 0}, ...]}
+
+When OTEL_EXPORTER_OTLP_ENDPOINT is set and the optional OpenTelemetry
+packages are installed (pip install 'backend[tracing]'), finished traces
+are also sent to that OTLP/HTTP collector from a background thread.
+"""
+import contextvars
+import logging
+import time
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+# Bounds the JSON stored per log; a runaway loop of spans is cut off
+MAX_SPANS = 50
+
+_current = contextvars.ContextVar('trace', default=None)
+_otel = {'tracer': None}
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 2)
+
+
+class Span:
+    __slots__ = ('name', 'parent', 'depth', 'start', 'end', 'queries', 'query_time')
+
+    def __init__(self, name, parent, depth, start):
+        self.name = name
+        self.parent = parent
+        self.depth = depth
+        self.start = start
+        self.end = None
+        self.queries = 0
+        self.query_time = 0.0
+
+
+class Trace:
+    def __init__(self, name):
+        self.name = name
+        self.start = time.perf_counter()
+        self.start_ns = time.time_ns()
+        self.end = None
+        self.spans = []
+        self.dropped = 0
+        self.queries = 0
+        self.query_time = 0.0
+        self._open = []
+
+    def record_query(self, execute, sql, params, many, context):
+        """Connection.execute_wrapper hook"""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.queries += 1
+            self.query_time += elapsed
+            for span in self._open:
+                span.queries += 1
+                span.query_time += elapsed
+
+    def push(self, name):
+        parent = self._open[-1] if self._open else None
+        span = Span(name, parent, len(self._open), time.perf_counter())
+        if len(self.spans) < MAX_SPANS:
+            self.spans.append(span)
+        else:
+            self.dropped += 1
+        self._open.append(span)
+        return span
+
+    def pop(self, span):
+        span.end = time.perf_counter()
+        self._open.remove(span)
+
+    def as_dict(self):
+        """Breakdown so far; open spans are measured up to now"""
+        now = time.perf_counter()
+        result = {
+            'total_ms': _ms((self.end or now) - self.start),
+            'queries': self.queries,
+            'query_ms': _ms(self.query_time),
+            'spans': [
+                {
+                    'name': span.name,
+                    'start_ms': _ms(span.start - self.start),
+                    'ms': _ms((span.end or now) - span.start),
+                    'queries': span.queries,
+                    'query_ms': _ms(span.query_time),
+                    'depth': span.depth,
+                }
+                for span in self.spans
+            ],
+        }
+        if self.dropped:
+            result['dropped_spans'] = self.dropped
+        return result
+
+
+def current():
+    return _current.get()
+
+
+def timings():
+    """The active trace's breakdown, or None outside a trace"""
+    active = _current.get()
+    return active.as_dict() if active is not None else None
+
+
+@contextmanager
+def span(name):
+    active = _current.get()
+    if active is None:
+        yield None
+        return
+    opened = active.push(name)
+    try:
+        yield opened
+    finally:
+        active.pop(opened)
+
+
+@contextmanager
+def trace(name):
+    """Trace the block (or, as a decorator, each call); a span inside another trace"""
+    if _current.get() is not None:
+        with span(name) as opened:
+            yield opened
+        return
+
+    active = Trace(name)
+    token = _current.set(active)
+    try:
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(active.record_query))
+            yield active
+    finally:
+        active.end = time.perf_counter()
+        _current.reset(token)
+        export(active)
+
+
+def _tracer():
+    if _otel['tracer'] is None:
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+
+        endpoint = settings.OTEL_EXPORTER_OTLP_ENDPOINT.rstrip('/') + '/v1/traces'
+        provider = TracerProvider(
+            resource=Resource.create({'service.name': settings.OTEL_SERVICE_NAME})
+        )
+        provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter(endpoint=endpoint)))
+        _otel['tracer'] = provider.get_tracer(__name__)
+    return _otel['tracer']
+
+
+def export(finished):
+    """Replay a finished trace as OpenTelemetry spans; never raises"""
+    if _otel['tracer'] is None and not getattr(settings, 'OTEL_EXPORTER_OTLP_ENDPOINT', ''):
+        return
+    try:
+        from opentelemetry import trace as otel_trace
+
+        tracer = _tracer()
+    except ImportError:
+        return
+
+    def wall_ns(moment):
+        return finished.start_ns + int((moment - finished.start) * 1e9)
+
+    def db_attributes(item):
+        return {'db.queries': item.queries, 'db.query_ms': _ms(item.query_time)}
+
+    try:
+        root = tracer.start_span(
+            finished.name, start_time=finished.start_ns, attributes=db_attributes(finished)
+        )
+        exported = {}
+        for item in finished.spans:
+            parent = exported.get(id(item.parent), root)
+            exported[id(item)] = tracer.start_span(
+                item.name,
+                context=otel_trace.set_span_in_context(parent),
+                start_time=wall_ns(item.start),
+                attributes=db_attributes(item),
+            )
+        for item in finished.spans:
+            exported[id(item)].end(end_time=wall_ns(item.end or finished.end))
+        root.end(end_time=wall_ns(finished.end))
+    except Exception:
+        logger.warning('Exporting trace %s failed', finished.name, exc_info=True)
@@ -0,0 +1,125 @@
+"""
+Streaming upload handling for receipt images
+
+Django's default handlers keep uploads up to FILE_UPLOAD_MAX_MEMORY_SIZE in
+memory. ReceiptUploadHandler instead streams every chunk straight to a
+temporary file while hashing, counting and sniffing it, so oversized or
+non-image payloads are rejected mid-stream and worker memory stays bounded.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from rest_framework import status
+from rest_framework.exceptions import APIException, UnsupportedMediaType
+
+# Magic numbers of the image formats phones and scanners produce
+IMAGE_SIGNATURES = (
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+)
+HEIF_BRANDS = (b'heic', b'heix', b'hevc', b'heim', b'heis', b'mif1', b'msf1')
+SNIFF_BYTES = 16
+
+
+class PayloadTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'Uploaded file is too large.'
+    default_code = 'payload_too_large'
+
+
+def sniff_image_type(head):
+    """Return the MIME type of an image from its first bytes, or None"""
+    for signature, mime in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return mime
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp'
+    if head[4:8] == b'ftyp' and head[8:12] in HEIF_BRANDS:
+        return 'image/heic'
+    return None
+
+
+def max_upload_bytes():
+    return getattr(settings, 'RECEIPT_UPLOAD_MAX_BYTES', 10 * 1024 * 1024)
+
+
+class ReceiptUploadHandler(TemporaryFileUploadHandler):
+    """
+    Upload handler that only accepts images
+    Adds .content_hash (SHA-256), .sniffed_type and the final size to the
+    uploaded file so later stages do not have to re-read it
+    """
+
+    # Multipart framing + ordinary form fields on top of the file itself
+    BODY_OVERHEAD = 64 * 1024
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        # Reject on the declared length before a single body byte is read
+        if content_length and content_length > max_upload_bytes() + self.BODY_OVERHEAD:
+            raise PayloadTooLarge()
+        return None
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.hasher = hashlib.sha256()
+        self.received = 0
+        self.head = b''
+        self.sniffed_type = None
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > max_upload_bytes():
+            self._abort()
+            raise PayloadTooLarge()
+
+        if self.sniffed_type is None:
+            self.head += raw_data[:SNIFF_BYTES - len(self.head)]
+            if len(self.head) >= SNIFF_BYTES:
+                self.sniffed_type = sniff_image_type(self.head)
+                if self.sniffed_type is None:
+                    self._abort()
+                    raise UnsupportedMediaType(
+                        self.content_type or 'unknown',
+                        detail='Only JPEG, PNG, GIF, WebP or HEIC images can be uploaded.',
+                    )
+
+        self.hasher.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        if self.sniffed_type is None:
+            # File shorter than the sniff window
+            self.sniffed_type = sniff_image_type(self.head)
+            if self.sniffed_type is None:
+                self._abort()
+                raise UnsupportedMediaType(
+                    self.content_type or 'unknown',
+                    detail='Only JPEG, PNG, GIF, WebP or HEIC images can be uploaded.',
+                )
+
+        uploaded = super().file_complete(file_size)
+        uploaded.content_hash = self.hasher.hexdigest()
+        uploaded.sniffed_type = self.sniffed_type
+        uploaded.content_type = self.sniffed_type
+        return uploaded
+
+    def _abort(self):
+        """Drop the partial temp file right away instead of waiting for GC"""
+        try:
+            self.file.close()
+        except Exception:
+            pass
+
+
+class StreamingUploadMixin:
+    """
+    View mixin that installs ReceiptUploadHandler before the body is parsed
+    """
+    upload_handler_classes = [ReceiptUploadHandler]
+
+    def initialize_request(self, request, *args, **kwargs):
+        request.upload_handlers = [handler(request) for handler in self.upload_handler_classes]
+        return super().initialize_request(request, *args, **kwargs)
@@ -2,18 +2,24 @@ from django.urls import path, include
 from .views import api_staff_list
 from rest_framework.routers import SimpleRouter
 from . import views
+from .metrics import metrics_view
 from app.views import (
     GoogleLogin,
+    AccessTokenView,
     BranchViewSet,
     CategoryViewSet,
     TransactionViewSet,
     UserViewSet,
     IngestionLogViewSet,
     DailySummaryViewSet,
+    AnomalyViewSet,
+    ForecastView,
+    DigestViewSet,
     EmailIngestionWebhook,
     WhatsAppWebhookView,
     InternalWhatsAppIngestion,
     HealthCheckView,
+    ReadinessView,
     BotMasterData,
 )
 
@@ -25,6 +31,8 @@ router.register(r'transactions', TransactionViewSet, basename='transaction')
 router.register(r'users', UserViewSet, basename='user')
 router.register(r'ingestion-logs', IngestionLogViewSet, basename='ingestionlog')
 router.register(r'daily-summaries', DailySummaryViewSet, basename='dailysummary')
+router.register(r'anomalies', AnomalyViewSet, basename='anomaly')
+router.register(r'digests', DigestViewSet, basename='digest')
 
 urlpatterns = [
     path('', views.home, name='home'),
@@ -33,11 +41,14 @@ urlpatterns = [
     path('api/', include([
         # Authentication endpoints under /api/
         path('auth/google/', GoogleLogin.as_view(), name='google_login'),
+        path('auth/access-token/', AccessTokenView.as_view(), name='access_token'),
         path('auth/', include('dj_rest_auth.urls')),
         path('auth/registration/', include('dj_rest_auth.registration.urls')),
         
         # ViewSet endpoints
         path('', include(router.urls)),
+
+        path('analytics/forecast/', ForecastView.as_view(), name='forecast'),
     ])),
     
     # Email Webhook endpoint
@@ -51,4 +62,8 @@ urlpatterns = [
 
     # Health Check endpoint
     path('health/', HealthCheckView.as_view(), name='health-check'),
+    path('health/ready/', ReadinessView.as_view(), name='health-ready'),
+
+    # Prometheus scrape endpoint
+    path('metrics', metrics_view, name='metrics'),
 ]
\ No newline at end of file
@@ -11,7 +11,10 @@ from .models import (
     Category, 
     User, 
     DailySummary, 
-    PaymentMethod
+    PaymentMethod,
+    Anomaly,
+    ForecastFit,
+    Digest,
 )
 from .serializers import EmailWebhookPayloadSerializer
 from .ingestion.email_webhook import EmailWebhookService
@@ -30,7 +33,7 @@ from dj_rest_auth.registration.views import SocialLoginView
 from decouple import config
 from django.db.models import Sum
 import logging
-import traceback
+from datetime import timedelta
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from .models import Branch, Category, User
@@ -42,6 +45,9 @@ from .serializers import (
     UserSerializer,
     IngestionLogSerializer,
     DailySummarySerializer,
+    AnomalySerializer,
+    DigestSerializer,
+    ForecastQuerySerializer,
     WhatsAppWebhookPayloadSerializer,
 )
 from .permissions import (
@@ -49,6 +55,13 @@ from .permissions import (
     IsOwnerOrReadOnly,
     CanVerifyTransaction,
 )
+from . import authentication, branch_scope, digest, health, idempotency, tracing
+from .analytics import forecast
+from .log import bind as bind_log_context
+from .uploads import StreamingUploadMixin
+from .search import RankedSearchFilter
+from .throttling import EndpointThrottle
+from .metrics import timed
 
 logger = logging.getLogger(__name__)
 
@@ -61,7 +74,11 @@ class EmailIngestionWebhook(APIView):
     authentication_classes = []
     permission_classes = []
     parser_classes = [JSONParser, MultiPartParser, FormParser]
+    throttle_classes = [EndpointThrottle]
+    throttle_scope = "webhook"
 
+    @idempotency.idempotent("email_webhook")
+    @tracing.trace("email_webhook")
     def post(self, request, *args, **kwargs):
         # 1. Security
         api_key = request.headers.get('X-Api-Key')
@@ -101,6 +118,7 @@ class EmailIngestionWebhook(APIView):
             msg = service.process_payload(serializer.validated_data)
 
             log.status = IngestionStatus.SUCCESS
+            log.timings = tracing.timings()
             log.save()
             logger.info("Webhook processed successfully.")
             return Response(
@@ -111,6 +129,7 @@ class EmailIngestionWebhook(APIView):
         except Exception as e:
             log.status = IngestionStatus.FAILED
             log.error_message = str(e)
+            log.timings = tracing.timings()
             log.save()
             logger.error(f"Webhook processing failed: {e}", exc_info=True)
             return Response(
@@ -151,26 +170,20 @@ class GoogleLogin(SocialLoginView):
 
     def post(self, request, *args, **kwargs):
         """Handle Google OAuth login with comprehensive error handling"""
-        logger.info("=" * 80)
-        logger.info("Google OAuth Login Attempt")
-        logger.info("=" * 80)
-
-        # 1. Log request metadata
-        logger.info(f"Request method: {request.method}")
-        logger.info(f"Request path: {request.path}")
-        logger.info(f"Content-Type: {request.content_type}")
-        logger.info(f"Origin: {request.headers.get('Origin', 'No Origin header')}")
-        logger.info(f"User-Agent: {request.headers.get('User-Agent', 'Unknown')}")
-
-        # 2. Log request data (without sensitive info)
-        logger.info(f"Request data keys: {list(request.data.keys())}")
+        # 1. Log request metadata (without sensitive info)
         has_access_token = "access_token" in request.data
         has_code = "code" in request.data
         has_id_token = "id_token" in request.data
-
-        logger.info(f"Has access_token: {has_access_token}")
-        logger.info(f"Has code: {has_code}")
-        logger.info(f"Has id_token: {has_id_token}")
+        logger.debug(
+            "Google OAuth login attempt: content_type=%s origin=%s user_agent=%s "
+            "access_token=%s code=%s id_token=%s",
+            request.content_type,
+            request.headers.get("Origin"),
+            request.headers.get("User-Agent"),
+            has_access_token,
+            has_code,
+            has_id_token,
+        )
 
         if not (has_access_token or has_code or has_id_token):
             logger.error("No authentication token provided")
@@ -188,7 +201,7 @@ class GoogleLogin(SocialLoginView):
         client_secret = google_config.get("APP", {}).get("secret")
 
         if not client_id:
-            logger.error("❌ GOOGLE_OAUTH_CLIENT_ID is not configured")
+            logger.error("GOOGLE_OAUTH_CLIENT_ID is not configured")
             return Response(
                 {
                     "error": "Server misconfiguration",
@@ -198,7 +211,7 @@ class GoogleLogin(SocialLoginView):
             )
 
         if not client_secret:
-            logger.error("❌ GOOGLE_OAUTH_CLIENT_SECRET is not configured")
+            logger.error("GOOGLE_OAUTH_CLIENT_SECRET is not configured")
             return Response(
                 {
                     "error": "Server misconfiguration",
@@ -207,16 +220,9 @@ class GoogleLogin(SocialLoginView):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR,
             )
 
-        logger.info(
-            f"✅ Google Client ID configured (first 20 chars): {client_id[:20]}..."
-        )
-        logger.info(
-            f"✅ Google Client Secret configured: {'*' * len(client_secret)}"
-        )
-
         # 4. Check owner emails configuration
         if not settings.OWNER_EMAILS:
-            logger.error("❌ OWNER_EMAILS not configured")
+            logger.error("OWNER_EMAILS not configured")
             return Response(
                 {
                     "error": "Server misconfiguration",
@@ -225,46 +231,31 @@ class GoogleLogin(SocialLoginView):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR,
             )
 
-        logger.info(f"✅ Owner emails configured: {settings.OWNER_EMAILS}")
-
-        # 5. Log callback URL
+        # 5. Call parent class method
         callback = self.callback_url
-        logger.info(f"Callback URL: {callback}")
-
         try:
-            # 6. Call parent class method
-            logger.info("Calling parent SocialLoginView.post()...")
             response = super().post(request, *args, **kwargs)
 
-            # 7. Log response
-            logger.info(f"Response status code: {response.status_code}")
-
+            # 6. Log response
             if response.status_code == 200:
                 user_data = response.data.get("user", {})
-                user_email = user_data.get("email", "unknown")
-                logger.info("✅ Google OAuth login successful")
-                logger.info(f"User email: {user_email}")
-                logger.info(f"User ID: {user_data.get('pk', 'unknown')}")
-                logger.info(f"Token created: {'key' in response.data}")
+                logger.info(
+                    "Google OAuth login successful: user_id=%s email=%s token_created=%s",
+                    user_data.get("pk"),
+                    user_data.get("email"),
+                    "key" in response.data,
+                )
             else:
-                logger.warning(f"⚠️ Non-200 response: {response.status_code}")
-                logger.warning(f"Response data: {response.data}")
-
-            logger.info("=" * 80)
+                logger.warning(
+                    "Google OAuth login returned %s: %s", response.status_code, response.data
+                )
             return response
 
         except Exception as e:
-            # 8. Comprehensive error logging
-            logger.error("=" * 80)
-            logger.error("❌ Google OAuth login exception caught")
-            logger.error(f"Exception type: {type(e).__name__}")
-            logger.error(f"Exception message: {str(e)}")
-            logger.error(f"Exception args: {e.args}")
-            logger.error("Full traceback:")
-            logger.error(traceback.format_exc())
-            logger.error("=" * 80)
-
-            # 9. Build error response
+            # 7. Log with traceback
+            logger.exception("Google OAuth login failed (callback %s)", callback)
+
+            # 8. Build error response
             error_response = {
                 "error": "Authentication failed",
                 "message": "Please try again",
@@ -291,6 +282,30 @@ class GoogleLogin(SocialLoginView):
             )
 
 
+class AccessTokenView(APIView):
+    """
+    Issue a signed, short-lived Bearer access token for the calling token
+    (only when AUTH_SIGNED_TOKENS is enabled)
+    """
+
+    authentication_classes = [authentication.CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        if not settings.AUTH_SIGNED_TOKENS:
+            return Response(
+                {"detail": "Signed access tokens are disabled"},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+        return Response(
+            {
+                "access": authentication.issue_access_token(request.auth),
+                "token_type": "Bearer",
+                "expires_in": settings.AUTH_SIGNED_TOKEN_MAX_AGE,
+            }
+        )
+
+
 def home(request):
     """
     Simple home view for testing
@@ -358,10 +373,11 @@ class CategoryViewSet(viewsets.ModelViewSet):
 # ==========================================
 
 
-class TransactionViewSet(viewsets.ModelViewSet):
+class TransactionViewSet(StreamingUploadMixin, viewsets.ModelViewSet):
     """
     ViewSet for Transaction management
     - List: Filter by branch, date range, verification status
+    - Search: ?q= ranked full-text search (?search= keeps the plain match)
     - Create: Staff can create for their branch, auto-verified if they're verified staff
     - Verify: Only owner can verify
     - Void: Only owner can void
@@ -370,7 +386,7 @@ class TransactionViewSet(viewsets.ModelViewSet):
     queryset = Transaction.objects.all()
     serializer_class = TransactionSerializer
     permission_classes = [IsAuthenticated, CanVerifyTransaction]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter, RankedSearchFilter]
     filterset_fields = ["branch", "transaction_type", "is_verified", "date", "source"]
     search_fields = ["description", "category__name", "source_identifier"]
     ordering_fields = ["date", "created_at", "amount"]
@@ -380,15 +396,15 @@ class TransactionViewSet(viewsets.ModelViewSet):
         """
         Filter transactions based on user role
         - Owner: sees all
-        - Staff: sees only their branch's transactions
+        - Staff: sees only their branches' transactions
         """
-        if self.request.user.is_superuser:
-            return Transaction.objects.all()
+        # The serializer expands branch, category and reporter on every row
+        queryset = Transaction.objects.select_related("branch", "category", "reported_by")
+        return branch_scope.for_request(self.request).filter(queryset)
 
-        if self.request.user.assigned_branch:
-            return Transaction.objects.filter(branch=self.request.user.assigned_branch)
-
-        return Transaction.objects.none()
+    @idempotency.idempotent("transactions")
+    def create(self, request, *args, **kwargs):
+        return super().create(request, *args, **kwargs)
 
     def perform_create(self, serializer):
         """
@@ -462,17 +478,18 @@ class UserViewSet(viewsets.ModelViewSet):
     serializer_class = UserSerializer
     permission_classes = [IsAuthenticated]
     filter_backends = [DjangoFilterBackend, filters.SearchFilter]
-    filterset_fields = ["assigned_branch", "is_verified"]
-    search_fields = ["username", "email", "phone_number"]
+    filterset_fields = ["branch_assignments__branch", "is_verified"]
+    search_fields = ["username", "email", "phone_numbers__phone_number"]
 
     def get_queryset(self):
         """
         Owner sees all users, staff sees only their own profile
         """
+        queryset = User.objects.prefetch_related("phone_numbers", "branch_assignments__branch", "line_ids")
         if self.request.user.is_superuser:
-            return User.objects.all()
+            return queryset
 
-        return User.objects.filter(id=self.request.user.id)
+        return queryset.filter(id=self.request.user.id)
 
     def get_permissions(self):
         """
@@ -568,18 +585,9 @@ class DailySummaryViewSet(viewsets.ReadOnlyModelViewSet):
         """
         Filter summaries based on user role
         - Owner: sees all
-        - Staff: sees only their branch's summaries
+        - Staff: sees only their branches' summaries
         """
-        request = self.request
-        user = getattr(request, "user", None)
-
-        if user and user.is_superuser:
-            return DailySummary.objects.all()
-
-        if user and getattr(user, "assigned_branch", None):
-            return DailySummary.objects.filter(branch=user.assigned_branch)
-
-        return DailySummary.objects.none()
+        return branch_scope.for_request(self.request).filter(DailySummary.objects.select_related("branch"))
 
     @action(detail=False, methods=["get"], permission_classes=[IsAuthenticated])
     def payment_breakdown(self, request):
@@ -642,6 +650,163 @@ class DailySummaryViewSet(viewsets.ReadOnlyModelViewSet):
         return Response(result)
 
 
+# ==========================================
+# ANOMALY VIEWSET
+# ==========================================
+
+
+class AnomalyViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Anomalies found by `manage.py detect_anomalies` (app/analytics)
+    - Owner: See all anomalies
+    - Staff: See only their branches' anomalies
+    Filters: branch, category, kind, date, date_after/date_before
+    """
+
+    serializer_class = AnomalySerializer
+    permission_classes = [IsAuthenticated]
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
+    filterset_fields = ["branch", "category", "kind", "date"]
+    ordering_fields = ["date", "score"]
+    ordering = ["-date", "branch"]
+
+    def get_queryset(self):
+        queryset = branch_scope.for_request(self.request).filter(
+            Anomaly.objects.select_related("branch", "category")
+        )
+        date_after = self.request.query_params.get("date_after")
+        date_before = self.request.query_params.get("date_before")
+        if date_after:
+            queryset = queryset.filter(date__gte=date_after)
+        if date_before:
+            queryset = queryset.filter(date__lte=date_before)
+        return queryset
+
+
+class ForecastView(APIView):
+    """
+    Daily forecasts with intervals from the fitted series (app/analytics/forecast.py)
+    - Owner: All branches
+    - Staff: Only their branches
+    Params: series (revenue/expenses), branch, branch_type, category,
+    group_by (branch/branch_type), start, horizon (days), level (interval)
+    group_by=branch_type adds up the branches of each type (per category
+    for expenses)
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        query = ForecastQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+        if forecast.np is None:
+            return Response(
+                {"detail": "Forecasting requires the analytics extra (numpy)"},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+            )
+
+        fits = branch_scope.for_request(request).filter(
+            ForecastFit.objects.select_related("branch", "category").filter(
+                category__isnull=params["series"] == forecast.REVENUE
+            )
+        )
+        if "branch" in params:
+            fits = fits.filter(branch_id=params["branch"])
+        if "branch_type" in params:
+            fits = fits.filter(branch__branch_type=params["branch_type"])
+        if "category" in params:
+            fits = fits.filter(category_id=params["category"])
+        fits = list(fits.order_by("branch__name", "category__name"))
+
+        start = params.get("start")
+        if start is None and fits:
+            start = max(fit.fitted_through for fit in fits) + timedelta(days=1)
+        response = {
+            "series": params["series"],
+            "start": start,
+            "horizon": params["horizon"],
+            "level": params["level"],
+            "results": [],
+        }
+        if not fits:
+            return Response(response)
+
+        point, sigma, z = forecast.predict(fits, start, params["horizon"], params["level"])
+        dates = [start + timedelta(days=i) for i in range(params["horizon"])]
+
+        def points(row_point, row_sigma):
+            return [
+                {
+                    "date": day,
+                    "forecast": round(float(value), 2),
+                    "lower": round(max(float(value - z * spread), 0.0), 2),
+                    "upper": round(float(value + z * spread), 2),
+                }
+                for day, value, spread in zip(dates, row_point, row_sigma)
+            ]
+
+        if params["group_by"] == "branch_type":
+            groups = {}
+            for row, fit in enumerate(fits):
+                groups.setdefault((fit.branch.branch_type, fit.category), []).append(row)
+            summed, spread = forecast.combine(point, sigma, list(groups.values()))
+            for (branch_type, category), rows, row_point, row_sigma in zip(
+                groups, groups.values(), summed, spread
+            ):
+                response["results"].append({
+                    "branch_type": branch_type,
+                    "category": category.pk if category else None,
+                    "category_name": category.name if category else None,
+                    "branches": len(rows),
+                    "points": points(row_point, row_sigma),
+                })
+        else:
+            for fit, row_point, row_sigma in zip(fits, point, sigma):
+                response["results"].append({
+                    "branch": fit.branch_id,
+                    "branch_name": fit.branch.name,
+                    "branch_type": fit.branch.branch_type,
+                    "category": fit.category_id,
+                    "category_name": fit.category.name if fit.category_id else None,
+                    "method": fit.method,
+                    "fitted_through": fit.fitted_through,
+                    "points": points(row_point, row_sigma),
+                })
+        return Response(response)
+
+
+class DigestViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Owner digests built by `manage.py send_digest` (app/digest.py)
+    - Owner only
+    Filters: period, start; /html/ and /pdf/ return the rendered versions
+    """
+
+    queryset = Digest.objects.defer("html", "pdf")
+    serializer_class = DigestSerializer
+    permission_classes = [IsAuthenticated, IsOwner]
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
+    filterset_fields = ["period", "start"]
+    ordering = ["-start", "period"]
+
+    @action(detail=True, methods=["get"])
+    def html(self, request, pk=None):
+        return HttpResponse(self.get_object().html, content_type="text/html; charset=utf-8")
+
+    @action(detail=True, methods=["get"])
+    def pdf(self, request, pk=None):
+        pdf = digest.pdf_of(self.get_object())
+        if pdf is None:
+            return Response(
+                {"detail": "PDF rendering requires the pdf extra (xhtml2pdf)"},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+            )
+        response = HttpResponse(pdf, content_type="application/pdf")
+        response["Content-Disposition"] = f'inline; filename="digest-{pk}.pdf"'
+        return response
+
+
 # ==========================================
 # WEBHOOK VIEWS (API Key Protected)
 # ==========================================
@@ -652,6 +817,8 @@ class BotMasterData(APIView):
     """
     permission_classes = [AllowAny]
     authentication_classes = []
+    throttle_classes = [EndpointThrottle]
+    throttle_scope = "bot"
 
     def get(self, request):
         branches = list(Branch.objects.values('id', 'name', 'branch_type'))
@@ -669,7 +836,11 @@ class WhatsAppWebhookView(APIView):
     """
 
     permission_classes = [AllowAny]
+    throttle_classes = [EndpointThrottle]
+    throttle_scope = "webhook"
 
+    @timed("source", "whatsapp_webhook")
+    @idempotency.idempotent("whatsapp_webhook")
     def post(self, request):
         # Verify API Key is configured
         expected_key = getattr(settings, "INGESTION_API_KEY", None)
@@ -722,12 +893,14 @@ class WhatsAppWebhookView(APIView):
 
             # Try to get user by phone number
             try:
-                user = User.objects.get(phone_number=data["phone_number"])
-                branch = user.assigned_branch
+                user = User.objects.get(phone_numbers__phone_number=data["phone_number"])
+                branch = None
+                if branch_scope.for_user(user).allows(data["branch_id"]):
+                    branch = Branch.objects.filter(pk=data["branch_id"]).first()
 
                 if not branch:
                     ingestion_log.status = IngestionStatus.FAILED
-                    ingestion_log.error_message = "User has no assigned branch"
+                    ingestion_log.error_message = "User is not assigned to this branch"
                     ingestion_log.save()
                     return Response(
                         {"error": "Invalid request"},
@@ -790,101 +963,99 @@ class InternalWhatsAppIngestion(APIView):
     """
     permission_classes = [AllowAny]
     authentication_classes = []
+    throttle_classes = [EndpointThrottle]
+    throttle_scope = "bot"
 
+    @timed("source", "whatsapp_bot")
+    @idempotency.idempotent("whatsapp_bot")
+    @tracing.trace("whatsapp_bot")
     def post(self, request):
         data = request.data
-        
-        # Log untuk debugging di Render
-        logger.info("=" * 80)
-        logger.info("📥 WhatsApp Bot Internal Ingestion")
-        logger.info(f"Payload received: {data}")
-        logger.info("=" * 80)
-        
+        bind_log_context(source=TransactionSource.WHATSAPP)
+        logger.debug("WhatsApp bot ingestion payload: %s", data)
+        ingestion_log = None
+
         try:
             # 1. Validasi & ambil phone number
             phone = data.get('phone_number')
             if not phone:
-                logger.error("❌ phone_number tidak ada di payload")
+                logger.warning("WhatsApp bot ingestion without phone_number")
                 return Response(
                     {"error": "phone_number is required"}, 
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
-            logger.info(f"📞 Mencari user dengan phone_number: {phone}")
-
             # 2. Cari staff berdasarkan phone number
             staff_user = None
-            try:
-                staff_user = User.objects.get(phone_number=phone)
-                logger.info(f"✅ User ditemukan: {staff_user.username} (ID: {staff_user.id})")
-            except User.DoesNotExist:
-                # Coba format alternatif (62xxx <-> 0xxx)
-                alternative_phone = None
-                if phone.startswith('62'):
-                    alternative_phone = '0' + phone[2:]
-                elif phone.startswith('0'):
-                    alternative_phone = '62' + phone[1:]
-                
-                if alternative_phone:
-                    logger.info(f"🔄 Mencoba format alternatif: {alternative_phone}")
-                    try:
-                        staff_user = User.objects.get(phone_number=alternative_phone)
-                        logger.info(f"✅ User ditemukan (format alternatif): {staff_user.username}")
-                    except User.DoesNotExist:
-                        pass
+            with tracing.span("resolve_user"):
+                try:
+                    staff_user = User.objects.get(phone_numbers__phone_number=phone)
+                except User.DoesNotExist:
+                    # Coba format alternatif (62xxx <-> 0xxx)
+                    alternative_phone = None
+                    if phone.startswith('62'):
+                        alternative_phone = '0' + phone[2:]
+                    elif phone.startswith('0'):
+                        alternative_phone = '62' + phone[1:]
+                    
+                    if alternative_phone:
+                        logger.debug("Trying alternative phone format %s", alternative_phone)
+                        try:
+                            staff_user = User.objects.get(phone_numbers__phone_number=alternative_phone)
+                        except User.DoesNotExist:
+                            pass
             
             if not staff_user:
-                logger.error(f"❌ User tidak ditemukan untuk phone_number: {phone}")
+                logger.warning("No user for phone_number %s", phone)
                 return Response(
                     {"error": f"Nomor {phone} tidak terdaftar di sistem"}, 
                     status=status.HTTP_404_NOT_FOUND
                 )
 
-            # 3. Validasi bahwa user adalah staff (punya assigned_branch)
-            if not staff_user.assigned_branch:
-                logger.error(f"❌ User {staff_user.username} tidak memiliki assigned_branch")
+            # 3. Validasi bahwa user adalah staff (terdaftar di minimal satu cabang)
+            with tracing.span("branch_scope"):
+                scope = branch_scope.for_user(staff_user)
+            if not scope.unrestricted and not scope.branch_ids:
+                logger.warning("User %s has no branch assignment", staff_user.username)
                 return Response(
                     {"error": "User bukan staff yang terdaftar di cabang manapun"}, 
                     status=status.HTTP_403_FORBIDDEN
                 )
-            
-            logger.info(f"✅ Staff verified - Assigned to: {staff_user.assigned_branch.name}")
 
             # 4. Validasi branch_id
             branch_id = data.get('branch_id')
             if not branch_id:
-                logger.error("❌ branch_id tidak ada di payload")
+                logger.warning("WhatsApp bot ingestion without branch_id")
                 return Response(
                     {"error": "branch_id is required"}, 
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
-            logger.info(f"🏢 Mencari Branch dengan ID: {branch_id}")
             try:
-                branch = Branch.objects.get(pk=branch_id)
-                logger.info(f"✅ Branch ditemukan: {branch.name} ({branch.get_branch_type_display()})")
+                with tracing.span("resolve_branch"):
+                    branch = Branch.objects.get(pk=branch_id)
             except Branch.DoesNotExist:
-                logger.error(f"❌ Branch dengan ID {branch_id} tidak ditemukan")
+                logger.warning("Branch %s not found", branch_id)
                 return Response(
                     {"error": f"Branch dengan ID {branch_id} tidak ditemukan"}, 
                     status=status.HTTP_400_BAD_REQUEST
                 )
+            bind_log_context(branch=branch.id)
 
             # 5. Validasi category_id
             category_id = data.get('category_id')
             if not category_id:
-                logger.error("❌ category_id tidak ada di payload")
+                logger.warning("WhatsApp bot ingestion without category_id")
                 return Response(
                     {"error": "category_id is required"}, 
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
-            logger.info(f"📂 Mencari Category dengan ID: {category_id}")
             try:
-                category = Category.objects.get(pk=category_id)
-                logger.info(f"✅ Category ditemukan: {category.name} ({category.transaction_type})")
+                with tracing.span("resolve_category"):
+                    category = Category.objects.get(pk=category_id)
             except Category.DoesNotExist:
-                logger.error(f"❌ Category dengan ID {category_id} tidak ditemukan")
+                logger.warning("Category %s not found", category_id)
                 return Response(
                     {"error": f"Category dengan ID {category_id} tidak ditemukan"}, 
                     status=status.HTTP_400_BAD_REQUEST
@@ -893,7 +1064,7 @@ class InternalWhatsAppIngestion(APIView):
             # 6. Validasi amount
             amount = data.get('amount')
             if not amount:
-                logger.error("❌ amount tidak ada di payload")
+                logger.warning("WhatsApp bot ingestion without amount")
                 return Response(
                     {"error": "amount is required"}, 
                     status=status.HTTP_400_BAD_REQUEST
@@ -903,9 +1074,8 @@ class InternalWhatsAppIngestion(APIView):
                 amount = int(amount)
                 if amount <= 0:
                     raise ValueError("Amount must be positive")
-                logger.info(f"💰 Amount: Rp {amount:,}")
             except (ValueError, TypeError) as e:
-                logger.error(f"❌ amount tidak valid: {amount} - {str(e)}")
+                logger.warning("Invalid amount %r: %s", amount, e)
                 return Response(
                     {"error": "amount harus berupa angka positif"}, 
                     status=status.HTTP_400_BAD_REQUEST
@@ -914,52 +1084,50 @@ class InternalWhatsAppIngestion(APIView):
             # 7. Validasi transaction type
             transaction_type = data.get('type', 'EXPENSE')
             if transaction_type not in ['INCOME', 'EXPENSE']:
-                logger.error(f"❌ type tidak valid: {transaction_type}")
+                logger.warning("Invalid transaction type %r", transaction_type)
                 return Response(
                     {"error": "type harus INCOME atau EXPENSE"}, 
                     status=status.HTTP_400_BAD_REQUEST
                 )
-            
-            logger.info(f"📊 Transaction Type: {transaction_type}")
 
             # 8. Get notes
             notes = data.get('notes', '-')
-            logger.info(f"📝 Notes: {notes}")
 
             # 9. Buat Ingestion Log
-            logger.info("📝 Creating ingestion log...")
             ingestion_log = IngestionLog.objects.create(
                 source=TransactionSource.WHATSAPP,
                 raw_payload=data,
                 status=IngestionStatus.PENDING,
             )
-            logger.info(f"✅ Ingestion log created: ID={ingestion_log.id}")
 
             # 10. Buat Transaction
-            logger.info("💾 Creating transaction record...")
-            transaction = Transaction.objects.create(
-                branch=branch,
-                reported_by=staff_user,
-                amount=amount,
-                transaction_type=transaction_type,
-                category=category,
-                description=notes,
-                payment_method=PaymentMethod.CASH,
-                is_verified=staff_user.is_verified,
-                source=TransactionSource.WHATSAPP,
-                date=timezone.now().date(),
-            )
+            with tracing.span("create_transaction"):
+                transaction = Transaction.objects.create(
+                    branch=branch,
+                    reported_by=staff_user,
+                    amount=amount,
+                    transaction_type=transaction_type,
+                    category=category,
+                    description=notes,
+                    payment_method=PaymentMethod.CASH,
+                    is_verified=staff_user.is_verified,
+                    source=TransactionSource.WHATSAPP,
+                    date=timezone.now().date(),
+                )
             
-            logger.info(f"✅ Transaction created successfully: ID={transaction.id}")
-            logger.info(f"   Branch: {branch.name}")
-            logger.info(f"   Amount: Rp {amount:,}")
-            logger.info(f"   Type: {transaction_type}")
-            logger.info(f"   Category: {category.name}")
-            logger.info(f"   Verified: {transaction.is_verified}")
-            logger.info("=" * 80)
+            logger.info(
+                "WhatsApp transaction %s created: user=%s amount=%s type=%s category=%s verified=%s",
+                transaction.id,
+                staff_user.id,
+                amount,
+                transaction_type,
+                category.name,
+                transaction.is_verified,
+            )
             
             ingestion_log.status = IngestionStatus.SUCCESS
             ingestion_log.created_transaction = transaction
+            ingestion_log.timings = tracing.timings()
             ingestion_log.save()
             
             return Response({
@@ -973,14 +1141,13 @@ class InternalWhatsAppIngestion(APIView):
             }, status=status.HTTP_201_CREATED)
             
         except Exception as e:
-            logger.error("❌ Exception occurred during transaction creation")
-            logger.error(f"Exception: {str(e)}")
-            logger.error(traceback.format_exc())
-            logger.error("=" * 80)
+            logger.exception("WhatsApp bot ingestion failed")
             
-            ingestion_log.status = IngestionStatus.FAILED
-            ingestion_log.error_message = str(e)
-            ingestion_log.save()
+            if ingestion_log is not None:
+                ingestion_log.status = IngestionStatus.FAILED
+                ingestion_log.error_message = str(e)
+                ingestion_log.timings = tracing.timings()
+                ingestion_log.save()
             
             return Response(
                 {"error": "Gagal membuat transaksi", "detail": str(e)}, 
@@ -994,39 +1161,57 @@ def api_staff_list(request):
     """
     User = get_user_model()
     
-    # Ambil user yang punya nomor HP dan sudah diverifikasi
-    staff_users = User.objects.filter(phone_number__isnull=False).exclude(phone_number='')
+    # Ambil user yang punya nomor HP, beserta nomor dan cabangnya (4 query)
+    staff_users = (
+        User.objects.filter(phone_numbers__isnull=False)
+        .distinct()
+        .prefetch_related('phone_numbers', 'branch_assignments__branch')
+    )
     
     data_bot = {}
 
     for user in staff_users:
-        # 1. Pastikan nomor HP bersih (Format: 628...)
-        phone = str(user.phone_number).replace('+', '').replace('-', '').strip()
-        
-        # Tambahkan akhiran WA
-        wa_id = f"{phone}@s.whatsapp.net"
-        
-        # 2. Ambil nama Cabang (Cegah error jika cabang kosong)
-        nama_cabang = "Pusat"
-        if user.assigned_branch:
-            nama_cabang = str(user.assigned_branch) # Atau user.assigned_branch.name
-
-        # 3. Masukkan ke kamus data
-        data_bot[wa_id] = {
-            "nama": user.username,  # Atau user.first_name
-            "cabang": nama_cabang,
-            "unit": "Laundry"       # Bisa disesuaikan logic-nya
-        }
+        # 1. Ambil nama Cabang (Cegah error jika cabang kosong)
+        assignments = list(user.branch_assignments.all())
+        nama_cabang = assignments[0].branch.name if assignments else "Pusat"
+
+        for number in user.phone_numbers.all():
+            # 2. Pastikan nomor HP bersih (Format: 628...) dan tambahkan akhiran WA
+            phone = str(number.phone_number).replace('+', '').replace('-', '').strip()
+            wa_id = f"{phone}@s.whatsapp.net"
+
+            # 3. Masukkan ke kamus data
+            data_bot[wa_id] = {
+                "nama": user.username,  # Atau user.first_name
+                "cabang": nama_cabang,
+                "unit": "Laundry"       # Bisa disesuaikan logic-nya
+            }
 
     # Kembalikan sebagai JSON (Data Mentah)
     return JsonResponse(data_bot)
    
 class HealthCheckView(APIView):
     """
-    Cek kesehatan server untuk Render
+    Cek kesehatan server untuk Render (liveness, tidak menyentuh dependency)
+    """
+    permission_classes = [AllowAny]
+    authentication_classes = []
+    throttle_classes = []
+
+    def get(self, request):
+        return Response({"status": "ok", "service": "MaknaFlow Backend"})
+
+
+class ReadinessView(APIView):
+    """
+    Readiness for the load balancer: database, cache, ingestion queue and
+    IMAP probes (app/health.py), 503 when the worker should not get traffic
     """
     permission_classes = [AllowAny]
     authentication_classes = []
+    throttle_classes = []
 
     def get(self, request):
-        return Response({"status": "ok", "message": "Server is running"})
\ No newline at end of file
+        result = health.readiness()
+        code = status.HTTP_200_OK if result["status"] == "ok" else status.HTTP_503_SERVICE_UNAVAILABLE
+        return Response(result, status=code)
\ No newline at end of file
@@ -43,6 +43,7 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'django.contrib.sites',
+    'django.contrib.postgres',
     
     # Project app
     'app',
@@ -68,6 +69,8 @@ SITE_ID = 1
 # MIDDLEWARE
 # =============================================================================
 MIDDLEWARE = [
+    'app.log.RequestContextMiddleware',
+    'app.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -75,6 +78,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'app.db_router.ReplicaRoutingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'allauth.account.middleware.AccountMiddleware',
@@ -134,6 +138,67 @@ else:
         }
     }
 
+# Read replicas (app/db_router.py), comma separated database URLs.
+# Tests mirror them onto the default test database.
+DATABASE_REPLICAS = []
+for _index, _url in enumerate(config('DATABASE_REPLICA_URLS', default='', cast=Csv())):
+    _alias = f'replica_{_index}'
+    DATABASES[_alias] = dj_database_url.parse(_url, conn_max_age=600, conn_health_checks=True)
+    DATABASES[_alias]['TEST'] = {'MIRROR': 'default'}
+    DATABASE_REPLICAS.append(_alias)
+
+# Connection pooling for PostgreSQL (pip install 'backend[pool]', psycopg 3).
+# Replaces the persistent per-worker connections (conn_max_age) with a pool
+# per process; stats are reported by /health/ (app/db_pool.py).
+DATABASE_POOL = config('DATABASE_POOL', default=False, cast=bool)
+if DATABASE_POOL:
+    from psycopg_pool import ConnectionPool
+
+    for _database in DATABASES.values():
+        if _database['ENGINE'] != 'django.db.backends.postgresql':
+            continue
+        # Pooling requires non-persistent connections
+        _database['CONN_MAX_AGE'] = 0
+        _database['CONN_HEALTH_CHECKS'] = False
+        _database.setdefault('OPTIONS', {})['pool'] = {
+            'min_size': config('DATABASE_POOL_MIN_SIZE', default=2, cast=int),
+            'max_size': config('DATABASE_POOL_MAX_SIZE', default=10, cast=int),
+            # Seconds a request waits for a free connection before failing
+            'timeout': config('DATABASE_POOL_TIMEOUT', default=10, cast=float),
+            'max_idle': config('DATABASE_POOL_MAX_IDLE', default=300, cast=float),
+            'max_lifetime': config('DATABASE_POOL_MAX_LIFETIME', default=3600, cast=float),
+            # Health-check connections when they are handed out
+            'check': ConnectionPool.check_connection,
+        }
+
+DATABASE_ROUTERS = ['app.db_router.ReplicaRouter']
+# Seconds a client keeps reading from the primary after a write
+REPLICA_STICKY_SECONDS = config('REPLICA_STICKY_SECONDS', default=5, cast=int)
+# Replicas further behind than this many seconds are skipped
+REPLICA_MAX_LAG = config('REPLICA_MAX_LAG', default=5, cast=float)
+REPLICA_HEALTH_TTL = config('REPLICA_HEALTH_TTL', default=10, cast=int)
+
+# =============================================================================
+# CACHE
+# =============================================================================
+# Throttle counters, token and branch-scope caches live here. Set REDIS_URL
+# (pip install 'backend[redis]') so gunicorn workers share them; locmem is
+# per process.
+REDIS_URL = config('REDIS_URL', default='')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -170,6 +235,132 @@ USE_TZ = True
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Receipt uploads are streamed to temp files and capped (app/uploads.py)
+RECEIPT_UPLOAD_MAX_BYTES = config('RECEIPT_UPLOAD_MAX_BYTES', default=10 * 1024 * 1024, cast=int)
+
+# Receipt image pipeline (app/receipt_images.py)
+RECEIPT_IMAGE_MAX_DIMENSION = config('RECEIPT_IMAGE_MAX_DIMENSION', default=2048, cast=int)
+RECEIPT_IMAGE_MAX_BYTES = config('RECEIPT_IMAGE_MAX_BYTES', default=600 * 1024, cast=int)
+RECEIPT_IMAGE_QUALITY = config('RECEIPT_IMAGE_QUALITY', default=85, cast=int)
+RECEIPT_IMAGE_MIN_QUALITY = config('RECEIPT_IMAGE_MIN_QUALITY', default=60, cast=int)
+RECEIPT_THUMBNAIL_SIZES = [320, 960]
+RECEIPT_THUMBNAIL_QUALITY = config('RECEIPT_THUMBNAIL_QUALITY', default=75, cast=int)
+
+# Full-text search (app/search.py)
+# 'simple' = no stemming, Postgres has no Indonesian dictionary
+SEARCH_CONFIG = config('SEARCH_CONFIG', default='simple')
+SEARCH_MAX_RESULTS = 1000
+
+# Seconds a user's allowed branch ids stay cached (see app/branch_scope.py)
+BRANCH_SCOPE_CACHE_TTL = config('BRANCH_SCOPE_CACHE_TTL', default=60, cast=int)
+
+# Token authentication cache (app/authentication.py)
+AUTH_TOKEN_CACHE_TTL = config('AUTH_TOKEN_CACHE_TTL', default=300, cast=int)
+AUTH_TOKEN_LRU_SIZE = config('AUTH_TOKEN_LRU_SIZE', default=1024, cast=int)
+AUTH_TOKEN_LRU_TTL = config('AUTH_TOKEN_LRU_TTL', default=10, cast=int)
+# Signed "Bearer" access tokens issued from /api/auth/access-token/
+AUTH_SIGNED_TOKENS = config('AUTH_SIGNED_TOKENS', default=False, cast=bool)
+AUTH_SIGNED_TOKEN_MAX_AGE = config('AUTH_SIGNED_TOKEN_MAX_AGE', default=900, cast=int)
+
+# =============================================================================
+# LOGGING (app/log.py)
+# =============================================================================
+LOG_LEVEL = config('LOG_LEVEL', default='INFO')
+# 'json' for one object per line, 'plain' for humans
+LOG_FORMAT = config('LOG_FORMAT', default='plain' if DEBUG else 'json')
+# Fraction of requests whose INFO/DEBUG records are kept; warnings always are
+LOG_INFO_SAMPLE_RATE = config('LOG_INFO_SAMPLE_RATE', default=1.0, cast=float)
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'filters': {
+        'context': {'()': 'app.log.ContextFilter'},
+    },
+    'formatters': {
+        'json': {'()': 'app.log.JsonFormatter'},
+        'plain': {'format': '%(asctime)s %(levelname)s %(name)s %(message)s'},
+    },
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+            'formatter': LOG_FORMAT,
+        },
+        'queue': {
+            'class': 'app.log.QueueHandler',
+            'listener': 'app.log.QueueListener',
+            'handlers': ['console'],
+            'filters': ['context'],
+        },
+    },
+    'root': {
+        'handlers': ['queue'],
+        'level': LOG_LEVEL,
+    },
+    'loggers': {
+        # Replace Django's default console handler instead of logging twice
+        'django': {'handlers': ['queue'], 'level': LOG_LEVEL, 'propagate': False},
+    },
+}
+
+# Admin changelists of tables above this many rows (planner estimate) show
+# an estimated total instead of running COUNT(*) (PostgreSQL only, app/admin.py)
+ADMIN_ESTIMATED_COUNT_THRESHOLD = config('ADMIN_ESTIMATED_COUNT_THRESHOLD', default=100000, cast=int)
+
+# Prometheus metrics (app/metrics.py); /metrics requires
+# "Authorization: Bearer <METRICS_TOKEN>" and answers 404 while it is unset
+# (unless DEBUG), so set it wherever Prometheus scrapes
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+
+# Ingestion tracing (app/tracing.py); when set, traces are also exported to
+# this OTLP/HTTP collector (needs the 'tracing' extra)
+OTEL_EXPORTER_OTLP_ENDPOINT = config('OTEL_EXPORTER_OTLP_ENDPOINT', default='')
+OTEL_SERVICE_NAME = config('OTEL_SERVICE_NAME', default='maknaflow-backend')
+
+# Health checks (app/health.py)
+HEALTH_CACHE_SECONDS = config('HEALTH_CACHE_SECONDS', default=5, cast=int)
+HEALTH_PROBE_TIMEOUT = config('HEALTH_PROBE_TIMEOUT', default=2.0, cast=float)
+HEALTH_DB_LATENCY_BUDGET_MS = config('HEALTH_DB_LATENCY_BUDGET_MS', default=500, cast=int)
+# Oldest PENDING ingestion log allowed before readiness fails, seconds
+HEALTH_QUEUE_MAX_AGE = config('HEALTH_QUEUE_MAX_AGE', default=900, cast=int)
+
+# Ingestion log purge (app/purge.py): rows per DELETE batch, and the
+# largest admin selection purged inside the request (more runs in background)
+PURGE_BATCH_SIZE = config('PURGE_BATCH_SIZE', default=1000, cast=int)
+PURGE_SYNC_LIMIT = config('PURGE_SYNC_LIMIT', default=5000, cast=int)
+
+# Reconciliation (app/reconciliation.py): summary vs transaction differences
+# up to this many rupiah are not reported
+RECONCILIATION_TOLERANCE = config('RECONCILIATION_TOLERANCE', default=1, cast=int)
+
+# Anomaly detection (app/analytics): robust z-score from which a day is flagged
+ANOMALY_Z_THRESHOLD = config('ANOMALY_Z_THRESHOLD', default=3.5, cast=float)
+# Forecasts (app/analytics/forecast.py): step the fitted series forward in the
+# background after every ingested summary or expense
+FORECAST_REFRESH_ON_INGEST = config('FORECAST_REFRESH_ON_INGEST', default=True, cast=bool)
+
+# Idempotency-Key (app/idempotency.py): seconds a stored response is replayed
+IDEMPOTENCY_KEY_TTL = config('IDEMPOTENCY_KEY_TTL', default=86400, cast=int)
+# Seconds after which a request still holding its key is presumed dead and
+# the key can be claimed again; keep it above the gunicorn --timeout
+IDEMPOTENCY_LEASE_SECONDS = config('IDEMPOTENCY_LEASE_SECONDS', default=600, cast=int)
+
+# Owner digests (app/digest.py): local hours ("start-end") during which stored
+# digests are served as they are instead of being recomputed
+DIGEST_BUSINESS_HOURS = tuple(
+    int(hour) for hour in config('DIGEST_BUSINESS_HOURS', default='7-22').split('-')
+)
+
+# IMAP ingestion (app/ingestion/imap_triage.py): most bytes of a message's
+# text part downloaded, larger ones are skipped ('too_large'); attachments
+# are never downloaded
+IMAP_BODY_MAX_BYTES = config('IMAP_BODY_MAX_BYTES', default=262144, cast=int)
+
+# Background tasks (app/background.py)
+# Set BACKGROUND_TASKS_SYNC=True to run them inline (tests, one-off scripts)
+BACKGROUND_TASK_WORKERS = config('BACKGROUND_TASK_WORKERS', default=2, cast=int)
+BACKGROUND_TASKS_SYNC = config('BACKGROUND_TASKS_SYNC', default=False, cast=bool)
+
 
 # Static files (Whitenoise for Render)
 STATIC_URL = '/static/'
@@ -189,7 +380,8 @@ AUTH_USER_MODEL = 'app.User'
 # =============================================================================
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'app.authentication.CachedTokenAuthentication',
+        'app.authentication.SignedTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ],
     'DEFAULT_FILTER_BACKENDS': [
@@ -203,15 +395,24 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticated',
     ],
     'DEFAULT_THROTTLE_CLASSES': [
-        'rest_framework.throttling.AnonRateThrottle',
-        'rest_framework.throttling.UserRateThrottle'
+        'app.throttling.AnonSlidingThrottle',
+        'app.throttling.UserSlidingThrottle'
     ],
     'DEFAULT_THROTTLE_RATES': {
         'anon': '100/hour',
-        'user': '1000/hour'
+        'user': '1000/hour',
+        # Per-endpoint budgets (views with throttle_scope, app/throttling.py)
+        'webhook': config('THROTTLE_WEBHOOK_RATE', default='300/hour'),
+        'bot': config('THROTTLE_BOT_RATE', default='600/hour'),
     }
 }
 
+# Extra requests per window for callers with a valid INGESTION_API_KEY
+THROTTLE_BURSTS = {
+    'webhook': config('THROTTLE_WEBHOOK_BURST', default=300, cast=int),
+    'bot': config('THROTTLE_BOT_BURST', default=300, cast=int),
+}
+
 # =============================================================================
 # DJANGO-ALLAUTH CONFIGURATION
 # =============================================================================
@@ -16,5 +16,7 @@ python manage.py collectstatic --noinput
 # 3. Start Gunicorn
 # CRITICAL: We bind to 0.0.0.0:8000 explicitly.
 # Azure listens on port 8000 inside the container by default for Python images.
+# Set METRICS_TOKEN in the App Service settings for Prometheus: /metrics
+# answers 404 without it (app/metrics.py).
 echo "Starting Gunicorn..."
 python -m gunicorn --bind 0.0.0.0:8000 --timeout 600 --chdir . config.wsgi:application
\ No newline at end of file
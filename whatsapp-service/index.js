@@ -7,6 +7,8 @@ const fs = require('fs');
 
 // --- KONFIGURASI ---
 const BASE_URL = 'https://maknaflow-staging.onrender.com/api';
+// Sama dengan INGESTION_API_KEY di backend; tanpa ini Idempotency-Key diabaikan server
+const API_KEY = process.env.INGESTION_API_KEY || '';
 const SESSION_DIR = 'auth_baileys'; 
 const CONTACTS_FILE = 'contacts_mapping.json'; // File database manual kita
 
@@ -268,7 +270,18 @@ async function connectToWhatsApp() {
                             notes: session.data.notes
                         };
 
-                        const response = await axios.post(`${BASE_URL}/ingestion/internal-wa/`, payload);
+                        // Idempotency-Key dari ID pesan WhatsApp: kirim ulang (retry, atau pesan
+                        // yang dikirim ulang WhatsApp) tidak mencatat transaksi dua kali
+                        const headers = { 'X-Api-Key': API_KEY, 'Idempotency-Key': `wa-${msg.key.id}` };
+                        const post = () => axios.post(`${BASE_URL}/ingestion/internal-wa/`, payload, { headers });
+                        let response;
+                        try {
+                            response = await post();
+                        } catch (e) {
+                            // Koneksi putus sebelum ada jawaban: server mungkin sudah mencatatnya, coba sekali lagi
+                            if (e.response) throw e;
+                            response = await post();
+                        }
 
                         // --- FORMAT WAKTU (WIB) ---
                         // Kita paksa Timezone Asia/Jakarta agar jamnya sesuai WIB (bukan jam server London/USA)